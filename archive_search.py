@@ -0,0 +1,128 @@
+import time
+import numpy as np
+import pandas as pd
+
+from hitran_overlay import HitranOverlay
+from hitran_molecule_info import CELSIUS_TO_KELVIN
+from molecular_transition_strength import get_column_densities_for_locations
+
+# READ ME:
+# This answers questions like "which observations cover 1300-1310 cm^-1 and contain a CH4 line stronger than X at their altitude?"
+# for the whole archive at once, using only the catalog (see exes_catalog.py) and the HITRAN lines (see hitran_overlay.py).
+#
+# 1. Each file's wavenumber range goes into a pandas IntervalIndex, so the files that overlap the query range are found without opening any of them.
+# 2. The HITRAN lines are loaded once for the whole archive's wavenumber range, sorted by wavenumber,
+#    so the lines inside a (query range & file range) are a contiguous slice found with np.searchsorted().
+# 3. The per file terms of the line strength (partition sums for the file's temperature, column densities for the file's altitude and latitude)
+#    are computed once when the index is built, so a query only evaluates the lines it actually needs for the files it actually matched.
+
+class ArchiveSearchIndex:
+
+    def __init__(self, catalog, overlay = None):
+
+        self.catalog = catalog.reset_index(drop = True)
+
+        wavenumber_min = self.catalog["wavenumber_min"].to_numpy(dtype = float)
+        wavenumber_max = self.catalog["wavenumber_max"].to_numpy(dtype = float)
+
+        self.wavenumber_min = wavenumber_min
+        self.wavenumber_max = wavenumber_max
+        self.interval_index = pd.IntervalIndex.from_arrays(wavenumber_min, wavenumber_max, closed = "both")
+
+        # one line store for the whole archive
+        if overlay is None:
+            overlay = HitranOverlay([np.min(wavenumber_min), np.max(wavenumber_max)] if len(self.catalog) else [0, 0])
+
+        self.overlay = overlay
+
+        # per file terms of the line strength (see "HitranOverlay.evaluate()"): a (files x isotopologues) log factor, and each file's temperature
+        self.temperature_kelvin = self.catalog["temperature"].to_numpy(dtype = float) + CELSIUS_TO_KELVIN
+
+        log_partition_sum_ratios = np.zeros((len(self.catalog), len(overlay.isotopologue_names)))
+        for temperature_kelvin in np.unique(self.temperature_kelvin):
+            log_partition_sum_ratios[self.temperature_kelvin == temperature_kelvin] = np.log(overlay.get_partition_sum_ratios(temperature_kelvin))
+
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            log_column_densities = np.column_stack([
+                np.log(get_column_densities_for_locations(molecule, self.catalog["avg_altitude_km"].to_numpy(dtype = float), self.catalog["latitude"].to_numpy(dtype = float)))
+                for molecule in overlay.molecule_names
+            ]) if overlay.molecule_names else np.zeros((len(self.catalog), 0))
+
+        self.file_isotopologue_log_factor = log_partition_sum_ratios + log_column_densities[:, overlay.isotopologue_molecule_index]
+
+    # returns the catalog positions of the files whose wavenumber range overlaps the query range
+    def get_overlapping_files(self, wavenumber_min, wavenumber_max):
+
+        if len(self.catalog) == 0:
+            return np.array([], dtype = int)
+
+        return np.flatnonzero(self.interval_index.overlaps(pd.Interval(wavenumber_min, wavenumber_max, closed = "both")))
+
+    # function returns the observations that cover (part of) the query range, along with the expected lines in them
+    # if a molecule and/or a minimum strength is given, only observations with at least one such line (at their own temperature and location) are returned
+    # returns a dataframe of matching observations and a dataframe of their lines
+    def search(self, wavenumber_min, wavenumber_max, molecule = None, min_strength = None):
+
+        start_time = time.perf_counter()
+
+        wavenumber_min, wavenumber_max = min(wavenumber_min, wavenumber_max), max(wavenumber_min, wavenumber_max)
+        overlay = self.overlay
+
+        file_positions = self.get_overlapping_files(wavenumber_min, wavenumber_max)
+
+        # the lines inside the query range (and of the requested molecule)
+        line_start = np.searchsorted(overlay.wavenumber, wavenumber_min, side = "left")
+        line_stop = np.searchsorted(overlay.wavenumber, wavenumber_max, side = "right")
+        line_positions = np.arange(line_start, line_stop)
+
+        if molecule is not None:
+            line_molecules = overlay.isotopologue_molecule_index[overlay.isotopologue_index[line_positions]]
+            molecule_index = overlay.molecule_names.index(molecule) if molecule in overlay.molecule_names else -1
+            line_positions = line_positions[line_molecules == molecule_index]
+
+        line_wavenumbers = overlay.wavenumber[line_positions]
+
+        # each file's lines are a contiguous slice of the (wavenumber sorted) query lines, so every (file, line) pair can be built without a loop
+        slice_start = np.searchsorted(line_wavenumbers, self.wavenumber_min[file_positions], side = "left")
+        slice_stop = np.searchsorted(line_wavenumbers, self.wavenumber_max[file_positions], side = "right")
+        slice_length = np.maximum(slice_stop - slice_start, 0)
+
+        pair_file = np.repeat(np.arange(len(file_positions)), slice_length)
+        pair_line = slice_start[pair_file] + np.arange(len(pair_file)) - np.repeat(np.cumsum(slice_length) - slice_length, slice_length)
+
+        # same expression as "HitranOverlay.evaluate()", just with each pair's own file temperature and location
+        pair_positions = line_positions[pair_line]
+        pair_catalog_positions = file_positions[pair_file]
+        pair_temperature_kelvin = self.temperature_kelvin[pair_catalog_positions]
+        pair_isotopologue = overlay.isotopologue_index[pair_positions]
+
+        with np.errstate(over = "ignore", invalid = "ignore"):
+            pair_strengths = np.exp(overlay.log_line_constant[pair_positions] + overlay.negative_c2_elower[pair_positions] / pair_temperature_kelvin + self.file_isotopologue_log_factor[pair_catalog_positions, pair_isotopologue]) * -np.expm1(overlay.negative_c2_wavenumber[pair_positions] / pair_temperature_kelvin)
+
+        passing_pairs = np.isfinite(pair_strengths)
+        if min_strength is not None:
+            passing_pairs &= pair_strengths >= min_strength
+
+        lines_df = pd.DataFrame({
+            "file_name": self.catalog["file_name"].to_numpy()[pair_catalog_positions[passing_pairs]],
+            "molecule": np.array(overlay.isotopologue_molecules, dtype = object)[pair_isotopologue[passing_pairs]] if len(overlay.isotopologue_names) else [],
+            "isotopologue": np.array(overlay.isotopologue_names, dtype = object)[pair_isotopologue[passing_pairs]] if len(overlay.isotopologue_names) else [],
+            "wavenumber": overlay.wavenumber[pair_positions[passing_pairs]],
+            "col_den_trans": pair_strengths[passing_pairs],
+        })
+
+        line_counts = np.bincount(pair_file[passing_pairs], minlength = len(file_positions))
+        max_strengths = np.full(len(file_positions), np.nan)
+        np.fmax.at(max_strengths, pair_file[passing_pairs], pair_strengths[passing_pairs])
+
+        observations_df = self.catalog.iloc[file_positions].copy()
+        observations_df["line_count"] = line_counts
+        observations_df["max_col_den_trans"] = max_strengths
+
+        # without a line requirement, covering the query range is enough
+        if (molecule is not None) or (min_strength is not None):
+            observations_df = observations_df[line_counts > 0]
+
+        self.last_search_seconds = time.perf_counter() - start_time
+
+        return observations_df.reset_index(drop = True), lines_df
@@ -0,0 +1,90 @@
+// READ ME:
+// This filters the map of observations by object in the browser, instead of rebuilding the map figure on the server every time the object dropdown changes.
+// The map figure is built once (see "get_map_figure()" in dashboard_spectra_and_hitran.py), and sent along with the object of each marker in the "map_catalog" store.
+// When the FITS directory changes, the new "map_catalog" is sent, and the filter runs again on the new map.
+// Filtering drops the markers of the objects that aren't selected from every per marker array of the map's trace (positions, hover text, custom data and colors),
+// so they can't be hovered or clicked (or start prefetching the file under the mouse), instead of only being made invisible.
+
+// the per marker arrays of the map's trace (the colors are in "marker.color")
+const MARKER_ARRAY_KEYS = ["lat", "lon", "hovertext", "text", "customdata", "ids"];
+
+// Plotly.js typed array dtypes -> javascript typed array constructors (plotly sends the numeric arrays of a figure as {dtype, bdata} typed array dictionaries)
+const MAP_TYPED_ARRAY_CONSTRUCTORS = {
+    f8: Float64Array,
+    f4: Float32Array,
+    i8: BigInt64Array,
+    i4: Int32Array,
+    i2: Int16Array,
+    i1: Int8Array,
+    u4: Uint32Array,
+    u2: Uint16Array,
+    u1: Uint8Array,
+};
+
+// returns the entries of an array (or a {dtype, bdata} typed array dictionary) at the given indices as a regular array, and anything that isn't an array as is
+function takeIndices(values, indices) {
+
+    if (values && values.bdata !== undefined) {
+
+        const binary = atob(values.bdata);
+        const bytes = new Uint8Array(binary.length);
+
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+
+        const array = new MAP_TYPED_ARRAY_CONSTRUCTORS[values.dtype](bytes.buffer);
+
+        return indices.map((i) => Number(array[i]));
+    }
+
+    return Array.isArray(values) ? indices.map((i) => values[i]) : values;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    map: {
+
+        // returns the map figure with only the markers of the selected objects (no selection shows every marker)
+        filter_observations: function (selectedObjects, catalog) {
+
+            if (!catalog || !catalog.figure) {
+                return window.dash_clientside.no_update;
+            }
+
+            const figure = catalog.figure;
+
+            if (!selectedObjects || selectedObjects.length === 0) {
+                return figure;
+            }
+
+            const selected = new Set(selectedObjects);
+            const indices = [];
+
+            catalog.object.forEach((object, i) => {
+                if (selected.has(object)) indices.push(i);
+            });
+
+            // the map is a single trace (since the markers are colored by a continuous scale), everything else in the figure is passed through as is
+            const data = figure.data.map((trace, traceIndex) => {
+
+                if (traceIndex !== 0) {
+                    return trace;
+                }
+
+                const filteredTrace = Object.assign({}, trace);
+
+                MARKER_ARRAY_KEYS.forEach((key) => {
+                    if (key in trace) filteredTrace[key] = takeIndices(trace[key], indices);
+                });
+
+                if (trace.marker) {
+                    filteredTrace.marker = Object.assign({}, trace.marker, {color: takeIndices(trace.marker.color, indices)});
+                }
+
+                return filteredTrace;
+            });
+
+            return Object.assign({}, figure, {data: data});
+        },
+    },
+});
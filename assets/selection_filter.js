@@ -0,0 +1,152 @@
+// READ ME:
+// This is the clientside version of "update_plot_axes_ranges()" in dashboard_spectra_and_hitran.py.
+// It runs in the browser whenever the user box selects or lasso selects part of the spectra plot (or the spectra plot changes),
+// and it filters every trace down to the selection without sending the whole figure to the server.
+//
+// Every trace on the spectra plot is sorted by wavenumber (including the stemplots), so the x bounds are found with a binary search and the trace is just sliced.
+// The y bounds are then only checked on the slice, instead of the whole array.
+
+// Plotly.js typed array dtypes -> javascript typed array constructors
+const TYPED_ARRAY_CONSTRUCTORS = {
+    f8: Float64Array,
+    f4: Float32Array,
+};
+
+// turns a trace array (a regular array, a typed array, or a {dtype, bdata} typed array dictionary) into a Float64Array
+function decodeTypedArray(values) {
+
+    if (values && values.bdata !== undefined) {
+
+        const binary = atob(values.bdata);
+        const bytes = new Uint8Array(binary.length);
+
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+
+        return Float64Array.from(new TYPED_ARRAY_CONSTRUCTORS[values.dtype](bytes.buffer));
+    }
+
+    // JSON lists store NaN as null
+    return Float64Array.from(values || [], (value) => (value === null ? NaN : value));
+}
+
+// turns a Float64Array into a {dtype, bdata} typed array dictionary (the same format as "encode_typed_array()" in plotly_transport.py)
+function encodeTypedArray(array) {
+
+    const bytes = new Uint8Array(array.buffer, array.byteOffset, array.byteLength);
+    const chunks = [];
+
+    // String.fromCharCode() can only take so many arguments at once, so the bytes are converted in chunks
+    for (let i = 0; i < bytes.length; i += 32768) {
+        chunks.push(String.fromCharCode.apply(null, bytes.subarray(i, i + 32768)));
+    }
+
+    return {dtype: "f8", bdata: btoa(chunks.join(""))};
+}
+
+// returns the first index whose value is greater than (or equal to, if "inclusive" is true) the target value
+function searchSorted(array, target, inclusive) {
+
+    let low = 0;
+    let high = array.length;
+
+    while (low < high) {
+
+        const middle = (low + high) >>> 1;
+
+        if (array[middle] < target || (!inclusive && array[middle] === target)) {
+            low = middle + 1;
+        } else {
+            high = middle;
+        }
+    }
+
+    return low;
+}
+
+// pulls the x, y1, and y2 bounds out of the selectedData (the same thing as "get_selection_bounds()")
+function getSelectionBounds(selectedData) {
+
+    const selection = selectedData.lassoPoints || selectedData.range;
+
+    return {
+        xLower: Math.min(...selection.x),
+        xUpper: Math.max(...selection.x),
+        y1Lower: Math.min(...selection.y),
+        y1Upper: Math.max(...selection.y),
+        y2Upper: selection.y2 ? Math.max(...selection.y2) : null,
+    };
+}
+
+// filters one trace down to the selection bounds
+function filterTrace(trace, bounds) {
+
+    const x = decodeTypedArray(trace.x);
+    const y = decodeTypedArray(trace.y);
+
+    // some orders are stored from high to low wavenumber, in which case the slice is found on the reversed array
+    const isDescending = x.length > 1 && x[0] > x[x.length - 1];
+    const sortedX = isDescending ? x.slice().reverse() : x;
+
+    let start = searchSorted(sortedX, bounds.xLower, true);
+    let end = searchSorted(sortedX, bounds.xUpper, false);
+
+    if (isDescending) {
+        [start, end] = [x.length - end, x.length - start];
+    }
+
+    const yaxis = trace.yaxis || "y";
+    const keptIndices = [];
+
+    for (let i = start; i < end; i++) {
+
+        if (yaxis === "y" || yaxis === "y1") {
+            if (bounds.y1Lower <= y[i] && y[i] <= bounds.y1Upper) keptIndices.push(i);
+        }
+        // stemplots have zeros in between every line, so only the upper y2 bound is applied
+        else if (yaxis === "y2" && bounds.y2Upper !== null) {
+            if (y[i] <= bounds.y2Upper) keptIndices.push(i);
+        }
+        else {
+            keptIndices.push(i);
+        }
+    }
+
+    const filteredTrace = Object.assign({}, trace);
+
+    filteredTrace.x = encodeTypedArray(Float64Array.from(keptIndices, (i) => x[i]));
+    filteredTrace.y = encodeTypedArray(Float64Array.from(keptIndices, (i) => y[i]));
+
+    // merged molecule overlay traces also carry per point isotopologue names and colors, which have to be filtered the same way
+    if (Array.isArray(trace.customdata)) {
+        filteredTrace.customdata = keptIndices.map((i) => trace.customdata[i]);
+    }
+
+    if (trace.marker && Array.isArray(trace.marker.color)) {
+        filteredTrace.marker = Object.assign({}, trace.marker, {color: keptIndices.map((i) => trace.marker.color[i])});
+    }
+
+    return filteredTrace;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    selection: {
+
+        // returns the selected part of the spectra figure, along with the selection that it was filtered with
+        filter_selected_traces: function (selectedData, figure) {
+
+            if (!selectedData || !figure || !(selectedData.lassoPoints || selectedData.range)) {
+                return null;
+            }
+
+            const bounds = getSelectionBounds(selectedData);
+
+            return {
+                selection: selectedData.lassoPoints || selectedData.range,
+                data: figure.data.map((trace) => filterTrace(trace, bounds)),
+                layout: figure.layout,
+            };
+        },
+    },
+});
@@ -1,4 +1,5 @@
 import pandas as pd
+from functools import lru_cache
 
 ATMOSPHERIC_DATA_EXCEL_SHEET = "Model Atmosphere Table.xls"
 
@@ -10,6 +11,8 @@ MODEL_ATMOSPHERE_HEADER_RECONFIG = {
     "Unnamed: 11": "O3_LAT_43",
     "Unnamed: 12": "O3_LAT_56"}
 
+# the excel sheet never changes while the dashboard is running, so it only gets read once (callers should treat the dataframe as read-only)
+@lru_cache(maxsize = None)
 def get_atmosphere_dataframe():
 
     # initialize pandas dataframe from excel sheet
@@ -0,0 +1,212 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy.optimize import nnls
+from scipy.signal import fftconvolve
+
+from exes_info import get_raw_exes_file_data
+from spectra_archive import get_raw_data_reader
+from continuum_estimation import get_flux_normalization
+from hitran_overlay import HitranOverlay
+
+# READ ME:
+# These functions estimate how much of each molecule is actually in the observation, instead of assuming the MOLECULE_CONFIG concentrations
+# and the "Model Atmosphere Table.xls" column densities.
+#
+# Each molecule gets one synthetic optical depth spectrum ("basis spectrum") on the observation's wavenumber grid:
+# every line's "col_den_trans" strength, spread out over a gaussian with the width of the instrument's resolution.
+# If the atmosphere had exactly the model column densities, the normalized flux would be:
+#
+#   norm_flux = continuum * exp(-(tau_H2O + tau_CH4 + ...))
+#
+# So we let each molecule's optical depth be scaled by a factor ("scale_factor"), and take the log:
+#
+#   -log(norm_flux) = -log(continuum) + scale_H2O * tau_H2O + scale_CH4 * tau_CH4 + ...
+#
+# which is linear in the scale factors, so they can be solved for with (non-negative) linear least squares instead of a nonlinear fit.
+# The continuum is allowed a linear offset (solved for alongside the scale factors), and the fit is repeated a few times with the weights re-estimated from the previous model.
+# A scale factor of 1 means the observation matches the model atmosphere.
+
+# EXES resolving power (lambda / delta lambda) used to set the width of every line
+RESOLVING_POWER = 75000
+
+# how many times the weights are re-estimated from the previous solution
+RETRIEVAL_ITERATIONS = 3
+
+# lines are spread out over this many standard deviations on either side of their center
+GAUSSIAN_KERNEL_HALF_WIDTH = 4
+
+# standard deviation = FWHM / (2 * sqrt(2 * ln(2)))
+FWHM_TO_STANDARD_DEVIATION = 1 / (2 * np.sqrt(2 * np.log(2)))
+
+# function builds a uniformly spaced grid over the range of the given wavenumbers, spaced like the median spacing of the wavenumbers
+def get_uniform_wavenumber_grid(wavenumber):
+
+    lower_wavenumber = np.nanmin(wavenumber)
+    upper_wavenumber = np.nanmax(wavenumber)
+    spacing = np.nanmedian(np.abs(np.diff(wavenumber)))
+
+    return lower_wavenumber + spacing * np.arange(int(np.floor((upper_wavenumber - lower_wavenumber) / spacing)) + 1)
+
+# function returns a normalized gaussian line profile (units of 1 / cm^-1) sampled at the given grid spacing, with the instrument's resolution as its FWHM
+def get_gaussian_line_kernel(spacing, center_wavenumber, resolving_power = RESOLVING_POWER):
+
+    standard_deviation = center_wavenumber / resolving_power * FWHM_TO_STANDARD_DEVIATION
+    half_width = int(np.ceil(GAUSSIAN_KERNEL_HALF_WIDTH * standard_deviation / spacing))
+    kernel_offsets = spacing * np.arange(-half_width, half_width + 1)
+
+    return np.exp(-0.5 * (kernel_offsets / standard_deviation) ** 2) / (np.sqrt(2 * np.pi) * standard_deviation)
+
+# function spreads lines out into one spectrum per group (e.g. per molecule) on a uniform grid
+# "line_groups" is the row that each line gets added to, and lines outside of the grid are ignored
+def get_uniform_line_spectra(uniform_grid, line_wavenumbers, line_strengths, line_groups, group_count, resolving_power = RESOLVING_POWER):
+
+    spacing = uniform_grid[1] - uniform_grid[0] if len(uniform_grid) > 1 else 1.0
+
+    usable_lines = np.isfinite(line_strengths) & (line_wavenumbers >= uniform_grid[0]) & (line_wavenumbers <= uniform_grid[-1])
+
+    # split each line's strength between the two grid points on either side of it
+    line_position = (line_wavenumbers[usable_lines] - uniform_grid[0]) / spacing
+    left_index = np.minimum(np.floor(line_position).astype(int), len(uniform_grid) - 1)
+    right_index = np.minimum(left_index + 1, len(uniform_grid) - 1)
+    right_fraction = line_position - left_index
+
+    stick_spectra = np.zeros((group_count, len(uniform_grid)))
+    np.add.at(stick_spectra, (line_groups[usable_lines], left_index), line_strengths[usable_lines] * (1 - right_fraction))
+    np.add.at(stick_spectra, (line_groups[usable_lines], right_index), line_strengths[usable_lines] * right_fraction)
+
+    kernel = get_gaussian_line_kernel(spacing, np.mean(uniform_grid), resolving_power)
+
+    return fftconvolve(stick_spectra, kernel[np.newaxis, :], mode = "same", axes = 1)
+
+# function builds one optical depth spectrum per molecule on the given wavenumber grid
+# returns a (molecules x wavenumbers) array, along with the list of molecule names for its rows
+def get_molecule_basis_spectra(overlay, wavenumber, line_strengths, resolving_power = RESOLVING_POWER):
+
+    molecule_names = overlay.molecule_names
+
+    # the lines get binned onto a uniform grid and convolved with the line profile, then interpolated back onto the observation's grid
+    uniform_grid = get_uniform_wavenumber_grid(wavenumber)
+    line_molecule_index = overlay.isotopologue_molecule_index[overlay.isotopologue_index]
+
+    uniform_basis_spectra = get_uniform_line_spectra(uniform_grid, overlay.wavenumber, line_strengths, line_molecule_index, len(molecule_names), resolving_power)
+
+    basis_spectra = np.array([np.interp(wavenumber, uniform_grid, uniform_basis) for uniform_basis in uniform_basis_spectra]).reshape(len(molecule_names), len(wavenumber))
+
+    return basis_spectra, molecule_names
+
+# function solves for each molecule's scale factor with non-negative linear least squares
+def solve_column_density_scale_factors(wavenumber, norm_flux, norm_uncertainty, basis_spectra, iterations = RETRIEVAL_ITERATIONS):
+
+    # only points with a positive flux and a usable uncertainty can go into -log(flux)
+    usable_points = np.isfinite(wavenumber) & np.isfinite(norm_flux) & (norm_flux > 0) & np.isfinite(norm_uncertainty) & (norm_uncertainty > 0)
+
+    y = -np.log(norm_flux[usable_points])
+    basis = basis_spectra[:, usable_points].T
+
+    # the continuum terms: a constant and a linear slope (these can have either sign, so they can't go into the NNLS problem directly)
+    centered_wavenumber = wavenumber[usable_points] - np.mean(wavenumber[usable_points])
+    centered_wavenumber = centered_wavenumber / max(np.max(np.abs(centered_wavenumber)), 1e-12)
+    continuum_columns = np.column_stack([np.ones(len(y)), centered_wavenumber])
+
+    # the uncertainty of log(flux) is ~ uncertainty / flux, so the first pass is weighted by the observed flux
+    model_flux = norm_flux[usable_points]
+
+    for iteration in range(iterations):
+
+        weights = model_flux / norm_uncertainty[usable_points]
+
+        weighted_basis = basis * weights[:, np.newaxis]
+        weighted_continuum = continuum_columns * weights[:, np.newaxis]
+        weighted_y = y * weights
+
+        # project the continuum terms out of the problem, solve for the (non-negative) scale factors, then solve for the continuum terms
+        continuum_q, _ = np.linalg.qr(weighted_continuum)
+        projected_basis = weighted_basis - continuum_q @ (continuum_q.T @ weighted_basis)
+        projected_y = weighted_y - continuum_q @ (continuum_q.T @ weighted_y)
+
+        scale_factors, residual_norm = nnls(projected_basis, projected_y)
+        continuum_solution = np.linalg.lstsq(weighted_continuum, weighted_y - weighted_basis @ scale_factors, rcond = None)[0]
+
+        # the next pass is weighted by the (noise free) model flux instead
+        model_flux = np.exp(-(basis @ scale_factors + continuum_columns @ continuum_solution))
+
+    return {
+        "scale_factors": scale_factors,
+        "continuum_solution": continuum_solution,
+        "residual_norm": residual_norm,
+        "iterations": iterations,
+        "point_count": int(np.sum(usable_points)),
+    }
+
+# function retrieves the column density of every molecule for one spectrum
+# returns a dataframe with one row per molecule
+# "line_strengths" can be passed in if they were already evaluated for this temperature and location (e.g. by the spectrum pipeline),
+# along with the "expected_column_densities" they were scaled by (e.g. averaged over the flight segment)
+def retrieve_column_densities(wavenumber, norm_flux, norm_uncertainty, overlay, temperature, altitude_km, latitude, line_strengths = None, expected_column_densities = None, resolving_power = RESOLVING_POWER, iterations = RETRIEVAL_ITERATIONS):
+
+    start_time = time.perf_counter()
+
+    if line_strengths is None:
+        line_strengths = overlay.evaluate(temperature, altitude_km, latitude)
+    basis_spectra, molecule_names = get_molecule_basis_spectra(overlay, wavenumber, line_strengths, resolving_power)
+
+    solution = solve_column_density_scale_factors(wavenumber, norm_flux, norm_uncertainty, basis_spectra, iterations)
+
+    if expected_column_densities is None:
+        expected_column_densities = overlay.get_column_densities(altitude_km, latitude)
+
+    return pd.DataFrame({
+        "molecule": molecule_names,
+        "scale_factor": solution["scale_factors"],
+        "expected_column_density": expected_column_densities,
+        "retrieved_column_density": solution["scale_factors"] * expected_column_densities,
+        "residual_norm": solution["residual_norm"],
+        "seconds": time.perf_counter() - start_time,
+    })
+
+# function retrieves the column densities for a dictionary returned by "get_raw_exes_file_data()" (or a stack)
+def retrieve_column_densities_for_raw_data(raw_data, overlay = None, temperature = None, altitude_km = None, latitude = None, continuum_method = None):
+
+    if overlay is None:
+        overlay = HitranOverlay(raw_data["wavenumber"])
+
+    # a single normalization value, or the estimated continuum at every sample (see continuum_estimation.py)
+    norm = get_flux_normalization(raw_data, continuum_method)
+
+    return retrieve_column_densities(
+        raw_data["wavenumber"],
+        raw_data["flux"] / norm,
+        raw_data["uncertainty"] / norm,
+        overlay,
+        raw_data["temperature"] if temperature is None else temperature,
+        raw_data["avg_altitude_km"] if altitude_km is None else altitude_km,
+        raw_data["latitude"] if latitude is None else latitude,
+    )
+
+# function runs the retrieval over every FITS file in a directory, and returns one dataframe with a row per file and molecule
+def retrieve_column_densities_for_archive(dir = "EXES_Files", extension = ".fits", continuum_method = None, archive = None):
+
+    retrieval_dfs = []
+
+    file_names, read_raw_data = get_raw_data_reader(dir, extension, archive)
+
+    for file_name in file_names:
+
+        raw_data = read_raw_data(file_name)
+
+        retrieval_df = retrieve_column_densities_for_raw_data(raw_data, continuum_method = continuum_method)
+        retrieval_df.insert(0, "file_name", file_name)
+        retrieval_df.insert(1, "object", raw_data["object"])
+
+        retrieval_dfs.append(retrieval_df)
+
+    if not retrieval_dfs:
+        return pd.DataFrame()
+
+    return pd.concat(retrieval_dfs, ignore_index = True)
+
+
+if __name__ == "__main__":
+    print(retrieve_column_densities_for_archive().to_string())
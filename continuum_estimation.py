@@ -0,0 +1,247 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy.interpolate import LSQUnivariateSpline
+
+from exes_info import get_raw_exes_file_data, get_fluxnorm
+from spectra_archive import get_raw_data_reader
+
+# READ ME:
+# "get_fluxnorm()" normalizes a whole spectrum by one number, but EXES continua slope and ripple across a file,
+# so a flat baseline only fits part of the spectrum. These functions estimate the continuum at every sample instead.
+#
+# 1. Samples where the atmospheric transmission ("atran") is below ATRAN_MASK_FRACTION of its maximum are masked out,
+#    since the flux there is pulled down by telluric lines rather than following the continuum.
+# 2. The continuum is estimated from the remaining samples with either:
+#    - "rolling_quantile": an upper quantile of the flux in a window CONTINUUM_WINDOW_WIDTH wide, centred on each sample
+#      (an upper quantile instead of the mean/median, so the absorption lines that slip past the mask don't pull the continuum down), or
+#    - "clipped_spline": a least squares cubic spline with knots every CONTINUUM_KNOT_SPACING, refit a few times
+#      with the samples that sit well below (absorption) or above (spikes) the last fit clipped out.
+# 3. The masked samples get the continuum interpolated from their neighbours.
+#
+# Both methods take time proportional to the number of samples (for a fixed window width/knot spacing).
+# "estimate_continua()" estimates the rolling quantile continuum of many spectra in a single pandas rolling call (one column per spectrum).
+
+CONTINUUM_METHODS = ["rolling_quantile", "clipped_spline"]
+
+# samples with an atran below this fraction of the maximum atran are left out of the continuum (see "get_fluxnorm()", which uses 0.95)
+ATRAN_MASK_FRACTION = 0.9
+
+# width (cm^-1) of the rolling window, and the quantile of the flux in the window that is taken as the continuum
+CONTINUUM_WINDOW_WIDTH = 0.5
+CONTINUUM_QUANTILE = 0.9
+
+# at least this fraction of a window has to be unmasked for the window's quantile to be used (otherwise it's interpolated over)
+CONTINUUM_MIN_WINDOW_FRACTION = 0.1
+
+# spacing (cm^-1) of the spline's interior knots, and the order of the spline
+CONTINUUM_KNOT_SPACING = 1.0
+CONTINUUM_SPLINE_ORDER = 3
+
+# samples more than this many (robust) standard deviations below/above the spline get clipped before the next refit
+CONTINUUM_CLIP_LOWER_SIGMA = 2.0
+CONTINUUM_CLIP_UPPER_SIGMA = 3.0
+CONTINUUM_CLIP_ITERATIONS = 5
+
+# how many files of an archive are read and estimated together
+CONTINUUM_BATCH_SIZE = 32
+
+# median absolute deviation -> standard deviation (for normally distributed values)
+MAD_TO_STANDARD_DEVIATION = 1.4826
+
+# function returns a mask of the samples the continuum is estimated from (finite, and not inside a telluric line)
+def get_continuum_mask(wavenumber, flux, atran, atran_mask_fraction = ATRAN_MASK_FRACTION):
+
+    finite_samples = np.isfinite(wavenumber) & np.isfinite(flux)
+    finite_atran = finite_samples & np.isfinite(atran)
+
+    if not np.any(finite_atran):
+        return finite_samples
+
+    return finite_atran & (atran >= atran_mask_fraction * np.max(atran[finite_atran]))
+
+# function converts a window width in wavenumbers into an (odd) number of samples, using the median sample spacing
+def get_window_size(wavenumber, window_width = CONTINUUM_WINDOW_WIDTH):
+
+    finite_wavenumber = np.sort(wavenumber[np.isfinite(wavenumber)])
+    spacing = np.median(np.diff(finite_wavenumber)) if len(finite_wavenumber) > 1 else 0
+
+    window_size = int(np.ceil(window_width / spacing)) if spacing > 0 else 1
+
+    return max(window_size // 2 * 2 + 1, 3)
+
+# function fills in the samples that didn't get a continuum value (e.g. inside a masked telluric line) by interpolating over wavenumber
+def interpolate_continuum_gaps(wavenumber, continuum):
+
+    known_samples = np.isfinite(continuum)
+    finite_samples = np.isfinite(wavenumber)
+
+    if not np.any(known_samples):
+        return continuum
+
+    filled_continuum = continuum.copy()
+    filled_continuum[finite_samples] = np.interp(wavenumber[finite_samples], wavenumber[known_samples], continuum[known_samples])
+
+    return filled_continuum
+
+# function estimates the rolling quantile continuum of every column of a (samples x spectra) flux array at once
+# the samples in each column have to be in wavenumber order, and masked samples should already be NaN
+def get_rolling_quantile_continua(masked_flux, window_size, quantile = CONTINUUM_QUANTILE, min_window_fraction = CONTINUUM_MIN_WINDOW_FRACTION):
+
+    min_periods = max(int(np.ceil(min_window_fraction * window_size)), 1)
+
+    return pd.DataFrame(masked_flux).rolling(window_size, center = True, min_periods = min_periods).quantile(quantile).to_numpy()
+
+# function fits a cubic spline through the unmasked samples, clipping out the samples that sit far from the fit and refitting
+# "wavenumber" has to be sorted, returns the spline evaluated at every sample (NaN if there are too few samples for a spline)
+def get_clipped_spline_continuum(wavenumber, flux, mask, knot_spacing = CONTINUUM_KNOT_SPACING, iterations = CONTINUUM_CLIP_ITERATIONS):
+
+    continuum = np.full(len(wavenumber), np.nan)
+    kept = mask.copy()
+
+    for _ in range(iterations):
+
+        kept_wavenumber = wavenumber[kept]
+
+        if len(kept_wavenumber) <= CONTINUUM_SPLINE_ORDER + 1:
+            break
+
+        knots = get_spline_knots(kept_wavenumber, knot_spacing)
+        spline = LSQUnivariateSpline(kept_wavenumber, flux[kept], knots, k = CONTINUUM_SPLINE_ORDER)
+
+        finite_samples = np.isfinite(wavenumber)
+        continuum[finite_samples] = spline(wavenumber[finite_samples])
+
+        residual = flux - continuum
+        kept_residual = residual[kept]
+        residual_median = np.median(kept_residual)
+        residual_standard_deviation = MAD_TO_STANDARD_DEVIATION * np.median(np.abs(kept_residual - residual_median))
+
+        if residual_standard_deviation == 0:
+            break
+
+        new_kept = mask & (residual >= residual_median - CONTINUUM_CLIP_LOWER_SIGMA * residual_standard_deviation) & (residual <= residual_median + CONTINUUM_CLIP_UPPER_SIGMA * residual_standard_deviation)
+
+        if np.array_equal(new_kept, kept):
+            break
+
+        kept = new_kept
+
+    return continuum
+
+# function places the spline's interior knots every "knot_spacing" wavenumbers,
+# leaving out any knot that would leave fewer than (order + 1) samples since the last knot (e.g. across a masked telluric band), so the fit stays well posed
+def get_spline_knots(sorted_wavenumber, knot_spacing = CONTINUUM_KNOT_SPACING):
+
+    candidate_knots = np.arange(sorted_wavenumber[0] + knot_spacing, sorted_wavenumber[-1], knot_spacing)
+    sample_counts = np.searchsorted(sorted_wavenumber, candidate_knots, side = "left")
+
+    knots = []
+    last_count = 0
+
+    for knot, sample_count in zip(candidate_knots, sample_counts):
+
+        if (sample_count - last_count > CONTINUUM_SPLINE_ORDER) and (len(sorted_wavenumber) - sample_count > CONTINUUM_SPLINE_ORDER):
+            knots.append(knot)
+            last_count = sample_count
+
+    return knots
+
+# function estimates the continuum of a single spectrum, returns an array the same length as the flux (in the flux's units)
+def estimate_continuum(wavenumber, flux, atran, method = "rolling_quantile"):
+
+    wavenumber = np.asarray(wavenumber, dtype = float)
+    flux = np.asarray(flux, dtype = float)
+    atran = np.asarray(atran, dtype = float)
+
+    if method not in CONTINUUM_METHODS:
+        raise ValueError(f"Unknown continuum method {method!r}, expected one of {CONTINUUM_METHODS}")
+
+    # work in wavenumber order (the FITS rows aren't guaranteed to be sorted)
+    wavenumber_order = np.argsort(np.where(np.isfinite(wavenumber), wavenumber, np.inf), kind = "stable")
+    sorted_wavenumber = wavenumber[wavenumber_order]
+    sorted_flux = flux[wavenumber_order]
+    mask = get_continuum_mask(sorted_wavenumber, sorted_flux, atran[wavenumber_order])
+
+    if method == "rolling_quantile":
+        sorted_continuum = get_rolling_quantile_continua(np.where(mask, sorted_flux, np.nan)[:, np.newaxis], get_window_size(sorted_wavenumber))[:, 0]
+    else:
+        sorted_continuum = get_clipped_spline_continuum(sorted_wavenumber, sorted_flux, mask)
+
+    continuum = np.empty(len(flux))
+    continuum[wavenumber_order] = interpolate_continuum_gaps(sorted_wavenumber, sorted_continuum)
+
+    return continuum
+
+# function estimates the continua of many spectra (lists of wavenumber, flux, and atran arrays) at once
+# the rolling quantiles of all the spectra are taken in a single call, with one window size (from the first spectrum's sample spacing) for the whole batch
+# returns a list of continua, one per spectrum
+def estimate_continua(wavenumbers, fluxes, atrans, method = "rolling_quantile"):
+
+    if method != "rolling_quantile":
+        return [estimate_continuum(wavenumber, flux, atran, method) for wavenumber, flux, atran in zip(wavenumbers, fluxes, atrans)]
+
+    if len(wavenumbers) == 0:
+        return []
+
+    wavenumbers = [np.asarray(wavenumber, dtype = float) for wavenumber in wavenumbers]
+    wavenumber_orders = [np.argsort(np.where(np.isfinite(wavenumber), wavenumber, np.inf), kind = "stable") for wavenumber in wavenumbers]
+
+    # one column per spectrum, padded with NaN up to the longest spectrum
+    masked_flux = np.full((max(len(wavenumber) for wavenumber in wavenumbers), len(wavenumbers)), np.nan)
+
+    for i, (wavenumber, flux, atran, wavenumber_order) in enumerate(zip(wavenumbers, fluxes, atrans, wavenumber_orders)):
+
+        sorted_flux = np.asarray(flux, dtype = float)[wavenumber_order]
+        mask = get_continuum_mask(wavenumber[wavenumber_order], sorted_flux, np.asarray(atran, dtype = float)[wavenumber_order])
+        masked_flux[:len(wavenumber), i] = np.where(mask, sorted_flux, np.nan)
+
+    sorted_continua = get_rolling_quantile_continua(masked_flux, get_window_size(wavenumbers[0]))
+
+    continua = []
+
+    for i, (wavenumber, wavenumber_order) in enumerate(zip(wavenumbers, wavenumber_orders)):
+
+        continuum = np.empty(len(wavenumber))
+        continuum[wavenumber_order] = interpolate_continuum_gaps(wavenumber[wavenumber_order], sorted_continua[:len(wavenumber), i])
+        continua.append(continuum)
+
+    return continua
+
+# function returns what a spectrum's flux (and uncertainty) get divided by to normalize it:
+# the single "get_fluxnorm()" value if no continuum method is given, otherwise the estimated continuum at every sample
+def get_flux_normalization(raw_data, continuum_method = None):
+
+    if continuum_method is None:
+        return get_fluxnorm(raw_data["flux"], raw_data["atran"])
+
+    return estimate_continuum(raw_data["wavenumber"], raw_data["flux"], raw_data["atran"], continuum_method)
+
+# function estimates the continuum of every FITS file in a directory (CONTINUUM_BATCH_SIZE files per batch), returns a dictionary of file name -> continuum
+# the files are read from "archive" if one is given (see spectra_archive.py)
+def estimate_continua_for_archive(dir = "EXES_Files", extension = ".fits", method = "rolling_quantile", batch_size = CONTINUUM_BATCH_SIZE, archive = None):
+
+    file_names, read_raw_data = get_raw_data_reader(dir, extension, archive)
+    continua = {}
+
+    for batch_start in range(0, len(file_names), batch_size):
+
+        batch_file_names = file_names[batch_start:batch_start + batch_size]
+        raw_datas = [read_raw_data(file_name) for file_name in batch_file_names]
+
+        batch_continua = estimate_continua(
+            [raw_data["wavenumber"] for raw_data in raw_datas],
+            [raw_data["flux"] for raw_data in raw_datas],
+            [raw_data["atran"] for raw_data in raw_datas],
+            method,
+        )
+
+        continua.update(zip(batch_file_names, batch_continua))
+
+    return continua
+
+
+if __name__ == "__main__":
+
+    for file_name, continuum in estimate_continua_for_archive().items():
+        print(file_name, "continuum median:", np.nanmedian(continuum), "relative ripple:", np.nanstd(continuum) / np.nanmedian(continuum))
@@ -1,5 +1,7 @@
 import os
-from dash import Dash, html, dcc, callback, Output, Input, State, dash_table
+import json
+from functools import lru_cache
+from dash import Dash, html, dcc, callback, Output, Input, State, dash_table, ClientsideFunction, Patch, ctx, no_update
 import plotly.express as px
 import plotly.graph_objects as go
 import matplotlib.pyplot as plt
@@ -8,10 +10,20 @@ import pandas as pd
 
 # pd.set_option("display.max_rows", None)
 import numpy as np
-from scipy.signal import find_peaks
-from exes_info import get_exes_file_data
-from exes_info import get_endian_modified_exes_file_data
-from hitran_stemplots import get_isotopologues_as_trace_object_stemplots
+from spectrum_pipeline import SpectrumPipeline, get_values_at_wavenumbers, DEFAULT_MEMO_SIZE
+from hitran_tile_cache import HitranTileCache
+from hitran_cutoff_index import OVERLAY_LINE_LIMIT
+from prefetch_scheduler import PrefetchScheduler, PREFETCH_FILE_LIMIT
+from exes_stacking import NoWavenumberOverlap
+from molecular_transition_strength import MOLECULE_CONFIG, ISOTOPOLOGUE_COLOR_CONFIG
+from plotly_transport import encode_trace_list, decode_typed_array
+from exes_info import FEET_TO_KILOMETERS
+from exes_catalog import update_exes_catalog
+from spectra_archive import SpectraArchive, ARCHIVE_DIRECTORY
+from fits_watcher import FitsDirectoryWatcher, get_directory_snapshot
+from archive_search import ArchiveSearchIndex
+from spectra_fitting import SpectraFitCache, get_fitted_peaks_dataframe, get_model_from_parameters
+from results_store import ResultsStore
 
 # MOLECULE_LIST = list(MOLECULE_CONFIG.keys())
 MAP_CONFIG = {
@@ -34,32 +46,189 @@ MAP_CONFIG = {
     }
 }
 MARKERSIZE = 2
+
+# send trace arrays to the browser as base64 typed arrays instead of JSON number lists (see plotly_transport.py)
+BINARY_TRACE_TRANSPORT = True
+
+# traces that are only ever looked at (no callback reads their values back), so they can be sent as float32
+DISPLAY_ONLY_TRACE_NAMES = ["atran data", "Baseline Flux", "Line of Best Fit"] + list(ISOTOPOLOGUE_COLOR_CONFIG) + list(MOLECULE_CONFIG)
+
+# the most lines that the archive search shows at once (the strongest ones are kept)
+SEARCH_RESULT_LINE_LIMIT = 500
+
+# the full spectrum only shows the strongest lines (see hitran_cutoff_index.py), and a selected window is redrawn with the cutoff times this factor
+SELECTION_CUTOFF_FACTOR = 1e-3
 EXTENSION = ".fits"
-DIRECTORY = "EXES_Files"
+# the directory of FITS files can be overridden with the EXES_DIRECTORY environment variable (e.g. to run against the load test's synthetic fixtures)
+DIRECTORY = os.environ.get("EXES_DIRECTORY", "EXES_Files")
 # DIRECTORY = "AFGL_2136_search"
 
-currently_loaded_data = {
-    "file_name": None,
-    "exes": None,
-    "hitran": [],
-    "smooth_width": None,
-    "cutoff": None,
-}
+# watch the directory for FITS files that are added, changed, or removed while the dashboard is running (see fits_watcher.py),
+# and how often (in milliseconds) the browser checks whether the catalog changed
+WATCH_FITS_DIRECTORY = True
+CATALOG_REFRESH_INTERVAL = 5000
+
+# the consolidated archive the spectra are read from (see spectra_archive.py), can be overridden with the EXES_ARCHIVE_DIRECTORY environment variable
+SPECTRA_ARCHIVE_DIRECTORY = os.environ.get("EXES_ARCHIVE_DIRECTORY", ARCHIVE_DIRECTORY)
+
+# last converged line of best fit for each selection, so that edits to the peak table only refit what changed (see spectra_fitting.py)
+SPECTRA_FIT_CACHE = SpectraFitCache()
+
+# peaks, fits, and line assignments that were saved from the dashboard, so they survive a page reload (see results_store.py)
+RESULTS_STORE = ResultsStore()
+
+# every FITS file packed into one memory-mapped store (see spectra_archive.py), brought up to date with the directory at startup
+# (only the files that were added or changed since the last run get read)
+# the directory is snapshotted before the archive is synced, so a file that arrives while it's being synced still gets picked up by the watcher,
+# and so does a file that couldn't be read yet (it's left out of the snapshot)
+FITS_DIRECTORY_SNAPSHOT = get_directory_snapshot(DIRECTORY, EXTENSION)
+SPECTRA_ARCHIVE = SpectraArchive(SPECTRA_ARCHIVE_DIRECTORY)
+SPECTRA_ARCHIVE.sync(DIRECTORY, EXTENSION)
+FITS_DIRECTORY_SNAPSHOT = {file_name: snapshot for file_name, snapshot in FITS_DIRECTORY_SNAPSHOT.items() if file_name in SPECTRA_ARCHIVE}
+
+# one compact row per FITS file (header info and wavenumber range only, see exes_catalog.py), built from the archive's index without opening the FITS files
+FITS_GEOGRAPHIC_INFO = SPECTRA_ARCHIVE.get_catalog()
+
+# goes up every time the watcher changes the catalog, so the browsers know to fetch the new one
+CATALOG_VERSION = 0
+
+# HITRAN lines and evaluated overlay tiles shared by every observation (see hitran_tile_cache.py), loaded for the whole archive's wavenumber range the first time they're needed
+HITRAN_TILE_CACHE = HitranTileCache([FITS_GEOGRAPHIC_INFO["wavenumber_min"].min(), FITS_GEOGRAPHIC_INFO["wavenumber_max"].max()] if len(FITS_GEOGRAPHIC_INFO) else None)
+
+# memoized graph of everything derived from an observation (see spectrum_pipeline.py)
+# every node has room for a full round of prefetches on top of the usual results, and the file a client has open is pinned (see "get_all_spectra_data()")
+SPECTRUM_PIPELINE = SpectrumPipeline(dir = DIRECTORY, memo_size = DEFAULT_MEMO_SIZE + PREFETCH_FILE_LIMIT, tile_cache = HITRAN_TILE_CACHE, archive = SPECTRA_ARCHIVE)
+
+# the archive search index evaluates the HITRAN lines for every file, so it only gets built the first time someone searches (see archive_search.py)
+# its lines come from the tile cache's line source, instead of being read from the HITRAN tables again
+@lru_cache(maxsize = 1)
+def get_archive_search_index():
+
+    if len(FITS_GEOGRAPHIC_INFO) == 0:
+        return ArchiveSearchIndex(FITS_GEOGRAPHIC_INFO)
+
+    return ArchiveSearchIndex(FITS_GEOGRAPHIC_INFO, HITRAN_TILE_CACHE.get_overlay([FITS_GEOGRAPHIC_INFO["wavenumber_min"].min(), FITS_GEOGRAPHIC_INFO["wavenumber_max"].max()]))
+
+# function builds the map of every observation
+# it's only built once, and filtering it by object happens in the browser (see assets/map_filter.js), by dropping the markers of the other objects
+def get_map_figure(catalog):
+
+    fig = px.scatter_geo(
+        catalog,
+        lat="latitude",
+        lon="longitude",
+        hover_name="file_name",
+        hover_data={
+            "object": True,
+            "wavelength_range": True,
+            "avg_altitude": True,
+            "temperature": True,
+        },
+        color = "avg_altitude",
+        color_continuous_scale = "Viridis",
+        projection="mercator",  # scope = "usa" does not have a mercator projection, so nothing is displayed when this parameter is used
+        title="SOFIA Experiment Locations",
+    )
+    fig.update_geos(**MAP_CONFIG)
+
+    fig.update_layout(height=600, width=1600)
+
+    # the color scale covers every observation, so it doesn't change when the map is filtered down to some of them
+    if len(catalog):
+        fig.update_coloraxes(cmin = catalog["avg_altitude"].min(), cmax = catalog["avg_altitude"].max())
+
+    return fig
+
+# function returns the "map_catalog" store: the unfiltered map, and the object of each of its markers (in marker order), which the browser filters the map with
+def get_map_catalog(catalog, map_figure):
+    return {"object": catalog["object"].tolist(), "figure": map_figure}
+
+MAP_FIGURE = get_map_figure(FITS_GEOGRAPHIC_INFO)
+
+# function returns True if a fit cache key (the json of the peaks figure key, whose first item is the file name or the files of a stack) was made from the file
+def fit_key_contains_file_name(fit_key, file_name):
+
+    fit_file_name = json.loads(fit_key)[0]
 
-def get_all_fits_geographic_data(dir):
+    if isinstance(fit_file_name, list):
+        return file_name in fit_file_name
 
-    geographic_info = []
+    return fit_file_name == file_name
 
-    filelist = [file for file in os.listdir(dir) if file.endswith(EXTENSION)]
+# function brings everything built from the FITS directory up to date with the files the watcher found added, changed, or removed
+# only the added and changed files are read (into the archive, and their headers into the catalog), and only the results computed from the changed and removed files are forgotten
+# returns the files that couldn't be read yet, so the watcher tries them again on its next scan
+def ingest_catalog_changes(added, changed, removed):
 
-    for file in filelist:
-        file_info = get_exes_file_data(file, dir=DIRECTORY)
-        file_info["file_name"] = file
-        geographic_info.append(file_info)
+    global FITS_GEOGRAPHIC_INFO, MAP_FIGURE, CATALOG_VERSION
 
-    return pd.DataFrame(geographic_info)
+    # the archive is updated before the pipeline forgets the files, so the pipeline reads the new spectra when it recomputes them
+    archive_failed_file_names = SPECTRA_ARCHIVE.update_files(DIRECTORY, added, changed, removed)
 
-FITS_GEOGRAPHIC_INFO = get_all_fits_geographic_data(DIRECTORY)
+    catalog, failed_file_names = update_exes_catalog(FITS_GEOGRAPHIC_INFO, added, changed, removed, DIRECTORY)
+    failed_file_names = list(dict.fromkeys(list(failed_file_names) + archive_failed_file_names))
+
+    for file_name in list(changed) + list(removed):
+
+        SPECTRUM_PIPELINE.invalidate_file(file_name)
+        SPECTRA_FIT_CACHE.forget(lambda fit_key: fit_key_contains_file_name(fit_key, file_name))
+
+    # the new map and catalog are built before they replace the old ones, so callbacks never see one without the other
+    map_figure = get_map_figure(catalog)
+    FITS_GEOGRAPHIC_INFO, MAP_FIGURE = catalog, map_figure
+
+    # the archive search index gets rebuilt from the new catalog the next time someone searches
+    get_archive_search_index.cache_clear()
+
+    CATALOG_VERSION += 1
+
+    return failed_file_names
+
+# the watcher compares against the snapshot taken at import, so files that change before it starts are still picked up
+if WATCH_FITS_DIRECTORY:
+    FITS_WATCHER = FitsDirectoryWatcher(DIRECTORY, ingest_catalog_changes, EXTENSION, initial_snapshot = FITS_DIRECTORY_SNAPSHOT)
+
+# function starts watching the FITS directory, when the dashboard starts serving (importing the module doesn't start any threads)
+def start_fits_watcher():
+
+    if WATCH_FITS_DIRECTORY and (FITS_WATCHER.ident is None):
+        FITS_WATCHER.start()
+
+# function computes everything that a click on a file would (into the pipeline's memo), stopping between steps if the prefetch gets cancelled
+# the overlay is computed for the file's own temperature, altitude, and latitude, since that's what the sliders get set to when the file is clicked
+def prefetch_observation(file_name, cancelled, smooth_width, cutoff, overlay_render_mode, continuum_method, overlay_column_mode):
+
+    raw_data = SPECTRUM_PIPELINE.compute(["raw_arrays"], file_name = file_name)["raw_arrays"]
+
+    if cancelled.is_set():
+        return
+
+    SPECTRUM_PIPELINE.compute(["exes_data"], file_name = file_name, smooth_width = smooth_width, continuum_method = continuum_method)
+
+    if cancelled.is_set():
+        return
+
+    SPECTRUM_PIPELINE.compute(
+        ["stem_traces"],
+        file_name = file_name,
+        temperature = raw_data["temperature"],
+        altitude_km = raw_data["avg_altitude_km"],
+        latitude = raw_data["latitude"],
+        cutoff = cutoff,
+        overlay_render_mode = overlay_render_mode,
+        overlay_column_mode = overlay_column_mode,
+    )
+
+# loads the files that are likely to be clicked next in the background (see prefetch_scheduler.py)
+PREFETCH_SCHEDULER = PrefetchScheduler(prefetch_observation)
+
+# function prepares a figure's trace list for sending to the browser
+def get_figure_trace_list(trace_list):
+
+    if BINARY_TRACE_TRANSPORT:
+        return encode_trace_list(trace_list, DISPLAY_ONLY_TRACE_NAMES)
+
+    return trace_list
 
 def empty_spectra(graph_title):
     trace1 = go.Scatter(x=[], y=[], mode="markers", name="atran data")
@@ -77,22 +246,26 @@ def empty_spectra(graph_title):
     # return new figure object
     return {"data": [trace1, trace2], "layout": layout}
 
-def update_plot_axes_ranges(trace_list, selectedData):
-    
+# function pulls the x, y1, and y2 bounds out of the selectedData from the box select tool or the lasso tool
+# (y2_upper is None when the selection doesn't include the y2 axis)
+def get_selection_bounds(selectedData):
+
     # if the dictionary selectedData contains the key, "lassoPoints", then it is data from the lasso tool
     if "lassoPoints" in selectedData:
 
-        # if I had to guess, these are probably the coordinates outlining the lasso path (for some reason there's two sets of y coordinates)
-        selected_lasso_points = pd.DataFrame(selectedData["lassoPoints"])
+        # these are the coordinates outlining the lasso path (there's one set of y coordinates for each y axis)
+        selected_lasso_points = selectedData["lassoPoints"]
 
-        # when the lasso tool is used the selected data points will be used to set the x and y bounds
-        # the maximum/minimum x and y values will be used to set the x and y bounds
-        x_lower = selected_lasso_points["x"].min()
-        x_upper = selected_lasso_points["x"].max()
-        y1_lower = selected_lasso_points["y"].min()
-        y1_upper = selected_lasso_points["y"].max()
-        y1_lower = selected_lasso_points["y2"].min()
-        y1_upper = selected_lasso_points["y2"].max()
+        # when the lasso tool is used the maximum/minimum x and y values of the lasso path will be used to set the x and y bounds
+        x_lower = min(selected_lasso_points["x"])
+        x_upper = max(selected_lasso_points["x"])
+        y1_lower = min(selected_lasso_points["y"])
+        y1_upper = max(selected_lasso_points["y"])
+
+        if "y2" in selected_lasso_points:
+            y2_upper = max(selected_lasso_points["y2"])
+        else:
+            y2_upper = None
 
     # if the data was not from the lasso tool, then it is handled as data from the box select tool
     else:
@@ -101,73 +274,212 @@ def update_plot_axes_ranges(trace_list, selectedData):
         selected_range = selectedData["range"]
 
         # take x, y1, and y2 bounds from the box select tool's range data
-        x_lower = selected_range["x"][0]
-        x_upper = selected_range["x"][-1]
+        x_lower = min(selected_range["x"])
+        x_upper = max(selected_range["x"])
         
-        y1_lower = selected_range["y"][0]
-        y1_upper = selected_range["y"][-1]
+        y1_lower = min(selected_range["y"])
+        y1_upper = max(selected_range["y"])
 
-        # y2_lower = selected_range["y2"][0]
         if "y2" in selected_range:
-            y2_upper = selected_range["y2"][-1]
-        
+            y2_upper = max(selected_range["y2"])
         else:
-            y2_upper = False
+            y2_upper = None
+
+    return x_lower, x_upper, y1_lower, y1_upper, y2_upper
+
+# function returns the selection's range (or lasso path) so that the selection can be compared against the one that the client filtered
+def get_selection_key(selectedData):
+
+    if "lassoPoints" in selectedData:
+        return selectedData["lassoPoints"]
+
+    return selectedData["range"]
+
+# function turns a file name that was kept in a dcc.Store back into the pipeline's file name (a stack's tuple of file names comes back from the browser as a list)
+def get_pipeline_file_name(file_name):
+    return tuple(file_name) if isinstance(file_name, list) else file_name
+
+# function returns the key of a peaks figure: the spectrum it was built from (see the "loaded_spectrum" store), the selection, and the baseline
+# it's kept in the "peaks_figure_key" store of the client that built the figure, so it's returned the way it comes back from the browser (with lists instead of tuples)
+def get_peaks_figure_key(loaded_spectrum, selectedData, baseline):
+    return json.loads(json.dumps([loaded_spectrum["file_name"], loaded_spectrum["smooth_width"], loaded_spectrum["continuum_method"], get_selection_key(selectedData), baseline]))
+
+# server side fallback for the clientside "filter_selected_traces()" function (assets/selection_filter.js)
+# every trace on the spectra plot is sorted by wavenumber (including the stemplots), so the x bounds are found with a binary search and the trace is just sliced
+# the y bounds are then only checked on the slice, instead of the whole array
+def update_plot_axes_ranges(trace_list, selectedData):
+
+    x_lower, x_upper, y1_lower, y1_upper, y2_upper = get_selection_bounds(selectedData)
 
     for trace in trace_list:
 
-        df = pd.DataFrame({
-            "x": trace["x"],
-            "y": trace["y"]
-        })
-        
-        x_bounds = (x_lower <= df["x"]) & (df["x"] <= x_upper)
-        y_bounds = True
+        x = decode_typed_array(trace["x"])
+        y = decode_typed_array(trace["y"])
 
-        if trace["yaxis"] == "y":
+        # some orders are stored from high to low wavenumber, in which case the slice is found on the reversed arrays
+        is_descending = len(x) > 1 and x[0] > x[-1]
+        sorted_x = x[::-1] if is_descending else x
 
-            y_bounds = (y1_lower <= df["y"]) & (df["y"] <= y1_upper)
-        
-        if (trace["yaxis"] == "y2") and (y2_upper):
-        
-            # y_bounds = (y2_lower <= df["y"]) & (df["y"] <= y2_upper)
-            y_bounds = df["y"] <= y2_upper
-        
+        start = np.searchsorted(sorted_x, x_lower, side = "left")
+        end = np.searchsorted(sorted_x, x_upper, side = "right")
 
-        filtered_df = df[x_bounds & y_bounds]
+        if is_descending:
+            start, end = len(x) - end, len(x) - start
 
-        trace["x"] = filtered_df["x"]
-        trace["y"] = filtered_df["y"]
+        x = x[start:end]
+        y = y[start:end]
+
+        if trace.get("yaxis", "y") in ("y", "y1"):
+            point_mask = (y1_lower <= y) & (y <= y1_upper)
+
+        # stemplots have zeros in between every line, so only the upper y2 bound is applied
+        elif (trace.get("yaxis") == "y2") and (y2_upper is not None):
+            point_mask = y <= y2_upper
+
+        else:
+            point_mask = np.ones(len(x), dtype = bool)
+
+        trace["x"] = x[point_mask]
+        trace["y"] = y[point_mask]
+
+        # merged molecule overlay traces also carry per point isotopologue names and colors, which have to be filtered the same way
+        if "customdata" in trace:
+            trace["customdata"] = list(np.asarray(trace["customdata"], dtype = object)[start:end][point_mask])
+
+        if ("marker" in trace) and isinstance(trace["marker"].get("color"), (list, np.ndarray)):
+            trace["marker"]["color"] = list(np.asarray(trace["marker"]["color"], dtype = object)[start:end][point_mask])
 
     return trace_list
 
 def estimate_fwhm_for_exes_peak(exes_df, peak_heights_df):
     return None
 
-def get_all_spectra_data(exes_file_name, smooth_width, cutoff):
+# function returns the observation that should be analysed: a tuple of file names if two or more files are selected for stacking,
+# otherwise the file name of the experiment that was clicked on the map (or None if there isn't one)
+def get_selected_experiment(clickData, stack_file_selection):
 
-    if (currently_loaded_data["file_name"] is None) or (currently_loaded_data["file_name"] != exes_file_name):
+    if stack_file_selection and len(stack_file_selection) >= 2:
+        return tuple(sorted(stack_file_selection))
 
-        currently_loaded_data["file_name"] = exes_file_name
-        currently_loaded_data["exes"] = get_endian_modified_exes_file_data(exes_file_name, dir = DIRECTORY, smooth_width = smooth_width)
-        currently_loaded_data["smooth_width"] = smooth_width
+    if clickData:
+        return clickData["points"][0]["hovertext"]
 
-        temperature = currently_loaded_data["exes"]["temperature"]
-        altitude_km = currently_loaded_data["exes"]["avg_altitude_km"]
-        latitude = currently_loaded_data["exes"]["latitude"]
-        wavenumbers = currently_loaded_data["exes"]["wavenumber"]
+    return None
 
-        currently_loaded_data["hitran"] = get_isotopologues_as_trace_object_stemplots(temperature, altitude_km, latitude, wavenumbers, cutoff)
-        
-    if currently_loaded_data["smooth_width"] != smooth_width:
+# function computes a pipeline node that depends on the overlay's temperature and location (e.g. "column_density_retrieval")
+# returns None if there isn't a selected experiment (or the selected files can't be stacked)
+# any other parameters the node needs (e.g. "smooth_width" for the peaks of "equivalent_widths") are passed on to the pipeline
+def get_overlay_analysis_df(node_name, clickData, stack_file_selection, temperature, altitude_km, latitude, continuum_method = "none", overlay_column_mode = "average_altitude", **parameter_values):
 
-        currently_loaded_data["exes"] = get_endian_modified_exes_file_data(exes_file_name, dir = DIRECTORY, smooth_width = smooth_width)
+    experiment = get_selected_experiment(clickData, stack_file_selection)
 
-    # if currently_loaded_data["cutoff"] != cutoff:
-        
-    #     currently_loaded_data["hitran"] = get_isotopologues_as_trace_object_stemplots(temperature, altitude_km, latitude, wavenumbers)
+    if experiment is None:
+        return None
+
+    try:
+        raw_data = SPECTRUM_PIPELINE.compute(["raw_arrays"], file_name = experiment)["raw_arrays"]
+
+    except NoWavenumberOverlap:
+        return None
+
+    return SPECTRUM_PIPELINE.compute(
+        [node_name],
+        file_name = experiment,
+        temperature = raw_data["temperature"] if temperature is None else temperature,
+        altitude_km = raw_data["avg_altitude_km"] if altitude_km is None else altitude_km,
+        latitude = raw_data["latitude"] if latitude is None else latitude,
+        continuum_method = get_continuum_method(continuum_method),
+        overlay_column_mode = overlay_column_mode,
+        **parameter_values,
+    )[node_name]
+
+# function converts the continuum option in the dashboard into the pipeline's "continuum_method" (a radio item can't have a value of None)
+def get_continuum_method(continuum_option):
+    return None if continuum_option in [None, "none"] else continuum_option
+
+# function returns the normalized (unsmoothed) flux and its uncertainty at each of the given (selected) wavenumbers of an experiment
+def get_selection_flux_and_uncertainty(selected_wavenumbers, file_name, continuum_method):
+
+    results = SPECTRUM_PIPELINE.compute(["raw_arrays", "norm_flux", "norm_uncertainty"], file_name = get_pipeline_file_name(file_name), continuum_method = continuum_method)
+
+    # the selected samples are a subset of the spectrum's samples, so they line up exactly with their own wavenumbers
+    wavenumber = results["raw_arrays"]["wavenumber"]
+
+    return get_values_at_wavenumbers(wavenumber, results["norm_flux"], selected_wavenumbers), get_values_at_wavenumbers(wavenumber, results["norm_uncertainty"], selected_wavenumbers)
+
+# function converts a dataframe into DataTable records (NaN, e.g. no ozone column density above 56 deg. latitude, can't go into the table's JSON)
+def get_table_records(df):
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+def get_all_spectra_data(exes_file_name, smooth_width, cutoff, temperature = None, altitude_km = None, latitude = None, overlay_render_mode = "isotopologue", continuum_method = None, overlay_column_mode = "average_altitude"):
+
+    # the prefetches of the files that might get clicked next shouldn't push out the one that is open
+    SPECTRUM_PIPELINE.pin_file(exes_file_name)
 
-    return currently_loaded_data["exes"], currently_loaded_data["hitran"]
+    # if the sliders haven't been set yet, the overlay uses the values recorded in the file
+    if (temperature is None) or (altitude_km is None) or (latitude is None):
+
+        raw_data = SPECTRUM_PIPELINE.compute(["raw_arrays"], file_name = exes_file_name)["raw_arrays"]
+
+        if temperature is None:
+            temperature = raw_data["temperature"]
+        if altitude_km is None:
+            altitude_km = raw_data["avg_altitude_km"]
+        if latitude is None:
+            latitude = raw_data["latitude"]
+
+    # only the steps downstream of a changed parameter get recomputed (e.g. a new cutoff only re-slices the strength index)
+    results = SPECTRUM_PIPELINE.compute(
+        ["exes_data", "stem_traces", "display_cutoff"],
+        file_name = exes_file_name,
+        smooth_width = smooth_width,
+        temperature = temperature,
+        altitude_km = altitude_km,
+        latitude = latitude,
+        cutoff = cutoff,
+        overlay_render_mode = overlay_render_mode,
+        continuum_method = continuum_method,
+        overlay_column_mode = overlay_column_mode,
+    )
+
+    # the selected window's detailed overlay (see "get_window_stem_traces()") is queried from the same strength index, so the client keeps what the overlay was built with
+    # (along with the cutoff the full spectrum was actually drawn with, see "update_overlay_cutoff_status()")
+    overlay_parameters = {
+        "temperature": temperature,
+        "altitude_km": altitude_km,
+        "latitude": latitude,
+        "cutoff": cutoff,
+        "display_cutoff": results["display_cutoff"],
+        "overlay_render_mode": overlay_render_mode,
+        "overlay_column_mode": overlay_column_mode,
+    }
+
+    return results["exes_data"], results["stem_traces"], overlay_parameters
+
+# function returns the overlay traces of the selected window, with the lines down to SELECTION_CUTOFF_FACTOR times the overlay's cutoff
+# (the full spectrum only has the strongest lines, so a narrow window would otherwise show almost none of them)
+# "loaded_spectrum" is the client's "loaded_spectrum" store: the file and the overlay parameters the full spectrum's overlay was built with
+def get_window_stem_traces(selectedData, loaded_spectrum):
+
+    x_lower, x_upper, y1_lower, y1_upper, y2_upper = get_selection_bounds(selectedData)
+    overlay_parameters = loaded_spectrum["overlay_parameters"]
+
+    window_cutoff = overlay_parameters["cutoff"] * SELECTION_CUTOFF_FACTOR if overlay_parameters["cutoff"] else None
+
+    window_stem_traces = SPECTRUM_PIPELINE.compute(
+        ["window_stem_traces"],
+        file_name = get_pipeline_file_name(loaded_spectrum["file_name"]),
+        temperature = overlay_parameters["temperature"],
+        altitude_km = overlay_parameters["altitude_km"],
+        latitude = overlay_parameters["latitude"],
+        overlay_render_mode = overlay_parameters["overlay_render_mode"],
+        overlay_column_mode = overlay_parameters["overlay_column_mode"],
+        window_range = (x_lower, x_upper),
+        window_cutoff = window_cutoff,
+    )["window_stem_traces"]
+
+    # the traces are already inside the window, this only applies the selection's y2 bound
+    return update_plot_axes_ranges([trace.to_plotly_json() for trace in window_stem_traces], selectedData)
 
 
 app = Dash()
@@ -175,16 +487,148 @@ app = Dash()
 app.layout = [
     html.H1(children="SOFIA Experiment Dashboard", style={"textAlign": "center"}),
     dcc.Dropdown(FITS_GEOGRAPHIC_INFO["object"].sort_values().unique(), id = "observation_selection", multi = True),
-    dcc.Graph(id="exps_map", config={"scrollZoom": False}),
+    dcc.Graph(id="exps_map", figure = MAP_FIGURE, config={"scrollZoom": False}),
+    # the unfiltered map and the object of each of its markers, for filtering the map in the browser
+    dcc.Store(id = "map_catalog", data = get_map_catalog(FITS_GEOGRAPHIC_INFO, MAP_FIGURE)),
+    # the version of the catalog this page was built from, checked against the server's every CATALOG_REFRESH_INTERVAL
+    dcc.Store(id = "catalog_version", data = CATALOG_VERSION),
+    dcc.Interval(id = "catalog_refresh_interval", interval = CATALOG_REFRESH_INTERVAL, disabled = not WATCH_FITS_DIRECTORY),
+    html.H3(children="Archive Search"),
+    dcc.Input(id = "search_wavenumber_min", type = "number", placeholder = "minimum wavenumber (cm^-1)"),
+    dcc.Input(id = "search_wavenumber_max", type = "number", placeholder = "maximum wavenumber (cm^-1)"),
+    dcc.Dropdown(list(MOLECULE_CONFIG), id = "search_molecule", placeholder = "any molecule"),
+    dcc.Input(id = "search_min_strength", type = "number", placeholder = "minimum transition strength"),
+    html.Button("Search Archive", id = "search_button", n_clicks = 0),
+    dash_table.DataTable(
+        id = "search_observations_table",
+        data = [],
+        columns = [
+            {"id": "file_name", "name": "file name"},
+            {"id": "object", "name": "object"},
+            {"id": "wavenumber_min", "name": "min wavenumber", "type": "numeric", "format": {"specifier": ".3f"}},
+            {"id": "wavenumber_max", "name": "max wavenumber", "type": "numeric", "format": {"specifier": ".3f"}},
+            {"id": "avg_altitude", "name": "altitude (ft)"},
+            {"id": "line_count", "name": "lines"},
+            {"id": "max_col_den_trans", "name": "strongest line", "type": "numeric", "format": {"specifier": ".3e"}},
+        ],
+        sort_action = "native",
+        page_size = 10,
+    ),
+    dash_table.DataTable(
+        id = "search_lines_table",
+        data = [],
+        columns = [
+            {"id": "file_name", "name": "file name"},
+            {"id": "isotopologue", "name": "isotopologue"},
+            {"id": "wavenumber", "name": "wavenumber", "type": "numeric", "format": {"specifier": ".4f"}},
+            {"id": "col_den_trans", "name": "transition strength", "type": "numeric", "format": {"specifier": ".3e"}},
+        ],
+        sort_action = "native",
+        page_size = 10,
+    ),
+    dcc.Dropdown(FITS_GEOGRAPHIC_INFO["file_name"].sort_values(), id = "stack_file_selection", multi = True, placeholder = "Stack observations (select two or more files)"),
     dcc.Input(id = "smooth_width_parameter", type = "number", placeholder = "EXES Spectra Smooth Width", value = 9),
+    dcc.RadioItems(
+        id = "continuum_method",
+        options = [
+            {"label": "single normalization", "value": "none"},
+            {"label": "rolling quantile continuum", "value": "rolling_quantile"},
+            {"label": "clipped spline continuum", "value": "clipped_spline"},
+        ],
+        value = "none",
+        inline = True,
+    ),
     dcc.Input(id = "hitran_cutoff_parameter", type = "number", placeholder = "Hitran Transition Strength Cutoff", value = 1e-4),
+    # tells the user when the full spectrum's overlay was drawn with a higher cutoff than the one they entered
+    html.Div(id = "overlay_cutoff_status"),
+    html.H3(children="HITRAN Overlay Parameters"),
+    dcc.RadioItems(
+        id = "overlay_render_mode",
+        options = [
+            {"label": "one trace per isotopologue", "value": "isotopologue"},
+            {"label": "one WebGL trace per molecule", "value": "molecule"},
+        ],
+        value = "isotopologue",
+        inline = True,
+    ),
+    # the column densities at the average altitude, or averaged over the altitudes and airmasses of the flight segment (see hitran_overlay.py)
+    dcc.RadioItems(
+        id = "overlay_column_mode",
+        options = [
+            {"label": "average altitude", "value": "average_altitude"},
+            {"label": "flight segment and airmass", "value": "flight_segment"},
+        ],
+        value = "average_altitude",
+        inline = True,
+    ),
+    html.Label("Outside Temperature (C)"),
+    dcc.Slider(id = "temperature_parameter", min = -80, max = 0, step = 0.5, marks = None, updatemode = "drag", tooltip = {"placement": "bottom", "always_visible": True}),
+    html.Label("Altitude (km)"),
+    dcc.Slider(id = "altitude_parameter", min = 0, max = 15, step = 0.05, marks = None, updatemode = "drag", tooltip = {"placement": "bottom", "always_visible": True}),
+    html.Label("Latitude (deg.)"),
+    dcc.Slider(id = "latitude_parameter", min = 0, max = 60, step = 0.5, marks = None, updatemode = "drag", tooltip = {"placement": "bottom", "always_visible": True}),
     dcc.Graph(id="exp_spectra", config={"displayModeBar": True, "modeBarButtonsToAdd": ["select2d", "lasso2d"]},),
+    html.H3(children="Column Density Retrieval"),
+    html.Button("Retrieve Column Densities", id = "retrieval_button", n_clicks = 0),
+    dash_table.DataTable(
+        id = "retrieval_table",
+        data = [],
+        columns = [
+            {"id": "molecule", "name": "molecule"},
+            {"id": "scale_factor", "name": "scale factor", "type": "numeric", "format": {"specifier": ".3f"}},
+            {"id": "expected_column_density", "name": "model column density", "type": "numeric", "format": {"specifier": ".3e"}},
+            {"id": "retrieved_column_density", "name": "retrieved column density", "type": "numeric", "format": {"specifier": ".3e"}},
+        ],
+    ),
+    html.H3(children="Molecule Detection"),
+    html.Button("Detect Molecules", id = "detection_button", n_clicks = 0),
+    dash_table.DataTable(
+        id = "detection_table",
+        data = [],
+        columns = [
+            {"id": "name", "name": "name"},
+            {"id": "level", "name": "level"},
+            {"id": "line_count", "name": "lines"},
+            {"id": "significance", "name": "significance (sigma)", "type": "numeric", "format": {"specifier": ".1f"}},
+            {"id": "correlation", "name": "correlation", "type": "numeric", "format": {"specifier": ".3f"}},
+            {"id": "wavenumber_shift", "name": "wavenumber shift (cm^-1)", "type": "numeric", "format": {"specifier": ".4f"}},
+        ],
+        sort_action = "native",
+    ),
+    html.H3(children="Equivalent Widths"),
+    html.Button("Measure Equivalent Widths", id = "equivalent_width_button", n_clicks = 0),
+    html.Div(id = "equivalent_width_status"),
+    dash_table.DataTable(
+        id = "equivalent_width_table",
+        data = [],
+        columns = [
+            {"id": "center", "name": "center (cm^-1)", "type": "numeric", "format": {"specifier": ".4f"}},
+            {"id": "prominence", "name": "prominence", "type": "numeric", "format": {"specifier": ".3f"}},
+            {"id": "equivalent_width", "name": "equivalent width (cm^-1)", "type": "numeric", "format": {"specifier": ".3e"}},
+            {"id": "equivalent_width_uncertainty", "name": "uncertainty (cm^-1)", "type": "numeric", "format": {"specifier": ".1e"}},
+            {"id": "isotopologue", "name": "assigned line"},
+            {"id": "line_wavenumber", "name": "line wavenumber (cm^-1)", "type": "numeric", "format": {"specifier": ".4f"}},
+            {"id": "col_den_trans", "name": "expected strength", "type": "numeric", "format": {"specifier": ".3e"}},
+            {"id": "strength_ratio", "name": "measured / expected", "type": "numeric", "format": {"specifier": ".3f"}},
+            {"id": "strength_ratio_uncertainty", "name": "ratio uncertainty", "type": "numeric", "format": {"specifier": ".3f"}},
+        ],
+        sort_action = "native",
+        filter_action = "native",
+        page_size = 20,
+    ),
+    dcc.Store(id="selected_spectra_data"),
+    # the spectrum this client's spectra figure was built from (file name, smooth width, and continuum method), None while there isn't one
+    dcc.Store(id = "loaded_spectrum"),
+    # the files that are being prefetched
+    dcc.Store(id = "prefetch_status"),
     html.H3(children="Line of Best Fit Tuning Parameters"),
     dcc.Input(id="baseline_parameter", type="number", placeholder="spectra baseline", value=1),
     dcc.Input(id="height_parameter", type="number", placeholder="height input", value=0.9),
     dcc.Input(id="prominence_parameter", type="number", placeholder="prominence input"),
     dcc.Input(id="distance_parameter", type="number", placeholder="distance input"),
     dcc.Graph(id="spectra_peaks", config={}),
+    # the key of the spectrum and selection this client's peaks figure was built from (see "get_peaks_figure_key()"), None unless the figure ends with the identified peaks
+    dcc.Store(id = "peaks_figure_key"),
     dash_table.DataTable(
         id="dynamic_table",
         data=[],
@@ -203,96 +647,279 @@ app.layout = [
             }
         },
     ),
+    dcc.Checklist(
+        id = "fit_options",
+        options = [
+            {"label": "weight by flux uncertainty", "value": "weighted"},
+            {"label": "freeze unchanged peaks when refitting", "value": "freeze"},
+            {"label": "bootstrap confidence intervals", "value": "bootstrap"},
+        ],
+        value = ["weighted", "freeze"],
+    ),
+    html.Div(id = "fit_report"),
     dcc.Graph(id="spectra_fit"),
+    dcc.Store(id = "last_fit"),
+    dash_table.DataTable(
+        id = "fit_parameters_table",
+        data = [],
+        columns = [
+            {"id": "parameter", "name": "parameter"},
+            {"id": "value", "name": "value", "type": "numeric", "format": {"specifier": ".6g"}},
+            {"id": "standard_error", "name": "standard error", "type": "numeric", "format": {"specifier": ".3g"}},
+            {"id": "ci_lower", "name": "95% CI lower", "type": "numeric", "format": {"specifier": ".6g"}},
+            {"id": "ci_upper", "name": "95% CI upper", "type": "numeric", "format": {"specifier": ".6g"}},
+        ],
+    ),
+    html.H3(children = "Saved Results"),
+    html.Button("Save Fit", id = "save_fit_button"),
+    html.Div(id = "save_fit_status"),
+    dcc.Dropdown(id = "saved_fit_selection", options = [], placeholder = "Previous fits of the selected observation"),
+    html.Button("Load Fit", id = "load_fit_button"),
+    dcc.Graph(id = "saved_fit_graph"),
+    dash_table.DataTable(
+        id = "saved_peaks_table",
+        data = [],
+        columns = [
+            {"id": "peak_number", "name": "peak"},
+            {"id": "peak_model", "name": "model"},
+            {"id": "center", "name": "center", "type": "numeric", "format": {"specifier": ".5f"}},
+            {"id": "fwhm", "name": "FWHM", "type": "numeric", "format": {"specifier": ".4g"}},
+            {"id": "amplitude", "name": "amplitude", "type": "numeric", "format": {"specifier": ".4g"}},
+            {"id": "isotopologue", "name": "assigned isotopologue"},
+            {"id": "line_wavenumber", "name": "line wavenumber", "type": "numeric", "format": {"specifier": ".5f"}},
+            {"id": "col_den_trans", "name": "transition strength", "type": "numeric", "format": {"specifier": ".3e"}},
+        ],
+        sort_action = "native",
+    ),
 ]
 
 
-# callback for hoverdata, map formatting, and experiment info
-@app.callback(
+# clientside callback that filters the map down to the markers of the selected objects (see assets/map_filter.js)
+# it also runs when a new catalog arrives, so the new map is filtered the same way
+app.clientside_callback(
+    ClientsideFunction(namespace = "map", function_name = "filter_observations"),
     Output("exps_map", "figure"),
-    # Input("exps_map", "clickData"),
-    Input("observation_selection", "value")
+    Input("observation_selection", "value"),
+    Input("map_catalog", "data"),
 )
-def on_geo_map_click(dropdown_data):
 
-    if dropdown_data is not None:
-        dropdown_data_condition = FITS_GEOGRAPHIC_INFO["object"].isin(dropdown_data)
-    else:
-        dropdown_data_condition = FITS_GEOGRAPHIC_INFO == FITS_GEOGRAPHIC_INFO
 
-    fig = px.scatter_geo(
-        FITS_GEOGRAPHIC_INFO[dropdown_data_condition],
-        lat="latitude",
-        lon="longitude",
-        hover_name="file_name",
-        hover_data={
-            "object": True,
-            "wavelength_range": True,
-            "avg_altitude": True,
-            "temperature": True,
-        },
-        color = "avg_altitude",
-        color_continuous_scale = "Viridis",
-        projection="mercator",  # scope = "usa" does not have a mercator projection, so nothing is displayed when this parameter is used
-        title="SOFIA Experiment Locations",
+# callback to send the new catalog (map, objects, and files) to the browser after the watcher changed it, without reloading the page
+# nothing is sent while the page's catalog is still the current one
+@app.callback(
+    Output("map_catalog", "data"),
+    Output("observation_selection", "options"),
+    Output("stack_file_selection", "options"),
+    Output("catalog_version", "data"),
+    Input("catalog_refresh_interval", "n_intervals"),
+    State("catalog_version", "data"),
+    prevent_initial_call = True,
+)
+def refresh_catalog(n_intervals, catalog_version):
+
+    if catalog_version == CATALOG_VERSION:
+        return no_update, no_update, no_update, no_update
+
+    # the version is read first, so if the catalog changes again in between, the next check sends it again (instead of missing it)
+    current_version = CATALOG_VERSION
+    catalog, map_figure = FITS_GEOGRAPHIC_INFO, MAP_FIGURE
+
+    return (
+        get_map_catalog(catalog, map_figure),
+        list(catalog["object"].sort_values().unique()),
+        list(catalog["file_name"].sort_values()),
+        current_version,
     )
-    fig.update_geos(**MAP_CONFIG)
 
-    fig.update_layout(height=600, width=1600)
 
-    return fig
+# callback to prefetch the files that are likely to be clicked next: the file under the mouse first, then the files of the selected objects
+# (with nothing selected and nothing under the mouse, the running prefetches are cancelled)
+@app.callback(
+    Output("prefetch_status", "data"),
+    Input("observation_selection", "value"),
+    Input("exps_map", "hoverData"),
+    State("smooth_width_parameter", "value"),
+    State("hitran_cutoff_parameter", "value"),
+    State("overlay_render_mode", "value"),
+    State("continuum_method", "value"),
+    State("overlay_column_mode", "value"),
+    prevent_initial_call = True,
+)
+def prefetch_likely_observations(selected_objects, hoverData, smooth_width, hitran_cutoff, overlay_render_mode, continuum_method, overlay_column_mode):
+
+    likely_file_names = []
+
+    if hoverData:
+        likely_file_names.append(hoverData["points"][0]["hovertext"])
+
+    if selected_objects:
+        likely_file_names += FITS_GEOGRAPHIC_INFO[FITS_GEOGRAPHIC_INFO["object"].isin(selected_objects)]["file_name"].tolist()
+
+    prefetched_file_names = PREFETCH_SCHEDULER.schedule(
+        likely_file_names,
+        smooth_width = smooth_width,
+        cutoff = hitran_cutoff,
+        overlay_render_mode = overlay_render_mode,
+        continuum_method = get_continuum_method(continuum_method),
+        overlay_column_mode = overlay_column_mode,
+    )
+
+    return prefetched_file_names
+
+
+# callback to search the whole archive for observations that cover a wavenumber range (and have lines of a molecule above a strength)
+@app.callback(
+    Output("search_observations_table", "data"),
+    Output("search_lines_table", "data"),
+    Input("search_button", "n_clicks"),
+    State("search_wavenumber_min", "value"),
+    State("search_wavenumber_max", "value"),
+    State("search_molecule", "value"),
+    State("search_min_strength", "value"),
+    prevent_initial_call = True,
+)
+def update_archive_search(n_clicks, wavenumber_min, wavenumber_max, molecule, min_strength):
+
+    if (wavenumber_min is None) or (wavenumber_max is None):
+        return [], []
+
+    archive_search_index = get_archive_search_index()
+
+    observations_df, lines_df = archive_search_index.search(wavenumber_min, wavenumber_max, molecule, min_strength)
+
+    observations_df = observations_df[["file_name", "object", "wavenumber_min", "wavenumber_max", "avg_altitude", "line_count", "max_col_den_trans"]]
+    lines_df = lines_df.nlargest(SEARCH_RESULT_LINE_LIMIT, "col_den_trans")
+
+    return get_table_records(observations_df), get_table_records(lines_df)
+
+
+# callback to reset the overlay sliders to the flight's ranges (ALTI_STA to ALTI_END, and around TEMP_OUT) when a new experiment is clicked
+@app.callback(
+    Output("temperature_parameter", "min"),
+    Output("temperature_parameter", "max"),
+    Output("temperature_parameter", "value"),
+    Output("altitude_parameter", "min"),
+    Output("altitude_parameter", "max"),
+    Output("altitude_parameter", "value"),
+    Output("latitude_parameter", "min"),
+    Output("latitude_parameter", "max"),
+    Output("latitude_parameter", "value"),
+    Input("exps_map", "clickData"),
+    Input("stack_file_selection", "value"),
+)
+def update_overlay_sliders(clickData, stack_file_selection):
+
+    experiment = get_selected_experiment(clickData, stack_file_selection)
+
+    if experiment is None:
+        return -80, 0, None, 0, 15, None, 0, 60, None
+
+    # a stack uses the ranges covered by all of its observations
+    experiment_file_names = list(experiment) if isinstance(experiment, tuple) else [experiment]
+    experiment_info = FITS_GEOGRAPHIC_INFO[FITS_GEOGRAPHIC_INFO["file_name"].isin(experiment_file_names)]
+
+    temperature = experiment_info["temperature"].mean()
+    start_altitude_km = experiment_info["start_altitude"].min() * FEET_TO_KILOMETERS
+    end_altitude_km = experiment_info["end_altitude"].max() * FEET_TO_KILOMETERS
+    latitude = experiment_info["latitude"].mean()
+
+    return (
+        experiment_info["temperature"].min() - 20, experiment_info["temperature"].max() + 20, temperature,
+        min(start_altitude_km, end_altitude_km) - 0.5, max(start_altitude_km, end_altitude_km) + 0.5, experiment_info["avg_altitude_km"].mean(),
+        experiment_info["latitude"].min() - 10, experiment_info["latitude"].max() + 10, latitude,
+    )
+
+
+# function returns the name an experiment (a file, or a tuple of files selected for stacking) is shown under
+# a stack is labelled by how many files went into it (its title lists the objects)
+def get_experiment_file_name(experiment):
+
+    if isinstance(experiment, (tuple, list)):
+        return "stack of " + str(len(experiment)) + " files"
+
+    return experiment
+
+# function returns the atran and experimental data traces of an experiment's spectra figure
+def get_spectra_traces(exes_dict):
+
+    spectra_df = exes_dict["dataframe"]
+
+    traces_list = []
+
+    # graph spectra data for user selected experiment
+    traces_list.append({
+        "type": "scatter",
+        "x": spectra_df["wavenumber"].to_numpy(),
+        "y": spectra_df["atran"].to_numpy(),
+        "mode": "lines+markers",
+        "marker": {"size": MARKERSIZE},
+        "name": "atran data",
+        "yaxis": "y1",
+        "line": {"color": "red"},
+    })
+
+    traces_list.append({
+        "type": "scatter",
+        "x": spectra_df["wavenumber"].to_numpy(),
+        "y": spectra_df["smooth_flux"].to_numpy(),
+        "mode": "lines+markers",
+        "marker": {"size": MARKERSIZE},
+        "name": "experimental data",
+        "yaxis": "y1",
+        "line": {"color": "black"},
+    })
+
+    return traces_list
+
+# function returns the layout of an experiment's spectra figure
+def get_spectra_layout(experiment_file_name, exes_dict):
+
+    return go.Layout(
+        title = experiment_file_name + ":  " + exes_dict["dashboard_spectrum_title"],
+        yaxis={"title": "y1 axis"},
+        yaxis2={"title": "y2 axis", "overlaying": "y", "side": "right", "type": "log"},
+    ).to_plotly_json()
 
 
 # callback to plot a specific experiment's spectra, based on the experiment on the map that the user clicks on
 @app.callback(
         Output("exp_spectra", "figure"),
+        Output("loaded_spectrum", "data"),
         Input("exps_map", "clickData"),
         Input("smooth_width_parameter", "value"),
-        Input("hitran_cutoff_parameter", "value")
+        Input("hitran_cutoff_parameter", "value"),
+        Input("temperature_parameter", "value"),
+        Input("altitude_parameter", "value"),
+        Input("latitude_parameter", "value"),
+        Input("overlay_render_mode", "value"),
+        Input("stack_file_selection", "value"),
+        Input("continuum_method", "value"),
+        Input("overlay_column_mode", "value"),
 )
-def update_graph(clickData, smooth_width, hitran_cutoff):
+def update_graph(clickData, smooth_width, hitran_cutoff, temperature, altitude_km, latitude, overlay_render_mode, stack_file_selection, continuum_method = "none", overlay_column_mode = "average_altitude"):
 
-    # this will check to see if a specific experiment on the map has been clicked and has relevant info
-    if (not clickData) or (not smooth_width):
+    # the experiment is either the file clicked on the map, or a tuple of files selected for stacking
+    experiment = get_selected_experiment(clickData, stack_file_selection)
 
-        return empty_spectra("Select an experiment from the map")
+    # this will check to see if a specific experiment on the map has been clicked and has relevant info
+    if (experiment is None) or (not smooth_width):
 
-    # intialize dictionary from click data containing info for selected experiment
-    experiment_info = clickData["points"][0]
+        return empty_spectra("Select an experiment from the map"), None
 
-    # pull the experiment file name from the dictionary
-    experiment_file_name = experiment_info["hovertext"]
+    experiment_file_name = get_experiment_file_name(experiment)
 
-    
+    # if the file is being prefetched right now, its results are about to be in the pipeline's memo
+    PREFETCH_SCHEDULER.wait_for(experiment)
 
     # filter the datafrane of FITS file dictionaries to get the user selected experiment
-    exes_dict, hitran_traces = get_all_spectra_data(experiment_file_name, smooth_width, hitran_cutoff)
+    try:
+        exes_dict, hitran_traces, overlay_parameters = get_all_spectra_data(experiment, smooth_width, hitran_cutoff, temperature, altitude_km, latitude, overlay_render_mode, get_continuum_method(continuum_method), overlay_column_mode)
+
+    except NoWavenumberOverlap as e:
+        return empty_spectra(str(e)), None
     
     
-    spectra_df = exes_dict["dataframe"]
-
-    traces_list = []
-
-    # graph spectra data for user selected experiment
-    traces_list.append(go.Scatter(
-        x=spectra_df["wavenumber"],
-        y=spectra_df["atran"],
-        mode="lines+markers",
-        marker={"size": MARKERSIZE},
-        name="atran data",
-        yaxis="y1",
-        line={"color": "red"},
-    ))
-
-    traces_list.append(go.Scatter(
-        x=spectra_df["wavenumber"],
-        y=spectra_df["smooth_flux"],
-        mode="lines+markers",
-        marker={"size": MARKERSIZE},
-        name="experimental data",
-        yaxis="y1",
-        line={"color": "black"},
-    ))
+    traces_list = get_spectra_traces(exes_dict)
 
     traces_list += hitran_traces
 
@@ -304,73 +931,201 @@ def update_graph(clickData, smooth_width, hitran_cutoff):
     print("wavenumber range:", exes_dict["wavenumber_range"])
 
 
-    layout = go.Layout(
-        title = experiment_file_name + ":  " + exes_dict["dashboard_spectrum_title"],
-        yaxis={"title": "y1 axis"},
-        yaxis2={"title": "y2 axis", "overlaying": "y", "side": "right", "type": "log"},
-    )
+    layout = get_spectra_layout(experiment_file_name, exes_dict)
+
+    loaded_spectrum = {"file_name": experiment, "smooth_width": smooth_width, "continuum_method": get_continuum_method(continuum_method), "overlay_parameters": overlay_parameters}
 
-    return {"data": traces_list, "layout": layout}
+    return {"data": get_figure_trace_list(traces_list), "layout": layout}, loaded_spectrum
 
 
-# callback to plot the user selected portion of the spectra onto a separate graph that will be used for plotting peaks, identified by scipy.signal.find_peaks()
+# callback to show the cutoff the full spectrum's overlay was drawn with, when it's higher than the user's (only the OVERLAY_LINE_LIMIT strongest lines are drawn, see hitran_cutoff_index.py)
+@app.callback(
+    Output("overlay_cutoff_status", "children"),
+    Input("loaded_spectrum", "data"),
+)
+def update_overlay_cutoff_status(loaded_spectrum):
+
+    if not loaded_spectrum:
+        return ""
+
+    cutoff = loaded_spectrum["overlay_parameters"]["cutoff"]
+    display_cutoff = loaded_spectrum["overlay_parameters"]["display_cutoff"]
+
+    if (display_cutoff is None) or (display_cutoff == cutoff):
+        return ""
+
+    return "only the " + str(OVERLAY_LINE_LIMIT) + " strongest lines are drawn over the full spectrum, so the cutoff is " + format(display_cutoff, ".3g") + " (select a window to see the weaker lines)"
+
+
+# callback to retrieve the column density of each molecule from the selected experiment, using the overlay's temperature and location
+@app.callback(
+    Output("retrieval_table", "data"),
+    Input("retrieval_button", "n_clicks"),
+    State("exps_map", "clickData"),
+    State("stack_file_selection", "value"),
+    State("temperature_parameter", "value"),
+    State("altitude_parameter", "value"),
+    State("latitude_parameter", "value"),
+    State("continuum_method", "value"),
+    State("overlay_column_mode", "value"),
+    prevent_initial_call = True,
+)
+def update_retrieval_table(n_clicks, clickData, stack_file_selection, temperature, altitude_km, latitude, continuum_method, overlay_column_mode):
+
+    retrieval_df = get_overlay_analysis_df("column_density_retrieval", clickData, stack_file_selection, temperature, altitude_km, latitude, continuum_method, overlay_column_mode)
+
+    if retrieval_df is None:
+        return []
+
+    return get_table_records(retrieval_df)
+
+
+# callback to cross-correlate the selected experiment against every molecule's and isotopologue's template spectrum
+@app.callback(
+    Output("detection_table", "data"),
+    Input("detection_button", "n_clicks"),
+    State("exps_map", "clickData"),
+    State("stack_file_selection", "value"),
+    State("temperature_parameter", "value"),
+    State("altitude_parameter", "value"),
+    State("latitude_parameter", "value"),
+    State("continuum_method", "value"),
+    State("overlay_column_mode", "value"),
+    prevent_initial_call = True,
+)
+def update_detection_table(n_clicks, clickData, stack_file_selection, temperature, altitude_km, latitude, continuum_method, overlay_column_mode):
+
+    detection_df = get_overlay_analysis_df("molecule_detection", clickData, stack_file_selection, temperature, altitude_km, latitude, continuum_method, overlay_column_mode)
+
+    if detection_df is None:
+        return []
+
+    return get_table_records(detection_df.sort_values("significance", ascending = False))
+
+
+# callback to measure the equivalent width of every peak of the selected experiment (found in the smoothed flux), and compare it to the HITRAN line it's assigned to
+@app.callback(
+    Output("equivalent_width_table", "data"),
+    Output("equivalent_width_status", "children"),
+    Input("equivalent_width_button", "n_clicks"),
+    State("exps_map", "clickData"),
+    State("stack_file_selection", "value"),
+    State("smooth_width_parameter", "value"),
+    State("temperature_parameter", "value"),
+    State("altitude_parameter", "value"),
+    State("latitude_parameter", "value"),
+    State("continuum_method", "value"),
+    State("overlay_column_mode", "value"),
+    prevent_initial_call = True,
+)
+def update_equivalent_width_table(n_clicks, clickData, stack_file_selection, smooth_width, temperature, altitude_km, latitude, continuum_method, overlay_column_mode):
+
+    if not smooth_width:
+        return [], "Set a smooth width to find the peaks with"
+
+    equivalent_width_df = get_overlay_analysis_df("equivalent_widths", clickData, stack_file_selection, temperature, altitude_km, latitude, continuum_method, overlay_column_mode, smooth_width = smooth_width)
+
+    if equivalent_width_df is None:
+        return [], ""
+
+    seconds = equivalent_width_df["seconds"].iloc[0] if len(equivalent_width_df) else 0
+
+    return get_table_records(equivalent_width_df.sort_values("prominence", ascending = False)), "measured " + str(len(equivalent_width_df)) + " peaks (" + str(int(equivalent_width_df["isotopologue"].notna().sum())) + " assigned) in " + str(round(seconds * 1000, 1)) + " ms"
+
+
+# clientside callback that filters the spectra figure down to the user's box select or lasso selection in the browser (see assets/selection_filter.js)
+app.clientside_callback(
+    ClientsideFunction(namespace = "selection", function_name = "filter_selected_traces"),
+    Output("selected_spectra_data", "data"),
+    Input("exp_spectra", "selectedData"),
+    Input("exp_spectra", "figure"),
+)
+
+
+# callback to plot the user selected portion of the spectra onto a separate graph that will be used for plotting peaks, identified by scipy.signal.find_peaks() (through the precomputed peak hierarchy)
 @app.callback(
     # inputs are apparently assigned to the function in the same order as they are written in here
     Output("spectra_peaks", "figure"),
+    Output("peaks_figure_key", "data"),
+    Input("selected_spectra_data", "data"),
     Input("exp_spectra", "selectedData"),
-    Input("exp_spectra", "figure"),
     Input("height_parameter", component_property="value"),
     Input("prominence_parameter", component_property="value"),
     Input("distance_parameter", component_property="value"),
     Input("baseline_parameter", "value"),
+    State("loaded_spectrum", "data"),
+    State("peaks_figure_key", "data"),
 )
-def update_spectra_peaks(selectedData, parent_spectra_figure, height, prominence, distance, baseline):
+def update_spectra_peaks(selected_spectra_data, selectedData, height, prominence, distance, baseline, loaded_spectrum, previous_peaks_figure_key):
 
+    # the key is only set together with a full build, which always ends with the identified peaks, and every other figure clears it,
+    # so a client with a key has a figure that the identified peaks can be patched into (without sending the figure back to find out)
     if selectedData and height:
 
-        # initialize figure values, so we can manipulate them to display the user selected data in the new graph
-        spectra_layout = parent_spectra_figure["layout"]
-        spectra_data = parent_spectra_figure["data"]
+        if not loaded_spectrum:
+            return empty_spectra("Select an experiment from the map"), None
 
-        updated_spectra_data = update_plot_axes_ranges(spectra_data, selectedData)
+        # the peaks are picked out of the local minima that were precomputed for the whole smoothed spectrum (see peak_hierarchy.py)
+        peak_hierarchy = SPECTRUM_PIPELINE.compute(["peak_hierarchy"], file_name = get_pipeline_file_name(loaded_spectrum["file_name"]), smooth_width = loaded_spectrum["smooth_width"], continuum_method = loaded_spectrum["continuum_method"])["peak_hierarchy"]
 
-        exes_peaks_df = pd.DataFrame({
+        x_lower, x_upper, y1_lower, y1_upper, y2_upper = get_selection_bounds(selectedData)
+        peak_positions = peak_hierarchy.query(x_lower, x_upper, y1_lower, y1_upper, height = height, prominence = prominence, distance = distance)
+        peaks_dataframe = peak_hierarchy.get_peaks_dataframe(peak_positions)
+
+        # if only the peak parameters changed, only the identified peaks get sent back, instead of the whole figure
+        # (as long as this client's figure was built from the same spectrum and selection)
+        peaks_figure_key = get_peaks_figure_key(loaded_spectrum, selectedData, baseline)
+
+        if (ctx.triggered_id in ["height_parameter", "prominence_parameter", "distance_parameter"]) and (previous_peaks_figure_key == peaks_figure_key):
+
+            identified_peaks = get_figure_trace_list([{"x": peaks_dataframe["wavenumber"], "y": peaks_dataframe["flux"], "name": "Identified Peaks"}])[0]
+
+            patched_figure = Patch()
+            patched_figure["data"][-1]["x"] = identified_peaks["x"]
+            patched_figure["data"][-1]["y"] = identified_peaks["y"]
+
+            return patched_figure, no_update
+
+        # the clientside callback has usually already filtered the figure down to this selection
+        if selected_spectra_data and (selected_spectra_data["selection"] == get_selection_key(selectedData)):
+
+            spectra_layout = selected_spectra_data["layout"]
+            spectra_data = selected_spectra_data["data"]
+
+        # otherwise (e.g. the request didn't come from a browser), the selection gets filtered on the server, from the spectrum in this client's "loaded_spectrum" store
+        # (the full spectrum's overlay isn't rebuilt, since it's swapped for the window's below)
+        else:
+
+            exes_dict = SPECTRUM_PIPELINE.compute(["exes_data"], file_name = get_pipeline_file_name(loaded_spectrum["file_name"]), smooth_width = loaded_spectrum["smooth_width"], continuum_method = loaded_spectrum["continuum_method"])["exes_data"]
+
+            spectra_layout = get_spectra_layout(get_experiment_file_name(loaded_spectrum["file_name"]), exes_dict)
+            spectra_data = update_plot_axes_ranges(get_spectra_traces(exes_dict), selectedData)
+
+        # the full spectrum's overlay is swapped for the selected window's detailed one
+        spectra_data = [trace for trace in spectra_data if trace.get("yaxis") != "y2"] + get_window_stem_traces(selectedData, loaded_spectrum)
+
+        exes_wavenumbers = decode_typed_array(spectra_data[1]["x"])
+
+        if len(exes_wavenumbers) == 0:
+            return empty_spectra("Select a section of the spectra that has data in it"), None
 
-            "baseline": [baseline for i in range(len(updated_spectra_data[1]["x"]))],
-            "exes_wavenumbers": updated_spectra_data[1]["x"],
-            "exes_data": updated_spectra_data[1]["y"]
-        
-        })
-        
         # we'll add in the baseline onto the plot
         spectra_data.append({
                 "type": "scatter",
                 "mode": "lines",
-                "x": exes_peaks_df["exes_wavenumbers"],
-                "y": exes_peaks_df["baseline"],
+                "x": exes_wavenumbers,
+                "y": np.full(len(exes_wavenumbers), baseline, dtype = float),
                 "name": "Baseline Flux",
                 "line": {"dash": "dash", "color": "green"}
         })
 
-        # identify the peaks within filtered spectra dataframe
-        # we need to invert the data, so that the dips become local maxima or "peaks"
-        peak_indices, peak_heights = find_peaks(
-            -1 * exes_peaks_df["exes_data"],
-            height=-height,
-            prominence=prominence,
-            distance=distance,
-        )
-
-        # peaks_dataframe = exes_peaks_df.reset_index().loc[peak_indices]
-        peaks_dataframe = exes_peaks_df.reset_index().loc[peak_indices]
-
-        # now we must append two new elements into the spectra data list: the points marking where the peaks where identified AND a dashed line for an expected baseline flux
+        # now we must append the points marking where the peaks where identified
         spectra_data.append(
             {
                 "type": "scatter",
                 "mode": "markers",
-                "x": peaks_dataframe["exes_wavenumbers"],
-                "y": peaks_dataframe["exes_data"],
+                "x": peaks_dataframe["wavenumber"],
+                "y": peaks_dataframe["flux"],
                 "name": "Identified Peaks",
                 "line": {"color": "red"}
             }
@@ -378,13 +1133,17 @@ def update_spectra_peaks(selectedData, parent_spectra_figure, height, prominence
 
 
         # manipulate x bounds for the layout object
-        spectra_layout["xaxis"]["range"] = [min(exes_peaks_df["exes_wavenumbers"]), max(exes_peaks_df["exes_wavenumbers"])]
+        spectra_layout.setdefault("xaxis", {})["range"] = [min(exes_wavenumbers), max(exes_wavenumbers)]
 
         # return new figure dictionary
-        return {"data": spectra_data, "layout": spectra_layout}
+        return {"data": get_figure_trace_list(spectra_data), "layout": spectra_layout}, peaks_figure_key
 
     else:
-        return empty_spectra("Select a section of the spectra with the box select tool or the lasso tool")
+        return empty_spectra("Select a section of the spectra with the box select tool or the lasso tool"), None
+
+# function returns True if a peaks figure (as it comes back from the browser) ends with the identified peaks
+def is_identified_peaks_figure(peaks_figure):
+    return bool(peaks_figure) and bool(peaks_figure.get("data")) and (peaks_figure["data"][-1].get("name") == "Identified Peaks")
 
 @app.callback(
         Output("dynamic_table", "data"),
@@ -392,7 +1151,7 @@ def update_spectra_peaks(selectedData, parent_spectra_figure, height, prominence
 )
 def update_table(parent_spectra_figure):
 
-    if parent_spectra_figure["data"][-1]["name"] == "Identified Peaks":
+    if is_identified_peaks_figure(parent_spectra_figure):
 
         # initialize figure objects into something easier to read and access
         spectra_data = parent_spectra_figure["data"]
@@ -400,9 +1159,9 @@ def update_table(parent_spectra_figure):
         peaks_info = spectra_data[-1]
 
         peaks_df = pd.DataFrame({
-            "wavenumber": peaks_info["x"],
-            "flux": peaks_info["y"],
-            "peak_model": ["gaussian" for peak in peaks_info["x"]]
+            "wavenumber": decode_typed_array(peaks_info["x"]),
+            "flux": decode_typed_array(peaks_info["y"]),
+            "peak_model": "gaussian",
         })
         
         return peaks_df.to_dict("records")
@@ -412,62 +1171,73 @@ def update_table(parent_spectra_figure):
 
 @app.callback(
     Output("spectra_fit", "figure"),
+    Output("fit_report", "children"),
+    Output("fit_parameters_table", "data"),
+    Output("last_fit", "data"),
     Input("spectra_peaks", "figure"),
     Input("dynamic_table", "data"),
-    Input("baseline_parameter", "value")
+    Input("baseline_parameter", "value"),
+    Input("fit_options", "value"),
+    State("peaks_figure_key", "data"),
 )
-def update_spectra_fits(parent_spectra_figure, table_data, baseline):
+def update_spectra_fits(parent_spectra_figure, table_data, baseline, fit_options = ("weighted", "freeze"), peaks_figure_key = None):
+
+    fit_options = fit_options or []
 
     # initialize figure values, so we can manipulate them to display the user selected data in the new graph
     spectra_layout = parent_spectra_figure["layout"]
     spectra_data = parent_spectra_figure["data"]
 
-    if not table_data:
+    if (not table_data) or (peaks_figure_key is None):
         
-        return empty_spectra("Ensure the correct spectra peaks are identified and that the desired peak models are selected")
+        return empty_spectra("Ensure the correct spectra peaks are identified and that the desired peak models are selected"), "", [], None
 
     exes_df = pd.DataFrame({
-        "x": spectra_data[1]["x"],
-        "y": spectra_data[1]["y"]
+        "x": decode_typed_array(spectra_data[1]["x"]),
+        "y": decode_typed_array(spectra_data[1]["y"])
     })
 
-    # intialize max height to determine the Full Width at Half Maximum (FWHM)
-    maximum_peak_height_from_baseline = (baseline - exes_df["y"]).max()
-    half_maximum = 0.5 * maximum_peak_height_from_baseline # actually no, we need to be doing this on the detected peaks, not the absolute maximum
+    file_name, smooth_width, continuum_method, selection, peaks_baseline = peaks_figure_key
 
-    # add the first model (using the baseline as the amplitude of our Horizontal Line model) into the summation of models
-    summation_model = models.Const1D(baseline)
+    # the errors of neighbouring smoothed samples are correlated (they average mostly the same flux samples), which neither 1 / uncertainty weights nor the bootstrap's noise account for,
+    # so fits that use the flux uncertainty (from the FITS file's uncertainty row) are fit to the unsmoothed flux of the selected samples, whose errors are independent
+    use_uncertainty = ("weighted" in fit_options) or ("bootstrap" in fit_options)
 
-    for peak_data in table_data:
-        
-        mean = peak_data["wavenumber"]
-        amplitude = -1 * (baseline - peak_data["flux"])
-        stddev = 0.025
+    if use_uncertainty:
+        fit_flux, uncertainty = get_selection_flux_and_uncertainty(exes_df["x"], file_name, continuum_method)
+    else:
+        fit_flux, uncertainty = exes_df["y"], None
 
-        if peak_data["peak_model"] == "gaussian":
-        
-            model = models.Gaussian1D(amplitude = amplitude, mean = mean, stddev = stddev)
-        
-        else: #peak_data["peak_model"] == "lorentzian":
+    # each selection keeps its own converged fit (the selection key is the file, smooth width, continuum, and box/lasso selection that the peaks came from, plus which flux was fit)
+    fit_key = json.dumps(peaks_figure_key + ["norm_flux" if use_uncertainty else "smooth_flux"], sort_keys = True, default = str)
 
-            model = models.Lorentz1D(amplitude = amplitude, x_0 = mean, fwhm = stddev)
+    # take line of best fit, starting from the last converged fit for this selection (with "freeze", only the changed peaks and their neighbours get re-optimized)
+    fitted_model, fit_report = SPECTRA_FIT_CACHE.fit(fit_key, exes_df["x"], fit_flux, table_data, baseline, freeze_unchanged = "freeze" in fit_options, uncertainty = uncertainty if "weighted" in fit_options else None)
 
-        summation_model += model
+    fit_parameters_df = pd.DataFrame({
+        "parameter": fitted_model.param_names,
+        "value": fitted_model.parameters,
+        "standard_error": [fit_report["standard_errors"].get(name, np.nan) for name in fitted_model.param_names],
+    })
+
+    # refit hundreds of Monte-Carlo copies of the selection on a process pool, within a time budget (the same fit reuses its last bootstrap)
+    bootstrap_report_text = ""
+    if "bootstrap" in fit_options:
 
-    # # plot the summation model for testing purposes
-    # spectra_data.append({
-    #     "type": "scatter",
-    #     "mode": "lines",
-    #     "x": exes_df["x"],
-    #     "y": summation_model(exes_df["x"]),
-    #     "name": "inferred model",
-    #     "line": {"color": "purple"}
-    # })
+        bootstrap_df, bootstrap_report = SPECTRUM_PIPELINE.compute(
+            ["fit_bootstrap"],
+            file_name = get_pipeline_file_name(file_name),
+            continuum_method = continuum_method,
+            fit_peak_models = tuple(peak_data["peak_model"] for peak_data in table_data),
+            fit_parameter_values = tuple(zip(fitted_model.param_names, map(float, fitted_model.parameters))),
+            fit_wavenumbers = tuple(map(float, exes_df["x"])),
+            fit_weighted = "weighted" in fit_options,
+        )["fit_bootstrap"]
 
-    # take line of best fit, using the fitting object and the summation model
-    fitter = fitting.TRFLSQFitter()
-    fitted_model = fitter(summation_model, exes_df["x"], exes_df["y"])
+        fit_parameters_df["ci_lower"] = bootstrap_df["ci_lower"].to_numpy()
+        fit_parameters_df["ci_upper"] = bootstrap_df["ci_upper"].to_numpy()
 
+        bootstrap_report_text = ", bootstrap: " + str(bootstrap_report["samples"]) + " refits in " + str(round(bootstrap_report["seconds"], 2)) + " s" + ("" if "fit_bootstrap" in SPECTRUM_PIPELINE.recomputed_nodes else " (reused)")
 
     # add data for the line of best fit into the spectra data object, so that it can be graphed onto the plot
     spectra_data.append({
@@ -479,11 +1249,152 @@ def update_spectra_fits(parent_spectra_figure, table_data, baseline):
         "line": {"color": "rgb(127, 46, 231)"}
     })
 
+    fit_parameter_records = get_table_records(fit_parameters_df)
+
+    fit_report_text = "refit " + str(fit_report["refit_peaks"]) + " of " + str(len(table_data)) + " peaks (" + str(fit_report["frozen_peaks"]) + " frozen) in " + str(fit_report["iterations"]) + " iterations, " + str(round(fit_report["seconds"] * 1000, 1)) + " ms" + bootstrap_report_text
+
     return {
-        "data": spectra_data,
+        "data": get_figure_trace_list(spectra_data),
         "layout": spectra_layout
+    }, fit_report_text, fit_parameter_records, {
+        # the client keeps its own last fit, so it can be saved to the results store without refitting
+        "fit_key": fit_key,
+        "peaks_figure_key": peaks_figure_key,
+        "table_data": table_data,
+        "fit_parameters": fit_parameter_records,
+        "weighted": "weighted" in fit_options,
     }
 
 
+# callback to save the last line of best fit (its peaks, parameters, and the HITRAN lines the peaks line up with) to the results store
+@app.callback(
+    Output("save_fit_status", "children"),
+    Input("save_fit_button", "n_clicks"),
+    State("temperature_parameter", "value"),
+    State("altitude_parameter", "value"),
+    State("latitude_parameter", "value"),
+    State("overlay_column_mode", "value"),
+    State("last_fit", "data"),
+    prevent_initial_call = True,
+)
+def save_fit_results(n_clicks, temperature, altitude_km, latitude, overlay_column_mode, last_fit):
+
+    if last_fit is None:
+        return "Fit some peaks before saving"
+
+    file_name, smooth_width, continuum_method, selection, baseline = last_fit["peaks_figure_key"]
+
+    file_name = get_pipeline_file_name(file_name)
+    raw_data = SPECTRUM_PIPELINE.compute(["raw_arrays"], file_name = file_name)["raw_arrays"]
+
+    temperature = raw_data["temperature"] if temperature is None else temperature
+    altitude_km = raw_data["avg_altitude_km"] if altitude_km is None else altitude_km
+    latitude = raw_data["latitude"] if latitude is None else latitude
+
+    results = SPECTRUM_PIPELINE.compute(["line_store", "column_density_strengths"], file_name = file_name, temperature = temperature, altitude_km = altitude_km, latitude = latitude, overlay_column_mode = overlay_column_mode)
+
+    # the fitted model is rebuilt from the parameter records the client kept (NaN came back from the browser as None)
+    fit_parameters_df = pd.DataFrame(last_fit["fit_parameters"])
+    fit_parameters_df = fit_parameters_df.astype({column: float for column in fit_parameters_df.columns if column != "parameter"})
+    fitted_model = get_model_from_parameters([peak_data["peak_model"] for peak_data in last_fit["table_data"]], dict(zip(fit_parameters_df["parameter"], fit_parameters_df["value"])))
+
+    # each peak is assigned to the strongest line within half of its fitted FWHM
+    peaks_df = get_fitted_peaks_dataframe(fitted_model, last_fit["table_data"])
+    assignments_df = results["line_store"].assign_peaks(peaks_df["center"], peaks_df["fwhm"] / 2, results["column_density_strengths"])
+
+    fit_id = RESULTS_STORE.save_fit(
+        file_name,
+        raw_data,
+        {
+            "fit_key": last_fit["fit_key"],
+            "smooth_width": smooth_width,
+            "continuum_method": continuum_method,
+            "selection": selection,
+            "baseline": baseline,
+            "weighted": last_fit["weighted"],
+            "overlay_temperature": temperature,
+            "overlay_altitude_km": altitude_km,
+            "overlay_latitude": latitude,
+        },
+        peaks_df,
+        fit_parameters_df,
+        assignments_df,
+    )
+
+    return "Saved fit " + str(fit_id) + " (" + str(len(peaks_df)) + " peaks, " + str(int(assignments_df["isotopologue"].notna().sum())) + " assigned)"
+
+# callback to list the saved fits of the selected observation
+@app.callback(
+    Output("saved_fit_selection", "options"),
+    Input("exps_map", "clickData"),
+    Input("stack_file_selection", "value"),
+    Input("save_fit_status", "children"),
+)
+def update_saved_fit_options(clickData, stack_file_selection, save_fit_status):
+
+    experiment = get_selected_experiment(clickData, stack_file_selection)
+
+    if experiment is None:
+        return []
+
+    fits_df = RESULTS_STORE.get_fits(experiment)
+
+    return [
+        {"label": "fit " + str(fit["fit_id"]) + ", saved " + pd.Timestamp(fit["saved_time"], unit = "s").strftime("%Y-%m-%d %H:%M:%S"), "value": fit["fit_id"]}
+        for fit in fits_df.to_dict("records")
+    ]
+
+# callback to show a saved fit on top of its selection, using the saved parameters (nothing gets refit)
+@app.callback(
+    Output("saved_fit_graph", "figure"),
+    Output("saved_peaks_table", "data"),
+    Input("load_fit_button", "n_clicks"),
+    State("saved_fit_selection", "value"),
+    prevent_initial_call = True,
+)
+def load_saved_fit(n_clicks, fit_id):
+
+    saved_fit = None if fit_id is None else RESULTS_STORE.load_fit(fit_id)
+
+    if saved_fit is None:
+        return empty_spectra("Select a saved fit to load"), []
+
+    fit = saved_fit["fit"]
+    peaks_df = saved_fit["peaks"]
+    peak_models = peaks_df["peak_model"].tolist()
+
+    fitted_model = get_model_from_parameters(peak_models, dict(zip(saved_fit["fit_parameters"]["parameter"], saved_fit["fit_parameters"]["value"])))
+
+    # the fit key starts with the file name (a list, if the fit was made on a stack) that the spectrum gets recomputed from
+    file_name = get_pipeline_file_name(json.loads(fit["fit_key"])[0])
+
+    exes_data = SPECTRUM_PIPELINE.compute(["exes_data"], file_name = file_name, smooth_width = fit["smooth_width"], continuum_method = fit["continuum_method"])["exes_data"]
+    spectra_df = exes_data["dataframe"]
+
+    selected_trace = update_plot_axes_ranges([{"x": spectra_df["wavenumber"].to_numpy(), "y": spectra_df["smooth_flux"].to_numpy()}], {"lassoPoints": fit["selection"]})[0]
+
+    # put the fit back into the fit cache, so selecting the same region with the same peaks doesn't refit either
+    table_data = peaks_df[["wavenumber", "flux", "peak_model"]].to_dict("records")
+    SPECTRA_FIT_CACHE.restore(fit["fit_key"], table_data, fit["baseline"], bool(fit["weighted"]), fitted_model, dict(zip(saved_fit["fit_parameters"]["parameter"], saved_fit["fit_parameters"]["standard_error"])))
+
+    traces_list = [
+        {"type": "scatter", "mode": "lines+markers", "marker": {"size": MARKERSIZE}, "x": selected_trace["x"], "y": selected_trace["y"], "name": "experimental data", "line": {"color": "black"}},
+        {"type": "scatter", "mode": "markers", "x": peaks_df["wavenumber"], "y": peaks_df["flux"], "name": "Identified Peaks", "line": {"color": "red"}},
+        {"type": "scatter", "mode": "lines", "x": selected_trace["x"], "y": fitted_model(selected_trace["x"]), "name": "Line of Best Fit", "line": {"color": "rgb(127, 46, 231)"}},
+    ]
+
+    saved_peaks_df = peaks_df.merge(saved_fit["assignments"][["peak_number", "isotopologue", "line_wavenumber", "col_den_trans"]], on = "peak_number", how = "left")
+
+    return {
+        "data": get_figure_trace_list(traces_list),
+        "layout": {"title": "fit " + str(fit["fit_id"]) + " of " + fit["file_name"]},
+    }, get_table_records(saved_peaks_df)
+
+
 if __name__ == "__main__":
+
+    # the debug reloader runs this file twice (a parent that restarts the server when the code changes, and the child that serves), only the child watches the directory
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_fits_watcher()
+
     app.run_server(debug=True)
@@ -0,0 +1,276 @@
+import os
+import time
+import threading
+import functools
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# READ ME:
+# Most of the hot paths have been rewritten over time (e.g. "HitranOverlay.evaluate()" replaced "get_transition_strength_for_location()"),
+# and the original implementations were kept around. Dual path mode runs both of them on the same inputs, to prove that a faster version didn't change the physics:
+#
+#   1. the accelerated function runs as usual (its output is what the caller gets, dual path mode never changes a result)
+#   2. the reference implementation runs on the same arguments
+#   3. the two outputs are diffed (arrays elementwise with np.isclose(), dictionaries, dataframes, lists and tuples entry by entry)
+#   4. every call is recorded in DUAL_PATH_RECORDS (with both timings), and every mismatch is printed along with the timing ratio
+#
+# Only numeric values are diffed: strings (e.g. the plot titles), dates, and the FITS objects are formatting, not physics,
+# and a dictionary key that only one of the outputs has is skipped (e.g. "norm_flux", which only the original "get_exes_file_data()" returns).
+#
+# The stages are switched on separately, since the references are a lot slower (see DUAL_PATH_STAGES):
+#   - with the EXES_DUAL_PATH environment variable (a comma separated list of stages, or "all"), before the modules are imported
+#   - or with "set_dual_path_stages()" at runtime
+# and each stage has its own tolerances (DUAL_PATH_TOLERANCES), since e.g. the overlay's log space evaluation can't match the original to the last bit.
+#
+# A reference that fails (raises) is recorded and printed as a mismatch, without affecting the accelerated result.
+# Decorated functions called from within a dual path run (by the accelerated function or by the reference) don't start a second run,
+# e.g. "HitranTileCache.get_strengths()" calls "HitranOverlay.evaluate()", which is only checked on its own when it's called outside of a tile_strengths run.
+#
+# dual_path_harness.py sweeps every stage over the synthetic fixtures (see synthetic_fixtures.py).
+
+# the stages that can be checked, and the accelerated function -> reference implementation each of them covers:
+#   exes_file_data         exes_info.py: "get_raw_exes_file_data()" and "get_endian_modified_exes_file_data()" -> "get_exes_file_data()"
+#   temperature_strengths  hitran_overlay.py: "HitranOverlay.evaluate_temperature_strengths()" -> "get_transition_strength_for_temp()" (hitran_molecule_info.py)
+#   transition_strengths   hitran_overlay.py: "HitranOverlay.evaluate()" -> "get_transition_strength_for_location()" (molecular_transition_strength.py)
+#   column_densities       molecular_transition_strength.py: "get_column_densities_for_locations()" -> "get_column_density_for_location()"
+#   stemplot               hitran_stemplots.py: "get_stemplot_arrays()" -> "modify_dataframe_for_graphing_stemplot()"
+#   tile_strengths         hitran_tile_cache.py: "HitranTileCache.get_strengths()" -> "HitranOverlay.evaluate()" on the observation's own line store, at the exact temperature
+DUAL_PATH_STAGES = ["exes_file_data", "temperature_strengths", "transition_strengths", "column_densities", "stemplot", "tile_strengths"]
+
+# (rtol, atol) of each stage, see np.isclose()
+DUAL_PATH_TOLERANCES = {
+    "exes_file_data": (1e-12, 0.0),
+    "temperature_strengths": (1e-9, 0.0),
+    "transition_strengths": (1e-9, 0.0),
+    "column_densities": (1e-12, 0.0),
+    "stemplot": (1e-12, 0.0),
+    # the tiles are evaluated at the center of the temperature's bin, so they're only within TILE_STRENGTH_RTOL of the exact temperature (see hitran_tile_cache.py)
+    "tile_strengths": (5e-3, 0.0),
+}
+
+DUAL_PATH_ENVIRONMENT_VARIABLE = "EXES_DUAL_PATH"
+
+# how many calls are kept in DUAL_PATH_RECORDS (the oldest ones are dropped first)
+DUAL_PATH_RECORD_LIMIT = 10000
+
+# how many of a mismatch's differences get printed
+DUAL_PATH_PRINTED_DIFFERENCE_COUNT = 3
+
+DUAL_PATH_RECORDS = deque(maxlen = DUAL_PATH_RECORD_LIMIT)
+
+# function returns the stages listed in a comma separated string ("all" for every stage)
+def get_dual_path_stages_from_string(stages_string):
+
+    stage_names = [stage.strip() for stage in stages_string.split(",") if stage.strip()]
+
+    if "all" in stage_names:
+        return list(DUAL_PATH_STAGES)
+
+    for stage in stage_names:
+        if stage not in DUAL_PATH_STAGES:
+            raise ValueError(f"Unknown dual path stage {stage!r}, expected one of {DUAL_PATH_STAGES}")
+
+    return stage_names
+
+enabled_stages = set(get_dual_path_stages_from_string(os.environ.get(DUAL_PATH_ENVIRONMENT_VARIABLE, "")))
+
+# the thread that is currently in a dual path run (so the decorated functions that the accelerated function or the reference call don't start their own run,
+# which would count their reference's time against the outer stage's accelerated function)
+dual_path_state = threading.local()
+
+# function switches dual path mode on for the given stages (and off for every other one), and optionally overrides their tolerances with {stage: (rtol, atol)}
+def set_dual_path_stages(stages, tolerances = None):
+
+    global enabled_stages
+
+    stages = get_dual_path_stages_from_string(stages) if isinstance(stages, str) else list(stages)
+
+    for stage in stages + list(tolerances or {}):
+        if stage not in DUAL_PATH_STAGES:
+            raise ValueError(f"Unknown dual path stage {stage!r}, expected one of {DUAL_PATH_STAGES}")
+
+    DUAL_PATH_TOLERANCES.update(tolerances or {})
+    enabled_stages = set(stages)
+
+def is_dual_path_stage_enabled(stage):
+    return (stage in enabled_stages) and not getattr(dual_path_state, "running", False)
+
+# function returns a numeric array for a value, or None if the value isn't numeric (strings, dates, objects)
+def get_numeric_array(value):
+
+    if isinstance(value, (str, bytes)):
+        return None
+
+    try:
+        array = np.asarray(value)
+    except (ValueError, TypeError):
+        return None
+
+    return array if array.dtype.kind in "biuf" else None
+
+# function diffs two arrays (or numbers), returns a list with one difference (or an empty list if they match within the tolerances)
+def get_array_differences(reference, optimized, rtol, atol, path):
+
+    if reference.shape != optimized.shape:
+        return [{"path": path, "reason": f"shape {optimized.shape} instead of {reference.shape}", "mismatch_count": None, "max_abs_diff": np.nan, "max_rel_diff": np.nan}]
+
+    reference = reference.astype(float)
+    optimized = optimized.astype(float)
+
+    mismatches = ~np.isclose(optimized, reference, rtol = rtol, atol = atol, equal_nan = True)
+
+    if not mismatches.any():
+        return []
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        abs_diffs = np.abs(optimized - reference)[mismatches]
+        rel_diffs = abs_diffs / np.abs(reference[mismatches])
+
+    finite_abs_diffs = abs_diffs[np.isfinite(abs_diffs)]
+    finite_rel_diffs = rel_diffs[np.isfinite(rel_diffs)]
+
+    return [{
+        "path": path,
+        "reason": "values",
+        "mismatch_count": int(mismatches.sum()),
+        "max_abs_diff": float(finite_abs_diffs.max()) if len(finite_abs_diffs) else np.nan,
+        "max_rel_diff": float(finite_rel_diffs.max()) if len(finite_rel_diffs) else np.nan,
+    }]
+
+# function diffs the outputs of a reference and an accelerated implementation, returns a list of differences (empty if they match)
+# each difference has a "path" (where in the output it is), a "reason", and for values: how many mismatched, and the largest absolute and relative difference
+def get_output_differences(reference, optimized, rtol, atol, path = "output"):
+
+    # a numeric value on one side and None on the other is a mismatch (but e.g. the archive not having an "hdu" isn't)
+    if (reference is None) or (optimized is None):
+
+        if get_numeric_array(optimized if reference is None else reference) is None:
+            return []
+
+        return [{"path": path, "reason": "missing from the " + ("reference" if reference is None else "accelerated") + " output", "mismatch_count": None, "max_abs_diff": np.nan, "max_rel_diff": np.nan}]
+
+    if isinstance(reference, dict) and isinstance(optimized, dict):
+        return [difference for key in reference if key in optimized for difference in get_output_differences(reference[key], optimized[key], rtol, atol, path + "[" + repr(key) + "]")]
+
+    if isinstance(reference, pd.DataFrame) and isinstance(optimized, pd.DataFrame):
+        return [difference for column in reference.columns if column in optimized.columns for difference in get_output_differences(reference[column].to_numpy(), optimized[column].to_numpy(), rtol, atol, path + "[" + repr(column) + "]")]
+
+    if isinstance(reference, pd.Series) or isinstance(optimized, pd.Series):
+        return get_output_differences(np.asarray(reference), np.asarray(optimized), rtol, atol, path)
+
+    reference_array = get_numeric_array(reference)
+    optimized_array = get_numeric_array(optimized)
+
+    if (reference_array is not None) and (optimized_array is not None):
+        return get_array_differences(reference_array, optimized_array, rtol, atol, path)
+
+    # lists and tuples that aren't numeric arrays (e.g. a tuple of arrays with different lengths) are diffed entry by entry
+    if isinstance(reference, (list, tuple)) and isinstance(optimized, (list, tuple)):
+
+        if len(reference) != len(optimized):
+            return [{"path": path, "reason": f"length {len(optimized)} instead of {len(reference)}", "mismatch_count": None, "max_abs_diff": np.nan, "max_rel_diff": np.nan}]
+
+        return [difference for i, (reference_item, optimized_item) in enumerate(zip(reference, optimized)) for difference in get_output_differences(reference_item, optimized_item, rtol, atol, path + "[" + str(i) + "]")]
+
+    return []
+
+# function runs the accelerated function, and (if the stage is switched on) the reference on the same arguments, diffs them, and records the call
+# always returns the accelerated function's result
+def run_dual_path(stage, optimized_function, reference_function, *args, **kwargs):
+
+    if not is_dual_path_stage_enabled(stage):
+        return optimized_function(*args, **kwargs)
+
+    rtol, atol = DUAL_PATH_TOLERANCES[stage]
+
+    dual_path_state.running = True
+
+    try:
+        start_time = time.perf_counter()
+        optimized_output = optimized_function(*args, **kwargs)
+        optimized_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+
+        try:
+            reference_output = reference_function(*args, **kwargs)
+            differences = get_output_differences(reference_output, optimized_output, rtol, atol)
+
+        except Exception as e:
+            differences = [{"path": "output", "reason": "the reference failed: " + repr(e), "mismatch_count": None, "max_abs_diff": np.nan, "max_rel_diff": np.nan}]
+
+        reference_seconds = time.perf_counter() - start_time
+
+    finally:
+        dual_path_state.running = False
+
+    record = {
+        "stage": stage,
+        "function": getattr(optimized_function, "__qualname__", repr(optimized_function)),
+        "matched": not differences,
+        "difference_count": len(differences),
+        "differences": differences,
+        "optimized_seconds": optimized_seconds,
+        "reference_seconds": reference_seconds,
+        "speedup": reference_seconds / optimized_seconds if optimized_seconds > 0 else np.inf,
+    }
+    DUAL_PATH_RECORDS.append(record)
+
+    if differences:
+        print(f"dual path mismatch in {stage} ({record['function']}): {len(differences)} difference(s), the reference took {record['speedup']:.1f}x as long as the accelerated version")
+
+        for difference in differences[:DUAL_PATH_PRINTED_DIFFERENCE_COUNT]:
+            print("   ", difference["path"] + ":", difference["reason"], "| mismatched:", difference["mismatch_count"], "| max abs diff:", difference["max_abs_diff"], "| max rel diff:", difference["max_rel_diff"])
+
+    return optimized_output
+
+# decorator that checks an accelerated function against a reference implementation (which takes the same arguments) whenever the stage is switched on
+def dual_path(stage, reference_function):
+
+    if stage not in DUAL_PATH_STAGES:
+        raise ValueError(f"Unknown dual path stage {stage!r}, expected one of {DUAL_PATH_STAGES}")
+
+    def decorator(optimized_function):
+
+        @functools.wraps(optimized_function)
+        def wrapper(*args, **kwargs):
+
+            if not is_dual_path_stage_enabled(stage):
+                return optimized_function(*args, **kwargs)
+
+            return run_dual_path(stage, optimized_function, reference_function, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+# function returns one row per stage: how many calls were checked and mismatched, the largest differences, and how much faster the accelerated version was
+def get_dual_path_summary(records = None):
+
+    records = list(DUAL_PATH_RECORDS if records is None else records)
+    rows = []
+
+    for stage in DUAL_PATH_STAGES:
+
+        stage_records = [record for record in records if record["stage"] == stage]
+
+        if not stage_records:
+            continue
+
+        differences = [difference for record in stage_records for difference in record["differences"]]
+        max_abs_diffs = [difference["max_abs_diff"] for difference in differences if np.isfinite(difference["max_abs_diff"])]
+        max_rel_diffs = [difference["max_rel_diff"] for difference in differences if np.isfinite(difference["max_rel_diff"])]
+
+        rows.append({
+            "stage": stage,
+            "calls": len(stage_records),
+            "mismatched_calls": sum(not record["matched"] for record in stage_records),
+            "max_abs_diff": max(max_abs_diffs) if max_abs_diffs else np.nan,
+            "max_rel_diff": max(max_rel_diffs) if max_rel_diffs else np.nan,
+            "optimized_seconds": sum(record["optimized_seconds"] for record in stage_records),
+            "reference_seconds": sum(record["reference_seconds"] for record in stage_records),
+            "median_speedup": float(np.median([record["speedup"] for record in stage_records])),
+        })
+
+    return pd.DataFrame(rows, columns = ["stage", "calls", "mismatched_calls", "max_abs_diff", "max_rel_diff", "optimized_seconds", "reference_seconds", "median_speedup"])
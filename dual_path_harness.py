@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+
+from synthetic_fixtures import write_synthetic_fixtures, SYNTHETIC_LINE_COUNT
+from dual_path import DUAL_PATH_STAGES, DUAL_PATH_TOLERANCES, get_dual_path_summary
+
+# READ ME:
+# This sweeps dual path mode (see dual_path.py) over a whole archive of FITS files (the synthetic fixtures in synthetic_fixtures.py, or a real directory),
+# so that a faster implementation of any of the checked stages can be shipped once the sweep comes back without mismatches.
+#
+# For every file, the sweep calls each accelerated function the way the dashboard does:
+#
+#   exes_file_data          read the FITS file (and normalize and smooth it at every width in HARNESS_SMOOTH_WIDTHS), and read it from a spectra archive (see spectra_archive.py)
+#   temperature_strengths   evaluate the file's HITRAN lines at every temperature in the sweep
+#   transition_strengths    ... at every temperature, at the file's altitude, and at the file's latitude and HARNESS_HIGH_LATITUDE (where there is no ozone column density)
+#   column_densities        the flight segment column densities at both latitudes
+#   stemplot                the stemplot arrays of the lines above HARNESS_STEMPLOT_CUTOFF
+#   tile_strengths          the pipeline's tiled strengths at the average altitude, at every temperature (the tiles are evaluated from the shared line source, not the file's own lines)
+#
+# and then runs the file through the spectrum pipeline (with a tile cache and the archive), which calls the same functions on its own slices of the lines.
+#
+# The sweep runs in a subprocess in the data directory (where HITRAN_Data and the model atmosphere table are), like the dashboard does in load_test.py.
+# The report has one row per stage (calls, mismatched calls, largest differences, and how much faster the accelerated version was),
+# and the harness exits with status 1 if anything mismatched.
+
+# the smooth widths the EXES files are normalized and smoothed with
+HARNESS_SMOOTH_WIDTHS = [None, 9]
+
+# temperatures (celsius) the lines are evaluated at, besides each file's own temperature
+# (-37.3 is between the steps of the dashboard's temperature slider, and -37.26 is between the centers of the tile cache's temperature bins, see hitran_tile_cache.py)
+HARNESS_TEMPERATURES = [-60.0, -37.3, -37.26, -20.0, 15.0]
+
+# a latitude without an ozone column density in the model atmosphere table (see "get_column_density_for_location()")
+HARNESS_HIGH_LATITUDE = 60.0
+
+HARNESS_STEMPLOT_CUTOFF = 1e-4
+
+SWEEP_SCRIPT = """
+import sys
+import json
+import dual_path_harness
+records = dual_path_harness.run_sweep(sys.argv[1], json.loads(sys.argv[2]), json.loads(sys.argv[3]), sys.argv[4])
+with open(sys.argv[5], "w") as records_file:
+    json.dump(records, records_file, default = float)
+"""
+
+# function calls every checked function for every FITS file in a directory (in this process, whose working directory has to be the data directory)
+# returns the dual path records of every call
+def run_sweep(exes_dir, stages, tolerances, archive_dir, extension = ".fits"):
+
+    # these read HITRAN_Data and the model atmosphere table from the working directory when they're imported, so they're only imported here
+    import dual_path
+    from exes_info import get_raw_exes_file_data, get_endian_modified_exes_file_data, get_exes_file_data, FEET_TO_KILOMETERS
+    from hitran_overlay import HitranOverlay, get_flight_segment_samples
+    from hitran_stemplots import get_stemplot_arrays
+    from hitran_tile_cache import HitranTileCache
+    from spectra_archive import SpectraArchive
+    from spectrum_pipeline import SpectrumPipeline
+
+    dual_path.set_dual_path_stages(stages, {stage: tuple(tolerance) for stage, tolerance in tolerances.items()})
+
+    archive = SpectraArchive(archive_dir)
+    archive.sync(exes_dir, extension)
+
+    pipeline = SpectrumPipeline(dir = exes_dir, tile_cache = HitranTileCache(), archive = archive)
+
+    for file_name in archive.get_file_names():
+
+        print("sweeping", file_name)
+
+        raw_data = get_raw_exes_file_data(file_name, exes_dir)
+
+        for smooth_width in HARNESS_SMOOTH_WIDTHS:
+            get_endian_modified_exes_file_data(file_name, smooth_width, exes_dir)
+
+        # the archive isn't one of the modules with a reference of its own, so its reads are checked against the original reader here
+        dual_path.run_dual_path("exes_file_data", archive.get_raw_data, lambda archived_file_name: get_exes_file_data(archived_file_name, None, exes_dir), file_name)
+
+        overlay = HitranOverlay(raw_data["wavenumber_range"])
+        flight_segment_samples = get_flight_segment_samples(raw_data["start_altitude"] * FEET_TO_KILOMETERS, raw_data["end_altitude"] * FEET_TO_KILOMETERS, raw_data["start_elevation_angle"], raw_data["end_elevation_angle"])
+
+        for temperature in [raw_data["temperature"]] + HARNESS_TEMPERATURES:
+
+            overlay.evaluate_temperature_strengths(temperature)
+
+            for latitude in [raw_data["latitude"], HARNESS_HIGH_LATITUDE]:
+
+                strengths = overlay.evaluate(temperature, raw_data["avg_altitude_km"], latitude)
+                overlay.get_flight_segment_column_densities(*flight_segment_samples, latitude)
+
+                above_cutoff = strengths >= HARNESS_STEMPLOT_CUTOFF
+                get_stemplot_arrays(overlay.wavenumber[above_cutoff], strengths[above_cutoff])
+
+        for temperature in HARNESS_TEMPERATURES:
+            pipeline.compute(["column_density_strengths"], file_name = file_name, temperature = temperature, altitude_km = raw_data["avg_altitude_km"], latitude = raw_data["latitude"])
+
+        for overlay_column_mode in ["average_altitude", "flight_segment"]:
+            pipeline.compute(
+                ["exes_data", "stem_traces"], file_name = file_name, smooth_width = HARNESS_SMOOTH_WIDTHS[-1], temperature = raw_data["temperature"],
+                altitude_km = raw_data["avg_altitude_km"], latitude = raw_data["latitude"], cutoff = HARNESS_STEMPLOT_CUTOFF, overlay_render_mode = "isotopologue",
+                overlay_column_mode = overlay_column_mode,
+            )
+
+    return list(dual_path.DUAL_PATH_RECORDS)
+
+# function runs the sweep in a subprocess (in "data_dir") and returns the dual path records of every call
+def run_sweep_subprocess(exes_dir, data_dir, stages, tolerances, archive_dir, log_path = os.devnull):
+
+    repository_dir = os.path.dirname(os.path.abspath(__file__))
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = repository_dir + os.pathsep + env.get("PYTHONPATH", "")
+
+    records_path = os.path.join(archive_dir, "dual_path_records.json")
+
+    with open(log_path, "w") as log_file:
+        subprocess.run(
+            [sys.executable, "-c", SWEEP_SCRIPT, os.path.abspath(exes_dir), json.dumps(stages), json.dumps(tolerances), os.path.abspath(archive_dir), records_path],
+            cwd = data_dir, env = env, stdout = log_file, stderr = subprocess.STDOUT, check = True,
+        )
+
+    with open(records_path) as records_file:
+        return json.load(records_file)
+
+# function writes the fixtures (unless an "exes_dir" is given), sweeps dual path mode over them, and returns the per stage report and every mismatch
+# ("line_count" is the number of synthetic HITRAN lines per molecule, e.g. raised to the density of the real tables to time the tile cache)
+def run_dual_path_harness(stages = DUAL_PATH_STAGES, rtol = None, atol = None, exes_dir = None, data_dir = None, label = None, log_path = os.devnull, line_count = SYNTHETIC_LINE_COUNT):
+
+    for stage in stages:
+        if stage not in DUAL_PATH_STAGES:
+            raise ValueError(f"Unknown dual path stage {stage!r}, expected one of {DUAL_PATH_STAGES}")
+
+    tolerances = {stage: (DUAL_PATH_TOLERANCES[stage][0] if rtol is None else rtol, DUAL_PATH_TOLERANCES[stage][1] if atol is None else atol) for stage in stages}
+
+    with tempfile.TemporaryDirectory() as fixture_dir:
+
+        if exes_dir is None:
+            exes_dir = write_synthetic_fixtures(fixture_dir, line_count = line_count)
+            data_dir = fixture_dir
+
+        # the sweep needs HITRAN_Data and the model atmosphere table in its working directory
+        data_dir = os.path.abspath(os.path.dirname(os.path.abspath(exes_dir)) if data_dir is None else data_dir)
+
+        archive_dir = os.path.join(fixture_dir, "EXES_Archive")
+        records = run_sweep_subprocess(exes_dir, data_dir, list(stages), tolerances, archive_dir, log_path)
+
+    report = get_dual_path_summary(records)
+
+    mismatches = pd.DataFrame(
+        [dict(difference, stage = record["stage"], function = record["function"], speedup = record["speedup"]) for record in records for difference in record["differences"]],
+        columns = ["stage", "function", "path", "reason", "mismatch_count", "max_abs_diff", "max_rel_diff", "speedup"],
+    )
+
+    if label is not None:
+        report.insert(0, "label", label)
+
+    return report, mismatches
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Run the accelerated and the reference implementations side by side over an archive of FITS files, and diff their outputs")
+    parser.add_argument("--stages", nargs = "+", default = DUAL_PATH_STAGES, help = "stages to check (see dual_path.py)")
+    parser.add_argument("--rtol", type = float, default = None, help = "relative tolerance for every stage (instead of each stage's own)")
+    parser.add_argument("--atol", type = float, default = None, help = "absolute tolerance for every stage (instead of each stage's own)")
+    parser.add_argument("--exes-directory", default = None, help = "directory of FITS files to use instead of the synthetic fixtures")
+    parser.add_argument("--data-directory", default = None, help = "directory with HITRAN_Data and the model atmosphere table (defaults to the parent of --exes-directory)")
+    parser.add_argument("--line-count", type = int, default = SYNTHETIC_LINE_COUNT, help = "synthetic HITRAN lines per molecule (ignored with --exes-directory)")
+    parser.add_argument("--label", default = None, help = "label for this run (e.g. the code version), added as a column of the report")
+    parser.add_argument("--output", default = None, help = "CSV file to append the report to")
+    parser.add_argument("--sweep-log", default = os.devnull, help = "file to write the sweep's output to")
+    arguments = parser.parse_args()
+
+    report, mismatches = run_dual_path_harness(arguments.stages, arguments.rtol, arguments.atol, arguments.exes_directory, arguments.data_directory, arguments.label, arguments.sweep_log, arguments.line_count)
+
+    print(report.to_string(index = False))
+
+    if len(mismatches):
+        print()
+        print(mismatches.to_string(index = False))
+
+    if arguments.output is not None:
+        report.to_csv(arguments.output, mode = "a", header = not os.path.exists(arguments.output), index = False)
+
+    sys.exit(1 if len(mismatches) else 0)
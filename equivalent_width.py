@@ -0,0 +1,184 @@
+import time
+import numpy as np
+import pandas as pd
+from astropy.convolution import convolve
+from astropy.convolution import Box1DKernel
+
+from continuum_estimation import get_flux_normalization
+from hitran_overlay import HitranOverlay
+from peak_hierarchy import PeakHierarchy
+from spectra_archive import get_raw_data_reader
+
+# READ ME:
+# The equivalent width of an absorption line is the area it takes out of the normalized spectrum:
+#
+#   W = integral over the line's window of (1 - flux / continuum) d(wavenumber)        (in cm^-1)
+#
+# and for an optically thin line it's the line's integrated optical depth, which is exactly what the overlay's "col_den_trans" is
+# (the line strength times the column density, also in cm^-1). So W / col_den_trans is ~1 for a weak line that the model atmosphere gets right,
+# less than 1 for a saturated line (or a column density that's too high), and more than 1 if the line is blended with something the assigned line doesn't account for.
+#
+# Every peak is measured at once, without a loop over the peaks:
+#   1. every sample gets the width of wavenumber it stands for (half the distance to each of its neighbours)
+#   2. the running sums of (1 - normalized flux) * width and (normalized uncertainty * width)^2 are computed once for the whole spectrum
+#   3. each peak's window (EQUIVALENT_WIDTH_WINDOW_FWHMS fitted FWHMs on each side of the center, cut off halfway to the neighbouring peaks so blends aren't counted twice)
+#      is two np.searchsorted() positions, and its equivalent width and uncertainty are the differences of the running sums at those positions
+#
+# The uncertainty comes from the FITS file's "uncertainty" row (normalized by the same continuum as the flux), assuming independent samples.
+# Samples without a finite flux or uncertainty are left out of the sums (and counted in "masked_sample_count").
+#
+# Each peak is assigned to the strongest HITRAN line within half of its FWHM ("HitranOverlay.assign_peaks()", the same way saved fits are assigned),
+# and "window_col_den_trans" is the total of every line within the window, for peaks that are blends of several lines.
+
+# how many FWHMs on each side of a peak's center its window reaches
+EQUIVALENT_WIDTH_WINDOW_FWHMS = 1.5
+
+# the smooth width that the peaks are found with in batch mode (the same as the dashboard's default)
+EQUIVALENT_WIDTH_SMOOTH_WIDTH = 9
+
+# function returns the width of wavenumber that each sample stands for (half the distance to each of its neighbours, the edge samples use their one neighbour on both sides)
+# "wavenumber" has to be sorted
+def get_sample_widths(wavenumber):
+
+    if len(wavenumber) < 2:
+        return np.zeros(len(wavenumber))
+
+    midpoints = (wavenumber[1:] + wavenumber[:-1]) / 2
+    edges = np.concatenate([[wavenumber[0] - (midpoints[0] - wavenumber[0])], midpoints, [wavenumber[-1] + (wavenumber[-1] - midpoints[-1])]])
+
+    return np.diff(edges)
+
+# function returns the window (lower and upper wavenumber) of each peak: "window_fwhms" FWHMs on each side, cut off halfway to the neighbouring peaks
+# "centers" has to be sorted
+def get_peak_windows(centers, fwhms, window_fwhms = EQUIVALENT_WIDTH_WINDOW_FWHMS):
+
+    half_widths = window_fwhms * np.abs(fwhms)
+    midpoints = (centers[1:] + centers[:-1]) / 2
+
+    lower = np.maximum(centers - half_widths, np.concatenate([[-np.inf], midpoints]))
+    upper = np.minimum(centers + half_widths, np.concatenate([midpoints, [np.inf]]))
+
+    return lower, upper
+
+# function returns the running sum of an array with a zero in front, so the sum over [start, stop) is "sums[stop] - sums[start]"
+def get_running_sums(values):
+    return np.concatenate([[0.0], np.cumsum(values)])
+
+# function measures the equivalent width (and its uncertainty) of every peak, and compares it to the HITRAN line each peak is assigned to
+# "centers" and "fwhms" are the peaks' wavenumbers and widths (in cm^-1), and "line_strengths" are the evaluated "col_den_trans" of every line of the overlay
+# returns a dataframe with one row per peak (in wavenumber order)
+def measure_equivalent_widths(wavenumber, norm_flux, norm_uncertainty, centers, fwhms, overlay, line_strengths, window_fwhms = EQUIVALENT_WIDTH_WINDOW_FWHMS):
+
+    start_time = time.perf_counter()
+
+    wavenumber = np.asarray(wavenumber, dtype = float)
+    norm_flux = np.asarray(norm_flux, dtype = float)
+    norm_uncertainty = np.asarray(norm_uncertainty, dtype = float)
+
+    # the sums need the samples in wavenumber order
+    finite_wavenumbers = np.isfinite(wavenumber)
+    wavenumber_order = np.argsort(wavenumber[finite_wavenumbers], kind = "stable")
+
+    wavenumber = wavenumber[finite_wavenumbers][wavenumber_order]
+    norm_flux = norm_flux[finite_wavenumbers][wavenumber_order]
+    norm_uncertainty = norm_uncertainty[finite_wavenumbers][wavenumber_order]
+
+    usable_samples = np.isfinite(norm_flux) & np.isfinite(norm_uncertainty)
+    sample_widths = get_sample_widths(wavenumber)
+
+    absorbed_area_sums = get_running_sums(np.where(usable_samples, (1 - np.where(usable_samples, norm_flux, 1)) * sample_widths, 0))
+    variance_sums = get_running_sums(np.where(usable_samples, (np.where(usable_samples, norm_uncertainty, 0) * sample_widths) ** 2, 0))
+    masked_sample_sums = get_running_sums(~usable_samples)
+
+    # the peaks in wavenumber order
+    centers = np.asarray(centers, dtype = float)
+    fwhms = np.asarray(fwhms, dtype = float)
+
+    peak_order = np.argsort(centers, kind = "stable")
+    centers = centers[peak_order]
+    fwhms = fwhms[peak_order]
+
+    window_lower, window_upper = get_peak_windows(centers, fwhms, window_fwhms)
+
+    window_start = np.searchsorted(wavenumber, window_lower, side = "left")
+    window_stop = np.searchsorted(wavenumber, window_upper, side = "right")
+
+    equivalent_widths = absorbed_area_sums[window_stop] - absorbed_area_sums[window_start]
+    equivalent_width_uncertainties = np.sqrt(np.maximum(variance_sums[window_stop] - variance_sums[window_start], 0))
+
+    # the HITRAN line each peak is assigned to, and the total of every line within its window
+    assignments_df = overlay.assign_peaks(centers, fwhms / 2, line_strengths)
+
+    line_strength_sums = get_running_sums(np.where(np.isfinite(line_strengths), line_strengths, 0))
+    window_line_strengths = line_strength_sums[np.searchsorted(overlay.wavenumber, window_upper, side = "right")] - line_strength_sums[np.searchsorted(overlay.wavenumber, window_lower, side = "left")]
+
+    expected_strengths = assignments_df["col_den_trans"].to_numpy(dtype = float)
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        strength_ratios = np.where(expected_strengths > 0, equivalent_widths / expected_strengths, np.nan)
+        strength_ratio_uncertainties = np.where(expected_strengths > 0, equivalent_width_uncertainties / expected_strengths, np.nan)
+
+    return pd.DataFrame({
+        "center": centers,
+        "fwhm": fwhms,
+        "window_lower": window_lower,
+        "window_upper": window_upper,
+        "sample_count": window_stop - window_start,
+        "masked_sample_count": masked_sample_sums[window_stop] - masked_sample_sums[window_start],
+        "equivalent_width": equivalent_widths,
+        "equivalent_width_uncertainty": equivalent_width_uncertainties,
+        "molecule": assignments_df["molecule"].to_numpy(),
+        "isotopologue": assignments_df["isotopologue"].to_numpy(),
+        "line_wavenumber": assignments_df["line_wavenumber"].to_numpy(dtype = float),
+        "col_den_trans": expected_strengths,
+        "window_col_den_trans": window_line_strengths,
+        "strength_ratio": strength_ratios,
+        "strength_ratio_uncertainty": strength_ratio_uncertainties,
+        "seconds": time.perf_counter() - start_time,
+    })
+
+# function measures the equivalent width of every peak of a peak hierarchy (see peak_hierarchy.py), with the peaks' prominences added to the result
+def measure_peak_hierarchy_equivalent_widths(wavenumber, norm_flux, norm_uncertainty, peak_hierarchy, overlay, line_strengths, window_fwhms = EQUIVALENT_WIDTH_WINDOW_FWHMS):
+
+    equivalent_width_df = measure_equivalent_widths(wavenumber, norm_flux, norm_uncertainty, peak_hierarchy.peak_wavenumber, peak_hierarchy.peak_fwhm, overlay, line_strengths, window_fwhms)
+
+    # the hierarchy's peaks are already in wavenumber order, so they line up with the rows
+    equivalent_width_df.insert(2, "prominence", peak_hierarchy.peak_prominence)
+
+    return equivalent_width_df
+
+# function measures the equivalent widths for a dictionary returned by "get_raw_exes_file_data()" (or a stack), finding the peaks in the flux smoothed with "smooth_width"
+def measure_equivalent_widths_for_raw_data(raw_data, overlay = None, temperature = None, altitude_km = None, latitude = None, continuum_method = None, smooth_width = EQUIVALENT_WIDTH_SMOOTH_WIDTH):
+
+    if overlay is None:
+        overlay = HitranOverlay(raw_data["wavenumber"])
+
+    # a single normalization value, or the estimated continuum at every sample (see continuum_estimation.py)
+    norm = get_flux_normalization(raw_data, continuum_method)
+
+    norm_flux = raw_data["flux"] / norm
+    line_strengths = overlay.evaluate(
+        raw_data["temperature"] if temperature is None else temperature,
+        raw_data["avg_altitude_km"] if altitude_km is None else altitude_km,
+        raw_data["latitude"] if latitude is None else latitude,
+    )
+
+    return measure_peak_hierarchy_equivalent_widths(raw_data["wavenumber"], norm_flux, raw_data["uncertainty"] / norm, PeakHierarchy(raw_data["wavenumber"], convolve(norm_flux, Box1DKernel(smooth_width), preserve_nan = True)), overlay, line_strengths)
+
+# function measures the equivalent widths over every FITS file in a directory (read from "archive" if one is given), and returns one dataframe with a row per file and peak
+def measure_equivalent_widths_for_archive(dir = "EXES_Files", extension = ".fits", continuum_method = None, smooth_width = EQUIVALENT_WIDTH_SMOOTH_WIDTH, archive = None):
+
+    equivalent_width_dfs = []
+
+    file_names, read_raw_data = get_raw_data_reader(dir, extension, archive)
+
+    for file_name in file_names:
+
+        raw_data = read_raw_data(file_name)
+
+        equivalent_width_df = measure_equivalent_widths_for_raw_data(raw_data, continuum_method = continuum_method, smooth_width = smooth_width)
+        equivalent_width_df.insert(0, "file_name", file_name)
+
+        equivalent_width_dfs.append(equivalent_width_df)
+
+    return pd.concat(equivalent_width_dfs, ignore_index = True) if equivalent_width_dfs else pd.DataFrame()
@@ -0,0 +1,90 @@
+import os
+import astropy.io.fits as fits
+import numpy as np
+import pandas as pd
+
+from exes_info import get_exes_header_info
+
+# READ ME:
+# The catalog is a small table with one row per FITS file: the header info (object, location, altitude, temperature, date)
+# plus the wavenumber range the file covers, so that questions about the whole archive can be answered without loading any spectra.
+#
+# Building a row only reads the header and the wavenumber row of the file (through a memory map),
+# instead of reading, normalizing and smoothing the whole spectrum like "get_exes_file_data()" does.
+#
+# When files arrive in (or change in, or leave) the directory while the dashboard is running (see fits_watcher.py),
+# "update_exes_catalog()" only reads the headers of those files and keeps every other row as it is.
+
+# the columns of the catalog
+CATALOG_COLUMNS = ["file_name", "object", "latitude", "longitude", "start_altitude", "end_altitude", "avg_altitude", "avg_altitude_km", "temperature", "telescope_elevation_angle", "date", "wavenumber_min", "wavenumber_max", "wavelength_range", "sample_count", "modified_time"]
+
+# function builds the catalog row for a single FITS file
+def get_exes_catalog_row(file_name, dir = "EXES_Files"):
+
+    path = dir + "/" + file_name
+
+    with fits.open(path, memmap = True) as hdulist:
+        primary_header = hdulist[0].header
+        wavenumber = np.array(hdulist[0].data[0], dtype = float)
+
+    return get_catalog_row_from_header(file_name, primary_header, wavenumber, os.path.getmtime(path))
+
+# function builds a catalog row from a file's header (anything "get_exes_header_info()" can read, e.g. a dictionary of its cards) and wavenumber row
+def get_catalog_row_from_header(file_name, primary_header, wavenumber, modified_time):
+
+    wavenumber = wavenumber[np.isfinite(wavenumber)]
+    header_info = get_exes_header_info(primary_header)
+
+    return {
+        "file_name": file_name,
+        "object": header_info["object"],
+        "latitude": header_info["latitude"],
+        "longitude": header_info["longitude"],
+        "start_altitude": header_info["start_altitude"], # altitude is in units of feet
+        "end_altitude": header_info["end_altitude"],
+        "avg_altitude": header_info["avg_altitude"],
+        "avg_altitude_km": header_info["avg_altitude_km"], # altitude is in units of kilometers
+        "temperature": header_info["temperature"],
+        "telescope_elevation_angle": header_info["telescope_elevation_angle"],
+        "date": header_info["date"],
+        "wavenumber_min": np.min(wavenumber),
+        "wavenumber_max": np.max(wavenumber),
+        "wavelength_range": [10000.0 / np.max(wavenumber), 10000.0 / np.min(wavenumber)],
+        "sample_count": len(wavenumber),
+        "modified_time": modified_time,
+    }
+
+# function builds the catalog for every FITS file in a directory
+def get_exes_catalog(dir = "EXES_Files", extension = ".fits"):
+
+    file_names = sorted(file for file in os.listdir(dir) if file.endswith(extension))
+
+    catalog = pd.DataFrame([get_exes_catalog_row(file_name, dir) for file_name in file_names])
+
+    if catalog.empty:
+        return pd.DataFrame(columns = CATALOG_COLUMNS)
+
+    return catalog
+
+# function updates a catalog for the files that were added, changed, or removed, reading only the headers of the added and changed files
+# returns the updated catalog, and the files that couldn't be read (e.g. still being written), which are left out until they can be
+def update_exes_catalog(catalog, added, changed, removed, dir = "EXES_Files"):
+
+    new_rows = []
+    failed_file_names = []
+
+    for file_name in list(added) + list(changed):
+        try:
+            new_rows.append(get_exes_catalog_row(file_name, dir))
+        except (OSError, ValueError, TypeError, IndexError, KeyError):
+            failed_file_names.append(file_name)
+
+    # the old rows of changed and removed files are dropped (changed files that can't be read yet keep their old row)
+    # an added file can already have a row if it's being retried (e.g. it was read here, but not into the spectra archive)
+    dropped_file_names = set(removed) | ((set(added) | set(changed)) - set(failed_file_names))
+    kept_catalog = catalog[~catalog["file_name"].isin(dropped_file_names)]
+
+    if new_rows:
+        kept_catalog = pd.concat([kept_catalog, pd.DataFrame(new_rows)], ignore_index = True)
+
+    return kept_catalog.sort_values("file_name").reset_index(drop = True), failed_file_names
@@ -5,6 +5,8 @@ from astropy.convolution import convolve
 from astropy.convolution import Box1DKernel
 import datetime,pytz
 
+from dual_path import dual_path
+
 MONTH_CONVERT = {1: "January", 2: "February", 3: "March", 4: "April", 5: "May", 6: "June", 7: "July", 8: "August", 9: "September", 10: "October", 11: "November", 12: "Decmeber"}
 
 # converts altitude from feet to kilometers
@@ -121,20 +123,42 @@ def get_exes_file_data(file_name, smooth_width = 9, dir = "EXES_Files"):
 # so if you don't know which function to use, both will probably work fine, but this one is probably a safer bet than get_exes_file_data()
 
 # TLDR: this does the same thing as "get_exes_file_data()", but it prevents a bug from occuring when the FITS data is stored in a pandas dataframe
+# (dual path mode can check it against "get_exes_file_data()", see dual_path.py)
+@dual_path("exes_file_data", get_exes_file_data)
 def get_endian_modified_exes_file_data(file_name, smooth_width = 9, dir = "EXES_Files"):
 
+    # initialize the raw arrays and header info (the arrays have already been switched to little endian)
+    raw_data = get_raw_exes_file_data(file_name, dir)
+
+    # calculate the values for normalized flux
+    norm = get_fluxnorm(raw_data["flux"], raw_data["atran"])
+    norm_flux = raw_data["flux"]/norm
+
+    if(smooth_width is not None):
+        # convolve flux if a smooth width is given
+        smooth_flux = convolve(norm_flux, Box1DKernel(smooth_width), preserve_nan = True)
+    else: smooth_flux = None
+
+    return get_exes_file_data_with_flux(raw_data, norm_flux, smooth_flux)
+
+# function does the same thing as "get_raw_exes_file_data()" with the original "get_exes_file_data()", for dual path mode (see dual_path.py)
+def get_reference_raw_exes_file_data(file_name, dir = "EXES_Files"):
+    return get_exes_file_data(file_name, smooth_width = None, dir = dir)
+
+# function pulls the arrays and header info out of a FITS file, without normalizing or smoothing anything
+# any big endian arrays are switched into the native byte order (see the comment above "get_endian_modified_exes_file_data()")
+@dual_path("exes_file_data", get_reference_raw_exes_file_data)
+def get_raw_exes_file_data(file_name, dir = "EXES_Files"):
+
     # initialize full path name
     path = dir + "/" + file_name
-    # print("\n", path, "\n")
 
-    hdulist = fits.open(path)
-    primary_hdu = hdulist[0]
-    primary_header = primary_hdu.header
-    primary_data = primary_hdu.data
+    with fits.open(path) as hdulist:
+        primary_hdu = hdulist[0]
+        primary_header = primary_hdu.header
 
-    #check to see if its big endian
-    if primary_data.dtype.byteorder == '>' : 
-        primary_data = primary_data.byteswap().newbyteorder()
+        # copying the data into a native byte order array also works with numpy versions that removed "ndarray.newbyteorder()"
+        primary_data = np.array(primary_hdu.data, dtype = primary_hdu.data.dtype.newbyteorder("="))
 
     wavenumber = primary_data[0]
     flux = primary_data[1]
@@ -144,27 +168,30 @@ def get_endian_modified_exes_file_data(file_name, smooth_width = 9, dir = "EXES_
     # calculate the wavelengths for each wavenumber
     wavelength = 10000.0 / wavenumber
 
-    # calculate the values for normalized flux
-    norm = get_fluxnorm(flux, atran)
-    norm_flux = flux/norm
-
-    if(smooth_width is not None):
-        # convolve flux if a smooth width is given
-        smooth_flux = convolve(norm_flux, Box1DKernel(smooth_width), preserve_nan = True)
-    else: smooth_flux = None
-
-    df = pd.DataFrame({
+    # return information as a dictionary
+    return {
+        "hdu": primary_hdu,
+        "header": primary_header,
+        "data": primary_data,
         "wavenumber": wavenumber,
-        "atran": atran,
+        "wavenumber_range":[min(wavenumber), max(wavenumber)],
         "flux": flux,
+        "atran": atran,
         "uncertainty": uncertainty,
-        "norm_flux": norm_flux,
-        "smooth_flux": smooth_flux,
-    })
+        "wavelength": wavelength,
+        "wavelength_range": [min(wavelength), max(wavelength)],
+        **get_exes_header_info(primary_header),
+    }
+
+# function pulls the useful header info (object, location, altitude, temperature, date, and the titles built from them) out of a FITS header
+def get_exes_header_info(primary_header):
 
     # initialize useful header info
     obj = primary_header["OBJECT"]
     TELEL = primary_header["TELEL"]
+    # the elevation at the start and end of the integration (from the zenith angles, if the file has them)
+    TELEL_STA = 90 - primary_header["ZA_START"] if "ZA_START" in primary_header else TELEL
+    TELEL_END = 90 - primary_header["ZA_END"] if "ZA_END" in primary_header else TELEL
     lat = primary_header['LAT_STA']
     lon = primary_header['LON_STA']
     ALTI_END = primary_header['ALTI_END']
@@ -190,23 +217,7 @@ def get_endian_modified_exes_file_data(file_name, smooth_width = 9, dir = "EXES_
     # create a neatly organized list for the map table's "cellText" argument
     map_table_array = [obj, str(TELEL) + "\N{DEGREE SIGN} ", str(avg_ALTI) + "ft f", str(round(-1 * lon, 3)) + "\N{DEGREE SIGN}W, " + str(round(lat, 3)) + "\N{DEGREE SIGN}N"]
 
-    hdulist.close()
-
-    # return information as a dictionary
     return {
-        "hdu": primary_hdu,
-        "header": primary_header,
-        "data": primary_data,
-        "wavenumber": wavenumber,
-        "wavenumber_range":[min(wavenumber), max(wavenumber)],
-        "flux": flux,
-        "atran": atran,
-        "dataframe": df,
-        "norm_flux": norm_flux,
-        "smooth_flux": smooth_flux,
-        "uncertainty": uncertainty,
-        "wavelength": wavelength,
-        "wavelength_range": [min(wavelength), max(wavelength)],
         "object": obj,
         "latitude": lat,
         "longitude": lon,
@@ -216,10 +227,25 @@ def get_endian_modified_exes_file_data(file_name, smooth_width = 9, dir = "EXES_
         "avg_altitude_km": avg_ALTI_kilometers, # altitude is in units of kilometers
         "temperature": Tout,
         "telescope_elevation_angle": TELEL,
+        "start_elevation_angle": TELEL_STA,
+        "end_elevation_angle": TELEL_END,
         "map_table_array": map_table_array,
         "spectrum_title": spectrum_title,
         "dashboard_spectrum_title": dashboard_spectrum_title,
         "date": date
     }
 
-  
\ No newline at end of file
+# function adds the normalized and smoothed flux (and the dataframe that the dashboard uses) onto the dictionary returned by "get_raw_exes_file_data()"
+# the result has the same keys as the dictionary returned by "get_endian_modified_exes_file_data()"
+def get_exes_file_data_with_flux(raw_data, norm_flux, smooth_flux):
+
+    df = pd.DataFrame({
+        "wavenumber": raw_data["wavenumber"],
+        "atran": raw_data["atran"],
+        "flux": raw_data["flux"],
+        "uncertainty": raw_data["uncertainty"],
+        "norm_flux": norm_flux,
+        "smooth_flux": smooth_flux,
+    })
+
+    return dict(raw_data, dataframe = df, norm_flux = norm_flux, smooth_flux = smooth_flux)
@@ -0,0 +1,178 @@
+import astropy.io.fits as fits
+import numpy as np
+
+from exes_info import get_raw_exes_file_data, get_fluxnorm, FEET_TO_KILOMETERS, MONTH_CONVERT
+
+# READ ME:
+# These functions co-add several EXES observations (e.g. of the same object) into a single, less noisy spectrum.
+#
+# 1. A common wavenumber grid is built over the range that every observation covers, spaced like the coarsest observation.
+# 2. Each observation is normalized (the same way as "get_endian_modified_exes_file_data()") and resampled onto the grid with np.interp().
+# 3. The resampled spectra are co-added with inverse-variance weights (1 / uncertainty^2) from each FITS file's "uncertainty" row.
+#
+# The files are streamed through one at a time (and the grid is resampled in chunks), so only the running sums and a single file are ever held in memory,
+# no matter how many observations are stacked.
+#
+# The result has the same keys as "get_raw_exes_file_data()", so the rest of the dashboard treats a stack like any other observation.
+#
+# "archive" can be a SpectraArchive (see spectra_archive.py), in which case the files are read from its memory map instead of from the FITS files.
+
+# how many grid points get resampled at once
+STACK_CHUNK_SIZE = 65536
+
+# function reads only the wavenumber row of a FITS file
+def get_exes_file_wavenumbers(file_name, dir = "EXES_Files"):
+
+    path = dir + "/" + file_name
+
+    with fits.open(path, memmap = True) as hdulist:
+        wavenumber = np.array(hdulist[0].data[0], dtype = float)
+
+    return wavenumber[np.isfinite(wavenumber)]
+
+# function builds a wavenumber grid over the range covered by every one of the files, using the coarsest sample spacing of the files
+def get_common_wavenumber_grid(file_names, dir = "EXES_Files", archive = None):
+
+    lower_wavenumber = -np.inf
+    upper_wavenumber = np.inf
+    spacing = 0
+
+    for file_name in file_names:
+
+        if (archive is not None) and (file_name in archive):
+            wavenumber = archive.get_spectrum(file_name)[0]
+            wavenumber = wavenumber[np.isfinite(wavenumber)]
+        else:
+            wavenumber = get_exes_file_wavenumbers(file_name, dir)
+
+        lower_wavenumber = max(lower_wavenumber, np.min(wavenumber))
+        upper_wavenumber = min(upper_wavenumber, np.max(wavenumber))
+        spacing = max(spacing, np.median(np.abs(np.diff(wavenumber))))
+
+    if lower_wavenumber >= upper_wavenumber:
+        raise NoWavenumberOverlap(f"The observations {list(file_names)} don't share any wavenumbers, so they can't be stacked", 400)
+
+    grid_length = int(np.floor((upper_wavenumber - lower_wavenumber) / spacing)) + 1
+
+    return lower_wavenumber + spacing * np.arange(grid_length)
+
+# function co-adds several observations onto a common wavenumber grid with inverse-variance weights
+def stack_exes_observations(file_names, dir = "EXES_Files", chunk_size = STACK_CHUNK_SIZE, archive = None):
+
+    file_names = list(file_names)
+    grid = get_common_wavenumber_grid(file_names, dir, archive)
+
+    # running sums (these are the only arrays that are kept while the files are streamed through)
+    weighted_flux_sum = np.zeros(len(grid))
+    weight_sum = np.zeros(len(grid))
+    atran_sum = np.zeros(len(grid))
+    atran_count = np.zeros(len(grid))
+
+    header_info = []
+
+    for file_name in file_names:
+
+        if (archive is not None) and (file_name in archive):
+            raw_data = archive.get_raw_data(file_name)
+        else:
+            raw_data = get_raw_exes_file_data(file_name, dir)
+
+        # normalize the flux (and its uncertainty) so that observations with different flux levels can be added together
+        norm = get_fluxnorm(raw_data["flux"], raw_data["atran"])
+
+        wavenumber = raw_data["wavenumber"]
+        norm_flux = raw_data["flux"] / norm
+        norm_uncertainty = raw_data["uncertainty"] / norm
+        atran = raw_data["atran"]
+
+        # np.interp() needs the wavenumbers to be finite and increasing
+        finite_wavenumbers = np.isfinite(wavenumber)
+        wavenumber_order = np.argsort(wavenumber[finite_wavenumbers], kind = "stable")
+
+        wavenumber = wavenumber[finite_wavenumbers][wavenumber_order]
+        norm_flux = norm_flux[finite_wavenumbers][wavenumber_order]
+        norm_uncertainty = norm_uncertainty[finite_wavenumbers][wavenumber_order]
+        atran = atran[finite_wavenumbers][wavenumber_order]
+
+        for start in range(0, len(grid), chunk_size):
+
+            grid_chunk = grid[start:start + chunk_size]
+
+            resampled_flux = np.interp(grid_chunk, wavenumber, norm_flux)
+            resampled_uncertainty = np.interp(grid_chunk, wavenumber, norm_uncertainty)
+            resampled_atran = np.interp(grid_chunk, wavenumber, atran)
+
+            # points without a usable flux or uncertainty don't contribute to the stack
+            usable_points = np.isfinite(resampled_flux) & np.isfinite(resampled_uncertainty) & (resampled_uncertainty > 0)
+            weights = np.where(usable_points, 1 / np.where(usable_points, resampled_uncertainty, 1) ** 2, 0)
+
+            weighted_flux_sum[start:start + chunk_size] += weights * np.where(usable_points, resampled_flux, 0)
+            weight_sum[start:start + chunk_size] += weights
+
+            finite_atran = np.isfinite(resampled_atran)
+            atran_sum[start:start + chunk_size] += np.where(finite_atran, resampled_atran, 0)
+            atran_count[start:start + chunk_size] += finite_atran
+
+        header_info.append({key: raw_data[key] for key in ["object", "latitude", "longitude", "start_altitude", "end_altitude", "avg_altitude", "temperature", "telescope_elevation_angle", "start_elevation_angle", "end_elevation_angle", "date"]})
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        stacked_flux = np.where(weight_sum > 0, weighted_flux_sum / weight_sum, np.nan)
+        stacked_uncertainty = np.where(weight_sum > 0, 1 / np.sqrt(weight_sum), np.nan)
+        stacked_atran = np.where(atran_count > 0, atran_sum / atran_count, np.nan)
+
+    return get_stacked_raw_data(file_names, grid, stacked_flux, stacked_uncertainty, stacked_atran, header_info)
+
+# function puts a stacked spectrum into the same dictionary format as "get_raw_exes_file_data()"
+def get_stacked_raw_data(file_names, wavenumber, flux, uncertainty, atran, header_info):
+
+    objects = list(dict.fromkeys(info["object"] for info in header_info))
+    obj = " + ".join(objects)
+
+    TELEL = np.mean([info["telescope_elevation_angle"] for info in header_info])
+    TELEL_STA = np.mean([info["start_elevation_angle"] for info in header_info])
+    TELEL_END = np.mean([info["end_elevation_angle"] for info in header_info])
+    lat = np.mean([info["latitude"] for info in header_info])
+    lon = np.mean([info["longitude"] for info in header_info])
+    ALTI_STA = min(info["start_altitude"] for info in header_info)
+    ALTI_END = max(info["end_altitude"] for info in header_info)
+    avg_ALTI = np.mean([info["avg_altitude"] for info in header_info])
+    Tout = np.mean([info["temperature"] for info in header_info])
+    date = min(info["date"] for info in header_info)
+
+    wavelength = 10000.0 / wavenumber
+
+    dashboard_spectrum_title = "Stack of " + str(len(file_names)) + " observations | " + obj + " | " + str(round(TELEL, 1)) + " deg." + " | " + str(round(avg_ALTI)) + " | " + MONTH_CONVERT[date.month] + "," + str(date.year)
+
+    return {
+        "hdu": None,
+        "header": None,
+        "data": np.vstack([wavenumber, flux, uncertainty, atran]),
+        "wavenumber": wavenumber,
+        "wavenumber_range": [min(wavenumber), max(wavenumber)],
+        "flux": flux,
+        "atran": atran,
+        "uncertainty": uncertainty,
+        "wavelength": wavelength,
+        "wavelength_range": [min(wavelength), max(wavelength)],
+        "object": obj,
+        "latitude": lat,
+        "longitude": lon,
+        "start_altitude": ALTI_STA, # altitude is in units of feet
+        "end_altitude": ALTI_END,
+        "avg_altitude": avg_ALTI,
+        "avg_altitude_km": avg_ALTI * FEET_TO_KILOMETERS, # altitude is in units of kilometers
+        "temperature": Tout,
+        "telescope_elevation_angle": TELEL,
+        "start_elevation_angle": TELEL_STA,
+        "end_elevation_angle": TELEL_END,
+        "map_table_array": [obj, str(round(TELEL, 1)) + "\N{DEGREE SIGN} ", str(round(avg_ALTI)) + "ft f", str(round(-1 * lon, 3)) + "\N{DEGREE SIGN}W, " + str(round(lat, 3)) + "\N{DEGREE SIGN}N"],
+        "spectrum_title": dashboard_spectrum_title,
+        "dashboard_spectrum_title": dashboard_spectrum_title,
+        "date": date,
+        "stacked_file_names": file_names,
+    }
+
+class NoWavenumberOverlap(Exception):
+    def __init__(self, message, error_code):
+        super().__init__(message)
+        self.error_code = error_code
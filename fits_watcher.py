@@ -0,0 +1,166 @@
+import os
+import time
+import select
+import ctypes
+import ctypes.util
+import threading
+
+# READ ME:
+# The watcher notices FITS files being added to, changed in, or removed from a directory while the dashboard is running,
+# so new reductions show up without restarting the server (and without re-reading the files that didn't change).
+#
+# Changes are found by comparing snapshots of the directory (file name -> modification time and size), which only stats the files.
+# A new snapshot is taken:
+#   - as soon as inotify reports something in the directory (Linux), after waiting WATCH_SETTLE_SECONDS for the writes to settle, and
+#   - every "poll_interval" seconds regardless, which is the whole mechanism where inotify isn't available (and a safety net where it misses events, e.g. network drives).
+#
+# Whatever changed is passed to "on_change(added, changed, removed)" on the watcher's own thread.
+# "on_change" can return the names of files it couldn't ingest yet (e.g. still being copied), and those get reported again on the next scan.
+
+WATCH_POLL_INTERVAL = 5.0
+WATCH_SETTLE_SECONDS = 0.5
+
+# inotify event masks (see "man inotify")
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+INOTIFY_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# function returns a snapshot of the directory: file name -> (modification time in nanoseconds, size in bytes)
+def get_directory_snapshot(directory, extension = ".fits"):
+
+    snapshot = {}
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(extension) and entry.is_file():
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+    return snapshot
+
+# function compares two snapshots, returns sorted lists of the added, changed, and removed file names
+def get_snapshot_changes(old_snapshot, new_snapshot):
+
+    added = sorted(set(new_snapshot) - set(old_snapshot))
+    removed = sorted(set(old_snapshot) - set(new_snapshot))
+    changed = sorted(file_name for file_name in set(new_snapshot) & set(old_snapshot) if new_snapshot[file_name] != old_snapshot[file_name])
+
+    return added, changed, removed
+
+# function returns an inotify file descriptor watching the directory, or None if inotify isn't available (e.g. not on Linux)
+def get_inotify_file_descriptor(directory):
+
+    library_name = ctypes.util.find_library("c")
+
+    if library_name is None:
+        return None
+
+    try:
+        libc = ctypes.CDLL(library_name, use_errno = True)
+        inotify_init1 = libc.inotify_init1
+        inotify_add_watch = libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    file_descriptor = inotify_init1(0)
+
+    if file_descriptor < 0:
+        return None
+
+    if inotify_add_watch(file_descriptor, os.fsencode(directory), INOTIFY_WATCH_MASK) < 0:
+        os.close(file_descriptor)
+        return None
+
+    return file_descriptor
+
+class FitsDirectoryWatcher(threading.Thread):
+
+    # "initial_snapshot" is the state the caller already knows about (e.g. the files its catalog was built from), defaults to the directory as it is now
+    def __init__(self, directory, on_change, extension = ".fits", poll_interval = WATCH_POLL_INTERVAL, initial_snapshot = None):
+
+        super().__init__(daemon = True)
+
+        self.directory = directory
+        self.on_change = on_change
+        self.extension = extension
+        self.poll_interval = poll_interval
+        self.snapshot = get_directory_snapshot(directory, extension) if initial_snapshot is None else dict(initial_snapshot)
+
+        self.inotify_file_descriptor = get_inotify_file_descriptor(directory)
+        self.mode = "polling" if self.inotify_file_descriptor is None else "inotify"
+        self.stopped = threading.Event()
+
+    # takes a new snapshot and reports any changes, returns the (added, changed, removed) file names
+    def scan(self):
+
+        new_snapshot = get_directory_snapshot(self.directory, self.extension)
+        added, changed, removed = get_snapshot_changes(self.snapshot, new_snapshot)
+
+        if not (added or changed or removed):
+            return added, changed, removed
+
+        retry = self.on_change(added, changed, removed) or []
+
+        # files that couldn't be ingested yet are left out of the snapshot, so the next scan reports them again
+        for file_name in retry:
+            if file_name in self.snapshot:
+                new_snapshot[file_name] = self.snapshot[file_name]
+            else:
+                new_snapshot.pop(file_name, None)
+
+        self.snapshot = new_snapshot
+
+        return added, changed, removed
+
+    # waits for an inotify event (or the poll interval), returns True if there was an event
+    def wait_for_event(self):
+
+        if self.inotify_file_descriptor is None:
+            self.stopped.wait(self.poll_interval)
+            return False
+
+        readable, _, _ = select.select([self.inotify_file_descriptor], [], [], self.poll_interval)
+
+        if not readable:
+            return False
+
+        # the events themselves aren't needed, since the snapshot finds out what changed
+        os.read(self.inotify_file_descriptor, 65536)
+
+        # let a file that is still being copied finish, and collect the rest of its events
+        time.sleep(WATCH_SETTLE_SECONDS)
+        while select.select([self.inotify_file_descriptor], [], [], 0)[0]:
+            os.read(self.inotify_file_descriptor, 65536)
+
+        return True
+
+    def run(self):
+
+        while not self.stopped.is_set():
+
+            self.wait_for_event()
+
+            if self.stopped.is_set():
+                break
+
+            try:
+                self.scan()
+            except OSError as e:
+                # e.g. the directory is briefly unavailable, the next scan tries again
+                print("FITS watcher scan failed:", e)
+
+    def stop(self):
+
+        self.stopped.set()
+
+        # a watcher that was never started has nothing to wait for
+        if self.ident is not None:
+            self.join()
+
+        if self.inotify_file_descriptor is not None:
+            os.close(self.inotify_file_descriptor)
+            self.inotify_file_descriptor = None
@@ -0,0 +1,288 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from molecular_transition_strength import get_transition_strength_for_location
+from molecular_transition_strength import MOLECULE_CONFIG, ISOTOPOLOGUE_CONFIG, ISOTOPOLOGUE_COLOR_CONFIG
+from hitran_stemplots import get_stemplot_arrays
+
+# READ ME:
+# The HITRAN overlay only depends on the cutoff through a single comparison: "col_den_trans >= cutoff".
+# So instead of rebuilding the overlay every time the user changes the cutoff, we compute the column density transition strengths once,
+# and store every isotopologue's lines sorted from strongest to weakest.
+#
+# Once the lines are sorted like that, every line above a given cutoff sits at the front of the arrays,
+# which means that any cutoff is just a prefix slice (found with a binary search), instead of a mask over the entire dataframe.
+#
+# The full spectrum only shows the OVERLAY_LINE_LIMIT strongest lines (if more than that pass the cutoff, "get_display_cutoff()" raises the cutoff to the strength of the last one),
+# and the details are drawn on demand for a selected window ("get_all_lines_in_range()") with a much lower cutoff.
+# The lines are also kept in wavenumber order, so a window is a slice found with two binary searches,
+# and the cutoff is only compared on that slice, which makes a narrow window cost time proportional to the lines inside it (instead of every line of the observation).
+# A window with more than SELECTION_LINE_LIMIT lines above its cutoff keeps only its strongest ones.
+
+# the most lines drawn over the full spectrum, and over a selected window
+OVERLAY_LINE_LIMIT = 2000
+SELECTION_LINE_LIMIT = 2000
+
+class HitranCutoffIndex:
+
+    # "isotopologue_lines" is a dictionary of isotopologue name -> {"molecule", "wavenumber", "col_den_trans"} (with the lines in wavenumber order)
+    def __init__(self, isotopologue_lines):
+
+        # dictionary of isotopologue name -> arrays of lines, sorted by strength (strongest first)
+        self.isotopologues = {}
+
+        for isotopologue, lines in isotopologue_lines.items():
+
+            wavenumbers = np.asarray(lines["wavenumber"], dtype = float)
+            strengths = np.asarray(lines["col_den_trans"], dtype = float)
+
+            # lines without a strength (e.g. ozone outside of the listed latitudes) can never pass a cutoff
+            finite_strengths = np.isfinite(strengths)
+            wavenumbers = wavenumbers[finite_strengths]
+            strengths = strengths[finite_strengths]
+
+            if len(wavenumbers) == 0:
+                continue
+
+            # "strength_order" holds the wavenumber-sorted positions of the lines, ordered from strongest to weakest
+            strength_order = np.argsort(-strengths, kind = "stable")
+
+            self.isotopologues[isotopologue] = {
+                "molecule": lines["molecule"],
+                "wavenumber": wavenumbers,
+                "col_den_trans": strengths,
+                "strength_order": strength_order,
+                # negated so that the array is ascending, which is what np.searchsorted() expects
+                "negative_sorted_strengths": -strengths[strength_order],
+            }
+
+        # every line's strength from strongest to weakest (over all isotopologues), for "get_display_cutoff()"
+        if self.isotopologues:
+            self.negative_sorted_strengths = np.sort(np.concatenate([iso_index["negative_sorted_strengths"] for iso_index in self.isotopologues.values()]))
+        else:
+            self.negative_sorted_strengths = np.zeros(0)
+
+    # returns the cutoff the full spectrum is drawn with: the given cutoff, raised to the strength of the "line_limit"-th strongest line if more lines than that would pass it
+    def get_display_cutoff(self, cutoff = None, line_limit = OVERLAY_LINE_LIMIT):
+
+        if len(self.negative_sorted_strengths) <= line_limit:
+            return cutoff
+
+        limit_strength = -self.negative_sorted_strengths[line_limit - 1]
+
+        if not cutoff:
+            return limit_strength
+
+        return max(cutoff, limit_strength)
+
+    # returns the number of lines of an isotopologue that are at least as strong as the cutoff
+    def get_line_count_above_cutoff(self, isotopologue, cutoff = None):
+
+        iso_index = self.isotopologues[isotopologue]
+
+        if not cutoff:
+            return len(iso_index["strength_order"])
+
+        return int(np.searchsorted(iso_index["negative_sorted_strengths"], -cutoff, side = "right"))
+
+    # returns the wavenumbers and strengths of an isotopologue's lines above the cutoff (in wavenumber order, so they can be plotted)
+    def get_lines_above_cutoff(self, isotopologue, cutoff = None):
+
+        iso_index = self.isotopologues[isotopologue]
+        line_count = self.get_line_count_above_cutoff(isotopologue, cutoff)
+
+        # the prefix of "strength_order" holds the positions of the strongest lines, sorting those positions puts them back into wavenumber order
+        positions = np.sort(iso_index["strength_order"][:line_count])
+
+        return iso_index["wavenumber"][positions], iso_index["col_den_trans"][positions]
+
+    # returns every isotopologue's lines above the cutoff (in the same format that the index is built from)
+    def get_all_lines_above_cutoff(self, cutoff = None):
+
+        isotopologue_lines = {}
+
+        for isotopologue, iso_index in self.isotopologues.items():
+
+            wavenumbers, strengths = self.get_lines_above_cutoff(isotopologue, cutoff)
+
+            isotopologue_lines[isotopologue] = {
+                "molecule": iso_index["molecule"],
+                "wavenumber": wavenumbers,
+                "col_den_trans": strengths,
+            }
+
+        return isotopologue_lines
+
+    # returns the wavenumbers and strengths of an isotopologue's lines within a wavenumber range that are at least as strong as the cutoff (in wavenumber order)
+    def get_lines_in_range(self, isotopologue, wavenumber_min, wavenumber_max, cutoff = None):
+
+        iso_index = self.isotopologues[isotopologue]
+
+        # the lines are stored in wavenumber order, so the window is a slice, and only the lines inside it are compared against the cutoff
+        start = np.searchsorted(iso_index["wavenumber"], wavenumber_min, side = "left")
+        stop = np.searchsorted(iso_index["wavenumber"], wavenumber_max, side = "right")
+
+        wavenumbers = iso_index["wavenumber"][start:stop]
+        strengths = iso_index["col_den_trans"][start:stop]
+
+        if not cutoff:
+            return wavenumbers, strengths
+
+        above_cutoff = strengths >= cutoff
+
+        return wavenumbers[above_cutoff], strengths[above_cutoff]
+
+    # returns every isotopologue's lines within a wavenumber range above the cutoff (in the same format that the index is built from)
+    # if more than "line_limit" lines pass, only the strongest "line_limit" of them are kept
+    def get_all_lines_in_range(self, wavenumber_min, wavenumber_max, cutoff = None, line_limit = SELECTION_LINE_LIMIT):
+
+        window_lines = {isotopologue: self.get_lines_in_range(isotopologue, wavenumber_min, wavenumber_max, cutoff) for isotopologue in self.isotopologues}
+
+        window_strengths = np.concatenate([strengths for wavenumbers, strengths in window_lines.values()]) if window_lines else np.zeros(0)
+
+        # the strength of the weakest line that's kept is found with a partial sort of just the window's lines
+        if len(window_strengths) > line_limit:
+            limit_strength = np.partition(window_strengths, len(window_strengths) - line_limit)[len(window_strengths) - line_limit]
+        else:
+            limit_strength = None
+
+        isotopologue_lines = {}
+
+        for isotopologue, (wavenumbers, strengths) in window_lines.items():
+
+            if limit_strength is not None:
+                above_limit = strengths >= limit_strength
+                wavenumbers = wavenumbers[above_limit]
+                strengths = strengths[above_limit]
+
+            isotopologue_lines[isotopologue] = {
+                "molecule": self.isotopologues[isotopologue]["molecule"],
+                "wavenumber": wavenumbers,
+                "col_den_trans": strengths,
+            }
+
+        return isotopologue_lines
+
+    # builds the same stemplot trace objects as "get_isotopologues_as_trace_object_stemplots()", but for any cutoff without recomputing anything
+    def get_trace_objects(self, cutoff = None):
+        return get_isotopologue_trace_objects(self.get_all_lines_above_cutoff(cutoff))
+
+    # builds one WebGL trace per molecule instead of one trace per isotopologue
+    def get_merged_trace_objects(self, cutoff = None):
+        return get_merged_molecule_trace_objects(self.get_all_lines_above_cutoff(cutoff))
+
+# function builds one stemplot trace object per isotopologue
+def get_isotopologue_trace_objects(isotopologue_lines):
+
+    hitran_list = []
+
+    for isotopologue, lines in isotopologue_lines.items():
+
+        if len(lines["wavenumber"]) == 0:
+            continue
+
+        stem_x, stem_y = get_stemplot_arrays(lines["wavenumber"], lines["col_den_trans"])
+
+        hitran_list.append(
+            go.Scatter(
+                x = stem_x,
+                y = stem_y,
+                mode = "lines+markers",
+                marker = {"size": 3},
+                name = isotopologue,
+                yaxis = "y2",
+                line = {"color": ISOTOPOLOGUE_COLOR_CONFIG[isotopologue]},
+            )
+        )
+
+    return hitran_list
+
+# function builds one WebGL trace per molecule instead of one trace per isotopologue
+# each point keeps its isotopologue's color and name (in "customdata"), so the hover info is the same, but the legend toggles whole molecules
+def get_merged_molecule_trace_objects(isotopologue_lines):
+
+    hitran_list = []
+
+    molecules = list(dict.fromkeys(lines["molecule"] for lines in isotopologue_lines.values()))
+
+    for molecule in molecules:
+
+        wavenumber_list = []
+        strength_list = []
+        isotopologue_list = []
+
+        for isotopologue, lines in isotopologue_lines.items():
+
+            if lines["molecule"] != molecule:
+                continue
+
+            wavenumber_list.append(lines["wavenumber"])
+            strength_list.append(lines["col_den_trans"])
+            isotopologue_list.append(np.full(len(lines["wavenumber"]), isotopologue, dtype = object))
+
+        wavenumbers = np.concatenate(wavenumber_list)
+
+        if len(wavenumbers) == 0:
+            continue
+
+        # put the isotopologues' lines together in wavenumber order, so the stems are drawn left to right
+        wavenumber_order = np.argsort(wavenumbers, kind = "stable")
+        stem_x, stem_y = get_stemplot_arrays(wavenumbers[wavenumber_order], np.concatenate(strength_list)[wavenumber_order])
+
+        # every line turns into three stem points, so each isotopologue name is repeated three times as well
+        stem_isotopologues = np.repeat(np.concatenate(isotopologue_list)[wavenumber_order], 3)
+        stem_colors = [ISOTOPOLOGUE_COLOR_CONFIG[isotopologue] for isotopologue in stem_isotopologues]
+
+        hitran_list.append(
+            go.Scattergl(
+                x = stem_x,
+                y = stem_y,
+                mode = "lines+markers",
+                marker = {"size": 3, "color": stem_colors},
+                name = molecule,
+                legendgroup = molecule,
+                customdata = stem_isotopologues,
+                hovertemplate = "%{customdata}<br>%{x}<br>%{y}<extra></extra>",
+                yaxis = "y2",
+                line = {"color": ISOTOPOLOGUE_COLOR_CONFIG[molecule]},
+            )
+        )
+
+    return hitran_list
+
+# function splits the dataframes returned by "get_transition_strength_for_location()" into wavenumber-sorted lines for each isotopologue
+def get_isotopologue_lines_from_molecule_dfs(molecule_dfs):
+
+    isotopologue_lines = {}
+
+    for molecule_name, molecule_df in molecule_dfs.items():
+
+        if molecule_df is None or molecule_df.empty:
+            continue
+
+        molecule_df = molecule_df.sort_values("wavenumber")
+
+        for isotopologue, iso_id in ISOTOPOLOGUE_CONFIG[molecule_name].items():
+
+            iso_df = molecule_df[molecule_df["iso_id"] == iso_id]
+
+            if iso_df.empty:
+                continue
+
+            isotopologue_lines[isotopologue] = {
+                "molecule": molecule_name,
+                "wavenumber": iso_df["wavenumber"].to_numpy(dtype = float),
+                "col_den_trans": iso_df["col_den_trans"].to_numpy(dtype = float),
+            }
+
+    return isotopologue_lines
+
+# function computes the column density transition strengths for every molecule in MOLECULE_CONFIG once (with no cutoff) and indexes them
+def get_hitran_cutoff_index(temperature, altitude_km, latitude, wavenumber_range = None):
+
+    molecule_dfs = {}
+
+    for molecule in MOLECULE_CONFIG:
+        molecule_dfs[molecule] = get_transition_strength_for_location(molecule, experimental_temp = temperature, altitude_km = altitude_km, latitude = latitude, wavenumber_range = wavenumber_range)
+
+    return HitranCutoffIndex(get_isotopologue_lines_from_molecule_dfs(molecule_dfs))
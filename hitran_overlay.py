@@ -0,0 +1,331 @@
+import copy
+import numpy as np
+import pandas as pd
+from hapi import partitionSum
+
+from hitran_molecule_info import get_hitran_molecule_info, get_transition_strength_for_temp
+from hitran_molecule_info import REF_TEMP, CELSIUS_TO_KELVIN, C2, MoleculeDataNotFound
+from molecular_transition_strength import get_column_density_for_location, get_column_densities_for_locations, get_transition_strength_for_location
+from molecular_transition_strength import MOLECULE_CONFIG, ISOTOPOLOGUE_CONFIG
+from hitran_cutoff_index import HitranCutoffIndex
+from dual_path import dual_path
+
+# READ ME:
+# "get_transition_strength_for_temp()" and "get_transition_strength_for_location()" redo all of their work every time they are called,
+# even though most of it only depends on the HITRAN lines (which never change for a given wavenumber range).
+#
+# Written out in full, the expected transition strength of a line is:
+#
+#   col_den_trans = S_ref * (Q_ref / Q(T)) * exp(-C2 * E / T) / exp(-C2 * E / T_ref) * (1 - exp(-C2 * nu / T)) / (1 - exp(-C2 * nu / T_ref)) * column_density
+#
+# Everything that doesn't depend on the temperature or location gets folded into one constant per line (in log space, so nothing overflows),
+# and the partition sums and column densities only have to be computed once per isotopologue/molecule instead of once per row.
+# So re-evaluating the overlay for a new temperature, altitude or latitude turns into a single vectorized expression over the lines.
+#
+# The column density at the average altitude ignores that the altitude changes between ALTI_STA and ALTI_END during an integration,
+# and that the telescope looks through the atmosphere at a slant (TELEL), which multiplies the column by the airmass (1 / sin(elevation) for a plane-parallel atmosphere).
+# "get_flight_segment_column_densities()" samples the flight segment at FLIGHT_SEGMENT_SAMPLE_COUNT altitudes (with the elevation at each of them)
+# and averages the slant column densities over the samples. At a fixed temperature a line's strength is proportional to its column density,
+# so scaling the lines by the averaged column densities gives the same strengths as averaging every line at every sample,
+# without ever building a (samples x lines) array, and costs about the same as the single altitude overlay.
+#
+# "evaluate()" and "evaluate_temperature_strengths()" can be checked against the original dataframe functions with dual path mode (see dual_path.py).
+
+# how many altitudes the flight segment is sampled at, and the lowest elevation the airmass is computed for (the plane-parallel airmass blows up at the horizon)
+FLIGHT_SEGMENT_SAMPLE_COUNT = 16
+MINIMUM_ELEVATION_ANGLE = 10.0
+
+# function returns the airmass of each elevation angle (degrees), for a plane-parallel atmosphere
+def get_airmass(elevation_angles):
+    return 1 / np.sin(np.radians(np.maximum(np.asarray(elevation_angles, dtype = float), MINIMUM_ELEVATION_ANGLE)))
+
+# function samples a flight segment at the midpoints of "sample_count" equal steps between its start and end
+# returns the altitude (kilometers) and elevation angle (degrees) of each sample
+def get_flight_segment_samples(start_altitude_km, end_altitude_km, start_elevation_angle, end_elevation_angle, sample_count = FLIGHT_SEGMENT_SAMPLE_COUNT):
+
+    fractions = (np.arange(sample_count) + 0.5) / sample_count
+
+    altitudes_km = start_altitude_km + fractions * (end_altitude_km - start_altitude_km)
+    elevation_angles = start_elevation_angle + fractions * (end_elevation_angle - start_elevation_angle)
+
+    return altitudes_km, elevation_angles
+
+# function returns the molecules that an overlay has lines for, and the wavenumber range its lines span (so the reference functions load the same lines as the overlay has)
+def get_reference_line_range(overlay):
+
+    molecules = list(dict.fromkeys(overlay.isotopologue_molecules[i] for i, positions in enumerate(overlay.isotopologue_positions) if len(positions)))
+
+    return molecules, [overlay.wavenumber[0], overlay.wavenumber[-1]] if len(overlay.wavenumber) else None
+
+# function puts a per line column of the reference dataframes (a dictionary of molecule -> dataframe, see hitran_molecule_info.py) in the overlay's line order
+# a molecule without a dataframe (e.g. ozone above 56 degrees latitude) is NaN, like in the overlay, and the lines have to be the same as the overlay's
+def get_reference_line_values(overlay, molecule_dfs, column):
+
+    values = np.full(len(overlay.wavenumber), np.nan)
+
+    for i, (molecule, isotopologue) in enumerate(zip(overlay.isotopologue_molecules, overlay.isotopologue_names)):
+
+        positions = overlay.isotopologue_positions[i]
+
+        if (not len(positions)) or (molecule_dfs.get(molecule) is None):
+            continue
+
+        molecule_df = molecule_dfs[molecule]
+        iso_df = molecule_df[molecule_df["iso_id"] == ISOTOPOLOGUE_CONFIG[molecule][isotopologue]].sort_values("wavenumber", kind = "stable")
+
+        if not np.array_equal(iso_df["wavenumber"].to_numpy(dtype = float), overlay.wavenumber[positions]):
+            raise ValueError(f"The reference lines of {isotopologue} aren't the same as the overlay's lines ({len(iso_df)} instead of {len(positions)})")
+
+        values[positions] = iso_df[column].to_numpy(dtype = float)
+
+    return values
+
+# function does the same thing as "HitranOverlay.evaluate()" with "get_transition_strength_for_location()", for dual path mode (see dual_path.py)
+def get_reference_strengths(overlay, temperature, altitude_km, latitude):
+
+    molecules, wavenumber_range = get_reference_line_range(overlay)
+    molecule_dfs = {molecule: get_transition_strength_for_location(molecule, temperature, altitude_km, latitude, wavenumber_range) for molecule in molecules}
+
+    return get_reference_line_values(overlay, molecule_dfs, "col_den_trans")
+
+# function does the same thing as "HitranOverlay.evaluate_temperature_strengths()" with "get_transition_strength_for_temp()", for dual path mode (see dual_path.py)
+def get_reference_temperature_strengths(overlay, temperature):
+
+    molecules, wavenumber_range = get_reference_line_range(overlay)
+    molecule_dfs = {}
+
+    for molecule in molecules:
+        try:
+            molecule_dfs[molecule] = get_transition_strength_for_temp(molecule, temperature, wavenumber_range)
+        except MoleculeDataNotFound:
+            molecule_dfs[molecule] = None
+
+    return get_reference_line_values(overlay, molecule_dfs, "exp_trans_strength")
+
+class HitranOverlay:
+
+    def __init__(self, wavenumber_range = None):
+
+        self.wavenumber_range = None if wavenumber_range is None else [min(wavenumber_range), max(wavenumber_range)]
+
+        # lists of per isotopologue info (the position in these lists is the isotopologue's index)
+        self.isotopologue_names = []
+        self.isotopologue_molecules = []
+        self.isotopologue_ref_partition_sums = []
+        self.isotopologue_hitran_ids = []
+
+        # lists of per line arrays (one entry per molecule, they get concatenated at the end)
+        wavenumber_list = []
+        ref_trans_strength_list = []
+        elower_list = []
+        isotopologue_index_list = []
+
+        for molecule_name in MOLECULE_CONFIG:
+
+            molecule_df = get_hitran_molecule_info(molecule_name, self.wavenumber_range)
+
+            if molecule_df.empty:
+                continue
+
+            for isotopologue, iso_id in ISOTOPOLOGUE_CONFIG[molecule_name].items():
+
+                iso_df = molecule_df[molecule_df["iso_id"] == iso_id]
+
+                if iso_df.empty:
+                    continue
+
+                molec_id = int(iso_df["molec_id"].iloc[0])
+
+                isotopologue_index = len(self.isotopologue_names)
+                self.isotopologue_names.append(isotopologue)
+                self.isotopologue_molecules.append(molecule_name)
+                self.isotopologue_hitran_ids.append((molec_id, iso_id))
+                self.isotopologue_ref_partition_sums.append(partitionSum(molec_id, iso_id, REF_TEMP))
+
+                wavenumber_list.append(iso_df["wavenumber"].to_numpy(dtype = float))
+                ref_trans_strength_list.append(iso_df["ref_trans_strength"].to_numpy(dtype = float))
+                elower_list.append(iso_df["elower"].to_numpy(dtype = float))
+                isotopologue_index_list.append(np.full(len(iso_df), isotopologue_index))
+
+        self.isotopologue_ref_partition_sums = np.array(self.isotopologue_ref_partition_sums, dtype = float)
+        self.molecule_names = list(dict.fromkeys(self.isotopologue_molecules))
+        self.isotopologue_molecule_index = np.array([self.molecule_names.index(molecule) for molecule in self.isotopologue_molecules], dtype = int)
+
+        if wavenumber_list:
+            wavenumber = np.concatenate(wavenumber_list)
+            ref_trans_strength = np.concatenate(ref_trans_strength_list)
+            elower = np.concatenate(elower_list)
+            isotopologue_index = np.concatenate(isotopologue_index_list)
+        else:
+            wavenumber = ref_trans_strength = elower = np.array([], dtype = float)
+            isotopologue_index = np.array([], dtype = int)
+
+        # keep every line in wavenumber order
+        wavenumber_order = np.argsort(wavenumber, kind = "stable")
+
+        self.wavenumber = wavenumber[wavenumber_order]
+        self.ref_trans_strength = ref_trans_strength[wavenumber_order]
+        self.elower = elower[wavenumber_order]
+        self.isotopologue_index = isotopologue_index[wavenumber_order]
+
+        # the wavenumber-sorted positions of each isotopologue's lines
+        self.isotopologue_positions = [np.flatnonzero(self.isotopologue_index == i) for i in range(len(self.isotopologue_names))]
+
+        # per line invariants: log(S_ref) + C2 * E / T_ref - log(1 - exp(-C2 * nu / T_ref))
+        with np.errstate(divide = "ignore"):
+            self.log_line_constant = np.log(self.ref_trans_strength) + C2 * self.elower / REF_TEMP - np.log1p(-np.exp(-C2 * self.wavenumber / REF_TEMP))
+
+        self.negative_c2_elower = -C2 * self.elower
+        self.negative_c2_wavenumber = -C2 * self.wavenumber
+
+        # partition sums only depend on the temperature, so they're cached for temperatures that were already evaluated
+        self.partition_sum_ratio_cache = {}
+
+    # returns an overlay of only the lines in positions [start, end) (in wavenumber order), without reading the HITRAN tables again
+    # the isotopologue info and the partition sum cache are shared with this overlay
+    def get_line_slice(self, start, end):
+
+        line_slice = copy.copy(self)
+
+        for name in ["wavenumber", "ref_trans_strength", "elower", "isotopologue_index", "log_line_constant", "negative_c2_elower", "negative_c2_wavenumber"]:
+            setattr(line_slice, name, getattr(self, name)[start:end])
+
+        line_slice.isotopologue_positions = [np.flatnonzero(line_slice.isotopologue_index == i) for i in range(len(self.isotopologue_names))]
+
+        return line_slice
+
+    # returns an overlay of only the lines within a wavenumber range (the same lines, in the same order, as "HitranOverlay(wavenumber_range)" would load)
+    def get_sub_overlay(self, wavenumber_range):
+
+        wavenumber_min = np.nanmin(wavenumber_range)
+        wavenumber_max = np.nanmax(wavenumber_range)
+
+        line_slice = self.get_line_slice(np.searchsorted(self.wavenumber, wavenumber_min, side = "left"), np.searchsorted(self.wavenumber, wavenumber_max, side = "right"))
+        line_slice.wavenumber_range = [wavenumber_min, wavenumber_max]
+
+        return line_slice
+
+    # returns Q_ref / Q(T) for every isotopologue
+    def get_partition_sum_ratios(self, temperature_kelvin):
+
+        if temperature_kelvin not in self.partition_sum_ratio_cache:
+
+            partition_sums = np.array([partitionSum(molec_id, iso_id, temperature_kelvin) for molec_id, iso_id in self.isotopologue_hitran_ids], dtype = float)
+            self.partition_sum_ratio_cache[temperature_kelvin] = self.isotopologue_ref_partition_sums / partition_sums
+
+        return self.partition_sum_ratio_cache[temperature_kelvin]
+
+    # returns the column density (multiplied by concentration) of every molecule, NaN if there isn't one for that location
+    def get_column_densities(self, altitude_km, latitude):
+
+        column_densities = [get_column_density_for_location(molecule, altitude_km, latitude) for molecule in self.molecule_names]
+
+        return np.array([np.nan if column_density is None else column_density for column_density in column_densities], dtype = float)
+
+    # returns the slant column density of every molecule averaged over the samples of a flight segment (see "get_flight_segment_samples()")
+    # NaN if any sample doesn't have a column density (e.g. ozone above 56 degrees latitude), like "get_column_densities()"
+    def get_flight_segment_column_densities(self, altitudes_km, elevation_angles, latitude):
+
+        # (samples x molecules) array of vertical column densities, times the airmass of each sample
+        column_densities = np.column_stack([get_column_densities_for_locations(molecule, altitudes_km, latitude) for molecule in self.molecule_names]) if self.molecule_names else np.zeros((len(altitudes_km), 0))
+        slant_column_densities = column_densities * get_airmass(elevation_angles)[:, np.newaxis]
+
+        return slant_column_densities.mean(axis = 0)
+
+    # returns the "col_den_trans" value of every line for the given temperature (celsius), altitude (kilometers) and latitude
+    @dual_path("transition_strengths", get_reference_strengths)
+    def evaluate(self, temperature, altitude_km, latitude):
+
+        temperature_kelvin = temperature + CELSIUS_TO_KELVIN
+
+        # combine everything that is constant within an isotopologue into a single log factor
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            isotopologue_log_factor = np.log(self.get_partition_sum_ratios(temperature_kelvin)) + np.log(self.get_column_densities(altitude_km, latitude))[self.isotopologue_molecule_index]
+
+        # single fused expression over every line
+        return np.exp(self.log_line_constant + self.negative_c2_elower / temperature_kelvin + isotopologue_log_factor[self.isotopologue_index]) * -np.expm1(self.negative_c2_wavenumber / temperature_kelvin)
+
+    # returns the "exp_trans_strength" value of every line for the given temperature (celsius), i.e. the same thing as "evaluate()" without the column densities
+    @dual_path("temperature_strengths", get_reference_temperature_strengths)
+    def evaluate_temperature_strengths(self, temperature):
+
+        temperature_kelvin = temperature + CELSIUS_TO_KELVIN
+
+        isotopologue_log_factor = np.log(self.get_partition_sum_ratios(temperature_kelvin))
+
+        return np.exp(self.log_line_constant + self.negative_c2_elower / temperature_kelvin + isotopologue_log_factor[self.isotopologue_index]) * -np.expm1(self.negative_c2_wavenumber / temperature_kelvin)
+
+    # multiplies the strengths returned by "evaluate_temperature_strengths()" by each line's column density for the given altitude (kilometers) and latitude
+    def apply_column_densities(self, temperature_strengths, altitude_km, latitude):
+        return self.scale_by_column_densities(temperature_strengths, self.get_column_densities(altitude_km, latitude))
+
+    # multiplies the strengths returned by "evaluate_temperature_strengths()" by each line's molecule's column density (one per molecule, in "molecule_names" order)
+    def scale_by_column_densities(self, temperature_strengths, column_densities):
+        return temperature_strengths * column_densities[self.isotopologue_molecule_index][self.isotopologue_index]
+
+    # returns the evaluated lines split up by isotopologue (the format "HitranCutoffIndex" is built from)
+    def get_isotopologue_lines(self, temperature, altitude_km, latitude):
+        return self.split_isotopologue_lines(self.evaluate(temperature, altitude_km, latitude))
+
+    # splits an array of per line strengths up by isotopologue
+    def split_isotopologue_lines(self, strengths):
+
+        isotopologue_lines = {}
+
+        for i, isotopologue in enumerate(self.isotopologue_names):
+
+            positions = self.isotopologue_positions[i]
+
+            isotopologue_lines[isotopologue] = {
+                "molecule": self.isotopologue_molecules[i],
+                "wavenumber": self.wavenumber[positions],
+                "col_den_trans": strengths[positions],
+            }
+
+        return isotopologue_lines
+
+    # assigns each peak to the strongest line within "tolerances" of its center (e.g. half of its fitted FWHM), given the evaluated "strengths" of every line
+    # returns one row per peak: "molecule", "isotopologue", "line_wavenumber", "col_den_trans" (all None/NaN if there's no line close enough)
+    def assign_peaks(self, centers, tolerances, strengths):
+
+        centers = np.asarray(centers, dtype = float)
+        tolerances = np.broadcast_to(np.asarray(tolerances, dtype = float), centers.shape)
+
+        # every (peak, line) pair within the tolerance, built the same way as in "ArchiveSearchIndex.search()"
+        slice_start = np.searchsorted(self.wavenumber, centers - tolerances, side = "left")
+        slice_stop = np.searchsorted(self.wavenumber, centers + tolerances, side = "right")
+        slice_length = np.maximum(slice_stop - slice_start, 0)
+
+        pair_peak = np.repeat(np.arange(len(centers)), slice_length)
+        pair_line = slice_start[pair_peak] + np.arange(len(pair_peak)) - np.repeat(np.cumsum(slice_length) - slice_length, slice_length)
+
+        pair_strengths = np.where(np.isfinite(strengths[pair_line]), strengths[pair_line], -np.inf)
+
+        # sort the pairs by peak, strongest line first, and keep the first pair of every peak
+        pair_order = np.lexsort((-pair_strengths, pair_peak))
+        first_pairs = pair_order[np.r_[True, pair_peak[pair_order][1:] != pair_peak[pair_order][:-1]]] if len(pair_order) else pair_order
+        first_pairs = first_pairs[np.isfinite(pair_strengths[first_pairs])]
+
+        assigned_peaks = pair_peak[first_pairs]
+        assigned_lines = pair_line[first_pairs]
+
+        isotopologues = np.full(len(centers), None, dtype = object)
+        molecules = np.full(len(centers), None, dtype = object)
+        line_wavenumbers = np.full(len(centers), np.nan)
+        line_strengths = np.full(len(centers), np.nan)
+
+        isotopologues[assigned_peaks] = np.array(self.isotopologue_names, dtype = object)[self.isotopologue_index[assigned_lines]] if len(assigned_lines) else []
+        molecules[assigned_peaks] = np.array(self.isotopologue_molecules, dtype = object)[self.isotopologue_index[assigned_lines]] if len(assigned_lines) else []
+        line_wavenumbers[assigned_peaks] = self.wavenumber[assigned_lines]
+        line_strengths[assigned_peaks] = strengths[assigned_lines]
+
+        return pd.DataFrame({
+            "molecule": molecules,
+            "isotopologue": isotopologues,
+            "line_wavenumber": line_wavenumbers,
+            "col_den_trans": line_strengths,
+        })
+
+    # returns a cutoff index for the given temperature, altitude and latitude
+    def get_cutoff_index(self, temperature, altitude_km, latitude):
+        return HitranCutoffIndex(self.get_isotopologue_lines(temperature, altitude_km, latitude))
@@ -1,8 +1,10 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 
 from molecular_transition_strength import get_transition_strength_for_location
 from molecular_transition_strength import MOLECULE_CONFIG, ISOTOPOLOGUE_CONFIG, ISOTOPOLOGUE_COLOR_CONFIG
+from dual_path import dual_path
 
 # READ ME:
 # As far as I am currently aware, there is no decent way to make a stemplot in the Plotly library, without making each stem it's own individual plot object.
@@ -42,6 +44,28 @@ def modify_row_in_dataframe_for_graphing_stemplot(row, y_coordinate_column):
 def modify_dataframe_for_graphing_stemplot(df, y_coordinate_column):
     return pd.concat(list(df.apply(lambda row: modify_row_in_dataframe_for_graphing_stemplot(row, y_coordinate_column), axis = 1)))
 
+# TLDR: this runs "modify_dataframe_for_graphing_stemplot()" on arrays, and returns arrays like "get_stemplot_arrays()" (for dual path mode, see dual_path.py)
+def get_reference_stemplot_arrays(x_coordinates, y_coordinates):
+
+    if len(x_coordinates) == 0:
+        return np.zeros(0), np.zeros(0)
+
+    stem_df = modify_dataframe_for_graphing_stemplot(pd.DataFrame({"x": np.asarray(x_coordinates, dtype = float), "y": y_coordinates}), "y")
+
+    return stem_df["x"].to_numpy(dtype = float), stem_df["y"].to_numpy(dtype = float)
+
+# TLDR: this does the same thing as "modify_dataframe_for_graphing_stemplot()", but directly on numpy arrays (without building a dataframe per row)
+# every x coordinate is repeated three times, and every y coordinate is put in between two zeros
+@dual_path("stemplot", get_reference_stemplot_arrays)
+def get_stemplot_arrays(x_coordinates, y_coordinates):
+
+    stem_x = np.repeat(np.asarray(x_coordinates, dtype = float), 3)
+
+    stem_y = np.zeros(len(stem_x))
+    stem_y[1::3] = y_coordinates
+
+    return stem_x, stem_y
+
 
 def get_isotopologue_dfs_from_molecule_transition_strengths_df(molecule_name, experimental_temp, altitude_km, latitude, wavenumber_range = None, cutoff = None, plotly_stemplot = True):
     isotopologue_dataframes = {}
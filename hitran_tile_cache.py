@@ -0,0 +1,179 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from hitran_overlay import HitranOverlay
+from atmospheric_info import get_atmosphere_dataframe
+from dual_path import dual_path
+
+# READ ME:
+# Many observations share a grating setting (so they cover the same wavenumbers) and fly at similar altitudes and temperatures,
+# but every observation used to build its own line store and evaluate its own lines from scratch.
+#
+# The tile cache shares that work between observations:
+#   - the HITRAN lines are loaded once, into a single line store covering every wavenumber asked for so far,
+#     and each observation's line store is a slice of it (see "HitranOverlay.get_sub_overlay()")
+#   - the evaluated strengths ("col_den_trans") are cached in tiles of TILE_WIDTH cm^-1, keyed on
+#     (tile, temperature bin, altitude bin, latitude band), and an observation's strengths are put together from the tiles it covers.
+#     Only the tiles that aren't cached yet get evaluated (in a single vectorized evaluation).
+#
+# The altitude and latitude only change the strengths through the model atmosphere table,
+# so the altitude bin is the table row the altitude falls in, and the latitude band is the ozone band (<= 9, <= 36, <= 43, <= 56, above 56 degrees).
+# Every altitude and latitude in a bin gives exactly the same strengths.
+#
+# The temperature bins are 1 / TEMPERATURE_BINS_PER_DEGREE degrees wide, centered on multiples of the bin width, and a bin's tiles are evaluated at its center.
+# So the dashboard's slider values (steps of 0.5 degrees) are evaluated exactly, and any other temperature (e.g. an observation's own, from its FITS header)
+# is at most half a bin away from the temperature its strengths were evaluated at.
+# A line's strength changes by about C2 * elower / T^2 per kelvin (~8% per kelvin for elower = 2000 cm^-1 at -80 celsius), so over half a bin the strengths
+# are within TILE_STRENGTH_RTOL of "HitranOverlay.evaluate()" at the exact temperature for lines with elower up to ~5000 cm^-1 down to -80 celsius
+# (dual path mode checks this with the same tolerance, see dual_path.py).
+#
+# The least recently used tiles are evicted once there are more than "max_tile_count", and "get_stats()" reports the hit rate.
+
+TILE_WIDTH = 1.0
+MAX_TILE_COUNT = 4096
+
+# temperature bins of 0.05 degrees, and the relative difference from a direct evaluation that the binned strengths stay within (see READ ME)
+TEMPERATURE_BINS_PER_DEGREE = 20
+TILE_STRENGTH_RTOL = 5e-3
+
+# the upper edges of the latitude bands that the model atmosphere table lists ozone column densities for
+OZONE_LATITUDE_BAND_EDGES = [9, 36, 43, 56]
+
+# function does the same thing as "HitranTileCache.get_strengths()" by evaluating the overlay's own lines directly, for dual path mode (see dual_path.py)
+def get_reference_tile_strengths(tile_cache, overlay, temperature, altitude_km, latitude):
+    return overlay.evaluate(temperature, altitude_km, latitude)
+
+class HitranTileCache:
+
+    # "wavenumber_range" is the range to load lines for up front (e.g. the whole archive), it grows whenever an observation outside of it comes along
+    def __init__(self, wavenumber_range = None, tile_width = TILE_WIDTH, max_tile_count = MAX_TILE_COUNT):
+
+        self.tile_width = tile_width
+        self.max_tile_count = max_tile_count
+
+        # the line store that every observation's line store is sliced from, and the range of whole tiles it covers
+        self.line_source = None
+        self.line_source_tiles = None
+        self.initial_wavenumber_range = wavenumber_range
+
+        # OrderedDict of (tile, temperature bin, altitude bin, latitude band) -> strengths of the tile's lines (least recently used first)
+        self.tiles = OrderedDict()
+
+        self.hit_count = 0
+        self.miss_count = 0
+        self.eviction_count = 0
+
+        self.table_altitudes = None
+
+        # the dashboard's callbacks run on several threads
+        self.lock = threading.Lock()
+
+    # returns the first and last tile that a wavenumber range touches
+    def get_tile_range(self, wavenumber_range):
+        return int(np.floor(np.nanmin(wavenumber_range) / self.tile_width)), int(np.floor(np.nanmax(wavenumber_range) / self.tile_width))
+
+    # makes sure that the line source covers every line of the tiles "first_tile" to "last_tile" (reloading it over a wider range if it doesn't)
+    def ensure_line_source(self, first_tile, last_tile):
+
+        if (self.line_source_tiles is not None) and (self.line_source_tiles[0] <= first_tile) and (last_tile <= self.line_source_tiles[1]):
+            return
+
+        if self.line_source_tiles is not None:
+            first_tile, last_tile = min(first_tile, self.line_source_tiles[0]), max(last_tile, self.line_source_tiles[1])
+
+        elif self.initial_wavenumber_range is not None:
+            initial_first_tile, initial_last_tile = self.get_tile_range(self.initial_wavenumber_range)
+            first_tile, last_tile = min(first_tile, initial_first_tile), max(last_tile, initial_last_tile)
+
+        # the cached tiles stay valid, since a tile's lines don't depend on how much else was loaded
+        self.line_source = HitranOverlay([first_tile * self.tile_width, (last_tile + 1) * self.tile_width])
+        self.line_source_tiles = (first_tile, last_tile)
+
+    # returns a line store for the lines within a wavenumber range (e.g. an observation's wavenumbers), sliced from the shared line source
+    def get_overlay(self, wavenumber_range):
+
+        with self.lock:
+            self.ensure_line_source(*self.get_tile_range(wavenumber_range))
+            line_source = self.line_source
+
+        return line_source.get_sub_overlay(wavenumber_range)
+
+    # returns the temperature (celsius) that the tiles of a temperature's bin are evaluated at
+    def get_bin_temperature(self, temperature):
+
+        # dividing by the (integer) bins per degree keeps the centers exact, e.g. -37.5 instead of -750 * 0.05 = -37.50000000000001
+        return round(temperature * TEMPERATURE_BINS_PER_DEGREE) / TEMPERATURE_BINS_PER_DEGREE
+
+    # returns the (temperature bin, altitude bin, latitude band) that strengths are cached under
+    def get_condition_key(self, temperature, altitude_km, latitude):
+
+        if self.table_altitudes is None:
+            self.table_altitudes = get_atmosphere_dataframe()["Alt (KM)"].to_numpy(dtype = float)
+
+        altitude_bin = int(np.searchsorted(self.table_altitudes, altitude_km, side = "right") - 1)
+        latitude_band = int(np.searchsorted(OZONE_LATITUDE_BAND_EDGES, latitude, side = "left"))
+
+        return (round(temperature * TEMPERATURE_BINS_PER_DEGREE), altitude_bin, latitude_band)
+
+    # returns the positions of a tile's lines in the line source
+    def get_tile_positions(self, tile):
+
+        wavenumber = self.line_source.wavenumber
+
+        return np.searchsorted(wavenumber, tile * self.tile_width, side = "left"), np.searchsorted(wavenumber, (tile + 1) * self.tile_width, side = "left")
+
+    # returns the "col_den_trans" value of every line of an overlay returned by "get_overlay()", for the given temperature (celsius), altitude (kilometers) and latitude
+    # (evaluated at the center of the temperature's bin, see READ ME)
+    @dual_path("tile_strengths", get_reference_tile_strengths)
+    def get_strengths(self, overlay, temperature, altitude_km, latitude):
+
+        with self.lock:
+
+            first_tile, last_tile = self.get_tile_range(overlay.wavenumber_range)
+            self.ensure_line_source(first_tile, last_tile)
+
+            condition_key = self.get_condition_key(temperature, altitude_km, latitude)
+            tile_keys = [(tile,) + condition_key for tile in range(first_tile, last_tile + 1)]
+
+            missing_tiles = [key[0] for key in tile_keys if key not in self.tiles]
+            self.miss_count += len(missing_tiles)
+            self.hit_count += len(tile_keys) - len(missing_tiles)
+
+            # every missing tile is evaluated in one go, over the lines from the first missing tile to the last one
+            if missing_tiles:
+
+                span_start = self.get_tile_positions(missing_tiles[0])[0]
+                span_end = self.get_tile_positions(missing_tiles[-1])[1]
+                span_strengths = self.line_source.get_line_slice(span_start, span_end).evaluate(self.get_bin_temperature(temperature), altitude_km, latitude)
+
+                for tile in missing_tiles:
+                    tile_start, tile_end = self.get_tile_positions(tile)
+                    self.tiles[(tile,) + condition_key] = span_strengths[tile_start - span_start:tile_end - span_start]
+
+            for key in tile_keys:
+                self.tiles.move_to_end(key)
+
+            strengths = np.concatenate([self.tiles[key] for key in tile_keys])
+
+            # the tiles cover whole multiples of TILE_WIDTH, so the lines outside of the overlay's range are cut off the ends
+            offset = np.searchsorted(self.line_source.wavenumber, overlay.wavenumber_range[0], side = "left") - self.get_tile_positions(first_tile)[0]
+
+            while len(self.tiles) > self.max_tile_count:
+                self.tiles.popitem(last = False)
+                self.eviction_count += 1
+
+        return strengths[offset:offset + len(overlay.wavenumber)]
+
+    # returns the cache's hit and miss counts (in tiles), its hit rate, and how many tiles it holds and has evicted
+    def get_stats(self):
+
+        lookup_count = self.hit_count + self.miss_count
+
+        return {
+            "hits": self.hit_count,
+            "misses": self.miss_count,
+            "hit_rate": self.hit_count / lookup_count if lookup_count else 0.0,
+            "tile_count": len(self.tiles),
+            "evictions": self.eviction_count,
+        }
@@ -0,0 +1,407 @@
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import requests
+import astropy.io.fits as fits
+
+from synthetic_fixtures import write_synthetic_fixtures
+
+# READ ME:
+# This starts the dashboard locally (against the synthetic fixtures in synthetic_fixtures.py, or a real directory of FITS files)
+# and replays analyst sessions against it from N simulated clients at once, to see how many concurrent analysts one server can support
+# and which callback saturates first.
+#
+# Each session does what an analyst does in the browser, by POSTing the same requests the browser sends to "/_dash-update-component":
+#
+#   (map filter)           filter the map to the observation's object (a clientside callback, so it's skipped unless the map is filtered on the server)
+#   update_graph           click the observation on the map
+#   update_spectra_peaks   box select a window around a telluric line, then tune the prominence a few times
+#   update_table           fill the peak table from the identified peaks
+#   update_spectra_fits    fit the peaks, then switch a peak to a lorentzian and fit again
+#
+# Every callback's output becomes the next callback's input (e.g. the peaks figure is sent back to "update_table"), just like the browser,
+# and the requests are built from the app's own "/_dash-dependencies" and "/_dash-layout", so they stay in sync with the dashboard's callbacks.
+#
+# For every concurrency level, the report has each callback's p50/p95/p99 latency, throughput, and error count, along with the server's RSS,
+# so runs can be compared across code versions (see "--label" and "--output").
+
+LOAD_TEST_CONCURRENCY_LEVELS = [1, 2, 4, 8]
+LOAD_TEST_SESSIONS_PER_CLIENT = 2
+LOAD_TEST_PORT = 8765
+
+# how long the server gets to start (it loads every FITS file and the HITRAN tables on import), and how long a single request may take (seconds)
+SERVER_START_TIMEOUT = 300
+REQUEST_TIMEOUT = 300
+
+# how often the server's RSS is sampled (seconds)
+RSS_SAMPLE_INTERVAL = 0.2
+
+# width (cm^-1) of the box selection, and the prominences the session tunes through
+SELECTION_WIDTH = 1.0
+PEAK_TUNING_PROMINENCES = [0.01, 0.02, 0.05]
+
+LATENCY_PERCENTILES = [50, 95, 99]
+
+# the dashboard is started in its own process, so its RSS (and its GIL) is separate from the clients'
+SERVER_SCRIPT = """
+import sys
+import dashboard_spectra_and_hitran as dashboard
+dashboard.start_fits_watcher()
+dashboard.app.run(host = "127.0.0.1", port = int(sys.argv[1]), debug = False, threaded = True)
+"""
+
+# function starts the dashboard in a subprocess, running in "data_dir" (where HITRAN_Data and the model atmosphere table are) and reading FITS files from "exes_dir"
+def start_dashboard_server(data_dir, exes_dir, port = LOAD_TEST_PORT, log_path = os.devnull):
+
+    repository_dir = os.path.dirname(os.path.abspath(__file__))
+
+    env = dict(os.environ)
+    env["EXES_DIRECTORY"] = os.path.abspath(exes_dir)
+    env["PYTHONPATH"] = repository_dir + os.pathsep + env.get("PYTHONPATH", "")
+
+    log_file = open(log_path, "w")
+
+    return subprocess.Popen([sys.executable, "-c", SERVER_SCRIPT, str(port)], cwd = data_dir, env = env, stdout = log_file, stderr = subprocess.STDOUT)
+
+# function waits until the server answers (or raises if it exits or doesn't answer in time)
+def wait_for_server(url, process, timeout = SERVER_START_TIMEOUT):
+
+    start_time = time.perf_counter()
+
+    while time.perf_counter() - start_time < timeout:
+
+        if process.poll() is not None:
+            raise RuntimeError("The dashboard exited with code " + str(process.returncode) + " before it started serving")
+
+        try:
+            if requests.get(url + "/_dash-layout", timeout = 5).status_code == 200:
+                return time.perf_counter() - start_time
+        except requests.ConnectionError:
+            pass
+
+        time.sleep(0.5)
+
+    raise TimeoutError("The dashboard didn't start serving within " + str(timeout) + " seconds")
+
+# function returns the resident set size (bytes) of a process (Linux only, None elsewhere)
+def get_rss_bytes(pid):
+
+    try:
+        with open("/proc/" + str(pid) + "/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+
+    except OSError:
+        return None
+
+    return None
+
+# samples a process's RSS in the background until stopped
+class RssSampler(threading.Thread):
+
+    def __init__(self, pid, interval = RSS_SAMPLE_INTERVAL):
+
+        super().__init__(daemon = True)
+
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+
+        while not self.stopped.is_set():
+
+            rss_bytes = get_rss_bytes(self.pid)
+            if rss_bytes is not None:
+                self.samples.append(rss_bytes)
+
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+
+        self.stopped.set()
+        self.join()
+
+# function collects the initial value of every component property in the layout, as "id.property" -> value
+def get_layout_values(component, values = None):
+
+    values = {} if values is None else values
+
+    if isinstance(component, list):
+        for child in component:
+            get_layout_values(child, values)
+
+    elif isinstance(component, dict) and "props" in component:
+
+        props = component["props"]
+
+        if "id" in props:
+            for name, value in props.items():
+                values[str(props["id"]) + "." + name] = value
+
+        get_layout_values(props.get("children"), values)
+
+    return values
+
+# function splits a dependency's output string into its "id.property" outputs (several outputs are written as "..a.b...c.d..")
+def get_dependency_outputs(output):
+
+    if output.startswith(".."):
+        return output[2:-2].split("...")
+
+    return [output]
+
+# function builds the body of a "/_dash-update-component" request, the same way the browser does
+def get_callback_request(dependency, values, changed_prop_ids):
+
+    def get_prop(item):
+        return {"id": item["id"], "property": item["property"], "value": values.get(item["id"] + "." + item["property"])}
+
+    outputs = [{"id": output.rsplit(".", 1)[0].split("@")[0], "property": output.rsplit(".", 1)[1]} for output in get_dependency_outputs(dependency["output"])]
+
+    return {
+        "output": dependency["output"],
+        "outputs": outputs if len(outputs) > 1 else outputs[0],
+        "inputs": [get_prop(item) for item in dependency["inputs"]],
+        "state": [get_prop(item) for item in dependency.get("state", [])],
+        "changedPropIds": changed_prop_ids,
+    }
+
+# function applies a Patch response (only the "Assign" operations the dashboard uses) to a copy of a figure
+def apply_patch(figure, patch):
+
+    figure = json.loads(json.dumps(figure))
+
+    for operation in patch.get("operations", []):
+
+        if operation["operation"] != "Assign":
+            continue
+
+        target = figure
+        for key in operation["location"][:-1]:
+            target = target[key]
+
+        target[operation["location"][-1]] = operation["params"]["value"]
+
+    return figure
+
+# a simulated analyst: keeps the values of every component (like the browser does), and times every callback request
+class DashClient:
+
+    def __init__(self, url, dependencies, layout_values):
+
+        self.url = url
+        self.session = requests.Session()
+        self.values = dict(layout_values)
+        self.records = []
+
+        # "id.property" of a callback's first output -> dependency
+        self.dependencies = {get_dependency_outputs(dependency["output"])[0].split("@")[0]: dependency for dependency in dependencies}
+
+    # calls the callback whose first output is "output", after setting the changed values, and stores its outputs in "values"
+    def call(self, callback_name, output, changed_values):
+
+        self.values.update(changed_values)
+        dependency = self.dependencies[output]
+
+        # clientside callbacks run in the browser, so there's no request to time
+        if dependency.get("clientside_function"):
+            return True
+
+        start_time = time.perf_counter()
+
+        try:
+            response = self.session.post(self.url + "/_dash-update-component", json = get_callback_request(dependency, self.values, list(changed_values)), timeout = REQUEST_TIMEOUT)
+            status_code = response.status_code
+        except requests.RequestException:
+            response = None
+            status_code = None
+
+        self.records.append({"callback": callback_name, "seconds": time.perf_counter() - start_time, "status_code": status_code, "completed_time": time.time()})
+
+        if (response is None) or (status_code != 200):
+            return False
+
+        for component_id, properties in response.json().get("response", {}).items():
+            for name, value in properties.items():
+
+                key = component_id + "." + name
+
+                # a Patch only sends back what changed, so it's applied to the figure the client already has
+                if isinstance(value, dict) and ("__dash_patch_update" in value):
+                    value = apply_patch(self.values.get(key), value)
+
+                self.values[key] = value
+
+        return True
+
+# function replays one analyst session for an observation, selecting the window around "selection_center"
+def run_session(client, file_name, object_name, selection_center):
+
+    client.call("on_geo_map_click", "exps_map.figure", {"observation_selection.value": [object_name]})
+
+    if not client.call("update_graph", "exp_spectra.figure", {"exps_map.clickData": {"points": [{"hovertext": file_name}]}}):
+        return
+
+    selection = {"range": {"x": [selection_center - SELECTION_WIDTH / 2, selection_center + SELECTION_WIDTH / 2], "y": [0, 2]}}
+
+    if not client.call("update_spectra_peaks", "spectra_peaks.figure", {"exp_spectra.selectedData": selection}):
+        return
+
+    for prominence in PEAK_TUNING_PROMINENCES:
+        client.call("update_spectra_peaks", "spectra_peaks.figure", {"prominence_parameter.value": prominence})
+
+    if not client.call("update_table", "dynamic_table.data", {"spectra_peaks.figure": client.values["spectra_peaks.figure"]}):
+        return
+
+    table_data = client.values.get("dynamic_table.data") or []
+
+    client.call("update_spectra_fits", "spectra_fit.figure", {"dynamic_table.data": table_data})
+
+    # edit the table, the way an analyst switches a peak's model
+    if table_data:
+        edited_table_data = [dict(peak_data) for peak_data in table_data]
+        edited_table_data[0]["peak_model"] = "lorentzian"
+        client.call("update_spectra_fits", "spectra_fit.figure", {"dynamic_table.data": edited_table_data})
+
+# function returns (file name, object, wavenumber of the deepest telluric line) for every FITS file, so each session selects a window with peaks in it
+def get_session_targets(exes_dir, extension = ".fits"):
+
+    targets = []
+
+    for file_name in sorted(file for file in os.listdir(exes_dir) if file.endswith(extension)):
+
+        with fits.open(os.path.join(exes_dir, file_name), memmap = True) as hdulist:
+            object_name = hdulist[0].header["OBJECT"]
+            wavenumber = np.array(hdulist[0].data[0], dtype = float)
+            atran = np.array(hdulist[0].data[3], dtype = float)
+
+        usable = np.isfinite(wavenumber) & np.isfinite(atran)
+        targets.append((file_name, object_name, float(wavenumber[usable][np.argmin(atran[usable])])))
+
+    return targets
+
+# function runs "concurrency" clients at once, each replaying "sessions_per_client" sessions, returns the request records, the wall time, and the RSS samples
+def run_load_level(url, pid, dependencies, layout_values, targets, concurrency, sessions_per_client):
+
+    clients = [DashClient(url, dependencies, layout_values) for _ in range(concurrency)]
+
+    def run_client(client_index):
+        for session_index in range(sessions_per_client):
+            run_session(clients[client_index], *targets[(client_index + session_index * concurrency) % len(targets)])
+
+    rss_sampler = RssSampler(pid)
+    rss_sampler.start()
+
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers = concurrency) as executor:
+        list(executor.map(run_client, range(concurrency)))
+
+    wall_seconds = time.perf_counter() - start_time
+    rss_sampler.stop()
+
+    return [record for client in clients for record in client.records], wall_seconds, rss_sampler.samples
+
+# function summarizes one concurrency level's records into one row per callback (and an "all" row)
+def summarize_load_level(records, wall_seconds, rss_samples, concurrency):
+
+    records_df = pd.DataFrame(records, columns = ["callback", "seconds", "status_code", "completed_time"])
+    rows = []
+
+    for callback_name, callback_df in [("all", records_df)] + list(records_df.groupby("callback", sort = False)):
+
+        successful_seconds = callback_df.loc[callback_df["status_code"] == 200, "seconds"].to_numpy()
+
+        row = {
+            "concurrency": concurrency,
+            "callback": callback_name,
+            "requests": len(callback_df),
+            "errors": int((callback_df["status_code"] != 200).sum()),
+        }
+
+        for percentile in LATENCY_PERCENTILES:
+            row["p" + str(percentile) + "_ms"] = np.percentile(successful_seconds, percentile) * 1000 if len(successful_seconds) else np.nan
+
+        row["throughput_per_second"] = len(successful_seconds) / wall_seconds if wall_seconds > 0 else np.nan
+        row["max_rss_mb"] = max(rss_samples) / 2 ** 20 if rss_samples else np.nan
+        row["end_rss_mb"] = rss_samples[-1] / 2 ** 20 if rss_samples else np.nan
+
+        rows.append(row)
+
+    return rows
+
+# function starts the server, replays the sessions at every concurrency level, and returns the report
+# without an "exes_dir", the synthetic fixtures are written to a temporary directory and used instead
+def run_load_test(concurrency_levels = LOAD_TEST_CONCURRENCY_LEVELS, sessions_per_client = LOAD_TEST_SESSIONS_PER_CLIENT, exes_dir = None, data_dir = None, port = LOAD_TEST_PORT, label = None, log_path = os.devnull):
+
+    with tempfile.TemporaryDirectory() as fixture_dir:
+
+        if exes_dir is None:
+            exes_dir = write_synthetic_fixtures(fixture_dir)
+            data_dir = fixture_dir
+
+        # the server needs HITRAN_Data and the model atmosphere table in its working directory
+        data_dir = os.path.abspath(os.path.dirname(os.path.abspath(exes_dir)) if data_dir is None else data_dir)
+
+        url = "http://127.0.0.1:" + str(port)
+        process = start_dashboard_server(data_dir, exes_dir, port, log_path)
+
+        try:
+            start_seconds = wait_for_server(url, process)
+            print("server started in", round(start_seconds, 1), "s")
+
+            dependencies = requests.get(url + "/_dash-dependencies", timeout = REQUEST_TIMEOUT).json()
+            layout_values = get_layout_values(requests.get(url + "/_dash-layout", timeout = REQUEST_TIMEOUT).json())
+            targets = get_session_targets(exes_dir)
+
+            rows = []
+
+            for concurrency in concurrency_levels:
+
+                records, wall_seconds, rss_samples = run_load_level(url, process.pid, dependencies, layout_values, targets, concurrency, sessions_per_client)
+                rows += summarize_load_level(records, wall_seconds, rss_samples, concurrency)
+
+                print("concurrency", concurrency, "done in", round(wall_seconds, 1), "s")
+
+        finally:
+            process.terminate()
+            process.wait()
+
+    report = pd.DataFrame(rows)
+
+    if label is not None:
+        report.insert(0, "label", label)
+
+    return report
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Replay analyst sessions against the dashboard from several concurrent clients")
+    parser.add_argument("--concurrency", type = int, nargs = "+", default = LOAD_TEST_CONCURRENCY_LEVELS, help = "numbers of concurrent clients to test")
+    parser.add_argument("--sessions", type = int, default = LOAD_TEST_SESSIONS_PER_CLIENT, help = "sessions each client replays per concurrency level")
+    parser.add_argument("--exes-directory", default = None, help = "directory of FITS files to use instead of the synthetic fixtures")
+    parser.add_argument("--data-directory", default = None, help = "directory with HITRAN_Data and the model atmosphere table (defaults to the parent of --exes-directory)")
+    parser.add_argument("--port", type = int, default = LOAD_TEST_PORT)
+    parser.add_argument("--label", default = None, help = "label for this run (e.g. the code version), added as a column of the report")
+    parser.add_argument("--output", default = None, help = "CSV file to append the report to")
+    parser.add_argument("--server-log", default = os.devnull, help = "file to write the dashboard's output to")
+    arguments = parser.parse_args()
+
+    report = run_load_test(arguments.concurrency, arguments.sessions, arguments.exes_directory, arguments.data_directory, arguments.port, arguments.label, arguments.server_log)
+
+    print(report.to_string(index = False, float_format = lambda value: format(value, ".1f")))
+
+    if arguments.output is not None:
+        report.to_csv(arguments.output, mode = "a", header = not os.path.exists(arguments.output), index = False)
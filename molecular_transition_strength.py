@@ -1,7 +1,9 @@
+import numpy as np
 import pandas as pd
 from hitran_molecule_info import get_transition_strength_for_temp
 from hitran_molecule_info import MoleculeDataNotFound
-from atmospheric_info import get_atmosphere_info_for_altitude
+from atmospheric_info import get_atmosphere_info_for_altitude, get_atmosphere_dataframe
+from dual_path import dual_path
 
 
 
@@ -128,8 +130,8 @@ ISOTOPOLOGUE_COLOR_CONFIG = {
         "H2(17O)": "navy",
         "HD(16O)": "rgb(0, 83, 146)",
         "HD(18O)": "aqua",
-        "HD(17O)": "midnight",
-        "D2(16O)": "sky",
+        "HD(17O)": "midnightblue",
+        "D2(16O)": "skyblue",
 
         "O3": "rgb(0, 99, 26)",
         "O2(18O)": "rgb(0, 176, 136)",
@@ -181,20 +183,10 @@ ISOTOPOLOGUE_COLOR_CONFIG = {
 #     for isotopologue in isotopologue_dict:
 #         total_isotopologue_count += 1
 
-# multiplies column density for experiment altitude and creates a new column in the dataframe returned by "get_transition_strength_for_temp"
-def get_transition_strength_for_location(molecule_name, experimental_temp, altitude_km, latitude = None, wavenumber_range = None, cutoff = None) : 
-    
-    # initialize dataframe with column for temperature dependent transition strength
-    try:
-        molecule_df = get_transition_strength_for_temp(molecule_name, experimental_temp, wavenumber_range)
+# returns the column density of a molecule (multiplied by its concentration) at a given altitude and latitude
+# returns None if the model atmosphere table doesn't list a column density for that location
+def get_column_density_for_location(molecule_name, altitude_km, latitude = None):
 
-    # if the molecule data is not found (this is a normal occurrence when the wavelength is filtered)    
-    except MoleculeDataNotFound as e:
-        print(f"Caught an exception: {e}")
-        print("Don't worry: this probably means that there just aren't any transitions for that specific molecule in the wavenumber range that was specified")
-        return None
-
-    
     # initialize dataframe row for specific altitude
     atm_info = get_atmosphere_info_for_altitude(altitude_km)
 
@@ -220,18 +212,90 @@ def get_transition_strength_for_location(molecule_name, experimental_temp, altit
             print("ozone column densities are not listed above 56 degrees")
             return None
 
-        # calculate expected transition strength based on column density and molecular concetration
-        molecule_df["col_den_trans"] = molecule_df["exp_trans_strength"] * column_density * molecular_concentration
-
-    # if the molecule is not latitude dependent (i.e. it's not ozone), then we just calculate the new transition strength the easy way
+    # if the molecule is not latitude dependent (i.e. it's not ozone), then we just take the column density the easy way
     else: 
-        # initialize column density value
         column_density = atm_info[MOLECULE_CONFIG[molecule_name]["column_density_header"]]
-        molecule_df["col_den_trans"] = molecule_df["exp_trans_strength"] * column_density * molecular_concentration
+
+    return float(column_density) * molecular_concentration
+
+# calls "get_column_density_for_location()" for every location, and returns an array like "get_column_densities_for_locations()" (for dual path mode, see dual_path.py)
+# a location that "get_column_density_for_location()" can't look up (an altitude below the table, or a cell that isn't a number) is NaN, like it is in the vectorized version
+def get_reference_column_densities_for_locations(molecule_name, altitudes_km, latitudes = None):
+
+    altitudes_km = np.atleast_1d(np.asarray(altitudes_km, dtype = float))
+    latitudes = [None] * len(altitudes_km) if latitudes is None else np.broadcast_to(np.asarray(latitudes, dtype = float), altitudes_km.shape)
+
+    column_densities = []
+
+    for altitude_km, latitude in zip(altitudes_km, latitudes):
+        try:
+            column_density = get_column_density_for_location(molecule_name, altitude_km, latitude)
+        except ValueError:
+            column_density = None
+
+        column_densities.append(np.nan if column_density is None else column_density)
+
+    return np.array(column_densities, dtype = float)
+
+# does the same thing as "get_column_density_for_location()" for whole arrays of altitudes (kilometers) and latitudes at once
+# returns NaN wherever "get_column_density_for_location()" would return None (ozone above 56 degrees), or the altitude is below the table
+@dual_path("column_densities", get_reference_column_densities_for_locations)
+def get_column_densities_for_locations(molecule_name, altitudes_km, latitudes = None):
+
+    atm_df = get_atmosphere_dataframe()
+    table_altitudes = atm_df["Alt (KM)"].to_numpy(dtype = float)
+
+    # the row for each altitude is the highest table altitude that is <= the altitude (the table is sorted by altitude)
+    altitudes_km = np.atleast_1d(np.asarray(altitudes_km, dtype = float))
+    row_index = np.searchsorted(table_altitudes, altitudes_km, side = "right") - 1
+    valid_rows = row_index >= 0
+    row_index = np.maximum(row_index, 0)
+
+    molecular_concentration = MOLECULE_CONFIG[molecule_name]["concentration"]
+
+    if MOLECULE_CONFIG[molecule_name]["is_lat_dependent"]:
+
+        latitudes = np.broadcast_to(np.asarray(latitudes, dtype = float), altitudes_km.shape)
+        latitude_dependent_table = atm_df[MOLECULE_CONFIG[molecule_name]["column_density_header"]].apply(pd.to_numeric, errors = "coerce").to_numpy(dtype = float)
+
+        # same latitude bands as "get_column_density_for_location()", with NaN above 56 degrees
+        band_index = np.select([latitudes <= 9, latitudes <= 36, latitudes <= 43, latitudes <= 56], [0, 1, 2, 3], default = -1)
+        column_densities = np.where(band_index >= 0, latitude_dependent_table[row_index, np.maximum(band_index, 0)], np.nan)
+
+    else:
+        # (a few cells in the excel sheet aren't numbers, e.g. "2.55%18" in the H2O column at 21.6 km, and those become NaN)
+        column_densities = pd.to_numeric(atm_df[MOLECULE_CONFIG[molecule_name]["column_density_header"]], errors = "coerce").to_numpy(dtype = float)[row_index]
+
+    return np.where(valid_rows, column_densities * molecular_concentration, np.nan)
+
+# multiplies column density for experiment altitude and creates a new column in the dataframe returned by "get_transition_strength_for_temp"
+def get_transition_strength_for_location(molecule_name, experimental_temp, altitude_km, latitude = None, wavenumber_range = None, cutoff = None) : 
+    
+    # initialize dataframe with column for temperature dependent transition strength
+    try:
+        molecule_df = get_transition_strength_for_temp(molecule_name, experimental_temp, wavenumber_range)
+
+    # if the molecule data is not found (this is a normal occurrence when the wavelength is filtered)    
+    except MoleculeDataNotFound as e:
+        print(f"Caught an exception: {e}")
+        print("Don't worry: this probably means that there just aren't any transitions for that specific molecule in the wavenumber range that was specified")
+        return None
+
+    
+    # initialize the column density multiplied by the molecule's concentration
+    column_density = get_column_density_for_location(molecule_name, altitude_km, latitude)
+
+    # ozone column densities aren't listed for every latitude
+    if column_density is None:
+        return None
+
+    # calculate expected transition strength based on column density and molecular concetration
+    molecule_df["col_den_trans"] = molecule_df["exp_trans_strength"] * column_density
     
+    # only keep the transitions that are at least as strong as the cutoff
     if cutoff:
-        cutoff_condition = molecule_df >= cutoff
-        filtered_molecule_df = molecule_df[cutoff_condition]
+        cutoff_condition = molecule_df["col_den_trans"] >= cutoff
+        molecule_df = molecule_df[cutoff_condition]
     
     # return the final dataframe
     return molecule_df
@@ -0,0 +1,200 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy.fft import rfft, irfft, next_fast_len
+
+from exes_info import get_raw_exes_file_data
+from spectra_archive import get_raw_data_reader
+from continuum_estimation import get_flux_normalization
+from hitran_overlay import HitranOverlay
+from column_density_retrieval import get_uniform_wavenumber_grid, get_uniform_line_spectra, RESOLVING_POWER
+
+# READ ME:
+# These functions check which molecules are actually in an observation, and whether the observation's wavenumbers are offset from HITRAN's,
+# by cross-correlating the observed absorption against a template spectrum of each molecule (and each isotopologue).
+#
+# 1. The normalized flux is resampled onto a uniform wavenumber grid, and turned into an absorption depth (1 - norm_flux).
+# 2. Every isotopologue's lines ("col_den_trans" strengths, e.g. from "get_transition_strength_for_location()") are spread out over the
+#    instrument's line profile on the same grid. A molecule's template is the sum of its isotopologues' templates.
+# 3. The spectrum is correlated against every template at every shift at once: one FFT of the spectrum, one batched FFT of all the templates,
+#    a multiplication, and one batched inverse FFT.
+#
+# The best shift is the one (within MAX_WAVENUMBER_SHIFT) with the highest correlation,
+# and the significance is how many (robust) standard deviations that peak is above the correlation at all the other shifts.
+
+# the largest wavenumber offset (cm^-1) that gets searched for
+MAX_WAVENUMBER_SHIFT = 0.1
+
+# the noise of the correlation is estimated from the shifts between NOISE_SHIFT_MULTIPLE * MAX_WAVENUMBER_SHIFT and NOISE_WAVENUMBER_SHIFT
+# (limited to a quarter of the spectrum, so the spectrum and the templates still mostly overlap)
+NOISE_SHIFT_MULTIPLE = 2
+NOISE_WAVENUMBER_SHIFT = 2.0
+
+# median absolute deviation -> standard deviation (for normally distributed values)
+MAD_TO_STANDARD_DEVIATION = 1.4826
+
+# function builds the absorption depth of an observation on a uniform wavenumber grid
+# returns the grid and the (mean subtracted) absorption depth, points without a finite flux are interpolated over
+def get_uniform_absorption_depth(wavenumber, norm_flux):
+
+    usable_points = np.isfinite(wavenumber) & np.isfinite(norm_flux)
+    wavenumber_order = np.argsort(wavenumber[usable_points], kind = "stable")
+
+    sorted_wavenumber = wavenumber[usable_points][wavenumber_order]
+    sorted_norm_flux = norm_flux[usable_points][wavenumber_order]
+
+    uniform_grid = get_uniform_wavenumber_grid(sorted_wavenumber)
+    absorption_depth = 1 - np.interp(uniform_grid, sorted_wavenumber, sorted_norm_flux)
+
+    return uniform_grid, absorption_depth - np.mean(absorption_depth)
+
+# function builds a template for every isotopologue and every molecule from a dictionary of isotopologue -> {"molecule", "wavenumber", "col_den_trans"}
+# returns a (templates x grid) array, along with a dataframe describing each row ("name", "level", "molecule", "line_count")
+def get_template_spectra(isotopologue_lines, uniform_grid, resolving_power = RESOLVING_POWER):
+
+    isotopologue_names = list(isotopologue_lines)
+    molecule_names = list(dict.fromkeys(lines["molecule"] for lines in isotopologue_lines.values()))
+
+    if not isotopologue_names:
+        return np.zeros((0, len(uniform_grid))), pd.DataFrame(columns = ["name", "level", "molecule", "line_count"])
+
+    line_wavenumbers = np.concatenate([np.asarray(lines["wavenumber"], dtype = float) for lines in isotopologue_lines.values()])
+    line_strengths = np.concatenate([np.asarray(lines["col_den_trans"], dtype = float) for lines in isotopologue_lines.values()])
+    line_groups = np.concatenate([np.full(len(lines["wavenumber"]), i) for i, lines in enumerate(isotopologue_lines.values())])
+
+    isotopologue_templates = get_uniform_line_spectra(uniform_grid, line_wavenumbers, line_strengths, line_groups, len(isotopologue_names), resolving_power)
+
+    isotopologue_molecule_index = np.array([molecule_names.index(isotopologue_lines[isotopologue]["molecule"]) for isotopologue in isotopologue_names])
+    molecule_templates = np.zeros((len(molecule_names), len(uniform_grid)))
+    np.add.at(molecule_templates, isotopologue_molecule_index, isotopologue_templates)
+
+    in_range = (line_wavenumbers >= uniform_grid[0]) & (line_wavenumbers <= uniform_grid[-1]) & np.isfinite(line_strengths)
+    isotopologue_line_counts = np.bincount(line_groups[in_range], minlength = len(isotopologue_names))
+    molecule_line_counts = np.bincount(isotopologue_molecule_index, weights = isotopologue_line_counts, minlength = len(molecule_names)).astype(int)
+
+    template_info = pd.DataFrame({
+        "name": molecule_names + isotopologue_names,
+        "level": ["molecule"] * len(molecule_names) + ["isotopologue"] * len(isotopologue_names),
+        "molecule": molecule_names + [isotopologue_lines[isotopologue]["molecule"] for isotopologue in isotopologue_names],
+        "line_count": np.concatenate([molecule_line_counts, isotopologue_line_counts]),
+    })
+
+    return np.vstack([molecule_templates, isotopologue_templates]), template_info
+
+# function cross-correlates one spectrum against every template at once
+# returns the correlation of every template at every shift (in grid points), for shifts -max_lag to +max_lag
+# a positive shift means the observed lines sit at higher wavenumbers than the template's
+def get_batched_cross_correlation(absorption_depth, templates, max_lag):
+
+    # zero padding so the correlation doesn't wrap around
+    fft_length = next_fast_len(len(absorption_depth) + templates.shape[1] - 1, real = True)
+
+    spectrum_fft = rfft(absorption_depth, fft_length)
+    template_fft = rfft(templates, fft_length, axis = 1)
+
+    correlation = irfft(spectrum_fft[np.newaxis, :] * np.conj(template_fft), fft_length, axis = 1)
+
+    # negative shifts wrap around to the end of the array
+    return np.concatenate([correlation[:, fft_length - max_lag:], correlation[:, :max_lag + 1]], axis = 1)
+
+# function finds the best shift and detection significance of every template
+def detect_molecules(wavenumber, norm_flux, isotopologue_lines, max_wavenumber_shift = MAX_WAVENUMBER_SHIFT, resolving_power = RESOLVING_POWER):
+
+    uniform_grid, absorption_depth = get_uniform_absorption_depth(wavenumber, norm_flux)
+    spacing = uniform_grid[1] - uniform_grid[0]
+
+    templates, template_info = get_template_spectra(isotopologue_lines, uniform_grid, resolving_power)
+
+    # normalize the templates so that the correlation at zero shift is a correlation coefficient
+    templates = templates - np.mean(templates, axis = 1, keepdims = True)
+    template_norms = np.linalg.norm(templates, axis = 1)
+    templates = templates / np.where(template_norms > 0, template_norms, 1)[:, np.newaxis]
+    spectrum_norm = np.linalg.norm(absorption_depth)
+
+    max_lag = max(min(int(np.ceil(NOISE_WAVENUMBER_SHIFT / spacing)), len(uniform_grid) // 4), 1)
+    search_lag = min(max(int(np.ceil(max_wavenumber_shift / spacing)), 1), max_lag)
+
+    correlation = get_batched_cross_correlation(absorption_depth, templates, max_lag) / (spectrum_norm if spectrum_norm > 0 else 1)
+    lags = np.arange(-max_lag, max_lag + 1)
+
+    # the peak is searched for within +/- MAX_WAVENUMBER_SHIFT, and the noise is estimated from the shifts well outside of it
+    search_window = np.abs(lags) <= search_lag
+    noise_window = np.abs(lags) > NOISE_SHIFT_MULTIPLE * search_lag
+    if not np.any(noise_window):
+        noise_window = ~search_window
+
+    search_correlation = correlation[:, search_window]
+    best_position = np.argmax(search_correlation, axis = 1)
+    best_correlation = search_correlation[np.arange(len(templates)), best_position]
+    best_lag = lags[search_window][best_position].astype(float)
+
+    # parabolic interpolation between the neighbouring shifts for a sub-grid point shift
+    rows = np.arange(len(templates))
+    left = search_correlation[rows, np.maximum(best_position - 1, 0)]
+    right = search_correlation[rows, np.minimum(best_position + 1, search_correlation.shape[1] - 1)]
+    curvature = left - 2 * best_correlation + right
+    interior = (best_position > 0) & (best_position < search_correlation.shape[1] - 1) & (curvature < 0)
+    best_lag[interior] += 0.5 * (left[interior] - right[interior]) / curvature[interior]
+
+    noise_correlation = correlation[:, noise_window]
+    noise_median = np.median(noise_correlation, axis = 1)
+    noise_standard_deviation = MAD_TO_STANDARD_DEVIATION * np.median(np.abs(noise_correlation - noise_median[:, np.newaxis]), axis = 1)
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        significance = np.where(noise_standard_deviation > 0, (best_correlation - noise_median) / noise_standard_deviation, np.nan)
+
+    # templates without any lines in range can't be detected
+    empty_templates = template_norms == 0
+    significance[empty_templates] = np.nan
+    best_correlation[empty_templates] = np.nan
+    best_lag[empty_templates] = np.nan
+
+    detection_df = template_info.copy()
+    detection_df["significance"] = significance
+    detection_df["correlation"] = best_correlation
+    detection_df["wavenumber_shift"] = best_lag * spacing
+
+    return detection_df
+
+# function runs the detection for a dictionary returned by "get_raw_exes_file_data()" (or a stack), using the overlay for the observation's own temperature and location
+def detect_molecules_for_raw_data(raw_data, overlay = None, temperature = None, altitude_km = None, latitude = None, continuum_method = None):
+
+    if overlay is None:
+        overlay = HitranOverlay(raw_data["wavenumber"])
+
+    isotopologue_lines = overlay.get_isotopologue_lines(
+        raw_data["temperature"] if temperature is None else temperature,
+        raw_data["avg_altitude_km"] if altitude_km is None else altitude_km,
+        raw_data["latitude"] if latitude is None else latitude,
+    )
+
+    # a single normalization value, or the estimated continuum at every sample (see continuum_estimation.py)
+    norm = get_flux_normalization(raw_data, continuum_method)
+
+    return detect_molecules(raw_data["wavenumber"], raw_data["flux"] / norm, isotopologue_lines)
+
+# function runs the detection over every FITS file in a directory, and returns one dataframe with a row per file and template
+def detect_molecules_for_archive(dir = "EXES_Files", extension = ".fits", continuum_method = None, archive = None):
+
+    detection_dfs = []
+
+    file_names, read_raw_data = get_raw_data_reader(dir, extension, archive)
+
+    for file_name in file_names:
+
+        raw_data = read_raw_data(file_name)
+
+        detection_df = detect_molecules_for_raw_data(raw_data, continuum_method = continuum_method)
+        detection_df.insert(0, "file_name", file_name)
+        detection_df.insert(1, "object", raw_data["object"])
+
+        detection_dfs.append(detection_df)
+
+    if not detection_dfs:
+        return pd.DataFrame()
+
+    return pd.concat(detection_dfs, ignore_index = True)
+
+
+if __name__ == "__main__":
+    print(detect_molecules_for_archive().to_string())
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks, peak_prominences, peak_widths
+
+# READ ME:
+# "find_peaks()" has to look at every sample of the spectrum again each time one of its parameters changes,
+# even though the local minima of a spectrum (and how deep and wide they are) never change for a given smoothed spectrum.
+#
+# So every local minimum of the (smoothed) flux gets found once, together with its prominence, width, and flux,
+# and kept in wavenumber order. Any (height, prominence, distance, selection range) query is then just a slice and a few masks over those arrays,
+# applied in the same order as "find_peaks()" applies them (height, then distance, then prominence).
+#
+# One difference from running "find_peaks()" on the selected slice: prominences are measured against the whole spectrum,
+# so a dip near the edge of a selection keeps the prominence it really has, instead of one cut short by the selection.
+
+class PeakHierarchy:
+
+    def __init__(self, wavenumber, flux):
+
+        wavenumber = np.asarray(wavenumber, dtype = float)
+        flux = np.asarray(flux, dtype = float)
+
+        # samples without a finite flux are never part of a selection, so they're left out (same as "update_plot_axes_ranges()")
+        finite_samples = np.isfinite(wavenumber) & np.isfinite(flux)
+        wavenumber_order = np.argsort(wavenumber[finite_samples], kind = "stable")
+
+        self.wavenumber = wavenumber[finite_samples][wavenumber_order]
+        self.flux = flux[finite_samples][wavenumber_order]
+
+        # the dips in the flux are the peaks of the inverted flux
+        inverted_flux = -self.flux
+
+        peak_index, _ = find_peaks(inverted_flux)
+        prominences, left_bases, right_bases = peak_prominences(inverted_flux, peak_index)
+        widths, width_heights, left_positions, right_positions = peak_widths(inverted_flux, peak_index, rel_height = 0.5, prominence_data = (prominences, left_bases, right_bases))
+
+        sample_positions = np.arange(len(self.wavenumber))
+
+        # per peak arrays (in wavenumber order)
+        self.peak_index = peak_index
+        self.peak_wavenumber = self.wavenumber[peak_index]
+        self.peak_flux = self.flux[peak_index]
+        self.peak_prominence = prominences
+        self.peak_width = widths # in samples
+        self.peak_fwhm = np.abs(np.interp(right_positions, sample_positions, self.wavenumber) - np.interp(left_positions, sample_positions, self.wavenumber)) if len(sample_positions) else widths
+
+    # returns the positions (in the per peak arrays) of the peaks that pass the query
+    # "height" is the highest flux a dip can have (the same as passing -height to "find_peaks()" on the inverted flux)
+    def query(self, x_lower = None, x_upper = None, y_lower = None, y_upper = None, height = None, prominence = None, distance = None):
+
+        start = 0 if x_lower is None else np.searchsorted(self.peak_wavenumber, x_lower, side = "left")
+        stop = len(self.peak_wavenumber) if x_upper is None else np.searchsorted(self.peak_wavenumber, x_upper, side = "right")
+
+        positions = np.arange(start, stop)
+        peak_flux = self.peak_flux[positions]
+
+        keep = np.ones(len(positions), dtype = bool)
+
+        if y_lower is not None:
+            keep &= peak_flux >= y_lower
+        if y_upper is not None:
+            keep &= peak_flux <= y_upper
+        if height is not None:
+            keep &= peak_flux <= height
+
+        positions = positions[keep]
+
+        if distance is not None:
+            positions = positions[select_peaks_by_distance(self.peak_index[positions], -self.peak_flux[positions], distance)]
+
+        if prominence is not None:
+            positions = positions[self.peak_prominence[positions] >= prominence]
+
+        return positions
+
+    # returns a dataframe of the peaks at the given positions
+    def get_peaks_dataframe(self, positions):
+
+        return pd.DataFrame({
+            "wavenumber": self.peak_wavenumber[positions],
+            "flux": self.peak_flux[positions],
+            "prominence": self.peak_prominence[positions],
+            "width": self.peak_width[positions],
+            "fwhm": self.peak_fwhm[positions],
+        })
+
+# function keeps the highest priority peaks that are at least "distance" samples away from each other (the same rule "find_peaks()" uses)
+# "peak_index" has to be sorted, and the returned mask lines up with it
+def select_peaks_by_distance(peak_index, priority, distance):
+
+    distance = np.ceil(distance)
+    keep = np.ones(len(peak_index), dtype = bool)
+
+    # go through the peaks from the highest priority down, and remove the (lower priority) neighbours that are too close
+    for i in np.argsort(priority, kind = "stable")[::-1]:
+
+        if not keep[i]:
+            continue
+
+        left = np.searchsorted(peak_index, peak_index[i] - distance, side = "right")
+        right = np.searchsorted(peak_index, peak_index[i] + distance, side = "left")
+
+        keep[left:i] = False
+        keep[i + 1:right] = False
+
+    return keep
@@ -0,0 +1,155 @@
+import base64
+import json
+import time
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+# READ ME:
+# By default, every x and y value in a figure gets written into the JSON payload as a decimal number (something like "1302.4567891234567,").
+# That's roughly three times bigger than the 8 bytes the float actually takes up, and both sides spend most of their time writing/parsing those numbers.
+#
+# Plotly.js also accepts arrays in a binary "typed array" form:  {"dtype": "f8", "bdata": <base64 encoded bytes>}
+# The functions below convert trace arrays into that form before a figure gets sent to the browser, and convert them back when a figure comes back into a callback.
+# Traces that are only there to be looked at (e.g. atran and the HITRAN overlay) can also be downcast to float32, which halves their size again.
+
+# the keys of a trace that hold (potentially large) arrays of numbers
+TYPED_ARRAY_TRACE_KEYS = ["x", "y"]
+
+# numpy dtypes -> the dtype names that Plotly.js expects
+TYPED_ARRAY_DTYPES = {
+    "float64": "f8",
+    "float32": "f4",
+}
+
+# function converts an array of numbers into a Plotly.js typed array dictionary
+def encode_typed_array(values, downcast = False):
+
+    array = np.asarray(values, dtype = np.float32 if downcast else np.float64)
+
+    # Plotly.js reads the bytes as little endian
+    array = np.ascontiguousarray(array, dtype = array.dtype.newbyteorder("<"))
+
+    return {
+        "dtype": TYPED_ARRAY_DTYPES[array.dtype.name],
+        "bdata": base64.b64encode(array.tobytes()).decode("ascii"),
+    }
+
+# function does the opposite of "encode_typed_array()", and it also accepts regular lists (e.g. traces that were never encoded)
+def decode_typed_array(values):
+
+    if isinstance(values, dict) and "bdata" in values:
+
+        dtype = np.dtype(values["dtype"]).newbyteorder("<")
+        array = np.frombuffer(base64.b64decode(values["bdata"]), dtype = dtype)
+
+        if "shape" in values:
+            array = array.reshape([int(length) for length in str(values["shape"]).split(",")])
+
+        return array.astype(np.float64)
+
+    # JSON lists store NaN as null, which numpy turns back into NaN when the dtype is float
+    return np.array(values, dtype = np.float64)
+
+# function converts a trace (a plotly graph object or a dictionary) into a dictionary with typed array x and y values
+def encode_trace_arrays(trace, downcast = False):
+
+    if hasattr(trace, "to_plotly_json"):
+        trace = trace.to_plotly_json()
+    else:
+        trace = dict(trace)
+
+    for key in TYPED_ARRAY_TRACE_KEYS:
+
+        # some traces (e.g. the ones in "empty_spectra()") don't have any data to encode
+        if key in trace and trace[key] is not None and not isinstance(trace[key], dict) and len(trace[key]) > 0:
+            trace[key] = encode_typed_array(trace[key], downcast)
+
+    return trace
+
+# function applies "encode_trace_arrays()" to every trace in a list, downcasting the traces whose names are listed in "display_only_trace_names"
+def encode_trace_list(trace_list, display_only_trace_names = (), downcast_display_only = True):
+
+    encoded_trace_list = []
+
+    for trace in trace_list:
+
+        trace_name = trace.to_plotly_json().get("name") if hasattr(trace, "to_plotly_json") else trace.get("name")
+        downcast = downcast_display_only and (trace_name in display_only_trace_names)
+
+        encoded_trace_list.append(encode_trace_arrays(trace, downcast))
+
+    return encoded_trace_list
+
+# function returns how big a figure's JSON payload is (in bytes), how long it takes to encode, and how long it takes to decode back into numpy arrays (in seconds)
+def measure_figure_payload(figure, repeat = 5):
+
+    encode_times = []
+    decode_times = []
+
+    for i in range(repeat):
+
+        start_time = time.perf_counter()
+        payload = to_json_plotly(figure)
+        encode_times.append(time.perf_counter() - start_time)
+
+        # this is what happens when the figure comes back into a callback as an Input/State
+        start_time = time.perf_counter()
+        for trace in json.loads(payload)["data"]:
+            decode_typed_array(trace["x"])
+            decode_typed_array(trace["y"])
+        decode_times.append(time.perf_counter() - start_time)
+
+    return {"payload_bytes": len(payload.encode("utf-8")), "encode_seconds": min(encode_times), "decode_seconds": min(decode_times)}
+
+# function builds a figure that looks like a typical EXES order (atran, smoothed flux, and a stemplot HITRAN overlay), with made up numbers
+def get_synthetic_exes_order_figure(sample_count = 20000, overlay_line_count = 300, seed = 0):
+
+    random_generator = np.random.default_rng(seed)
+
+    wavenumber = np.linspace(1290.0, 1302.0, sample_count)
+    atran = 1 - 0.5 * random_generator.random(sample_count) ** 20
+    smooth_flux = atran + random_generator.normal(0, 0.01, sample_count)
+
+    line_wavenumbers = np.sort(random_generator.uniform(1290.0, 1302.0, overlay_line_count))
+    stem_x = np.repeat(line_wavenumbers, 3)
+    stem_y = np.zeros(len(stem_x))
+    stem_y[1::3] = 10 ** random_generator.uniform(-4, 0, overlay_line_count)
+
+    return {
+        "data": [
+            {"type": "scatter", "x": wavenumber, "y": atran, "name": "atran data", "yaxis": "y"},
+            {"type": "scatter", "x": wavenumber, "y": smooth_flux, "name": "experimental data", "yaxis": "y"},
+            {"type": "scatter", "x": stem_x, "y": stem_y, "name": "CH4", "yaxis": "y2"},
+        ],
+        "layout": {},
+    }
+
+# function compares the JSON number list payload against the typed array payload for a synthetic EXES order
+def compare_trace_transport(sample_count = 20000):
+
+    figure = get_synthetic_exes_order_figure(sample_count)
+
+    # the callbacks used to put pandas series straight into the traces, which get written out as JSON number lists
+    list_figure = {"data": [dict(trace, x = pd.Series(trace["x"]), y = pd.Series(trace["y"])) for trace in figure["data"]], "layout": {}}
+    float64_figure = {"data": encode_trace_list(figure["data"], downcast_display_only = False), "layout": {}}
+    float32_figure = {"data": encode_trace_list(figure["data"], display_only_trace_names = ("atran data", "CH4")), "layout": {}}
+
+    # the encoding step itself (numpy -> base64) is part of the "after" cost, so it gets timed too
+    start_time = time.perf_counter()
+    encode_trace_list(figure["data"], display_only_trace_names = ("atran data", "CH4"))
+    typed_array_conversion_seconds = time.perf_counter() - start_time
+
+
+    return {
+        "json number lists": measure_figure_payload(list_figure),
+        "typed arrays (float64)": measure_figure_payload(float64_figure),
+        "typed arrays (float32 display traces)": measure_figure_payload(float32_figure),
+        "typed array conversion seconds": typed_array_conversion_seconds,
+    }
+
+
+if __name__ == "__main__":
+
+    for transport, measurement in compare_trace_transport().items():
+        print(transport + ":", measurement)
@@ -0,0 +1,131 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# READ ME:
+# After the map is filtered (or while the mouse is over a point), the next click almost always lands on one of a few files,
+# so those files can be loaded and run through the pipeline before the click happens, and the click is then served from the pipeline's memo.
+#
+# The scheduler runs "prefetch_function(file_name, cancelled, **parameters)" for each scheduled file on a small pool of worker threads:
+#   - at most "worker_count" prefetches run at once, and their threads get a lower scheduling priority (Linux only), so they don't slow down the callbacks
+#   - every call to "schedule()" replaces what's wanted: the queued prefetches that aren't wanted anymore are cancelled before they start,
+#     and the running ones get their "cancelled" event set, so they can stop between steps
+#   - files that are already queued or running (with the same parameters) aren't scheduled twice
+#
+# A callback that is about to compute a file that is being prefetched can "wait_for()" it, instead of computing the same thing at the same time.
+
+PREFETCH_WORKER_COUNT = 2
+PREFETCH_FILE_LIMIT = 4
+
+# how much lower the priority of the prefetch threads is (see "man setpriority")
+PREFETCH_NICENESS = 10
+
+# the longest a callback waits for a running prefetch (in seconds) before computing the file itself
+PREFETCH_WAIT_TIMEOUT = 30.0
+
+# function lowers the scheduling priority of the calling thread (on Linux, where each thread has its own priority), and does nothing where that isn't possible
+def lower_thread_priority(niceness = PREFETCH_NICENESS):
+
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), os.getpriority(os.PRIO_PROCESS, threading.get_native_id()) + niceness)
+    except (AttributeError, OSError):
+        pass
+
+class PrefetchScheduler:
+
+    def __init__(self, prefetch_function, worker_count = PREFETCH_WORKER_COUNT, file_limit = PREFETCH_FILE_LIMIT):
+
+        self.prefetch_function = prefetch_function
+        self.file_limit = file_limit
+        self.executor = ThreadPoolExecutor(max_workers = worker_count, thread_name_prefix = "prefetch", initializer = lower_thread_priority)
+
+        # dictionary of (file name, parameters) -> {"future", "cancelled" (event), "done" (event)}
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+        self.stats = {"scheduled": 0, "completed": 0, "cancelled": 0, "failed": 0}
+
+    # schedules prefetches for the files (most likely first, only the first "file_limit" of them), and cancels every prefetch that isn't one of them
+    # returns the file names that are now queued or running
+    def schedule(self, file_names, **parameters):
+
+        parameter_key = tuple(sorted(parameters.items()))
+        wanted_keys = [(file_name, parameter_key) for file_name in list(dict.fromkeys(file_names))[:self.file_limit]]
+
+        with self.lock:
+
+            for key, task in list(self.tasks.items()):
+                if (key not in wanted_keys) and (not task["cancelled"].is_set()):
+                    self.cancel_task(key, task)
+
+            for key in wanted_keys:
+                if (key not in self.tasks) or self.tasks[key]["cancelled"].is_set():
+
+                    task = {"cancelled": threading.Event(), "done": threading.Event()}
+                    self.tasks[key] = task
+                    task["future"] = self.executor.submit(self.run_task, key, task, parameters)
+                    self.stats["scheduled"] += 1
+
+            return [key[0] for key in wanted_keys]
+
+    # stops a prefetch: a queued one never starts, and a running one is asked to stop at its next step (must hold the lock)
+    # a running prefetch stays in "tasks" until it actually stops, so "wait_for()" still sees it
+    def cancel_task(self, key, task):
+
+        task["cancelled"].set()
+
+        if task["future"].cancel():
+            task["done"].set()
+            self.tasks.pop(key, None)
+
+        self.stats["cancelled"] += 1
+
+    # cancels every prefetch
+    def cancel_all(self):
+
+        with self.lock:
+            for key, task in list(self.tasks.items()):
+                if not task["cancelled"].is_set():
+                    self.cancel_task(key, task)
+
+    def run_task(self, key, task, parameters):
+
+        try:
+            if not task["cancelled"].is_set():
+                self.prefetch_function(key[0], task["cancelled"], **parameters)
+                self.stats["completed"] += 0 if task["cancelled"].is_set() else 1
+
+        except Exception as e:
+            # a prefetch that fails (e.g. a file that can't be stacked) is just left for the click to report
+            print("prefetch of", key[0], "failed:", e)
+            self.stats["failed"] += 1
+
+        finally:
+            task["done"].set()
+
+            with self.lock:
+                if self.tasks.get(key) is task:
+                    del self.tasks[key]
+
+    # waits until no prefetch of the file is running anymore (returns right away if there isn't one)
+    # a queued prefetch of the file is cancelled instead, since the caller is about to compute the file itself
+    def wait_for(self, file_name, timeout = PREFETCH_WAIT_TIMEOUT):
+
+        with self.lock:
+
+            running_tasks = []
+
+            for key, task in list(self.tasks.items()):
+                if key[0] == file_name:
+                    if task["future"].running():
+                        running_tasks.append(task)
+                    elif not task["cancelled"].is_set():
+                        self.cancel_task(key, task)
+
+        for task in running_tasks:
+            task["done"].wait(timeout)
+
+    def shutdown(self):
+
+        self.cancel_all()
+        self.executor.shutdown(wait = True)
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import sqlite3
+from contextlib import closing
+import pandas as pd
+
+# READ ME:
+# Everything derived in the dashboard (the peaks in the peak table, the fitted models, and the HITRAN lines the peaks were assigned to)
+# used to only live in the browser, so it was lost on a page reload and couldn't be compared across observations.
+# The results store keeps it in a SQLite database instead, with one table per kind of result:
+#
+#   observations    one row per observation (file name, or the files of a stack): object, location, altitude, temperature, date
+#   fits            one row per saved fit: the selection it was made on (file, smooth width, continuum, box/lasso selection), baseline, overlay conditions
+#   peaks           one row per peak of a fit: the peak table's wavenumber/flux/model, and the fitted center, FWHM, and amplitude
+#   fit_parameters  one row per fitted parameter: value, standard error, and bootstrap confidence interval (if there was one)
+#   assignments     one row per assigned peak: the strongest HITRAN line within half of the peak's fitted FWHM (see "HitranOverlay.assign_peaks()")
+#
+# Each fit is written in a single transaction with bulk inserts ("DataFrame.to_sql()"), and the tables are indexed on file name,
+# wavenumber, and molecule, so queries over the whole archive (e.g. "every CH4 peak between 1300 and 1310 cm^-1") don't scan every row.
+# Every table can also be exported to Parquet for analysis outside of the dashboard.
+#
+# A new connection is opened for every call, so a single store can be shared by the dashboard's (threaded) callbacks.
+
+RESULTS_DATABASE_PATH = "results.sqlite"
+
+RESULTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    file_name TEXT PRIMARY KEY,
+    object TEXT,
+    latitude REAL,
+    longitude REAL,
+    avg_altitude REAL,
+    avg_altitude_km REAL,
+    temperature REAL,
+    date TEXT
+);
+CREATE TABLE IF NOT EXISTS fits (
+    fit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_name TEXT NOT NULL,
+    fit_key TEXT,
+    smooth_width REAL,
+    continuum_method TEXT,
+    selection TEXT,
+    baseline REAL,
+    weighted INTEGER,
+    overlay_temperature REAL,
+    overlay_altitude_km REAL,
+    overlay_latitude REAL,
+    saved_time REAL
+);
+CREATE TABLE IF NOT EXISTS peaks (
+    fit_id INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    peak_number INTEGER,
+    wavenumber REAL,
+    flux REAL,
+    peak_model TEXT,
+    center REAL,
+    fwhm REAL,
+    amplitude REAL
+);
+CREATE TABLE IF NOT EXISTS fit_parameters (
+    fit_id INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    parameter TEXT,
+    value REAL,
+    standard_error REAL,
+    ci_lower REAL,
+    ci_upper REAL
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    fit_id INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    peak_number INTEGER,
+    molecule TEXT,
+    isotopologue TEXT,
+    line_wavenumber REAL,
+    col_den_trans REAL
+);
+CREATE INDEX IF NOT EXISTS observations_object ON observations (object);
+CREATE INDEX IF NOT EXISTS fits_file_name ON fits (file_name, saved_time);
+CREATE INDEX IF NOT EXISTS peaks_fit_id ON peaks (fit_id);
+CREATE INDEX IF NOT EXISTS peaks_file_name ON peaks (file_name);
+CREATE INDEX IF NOT EXISTS peaks_center ON peaks (center);
+CREATE INDEX IF NOT EXISTS fit_parameters_fit_id ON fit_parameters (fit_id);
+CREATE INDEX IF NOT EXISTS assignments_fit_id ON assignments (fit_id, peak_number);
+CREATE INDEX IF NOT EXISTS assignments_file_name ON assignments (file_name);
+CREATE INDEX IF NOT EXISTS assignments_molecule ON assignments (molecule, line_wavenumber);
+CREATE INDEX IF NOT EXISTS assignments_line_wavenumber ON assignments (line_wavenumber);
+"""
+
+RESULTS_TABLES = ["observations", "fits", "peaks", "fit_parameters", "assignments"]
+
+# function returns the name an observation is stored under (a stack of files is stored under all of its file names)
+def get_observation_name(file_name):
+
+    if isinstance(file_name, (tuple, list)):
+        return " + ".join(sorted(file_name))
+
+    return file_name
+
+class ResultsStore:
+
+    def __init__(self, path = RESULTS_DATABASE_PATH):
+
+        self.path = path
+
+        with closing(self.connect()) as connection:
+            connection.executescript(RESULTS_SCHEMA)
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    # saves a fit and everything that goes with it in a single transaction, returns the new fit's id
+    # "observation_info" is a dictionary like "get_raw_exes_file_data()" returns (object, latitude, longitude, avg_altitude, avg_altitude_km, temperature, date)
+    # "fit_info" has the keys of the fits table (fit_key, smooth_width, continuum_method, selection, baseline, weighted, overlay_temperature, overlay_altitude_km, overlay_latitude)
+    # "peaks_df" comes from "get_fitted_peaks_dataframe()", "fit_parameters_df" has "parameter", "value", "standard_error" (and optionally "ci_lower", "ci_upper"),
+    # and "assignments_df" comes from "HitranOverlay.assign_peaks()" (one row per peak, in the same order as "peaks_df")
+    def save_fit(self, file_name, observation_info, fit_info, peaks_df, fit_parameters_df, assignments_df = None):
+
+        file_name = get_observation_name(file_name)
+
+        observation_row = (
+            file_name,
+            observation_info.get("object"),
+            observation_info.get("latitude"),
+            observation_info.get("longitude"),
+            observation_info.get("avg_altitude"),
+            observation_info.get("avg_altitude_km"),
+            observation_info.get("temperature"),
+            None if observation_info.get("date") is None else str(observation_info.get("date")),
+        )
+
+        with closing(self.connect()) as connection, connection:
+
+            connection.execute("INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?)", observation_row)
+
+            fit_id = connection.execute(
+                "INSERT INTO fits (file_name, fit_key, smooth_width, continuum_method, selection, baseline, weighted, overlay_temperature, overlay_altitude_km, overlay_latitude, saved_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    file_name,
+                    fit_info.get("fit_key"),
+                    fit_info.get("smooth_width"),
+                    fit_info.get("continuum_method"),
+                    json.dumps(fit_info.get("selection")),
+                    fit_info.get("baseline"),
+                    int(bool(fit_info.get("weighted"))),
+                    fit_info.get("overlay_temperature"),
+                    fit_info.get("overlay_altitude_km"),
+                    fit_info.get("overlay_latitude"),
+                    time.time(),
+                ),
+            ).lastrowid
+
+            peaks_df = peaks_df[["peak_number", "wavenumber", "flux", "peak_model", "center", "fwhm", "amplitude"]].copy()
+            peaks_df.insert(0, "fit_id", fit_id)
+            peaks_df.insert(1, "file_name", file_name)
+            peaks_df.to_sql("peaks", connection, if_exists = "append", index = False)
+
+            fit_parameters_df = fit_parameters_df.reindex(columns = ["parameter", "value", "standard_error", "ci_lower", "ci_upper"])
+            fit_parameters_df.insert(0, "fit_id", fit_id)
+            fit_parameters_df.insert(1, "file_name", file_name)
+            fit_parameters_df.to_sql("fit_parameters", connection, if_exists = "append", index = False)
+
+            if assignments_df is not None:
+
+                assignments_df = assignments_df[["molecule", "isotopologue", "line_wavenumber", "col_den_trans"]].copy()
+                assignments_df.insert(0, "fit_id", fit_id)
+                assignments_df.insert(1, "file_name", file_name)
+                assignments_df.insert(2, "peak_number", peaks_df["peak_number"].to_numpy())
+
+                # peaks without a line close enough aren't assigned to anything
+                assignments_df[assignments_df["isotopologue"].notna()].to_sql("assignments", connection, if_exists = "append", index = False)
+
+        return fit_id
+
+    # returns the saved fits of an observation (newest first)
+    def get_fits(self, file_name):
+
+        with closing(self.connect()) as connection:
+            return pd.read_sql_query("SELECT * FROM fits WHERE file_name = ? ORDER BY saved_time DESC", connection, params = (get_observation_name(file_name),))
+
+    # returns everything saved with a fit: a dictionary of "fit" (the fits row), "peaks", "fit_parameters", and "assignments" dataframes
+    def load_fit(self, fit_id):
+
+        fit_id = int(fit_id)
+
+        with closing(self.connect()) as connection:
+
+            fits_df = pd.read_sql_query("SELECT * FROM fits WHERE fit_id = ?", connection, params = (fit_id,))
+
+            if fits_df.empty:
+                return None
+
+            fit = fits_df.iloc[0].to_dict()
+            fit["selection"] = json.loads(fit["selection"]) if fit["selection"] else None
+
+            return {
+                "fit": fit,
+                "peaks": pd.read_sql_query("SELECT * FROM peaks WHERE fit_id = ? ORDER BY peak_number", connection, params = (fit_id,)),
+                "fit_parameters": pd.read_sql_query("SELECT * FROM fit_parameters WHERE fit_id = ? ORDER BY rowid", connection, params = (fit_id,)),
+                "assignments": pd.read_sql_query("SELECT * FROM assignments WHERE fit_id = ? ORDER BY peak_number", connection, params = (fit_id,)),
+            }
+
+    # returns every saved peak (with its assignment and its observation's info) that matches the query, across the whole archive
+    # "wavenumber_min"/"wavenumber_max" are compared to the fitted centers, and "molecule" to the assigned lines
+    def query_peaks(self, wavenumber_min = None, wavenumber_max = None, molecule = None, file_name = None):
+
+        conditions = []
+        parameters = []
+
+        if wavenumber_min is not None:
+            conditions.append("peaks.center >= ?")
+            parameters.append(float(wavenumber_min))
+        if wavenumber_max is not None:
+            conditions.append("peaks.center <= ?")
+            parameters.append(float(wavenumber_max))
+        if molecule is not None:
+            conditions.append("assignments.molecule = ?")
+            parameters.append(molecule)
+        if file_name is not None:
+            conditions.append("peaks.file_name = ?")
+            parameters.append(get_observation_name(file_name))
+
+        query = """
+            SELECT peaks.*, assignments.molecule, assignments.isotopologue, assignments.line_wavenumber, assignments.col_den_trans,
+                observations.object, observations.latitude, observations.longitude, observations.avg_altitude, observations.temperature, observations.date
+            FROM peaks
+            LEFT JOIN assignments ON assignments.fit_id = peaks.fit_id AND assignments.peak_number = peaks.peak_number
+            LEFT JOIN observations ON observations.file_name = peaks.file_name
+        """
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        with closing(self.connect()) as connection:
+            return pd.read_sql_query(query + " ORDER BY peaks.center", connection, params = parameters)
+
+    # writes every table to "<directory>/<table>.parquet" (needs pandas' optional Parquet engine, e.g. pyarrow), returns the paths written
+    def export_parquet(self, directory = "results_parquet"):
+
+        os.makedirs(directory, exist_ok = True)
+
+        paths = []
+
+        with closing(self.connect()) as connection:
+
+            for table in RESULTS_TABLES:
+
+                path = os.path.join(directory, table + ".parquet")
+                pd.read_sql_query("SELECT * FROM " + table, connection).to_parquet(path, index = False)
+                paths.append(path)
+
+        return paths
+
+
+if __name__ == "__main__":
+    print(ResultsStore().export_parquet())
@@ -0,0 +1,284 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+
+from exes_info import get_raw_exes_file_data, get_exes_header_info
+from exes_catalog import get_catalog_row_from_header, CATALOG_COLUMNS
+from fits_watcher import get_directory_snapshot, get_snapshot_changes
+
+# READ ME:
+# Anything that goes over the whole archive (batch retrievals, stacking, search) used to open every FITS file separately,
+# paying for astropy's header parsing, the big-endian to native conversion, and a seek per file every time.
+#
+# The spectra archive packs every FITS file of a directory into a single consolidated store:
+#
+#   <archive>/spectra.<generation>.f8   one flat file of native-endian float64 values: each file's (wavenumber, flux, uncertainty, atran) rows, one file after the other
+#   <archive>/index.json                for each file: where its block starts, its sample count, the FITS header cards, its wavenumber range,
+#                                        and the modification time and size of the source file (to tell when it changed)
+#
+# The flat file is memory-mapped, so a spectrum (or a wavenumber window of one) is a view into the map (no copy, no parsing),
+# and reading the whole archive is one sequential read ("iter_spectra()").
+#
+# "sync()" keeps the archive in step with the source directory: only the added and changed files are read (and appended to the end of the flat file),
+# and removed or replaced blocks are just dropped from the index. Once more than ARCHIVE_COMPACTION_FRACTION of the flat file is dropped blocks,
+# it's rewritten without them (as a new generation, so readers that still have the old one mapped aren't affected).
+# The index is always written last (and replaced atomically), so an interrupted sync leaves the archive as it was
+# (the values it did append past the index's "value_count" are cut off by the next sync).
+
+ARCHIVE_DIRECTORY = "EXES_Archive"
+ARCHIVE_INDEX_NAME = "index.json"
+ARCHIVE_DTYPE = np.dtype("=f8")
+ARCHIVE_ROW_COUNT = 4
+ARCHIVE_COMPACTION_FRACTION = 0.5
+
+# FITS header cards that aren't keyword = value pairs
+COMMENTARY_KEYWORDS = ["COMMENT", "HISTORY", ""]
+
+# function returns the keyword = value cards of a FITS header as a dictionary (which "get_exes_header_info()" can read like a header)
+def get_header_cards(primary_header):
+    return {key: value for key, value in primary_header.items() if (key not in COMMENTARY_KEYWORDS) and isinstance(value, (str, int, float, bool))}
+
+# function returns the FITS file names in a directory, and a function that reads one of them (like "get_raw_exes_file_data()")
+# with an archive, the archive is synced with the directory first, and the files are read from its memory map
+def get_raw_data_reader(dir = "EXES_Files", extension = ".fits", archive = None):
+
+    if archive is None:
+        return sorted(file for file in os.listdir(dir) if file.endswith(extension)), lambda file_name: get_raw_exes_file_data(file_name, dir)
+
+    archive.sync(dir, extension)
+
+    return archive.get_file_names(), archive.get_raw_data
+
+class SpectraArchive:
+
+    def __init__(self, archive_dir = ARCHIVE_DIRECTORY):
+
+        self.archive_dir = archive_dir
+        os.makedirs(archive_dir, exist_ok = True)
+
+        self.index = self.read_index()
+        self.spectra_map = None
+
+        # syncs (from the watcher's thread) and reads (from the callbacks) can happen at the same time
+        self.lock = threading.RLock()
+
+    def get_index_path(self):
+        return os.path.join(self.archive_dir, ARCHIVE_INDEX_NAME)
+
+    def get_spectra_path(self, generation):
+        return os.path.join(self.archive_dir, "spectra." + str(generation) + ".f8")
+
+    def read_index(self):
+
+        if not os.path.exists(self.get_index_path()):
+            return {"generation": 0, "value_count": 0, "files": {}}
+
+        with open(self.get_index_path()) as index_file:
+            return json.load(index_file)
+
+    def write_index(self, index):
+
+        temporary_path = self.get_index_path() + ".tmp"
+
+        with open(temporary_path, "w") as index_file:
+            json.dump(index, index_file)
+
+        os.replace(temporary_path, self.get_index_path())
+
+    # returns the memory map of the flat file (mapped again whenever the file grew or was compacted)
+    def get_spectra_map(self):
+
+        with self.lock:
+
+            generation = self.index["generation"]
+            value_count = self.index["value_count"]
+
+            if (self.spectra_map is None) or (self.spectra_map[0] != generation) or (len(self.spectra_map[1]) != value_count):
+                values = np.memmap(self.get_spectra_path(generation), dtype = ARCHIVE_DTYPE, mode = "r", shape = (value_count,)) if value_count else np.zeros(0, dtype = ARCHIVE_DTYPE)
+                self.spectra_map = (generation, values)
+
+            return self.spectra_map[1]
+
+    def get_file_names(self):
+        return sorted(self.index["files"])
+
+    def __contains__(self, file_name):
+        return file_name in self.index["files"]
+
+    # returns a file's (wavenumber, flux, uncertainty, atran) rows as a read-only view into the memory map
+    def get_spectrum(self, file_name):
+
+        with self.lock:
+            entry = self.index["files"][file_name]
+            values = self.get_spectra_map()
+
+        return values[entry["start"]:entry["start"] + ARCHIVE_ROW_COUNT * entry["sample_count"]].reshape(ARCHIVE_ROW_COUNT, entry["sample_count"])
+
+    # returns the (wavenumber, flux, uncertainty, atran) rows of the samples within a wavenumber range
+    # a view if the file's wavenumbers are sorted (as EXES writes them), and a copy of the matching samples if they aren't
+    def get_window(self, file_name, wavenumber_min, wavenumber_max):
+
+        spectrum = self.get_spectrum(file_name)
+        wavenumber = spectrum[0]
+
+        if self.index["files"][file_name]["wavenumber_sorted"]:
+            return spectrum[:, np.searchsorted(wavenumber, wavenumber_min, side = "left"):np.searchsorted(wavenumber, wavenumber_max, side = "right")]
+
+        return spectrum[:, (wavenumber_min <= wavenumber) & (wavenumber <= wavenumber_max)]
+
+    # returns the same dictionary as "get_raw_exes_file_data()", with the arrays as views into the memory map (and the header as a dictionary of its cards)
+    def get_raw_data(self, file_name):
+
+        entry = self.index["files"][file_name]
+        primary_data = self.get_spectrum(file_name)
+
+        wavenumber = primary_data[0]
+
+        return {
+            "hdu": None,
+            "header": entry["header"],
+            "data": primary_data,
+            "wavenumber": wavenumber,
+            "wavenumber_range": entry["wavenumber_range"],
+            "flux": primary_data[1],
+            "atran": primary_data[3],
+            "uncertainty": primary_data[2],
+            "wavelength": 10000.0 / wavenumber,
+            "wavelength_range": entry["wavelength_range"],
+            **get_exes_header_info(entry["header"]),
+        }
+
+    # yields (file name, (wavenumber, flux, uncertainty, atran) rows) for every file, in the order they're stored, so the whole flat file is read sequentially
+    def iter_spectra(self):
+
+        with self.lock:
+            file_names = sorted(self.index["files"], key = lambda file_name: self.index["files"][file_name]["start"])
+
+        for file_name in file_names:
+            yield file_name, self.get_spectrum(file_name)
+
+    # returns the catalog (see exes_catalog.py) built from the stored headers and wavenumbers, without opening any FITS file
+    def get_catalog(self):
+
+        rows = [
+            get_catalog_row_from_header(file_name, self.index["files"][file_name]["header"], np.asarray(self.get_spectrum(file_name)[0]), self.index["files"][file_name]["modified_time"])
+            for file_name in self.get_file_names()
+        ]
+
+        return pd.DataFrame(rows, columns = CATALOG_COLUMNS)
+
+    # brings the archive up to date with the FITS files in a directory, returns the (added, changed, removed) file names
+    def sync(self, exes_dir = "EXES_Files", extension = ".fits"):
+
+        stored_snapshot = {file_name: tuple(entry["snapshot"]) for file_name, entry in self.index["files"].items()}
+        added, changed, removed = get_snapshot_changes(stored_snapshot, get_directory_snapshot(exes_dir, extension))
+
+        failed_file_names = self.update_files(exes_dir, added, changed, removed)
+
+        return [file_name for file_name in added if file_name not in failed_file_names], [file_name for file_name in changed if file_name not in failed_file_names], removed
+
+    # appends the added and changed files, and drops the changed and removed ones (e.g. for the files that fits_watcher.py found)
+    # returns the files that couldn't be read (e.g. still being written), which keep their old block (if they had one) until the next sync
+    def update_files(self, exes_dir, added, changed, removed):
+
+        with self.lock:
+
+            index = json.loads(json.dumps(self.index))
+            failed_file_names = []
+
+            for file_name in removed:
+                index["files"].pop(file_name, None)
+
+            with open(self.get_spectra_path(index["generation"]), "ab") as spectra_file:
+
+                # values an interrupted sync appended after the last indexed block would shift every new block, so they're cut off first
+                # (nothing maps them, the maps only cover the indexed values)
+                spectra_file.truncate(index["value_count"] * ARCHIVE_DTYPE.itemsize)
+
+                for file_name in list(added) + list(changed):
+
+                    path = os.path.join(exes_dir, file_name)
+
+                    try:
+                        stat = os.stat(path)
+                        raw_data = get_raw_exes_file_data(file_name, exes_dir)
+                    except (OSError, ValueError, TypeError, IndexError, KeyError):
+                        failed_file_names.append(file_name)
+                        continue
+
+                    index["files"][file_name] = self.get_index_entry(raw_data, index["value_count"], stat)
+
+                    block = np.ascontiguousarray(raw_data["data"][:ARCHIVE_ROW_COUNT], dtype = ARCHIVE_DTYPE)
+                    spectra_file.write(block.tobytes())
+                    index["value_count"] += block.size
+
+            if self.get_dropped_fraction(index) > ARCHIVE_COMPACTION_FRACTION:
+                index = self.compact(index)
+
+            # the index is written after the values it points to
+            self.write_index(index)
+            self.index = index
+
+        return failed_file_names
+
+    def get_index_entry(self, raw_data, start, stat):
+
+        wavenumber = raw_data["wavenumber"]
+        finite_wavenumber = wavenumber[np.isfinite(wavenumber)]
+
+        return {
+            "start": int(start),
+            "sample_count": int(len(wavenumber)),
+            "header": get_header_cards(raw_data["header"]),
+            "wavenumber_range": [float(np.min(wavenumber)), float(np.max(wavenumber))],
+            "wavelength_range": [float(np.min(raw_data["wavelength"])), float(np.max(raw_data["wavelength"]))],
+            "wavenumber_sorted": bool(len(finite_wavenumber) == len(wavenumber) and np.all(np.diff(wavenumber) >= 0)),
+            "modified_time": stat.st_mtime,
+            "snapshot": [stat.st_mtime_ns, stat.st_size],
+        }
+
+    # returns the fraction of the flat file that no file in the index points to anymore
+    def get_dropped_fraction(self, index):
+
+        if index["value_count"] == 0:
+            return 0.0
+
+        used_value_count = sum(ARCHIVE_ROW_COUNT * entry["sample_count"] for entry in index["files"].values())
+
+        return 1 - used_value_count / index["value_count"]
+
+    # rewrites the flat file with only the blocks the index points to (as the next generation), returns the index for it
+    def compact(self, index):
+
+        old_path = self.get_spectra_path(index["generation"])
+        old_values = np.memmap(old_path, dtype = ARCHIVE_DTYPE, mode = "r", shape = (index["value_count"],)) if index["value_count"] else np.zeros(0, dtype = ARCHIVE_DTYPE)
+
+        compacted_index = dict(index, generation = index["generation"] + 1, value_count = 0, files = {})
+
+        with open(self.get_spectra_path(compacted_index["generation"]), "wb") as spectra_file:
+
+            for file_name, entry in sorted(index["files"].items(), key = lambda item: item[1]["start"]):
+
+                block_size = ARCHIVE_ROW_COUNT * entry["sample_count"]
+                spectra_file.write(old_values[entry["start"]:entry["start"] + block_size].tobytes())
+
+                compacted_index["files"][file_name] = dict(entry, start = compacted_index["value_count"])
+                compacted_index["value_count"] += block_size
+
+        del old_values
+
+        # the old generation is only removed once the index points to the new one (readers that still map it keep their copy on Linux)
+        self.write_index(compacted_index)
+        os.remove(old_path)
+
+        return compacted_index
+
+
+if __name__ == "__main__":
+
+    archive = SpectraArchive()
+    added, changed, removed = archive.sync()
+
+    print(len(added), "added,", len(changed), "changed,", len(removed), "removed,", len(archive.get_file_names()), "files in", archive.archive_dir)
@@ -0,0 +1,471 @@
+import time
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+import numpy as np
+import pandas as pd
+from astropy.modeling import models, fitting
+
+# READ ME:
+# The line of best fit is a sum of a constant (the baseline) and one gaussian or lorentzian per peak in the peak table.
+# Fitting it from scratch every time the table changes means re-optimizing every component from the same default seeds,
+# even when only one peak was edited (e.g. switched from gaussian to lorentzian).
+#
+# So the last converged fit for each selection is kept in a cache, and when the table changes:
+#   - peaks that didn't change (and aren't next to a changed peak) keep the parameters they converged to last time, and are held fixed along with the baseline
+#   - peaks that changed (new peaks, different models, edited values) start from default seeds, or from their old parameters converted to the new model
+#   - peaks close to a changed (or removed) peak are re-optimized too, since overlapping components pull on each other
+# Since the unchanged peaks are frozen, only the samples around the re-optimized peaks are used for the fit (the frozen ones can't change anywhere else).
+# Freezing can be turned off ("freeze_unchanged = False"), in which case every component is re-optimized, starting from its last converged parameters.
+# The cache can be used from several threads at once (the dashboard's callbacks, and the FITS watcher forgetting the fits of changed files).
+# Only looking up and storing fits is locked, so two fits can run at the same time.
+# Each fit reports how many peaks were actually optimized (and how many were frozen), how many iterations (function evaluations) it took, and how long it ran.
+#
+# If the flux uncertainty is given, the fit is weighted by 1 / uncertainty, and the parameter standard errors come from the fit's covariance matrix.
+# Both (and the bootstrap below) assume the samples have independent errors, so they should be fit to the unsmoothed flux (smoothing correlates neighbouring samples).
+# The optional bootstrap ("bootstrap_fit_parameters()") refits hundreds of Monte-Carlo copies of the spectrum (the best fit plus noise drawn from the uncertainty)
+# on a process pool, each one starting from the best fit (weighted the same way as the best fit was), and turns the spread of the refit parameters into confidence intervals.
+# It stops at a time budget, and uses however many refits finished by then.
+# The pool's workers aren't forked from the dashboard's process (forking a process with running threads can copy a held lock into the worker),
+# they're started from a fresh fork server instead (or spawned, where there's no fork server), see BOOTSTRAP_START_METHOD.
+
+# default width (stddev for gaussians, fwhm for lorentzians) that new components start from
+DEFAULT_PEAK_WIDTH = 0.025
+
+# components whose centers are within this many (summed) FWHMs of a changed component get re-optimized with it
+NEIGHBOR_WIDTH_MULTIPLE = 1.5
+
+# when unchanged peaks are frozen, the fit only uses samples within this many FWHMs of a re-optimized peak
+FIT_WINDOW_WIDTH_MULTIPLE = 5
+
+# how many selections the fit cache remembers
+DEFAULT_FIT_CACHE_SIZE = 16
+
+# FWHM = GAUSSIAN_FWHM_FACTOR * stddev
+GAUSSIAN_FWHM_FACTOR = 2 * np.sqrt(2 * np.log(2))
+
+# how many Monte-Carlo refits the bootstrap runs, how many go to a worker at once, and how long it is allowed to take (seconds)
+BOOTSTRAP_SAMPLES = 200
+BOOTSTRAP_BATCH_SIZE = 10
+BOOTSTRAP_TIME_BUDGET = 5.0
+
+# confidence level of the bootstrap intervals
+BOOTSTRAP_CONFIDENCE_LEVEL = 0.95
+
+# how the bootstrap's worker processes are started
+BOOTSTRAP_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# the astropy parameter names of each peak model
+PEAK_MODEL_PARAMETERS = {
+    "gaussian": ["amplitude", "mean", "stddev"],
+    "lorentzian": ["amplitude", "x_0", "fwhm"],
+}
+
+# function returns the identity of a peak in the table (its position and flux), which doesn't change when only its model changes
+def get_peak_identity(peak_data):
+    return (round(float(peak_data["wavenumber"]), 9), round(float(peak_data["flux"]), 9))
+
+# function returns the starting parameters of a new component (the same seeds the dashboard has always used)
+def get_default_component_parameters(peak_data, baseline):
+
+    amplitude = -1 * (baseline - peak_data["flux"])
+
+    if peak_data["peak_model"] == "gaussian":
+        return {"amplitude": amplitude, "mean": peak_data["wavenumber"], "stddev": DEFAULT_PEAK_WIDTH}
+
+    return {"amplitude": amplitude, "x_0": peak_data["wavenumber"], "fwhm": DEFAULT_PEAK_WIDTH}
+
+# function converts a component's parameters from one peak model to another (so a switched peak can start from where it converged)
+def convert_component_parameters(parameters, from_peak_model, to_peak_model):
+
+    if from_peak_model == to_peak_model:
+        return dict(parameters)
+
+    if to_peak_model == "gaussian":
+        return {"amplitude": parameters["amplitude"], "mean": parameters["x_0"], "stddev": parameters["fwhm"] / GAUSSIAN_FWHM_FACTOR}
+
+    return {"amplitude": parameters["amplitude"], "x_0": parameters["mean"], "fwhm": parameters["stddev"] * GAUSSIAN_FWHM_FACTOR}
+
+# function returns a component's center and FWHM
+def get_component_center_and_fwhm(peak_model, parameters):
+
+    if peak_model == "gaussian":
+        return parameters["mean"], abs(parameters["stddev"]) * GAUSSIAN_FWHM_FACTOR
+
+    return parameters["x_0"], abs(parameters["fwhm"])
+
+# function builds a single gaussian or lorentzian component
+def get_component_model(peak_model, parameters):
+
+    if peak_model == "gaussian":
+        return models.Gaussian1D(**parameters)
+
+    return models.Lorentz1D(**parameters)
+
+# function builds the summation model (a constant plus one component per peak)
+def get_summation_model(baseline, components):
+
+    summation_model = models.Const1D(baseline)
+
+    for component in components:
+        summation_model += get_component_model(component["peak_model"], component["parameters"])
+
+    return summation_model
+
+# function pulls the parameters of each component back out of a (fitted) summation model
+def get_fitted_components(fitted_model, peak_models):
+
+    components = []
+
+    for i, peak_model in enumerate(peak_models):
+
+        component_model = fitted_model[i + 1]
+        components.append({
+            "peak_model": peak_model,
+            "parameters": {name: float(getattr(component_model, name).value) for name in PEAK_MODEL_PARAMETERS[peak_model]},
+        })
+
+    return components
+
+# function returns one row per peak of a fitted model: the peak table's wavenumber, flux, and model, along with the fitted center, FWHM, and amplitude
+def get_fitted_peaks_dataframe(fitted_model, table_data):
+
+    peak_models = [peak_data["peak_model"] for peak_data in table_data]
+    fitted_components = get_fitted_components(fitted_model, peak_models)
+    centers_and_fwhms = [get_component_center_and_fwhm(component["peak_model"], component["parameters"]) for component in fitted_components]
+
+    return pd.DataFrame({
+        "peak_number": np.arange(1, len(table_data) + 1),
+        "wavenumber": [float(peak_data["wavenumber"]) for peak_data in table_data],
+        "flux": [float(peak_data["flux"]) for peak_data in table_data],
+        "peak_model": peak_models,
+        "center": [center for center, fwhm in centers_and_fwhms],
+        "fwhm": [fwhm for center, fwhm in centers_and_fwhms],
+        "amplitude": [component["parameters"]["amplitude"] for component in fitted_components],
+    })
+
+# function rebuilds a fitted model from a dictionary of parameter name -> value (e.g. a saved fit), without fitting anything
+def get_model_from_parameters(peak_models, parameter_values):
+
+    components = [
+        {"peak_model": peak_model, "parameters": {name: parameter_values[name + "_" + str(i + 1)] for name in PEAK_MODEL_PARAMETERS[peak_model]}}
+        for i, peak_model in enumerate(peak_models)
+    ]
+
+    return get_summation_model(parameter_values["amplitude_0"], components)
+
+class SpectraFitCache:
+
+    def __init__(self, max_entries = DEFAULT_FIT_CACHE_SIZE):
+
+        self.max_entries = max_entries
+
+        # OrderedDict of fit key -> {"signature", "baseline", "components" (peak identity -> component), "model"}
+        self.fits = OrderedDict()
+        self.lock = threading.Lock()
+
+    # fits the peaks in the table to the selected spectrum, reusing the last converged fit for the same "fit_key" (e.g. the file and selection)
+    # "freeze_unchanged" keeps the parameters of unchanged peaks (and the baseline) fixed, so only the changed peaks and their neighbours are optimized
+    # without it every component is re-optimized (the unchanged ones just start from where they converged)
+    # returns the fitted model, and a report of what was refit (the peaks with free parameters), the iteration count, and the wall time
+    # "uncertainty" (the flux uncertainty of each sample) weights the fit by 1 / uncertainty, samples without a usable uncertainty get no weight
+    def fit(self, fit_key, x, y, table_data, baseline, freeze_unchanged = True, uncertainty = None):
+
+        start_time = time.perf_counter()
+
+        x = np.asarray(x, dtype = float)
+        y = np.asarray(y, dtype = float)
+        weights = get_uncertainty_weights(uncertainty)
+
+        peak_identities = [get_peak_identity(peak_data) for peak_data in table_data]
+        peak_models = [peak_data["peak_model"] for peak_data in table_data]
+        signature = (baseline, weights is not None, tuple(zip(peak_identities, peak_models)))
+
+        with self.lock:
+            previous_fit = self.fits.get(fit_key)
+            if previous_fit is not None:
+                self.fits.move_to_end(fit_key)
+
+        # nothing changed, so the last fit is still the answer
+        if (previous_fit is not None) and (previous_fit["signature"] == signature):
+
+            return previous_fit["model"], {
+                "iterations": 0,
+                "seconds": time.perf_counter() - start_time,
+                "refit_peaks": 0,
+                "reused_peaks": len(table_data),
+                "frozen_peaks": 0,
+                "warm_start": True,
+                "standard_errors": previous_fit["parameter_standard_errors"],
+            }
+
+        # a different baseline changes every component's seed, so it starts over
+        if (previous_fit is not None) and (previous_fit["baseline"] != baseline):
+            previous_fit = None
+
+        previous_components = {} if previous_fit is None else previous_fit["components"]
+
+        # start every component from its converged parameters when possible, and keep track of which ones changed
+        components = []
+        changed = []
+
+        for peak_data, identity, peak_model in zip(table_data, peak_identities, peak_models):
+
+            previous_component = previous_components.get(identity)
+
+            if previous_component is None:
+                parameters = get_default_component_parameters(peak_data, baseline)
+            else:
+                parameters = convert_component_parameters(previous_component["parameters"], previous_component["peak_model"], peak_model)
+
+            components.append({"peak_model": peak_model, "parameters": parameters})
+            changed.append((previous_component is None) or (previous_component["peak_model"] != peak_model))
+
+        # peaks that were removed from the table leave a gap that their neighbours have to fill
+        removed_components = [component for identity, component in previous_components.items() if identity not in set(peak_identities)]
+
+        centers_and_fwhms = [get_component_center_and_fwhm(component["peak_model"], component["parameters"]) for component in components]
+        changed_centers_and_fwhms = [centers_and_fwhms[i] for i in range(len(components)) if changed[i]]
+        changed_centers_and_fwhms += [get_component_center_and_fwhm(component["peak_model"], component["parameters"]) for component in removed_components]
+
+        refit = [
+            changed[i] or any(abs(center - changed_center) <= NEIGHBOR_WIDTH_MULTIPLE * (fwhm + changed_fwhm) for changed_center, changed_fwhm in changed_centers_and_fwhms)
+            for i, (center, fwhm) in enumerate(centers_and_fwhms)
+        ]
+
+        # switching between weighted and unweighted fits changes what every component converges to, so they're all re-optimized (from their last values)
+        if (previous_fit is not None) and (previous_fit["signature"][1] != (weights is not None)):
+            refit = [True] * len(components)
+
+        summation_model = get_summation_model(previous_fit["model"][0].amplitude.value if previous_fit is not None else baseline, components)
+
+        frozen_peaks = 0
+        fit_window = np.ones(len(x), dtype = bool)
+
+        if freeze_unchanged and (previous_fit is not None) and not all(refit):
+
+            summation_model.fixed["amplitude_0"] = True
+
+            for i, peak_model in enumerate(peak_models):
+                if not refit[i]:
+                    frozen_peaks += 1
+                    for name in PEAK_MODEL_PARAMETERS[peak_model]:
+                        summation_model.fixed[name + "_" + str(i + 1)] = True
+
+            # only the samples near the peaks being re-optimized can change the fit
+            fit_window = np.zeros(len(x), dtype = bool)
+            for i, (center, fwhm) in enumerate(centers_and_fwhms):
+                if refit[i]:
+                    fit_window |= np.abs(x - center) <= FIT_WINDOW_WIDTH_MULTIPLE * fwhm
+
+        # if everything is frozen there's nothing left to optimize
+        fit_standard_errors = {}
+
+        if all(summation_model.fixed.values()) or not np.any(fit_window):
+            fitted_model = summation_model
+            iterations = 0
+
+        else:
+            fitter = fitting.TRFLSQFitter()
+            fitted_model = fitter(summation_model, x[fit_window], y[fit_window], weights = None if weights is None else weights[fit_window])
+            iterations = int(fitter.fit_info["nfev"])
+
+            free_parameter_names = [name for name in fitted_model.param_names if not fitted_model.fixed[name]]
+            fit_standard_errors = get_standard_errors(fitter.fit_info.get("param_cov"), free_parameter_names)
+
+            # the fixed flags are only for this fit, the next one decides for itself
+            for name in fitted_model.param_names:
+                fitted_model.fixed[name] = False
+
+        fitted_components = get_fitted_components(fitted_model, peak_models)
+
+        # the covariance matrix only covers the parameters that were free in this fit, so the frozen peaks keep the standard errors from their last fit
+        previous_standard_errors = {} if previous_fit is None else previous_fit["standard_errors"]
+        standard_errors = {"amplitude_0": fit_standard_errors.get("amplitude_0", previous_standard_errors.get("baseline", np.nan))}
+
+        for i, (identity, component) in enumerate(zip(peak_identities, fitted_components)):
+
+            previous_component_errors = previous_standard_errors.get(identity, {}) if not changed[i] else {}
+
+            for name in PEAK_MODEL_PARAMETERS[component["peak_model"]]:
+                parameter_name = name + "_" + str(i + 1)
+                standard_errors[parameter_name] = fit_standard_errors.get(parameter_name, previous_component_errors.get(name, np.nan))
+
+        self.store(fit_key, {
+            "signature": signature,
+            "baseline": baseline,
+            "components": dict(zip(peak_identities, fitted_components)),
+            "model": fitted_model,
+            # peak identity -> parameter -> standard error (and "baseline" for the constant), so they still line up after peaks are added or removed
+            "standard_errors": dict(
+                {identity: {name: standard_errors[name + "_" + str(i + 1)] for name in PEAK_MODEL_PARAMETERS[peak_models[i]]} for i, identity in enumerate(peak_identities)},
+                baseline = standard_errors["amplitude_0"],
+            ),
+            "parameter_standard_errors": standard_errors,
+        })
+
+        return fitted_model, {
+            "iterations": iterations,
+            "seconds": time.perf_counter() - start_time,
+            "refit_peaks": len(table_data) - frozen_peaks,
+            "reused_peaks": (len(table_data) - sum(changed)) if previous_fit is not None else 0,
+            "frozen_peaks": frozen_peaks,
+            "warm_start": previous_fit is not None,
+            "standard_errors": standard_errors,
+        }
+
+    # puts an already converged fit (e.g. one loaded from the results store) into the cache, as if it had just been fit for this table
+    # "standard_errors" is a dictionary of parameter name -> standard error, like the one in the fit report
+    def restore(self, fit_key, table_data, baseline, weighted, fitted_model, standard_errors):
+
+        peak_identities = [get_peak_identity(peak_data) for peak_data in table_data]
+        peak_models = [peak_data["peak_model"] for peak_data in table_data]
+
+        self.store(fit_key, {
+            "signature": (baseline, weighted, tuple(zip(peak_identities, peak_models))),
+            "baseline": baseline,
+            "components": dict(zip(peak_identities, get_fitted_components(fitted_model, peak_models))),
+            "model": fitted_model,
+            "standard_errors": dict(
+                {identity: {name: standard_errors.get(name + "_" + str(i + 1), np.nan) for name in PEAK_MODEL_PARAMETERS[peak_models[i]]} for i, identity in enumerate(peak_identities)},
+                baseline = standard_errors.get("amplitude_0", np.nan),
+            ),
+            "parameter_standard_errors": {name: standard_errors.get(name, np.nan) for name in fitted_model.param_names},
+        })
+
+    # remembers a fit, forgetting the least recently used one if the cache is full
+    def store(self, fit_key, fit):
+
+        with self.lock:
+            self.fits[fit_key] = fit
+            self.fits.move_to_end(fit_key)
+            if len(self.fits) > self.max_entries:
+                self.fits.popitem(last = False)
+
+    # forgets every fit whose key "predicate" returns True for (e.g. the fits of a file that changed on disk)
+    # returns how many fits were forgotten
+    def forget(self, predicate):
+
+        with self.lock:
+            forgotten_keys = [fit_key for fit_key in self.fits if predicate(fit_key)]
+            for fit_key in forgotten_keys:
+                self.fits.pop(fit_key)
+
+        return len(forgotten_keys)
+
+# function turns flux uncertainties into fit weights (1 / uncertainty), giving samples without a usable uncertainty no weight
+def get_uncertainty_weights(uncertainty):
+
+    if uncertainty is None:
+        return None
+
+    uncertainty = np.asarray(uncertainty, dtype = float)
+    usable = np.isfinite(uncertainty) & (uncertainty > 0)
+
+    return np.where(usable, 1 / np.where(usable, uncertainty, 1), 0)
+
+# function returns parameter name -> standard error from a fit's covariance matrix (NaN if the fit didn't produce one)
+def get_standard_errors(param_cov, parameter_names):
+
+    if param_cov is None:
+        return {name: np.nan for name in parameter_names}
+
+    with np.errstate(invalid = "ignore"):
+        return dict(zip(parameter_names, np.sqrt(np.diag(param_cov))))
+
+# bootstrap workers are started once and then reused, since starting a process pool costs more than a batch of refits
+# (the dashboard's callbacks can ask for it from several threads at once, so it's created and replaced under a lock)
+bootstrap_executor = {"executor": None, "max_workers": None}
+bootstrap_executor_lock = threading.Lock()
+
+def get_bootstrap_executor(max_workers = None):
+
+    with bootstrap_executor_lock:
+
+        if (bootstrap_executor["executor"] is None) or (bootstrap_executor["max_workers"] != max_workers):
+
+            if bootstrap_executor["executor"] is not None:
+                bootstrap_executor["executor"].shutdown(wait = False, cancel_futures = True)
+
+            bootstrap_executor["executor"] = ProcessPoolExecutor(max_workers = max_workers, mp_context = multiprocessing.get_context(BOOTSTRAP_START_METHOD))
+            bootstrap_executor["max_workers"] = max_workers
+
+        return bootstrap_executor["executor"]
+
+# function refits a batch of Monte-Carlo copies of the spectrum (runs in a worker process)
+# every copy is the best fit plus gaussian noise with the given uncertainty, and every refit starts from the best fit (weighted by 1 / uncertainty if "weighted")
+# returns a (copies x parameters) array of refit parameters
+def fit_bootstrap_batch(baseline, components, x, model_y, uncertainty, seed, sample_count, weighted = True):
+
+    random_generator = np.random.default_rng(seed)
+    weights = get_uncertainty_weights(uncertainty) if weighted else None
+    noise_scale = np.where(np.isfinite(uncertainty) & (uncertainty > 0), uncertainty, 0)
+
+    best_fit_model = get_summation_model(baseline, components)
+    fitter = fitting.TRFLSQFitter()
+
+    refit_parameters = []
+
+    for i in range(sample_count):
+
+        perturbed_y = model_y + random_generator.normal(0, 1, len(model_y)) * noise_scale
+        refit_model = fitter(best_fit_model.copy(), x, perturbed_y, weights = weights)
+
+        refit_parameters.append(refit_model.parameters)
+
+    return np.array(refit_parameters)
+
+# function estimates confidence intervals for every fit parameter by refitting Monte-Carlo copies of the spectrum on a process pool
+# stops handing out work once the time budget is used up, and builds the intervals from whichever refits finished
+# "weighted" has to match how the best fit was made, so that the refits are the same estimator as the fit they're the intervals of
+# returns a dataframe with one row per parameter, along with the number of refits that went into it
+def bootstrap_fit_parameters(fitted_model, peak_models, x, uncertainty, weighted = True, sample_count = BOOTSTRAP_SAMPLES, time_budget = BOOTSTRAP_TIME_BUDGET, confidence_level = BOOTSTRAP_CONFIDENCE_LEVEL, batch_size = BOOTSTRAP_BATCH_SIZE, max_workers = None, seed = 0):
+
+    start_time = time.perf_counter()
+
+    x = np.asarray(x, dtype = float)
+    uncertainty = np.asarray(uncertainty, dtype = float)
+
+    # workers get plain numbers (instead of astropy models) and rebuild the best fit themselves
+    baseline = float(fitted_model[0].amplitude.value)
+    components = get_fitted_components(fitted_model, peak_models)
+    model_y = fitted_model(x)
+
+    executor = get_bootstrap_executor(max_workers)
+
+    batch_sizes = [min(batch_size, sample_count - start) for start in range(0, sample_count, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+
+    futures = [
+        executor.submit(fit_bootstrap_batch, baseline, components, x, model_y, uncertainty, batch_seed, batch_sample_count, weighted)
+        for batch_seed, batch_sample_count in zip(seeds, batch_sizes)
+    ]
+
+    done, not_done = wait(futures, timeout = max(time_budget - (time.perf_counter() - start_time), 0))
+
+    # whatever hasn't started by the time budget gets cancelled (batches already running are left to finish in the background)
+    for future in not_done:
+        future.cancel()
+
+    refit_parameters = [future.result() for future in done if future.exception() is None]
+    refit_parameters = np.vstack(refit_parameters) if refit_parameters else np.zeros((0, len(fitted_model.parameters)))
+
+    lower_percentile = 50 * (1 - confidence_level)
+    upper_percentile = 100 - lower_percentile
+
+    if len(refit_parameters):
+        lower, upper = np.percentile(refit_parameters, [lower_percentile, upper_percentile], axis = 0)
+        bootstrap_standard_deviation = np.std(refit_parameters, axis = 0, ddof = 1) if len(refit_parameters) > 1 else np.full(len(fitted_model.parameters), np.nan)
+    else:
+        lower = upper = bootstrap_standard_deviation = np.full(len(fitted_model.parameters), np.nan)
+
+    bootstrap_df = pd.DataFrame({
+        "parameter": fitted_model.param_names,
+        "value": fitted_model.parameters,
+        "bootstrap_standard_deviation": bootstrap_standard_deviation,
+        "ci_lower": lower,
+        "ci_upper": upper,
+    })
+
+    return bootstrap_df, {"samples": len(refit_parameters), "seconds": time.perf_counter() - start_time}
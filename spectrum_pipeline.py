@@ -0,0 +1,352 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from astropy.convolution import convolve
+from astropy.convolution import Box1DKernel
+
+from exes_info import get_raw_exes_file_data, get_exes_file_data_with_flux, get_fluxnorm, FEET_TO_KILOMETERS
+from exes_stacking import stack_exes_observations
+from hitran_overlay import HitranOverlay, get_flight_segment_samples
+from hitran_cutoff_index import HitranCutoffIndex, get_isotopologue_trace_objects, get_merged_molecule_trace_objects
+from column_density_retrieval import retrieve_column_densities
+from molecule_detection import detect_molecules
+from peak_hierarchy import PeakHierarchy
+from continuum_estimation import estimate_continuum
+from equivalent_width import measure_peak_hierarchy_equivalent_widths
+from spectra_fitting import bootstrap_fit_parameters, get_model_from_parameters
+
+# READ ME:
+# Everything the dashboard derives from a single observation is modelled here as a small graph of steps ("nodes").
+# Each node only depends on its own parameters and on the nodes directly upstream of it:
+#
+#   raw_arrays -> fluxnorm -> continuum -> norm_flux -> smooth_flux -> exes_data
+#   (raw_arrays, smooth_flux) -> peak_hierarchy
+#   (raw_arrays, continuum) -> norm_uncertainty
+#   (norm_flux, norm_uncertainty) -> smooth_uncertainty
+#   (raw_arrays, norm_uncertainty) -> fit_bootstrap
+#   raw_arrays -> line_store -> column_density_strengths -> strength_index -> display_cutoff -> cutoff_lines -> stem_traces
+#   strength_index -> window_lines -> window_stem_traces
+#   (raw_arrays, line_store) -> column_densities -> column_density_strengths
+#   (raw_arrays, norm_flux, norm_uncertainty, line_store, column_density_strengths, column_densities) -> column_density_retrieval
+#   (raw_arrays, norm_flux, line_store, column_density_strengths) -> molecule_detection
+#   (raw_arrays, norm_flux, norm_uncertainty, peak_hierarchy, line_store, column_density_strengths) -> equivalent_widths
+#
+# "file_name" can also be a tuple of file names, in which case "raw_arrays" is the stack of those observations (see exes_stacking.py),
+# and everything downstream of it (smoothing, the overlay, peak finding and fitting) works on the stack just like a single observation.
+#
+# "cutoff_lines" are the strongest lines over the whole spectrum (at most OVERLAY_LINE_LIMIT of them, see hitran_cutoff_index.py),
+# i.e. the lines above the "display_cutoff" (the cutoff, raised if more lines than that pass it),
+# and "window_lines" are the lines of a selected "window_range" (a (min, max) wavenumber tuple) above the much lower "window_cutoff", queried from the same index.
+#
+# "fit_bootstrap" refits Monte-Carlo copies of a fitted selection. Its parameters are the fit's peak models, its (parameter name, value) pairs,
+# and the wavenumbers it was fit to (all tuples, so they can be part of a key), and whether it was weighted by 1 / uncertainty ("fit_weighted").
+#
+# "column_densities" are the column densities the lines get scaled by: at the overlay's altitude, or (if "overlay_column_mode" is "flight_segment")
+# the slant column densities averaged over the flight segment (see hitran_overlay.py), shifted by however far the overlay's altitude is from the observation's average altitude.
+#
+# With an "archive" (see spectra_archive.py), observations are read from the consolidated archive instead of from their FITS files.
+#
+# With a "tile_cache" (see hitran_tile_cache.py), the line store is sliced out of lines shared by every observation,
+# and the strengths at the average altitude are put together from tiles that other observations may already have evaluated (at the center of the temperature's bin).
+#
+# "continuum" is what the flux gets divided by: the single "get_fluxnorm()" value, or (if a "continuum_method" is given) the continuum estimated at every sample (see continuum_estimation.py).
+#
+# Every node remembers its results, keyed on its own parameters plus the keys of its upstream nodes.
+# So when a parameter changes, only the nodes downstream of that parameter are recomputed,
+# e.g. a new smooth width only re-runs the convolution (instead of re-opening the FITS file), and a new cutoff only re-slices the strength index.
+# When a file changes on disk, "invalidate_file()" forgets everything that was computed from it.
+# "pin_file()" keeps the results of a file someone is looking at from being evicted by other files' results (e.g. prefetches of the files they might click next),
+# as long as there are other results to evict.
+#
+# The pipeline can be used from several threads at once (the dashboard's callbacks, and the prefetches in prefetch_scheduler.py).
+# Only looking up and storing results is locked, so two threads can compute at the same time (if they both need a result that isn't remembered yet, both compute it).
+
+# how many results each node remembers before it starts forgetting the least recently used ones
+DEFAULT_MEMO_SIZE = 8
+
+# how many of the most recently pinned files stay pinned (a few, since each browser session pins the file it has open)
+PINNED_FILE_LIMIT = 4
+
+# values of the parameters that callers don't have to pass to "compute()"
+DEFAULT_PARAMETER_VALUES = {"continuum_method": None, "overlay_column_mode": "average_altitude"}
+
+# the ways the overlay's column densities can be computed (see "get_column_densities()")
+OVERLAY_COLUMN_MODES = ["average_altitude", "flight_segment"]
+
+class SpectrumPipeline:
+
+    def __init__(self, dir = "EXES_Files", memo_size = DEFAULT_MEMO_SIZE, tile_cache = None, archive = None):
+
+        self.dir = dir
+        self.memo_size = memo_size
+        self.tile_cache = tile_cache
+        self.archive = archive
+
+        # dictionary of node name -> {"function", "dependencies", "parameters"}
+        self.nodes = {}
+
+        # dictionary of node name -> OrderedDict of node key -> result
+        self.memo = {}
+
+        # OrderedDict of the pinned file names (least recently pinned first), see "pin_file()"
+        self.pinned_file_names = OrderedDict()
+
+        # the nodes that had to be recomputed during each thread's last call to "compute()" (see "recomputed_nodes")
+        self.thread_state = threading.local()
+        self.memo_lock = threading.Lock()
+
+        # EXES spectrum nodes
+        self.add_node("raw_arrays", lambda file_name: get_observation_raw_data(file_name, self.dir, self.archive), parameters = ["file_name"])
+        self.add_node("fluxnorm", lambda raw_data: get_fluxnorm(raw_data["flux"], raw_data["atran"]), dependencies = ["raw_arrays"])
+        self.add_node("continuum", get_continuum, dependencies = ["raw_arrays", "fluxnorm"], parameters = ["continuum_method"])
+        self.add_node("norm_flux", lambda raw_data, continuum: raw_data["flux"] / continuum, dependencies = ["raw_arrays", "continuum"])
+        self.add_node("smooth_flux", get_smooth_flux, dependencies = ["norm_flux"], parameters = ["smooth_width"])
+        self.add_node("exes_data", get_exes_file_data_with_flux, dependencies = ["raw_arrays", "norm_flux", "smooth_flux"])
+        self.add_node("norm_uncertainty", lambda raw_data, continuum: raw_data["uncertainty"] / continuum, dependencies = ["raw_arrays", "continuum"])
+        self.add_node("smooth_uncertainty", get_smooth_uncertainty, dependencies = ["norm_flux", "norm_uncertainty"], parameters = ["smooth_width"])
+        self.add_node("peak_hierarchy", lambda raw_data, smooth_flux: PeakHierarchy(raw_data["wavenumber"], smooth_flux), dependencies = ["raw_arrays", "smooth_flux"])
+
+        # HITRAN overlay nodes
+        self.add_node("line_store", self.get_line_store, dependencies = ["raw_arrays"])
+        self.add_node("column_densities", get_column_densities, dependencies = ["raw_arrays", "line_store"], parameters = ["altitude_km", "latitude", "overlay_column_mode"])
+        self.add_node("column_density_strengths", self.get_column_density_strengths, dependencies = ["line_store", "column_densities"], parameters = ["temperature", "altitude_km", "latitude", "overlay_column_mode"])
+        self.add_node("strength_index", lambda overlay, strengths: HitranCutoffIndex(overlay.split_isotopologue_lines(strengths)), dependencies = ["line_store", "column_density_strengths"])
+        self.add_node("display_cutoff", lambda index, cutoff: index.get_display_cutoff(cutoff), dependencies = ["strength_index"], parameters = ["cutoff"])
+        self.add_node("cutoff_lines", lambda index, display_cutoff: index.get_all_lines_above_cutoff(display_cutoff), dependencies = ["strength_index", "display_cutoff"])
+        self.add_node("stem_traces", get_stem_traces, dependencies = ["cutoff_lines"], parameters = ["overlay_render_mode"])
+        self.add_node("window_lines", lambda index, window_range, window_cutoff: index.get_all_lines_in_range(window_range[0], window_range[1], window_cutoff), dependencies = ["strength_index"], parameters = ["window_range", "window_cutoff"])
+        self.add_node("window_stem_traces", get_stem_traces, dependencies = ["window_lines"], parameters = ["overlay_render_mode"])
+
+        # column density retrieval node (see column_density_retrieval.py)
+        self.add_node("column_density_retrieval", get_column_density_retrieval, dependencies = ["raw_arrays", "norm_flux", "norm_uncertainty", "line_store", "column_density_strengths", "column_densities"], parameters = ["temperature", "altitude_km", "latitude"])
+
+        # molecule detection node (see molecule_detection.py)
+        self.add_node("molecule_detection", lambda raw_data, norm_flux, overlay, strengths: detect_molecules(raw_data["wavenumber"], norm_flux, overlay.split_isotopologue_lines(strengths)), dependencies = ["raw_arrays", "norm_flux", "line_store", "column_density_strengths"])
+
+        # bootstrap confidence intervals of a fit (see spectra_fitting.py), the fit is passed in as hashable tuples so refitting the same fit doesn't re-run the bootstrap
+        self.add_node("fit_bootstrap", get_fit_bootstrap, dependencies = ["raw_arrays", "norm_uncertainty"], parameters = ["fit_peak_models", "fit_parameter_values", "fit_wavenumbers", "fit_weighted"])
+
+        # equivalent width node (see equivalent_width.py), every peak of the peak hierarchy gets measured
+        self.add_node("equivalent_widths", lambda raw_data, norm_flux, norm_uncertainty, peak_hierarchy, overlay, strengths: measure_peak_hierarchy_equivalent_widths(raw_data["wavenumber"], norm_flux, norm_uncertainty, peak_hierarchy, overlay, strengths), dependencies = ["raw_arrays", "norm_flux", "norm_uncertainty", "peak_hierarchy", "line_store", "column_density_strengths"])
+
+    # adds a step to the graph: "function" gets called with the results of the dependencies first, then the parameters (in the listed order)
+    def add_node(self, name, function, dependencies = (), parameters = ()):
+
+        self.nodes[name] = {
+            "function": function,
+            "dependencies": list(dependencies),
+            "parameters": list(parameters),
+        }
+        self.memo[name] = OrderedDict()
+
+    # returns the key that a node's result is remembered with: its own parameter values plus the keys of its dependencies
+    def get_node_key(self, name, parameter_values):
+
+        node = self.nodes[name]
+
+        own_key = tuple(parameter_values[parameter] for parameter in node["parameters"])
+        dependency_keys = tuple(self.get_node_key(dependency, parameter_values) for dependency in node["dependencies"])
+
+        return (own_key, dependency_keys)
+
+    # the nodes that had to be recomputed during the calling thread's last call to "compute()"
+    @property
+    def recomputed_nodes(self):
+        return getattr(self.thread_state, "recomputed_nodes", [])
+
+    # returns a node's result, computing it (and any of its dependencies) only if it isn't already remembered
+    def get_node_value(self, name, parameter_values):
+
+        node = self.nodes[name]
+        node_memo = self.memo[name]
+        key = self.get_node_key(name, parameter_values)
+
+        with self.memo_lock:
+            if key in node_memo:
+                node_memo.move_to_end(key)
+                return node_memo[key]
+
+        dependency_values = [self.get_node_value(dependency, parameter_values) for dependency in node["dependencies"]]
+        own_values = [parameter_values[parameter] for parameter in node["parameters"]]
+
+        value = node["function"](*dependency_values, *own_values)
+
+        with self.memo_lock:
+            node_memo[key] = value
+            if len(node_memo) > self.memo_size:
+                self.evict_result(node_memo)
+
+        self.thread_state.recomputed_nodes.append(name)
+
+        return value
+
+    # returns a dictionary of node name -> result for each of the requested nodes
+    # "parameter_values" only needs to include the parameters that the requested nodes (and their dependencies) use, apart from the ones in DEFAULT_PARAMETER_VALUES
+    def compute(self, node_names, **parameter_values):
+
+        self.thread_state.recomputed_nodes = []
+        parameter_values = {**DEFAULT_PARAMETER_VALUES, **parameter_values}
+
+        return {name: self.get_node_value(name, parameter_values) for name in node_names}
+
+    # returns the HITRAN lines within an observation's wavenumbers
+    def get_line_store(self, raw_data):
+
+        if self.tile_cache is None:
+            return HitranOverlay(raw_data["wavenumber"])
+
+        return self.tile_cache.get_overlay(raw_data["wavenumber"])
+
+    # returns the "col_den_trans" value of every line in the line store
+    # the tile cache only covers the average altitude, since the flight segment's column densities depend on the observation's own elevation angles
+    def get_column_density_strengths(self, overlay, column_densities, temperature, altitude_km, latitude, overlay_column_mode):
+
+        if (self.tile_cache is not None) and (overlay_column_mode == "average_altitude"):
+            return self.tile_cache.get_strengths(overlay, temperature, altitude_km, latitude)
+
+        return overlay.scale_by_column_densities(overlay.evaluate_temperature_strengths(temperature), column_densities)
+
+    # forgets a node's least recently used result that wasn't computed from a pinned file (or its least recently used result, if every one of them was)
+    # has to be called with the memo lock held
+    def evict_result(self, node_memo):
+
+        for key in node_memo:
+            if not any(key_contains_file_name(key, file_name) for file_name in self.pinned_file_names):
+                node_memo.pop(key)
+                return
+
+        node_memo.popitem(last = False)
+
+    # keeps the results computed from a file (or from each file of a stack) ahead of other files' results when a node's memo is full
+    # only the PINNED_FILE_LIMIT most recently pinned files stay pinned
+    def pin_file(self, file_name):
+
+        with self.memo_lock:
+
+            for pinned_file_name in (file_name if isinstance(file_name, tuple) else (file_name,)):
+                self.pinned_file_names[pinned_file_name] = True
+                self.pinned_file_names.move_to_end(pinned_file_name)
+
+            while len(self.pinned_file_names) > PINNED_FILE_LIMIT:
+                self.pinned_file_names.popitem(last = False)
+
+    # forgets every remembered result that was computed from a file (including stacks that contain it), e.g. because the file changed on disk
+    # returns how many results were forgotten
+    def invalidate_file(self, file_name):
+
+        forgotten_count = 0
+
+        with self.memo_lock:
+            for node_memo in self.memo.values():
+                for key in list(node_memo):
+                    if key_contains_file_name(key, file_name):
+                        node_memo.pop(key, None)
+                        forgotten_count += 1
+
+        return forgotten_count
+
+# function returns True if a node key (a nested tuple of parameter values) contains the file name anywhere in it
+def key_contains_file_name(key, file_name):
+
+    if isinstance(key, tuple):
+        return any(key_contains_file_name(value, file_name) for value in key)
+
+    return key == file_name
+
+# function reads a single observation, or stacks several observations if "file_name" is a tuple of file names
+# files in the "archive" (see spectra_archive.py) are read from its memory map instead of from their FITS files
+def get_observation_raw_data(file_name, dir = "EXES_Files", archive = None):
+
+    if isinstance(file_name, tuple):
+        return stack_exes_observations(file_name, dir, archive = archive)
+
+    if (archive is not None) and (file_name in archive):
+        return archive.get_raw_data(file_name)
+
+    return get_raw_exes_file_data(file_name, dir)
+
+# function returns what the flux gets divided by: the single "get_fluxnorm()" value, or the estimated continuum at every sample if a continuum method is given
+def get_continuum(raw_data, norm, continuum_method):
+
+    if continuum_method is None:
+        return norm
+
+    return estimate_continuum(raw_data["wavenumber"], raw_data["flux"], raw_data["atran"], continuum_method)
+
+# function returns the column density of every molecule that the overlay's lines get scaled by
+# "flight_segment" averages the slant column densities over the observation's flight segment, moved up or down so that its average altitude is "altitude_km"
+def get_column_densities(raw_data, overlay, altitude_km, latitude, overlay_column_mode):
+
+    if overlay_column_mode == "average_altitude":
+        return overlay.get_column_densities(altitude_km, latitude)
+
+    if overlay_column_mode != "flight_segment":
+        raise ValueError(f"Unknown overlay column mode {overlay_column_mode!r}, expected one of {OVERLAY_COLUMN_MODES}")
+
+    altitude_offset_km = altitude_km - raw_data["avg_altitude_km"]
+
+    altitudes_km, elevation_angles = get_flight_segment_samples(
+        raw_data["start_altitude"] * FEET_TO_KILOMETERS + altitude_offset_km,
+        raw_data["end_altitude"] * FEET_TO_KILOMETERS + altitude_offset_km,
+        raw_data["start_elevation_angle"],
+        raw_data["end_elevation_angle"],
+    )
+
+    return overlay.get_flight_segment_column_densities(altitudes_km, elevation_angles, latitude)
+
+# function smooths the normalized flux with a box kernel (or returns None if no smooth width is given)
+def get_smooth_flux(norm_flux, smooth_width):
+
+    if smooth_width is None:
+        return None
+
+    return convolve(norm_flux, Box1DKernel(smooth_width), preserve_nan = True)
+
+# function returns the uncertainty of the smoothed flux, propagated through the same box kernel that "get_smooth_flux()" uses
+# each smoothed sample is sum(k * flux) / sum(k) over the kernel's finite flux samples (astropy leaves the NaN samples out and renormalizes,
+# while the zeros past the ends of the spectrum still count), so for independent noise its uncertainty is sqrt(sum(k^2 * uncertainty^2)) / sum(k)
+# note that neighbouring smoothed samples share most of their flux samples, so their errors are correlated (see "get_fit_bootstrap()")
+def get_smooth_uncertainty(norm_flux, norm_uncertainty, smooth_width):
+
+    if smooth_width is None:
+        return norm_uncertainty
+
+    kernel = Box1DKernel(smooth_width).array
+    finite_flux = np.isfinite(norm_flux)
+
+    variance_sums = convolve(np.where(finite_flux, norm_uncertainty, 0) ** 2, kernel ** 2, normalize_kernel = False, boundary = "fill", fill_value = 0.0)
+    kernel_sums = convolve(finite_flux.astype(float), kernel, normalize_kernel = False, boundary = "fill", fill_value = 1.0)
+
+    return np.where(finite_flux, np.sqrt(variance_sums) / np.where(finite_flux, kernel_sums, 1), np.nan)
+
+# function returns the values (e.g. the normalized uncertainty) of a spectrum at the given wavenumbers, which are a subset of the spectrum's own samples
+def get_values_at_wavenumbers(wavenumber, values, selected_wavenumbers):
+
+    finite_samples = np.isfinite(wavenumber)
+    wavenumber_order = np.argsort(wavenumber[finite_samples], kind = "stable")
+
+    return np.interp(selected_wavenumbers, wavenumber[finite_samples][wavenumber_order], values[finite_samples][wavenumber_order])
+
+# function runs the bootstrap of a fit to the normalized (unsmoothed) flux, with the noise of every copy drawn from the normalized uncertainty
+# the unsmoothed samples have independent errors, unlike the smoothed ones, which is what the bootstrap's noise (and the fit's 1 / uncertainty weights) assume
+# (the refits are weighted the same way as the fit was, see "bootstrap_fit_parameters()")
+def get_fit_bootstrap(raw_data, norm_uncertainty, fit_peak_models, fit_parameter_values, fit_wavenumbers, fit_weighted):
+
+    fit_wavenumbers = np.array(fit_wavenumbers, dtype = float)
+    uncertainty = get_values_at_wavenumbers(raw_data["wavenumber"], norm_uncertainty, fit_wavenumbers)
+    fitted_model = get_model_from_parameters(list(fit_peak_models), dict(fit_parameter_values))
+
+    return bootstrap_fit_parameters(fitted_model, list(fit_peak_models), fit_wavenumbers, uncertainty, weighted = fit_weighted)
+
+# function builds the overlay trace objects for the lines that passed the cutoff
+def get_stem_traces(cutoff_lines, overlay_render_mode):
+
+    # "molecule" mode draws one WebGL trace per molecule, instead of one trace per isotopologue
+    if overlay_render_mode == "molecule":
+        return get_merged_molecule_trace_objects(cutoff_lines)
+
+    return get_isotopologue_trace_objects(cutoff_lines)
+
+# function retrieves the column densities of every molecule from the normalized flux, reusing the already evaluated line strengths
+def get_column_density_retrieval(raw_data, norm_flux, norm_uncertainty, overlay, line_strengths, column_densities, temperature, altitude_km, latitude):
+    return retrieve_column_densities(raw_data["wavenumber"], norm_flux, norm_uncertainty, overlay, temperature, altitude_km, latitude, line_strengths, column_densities)
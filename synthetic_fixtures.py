@@ -0,0 +1,125 @@
+import os
+import json
+import shutil
+import numpy as np
+import astropy.io.fits as fits
+from hapi import HITRAN_DEFAULT_HEADER
+
+from fetch_hitran_data import CONF
+
+# READ ME:
+# These functions write a small, self-contained data directory that the dashboard can run against without the real EXES archive or a HITRAN download
+# (e.g. for the tests in tests/, and the load test in load_test.py):
+#
+#   <directory>/EXES_Files/obs_<i>.fits      EXES-like FITS files: a (wavenumber, flux, uncertainty, atran) array plus the header keys "get_exes_header_info()" reads
+#   <directory>/HITRAN_Data/<molecule>.*     HAPI tables (160 character HITRAN records plus a JSON header) with random lines for every molecule in CONF
+#   <directory>/Model Atmosphere Table.xls   copied from this repository, since the column densities come from it
+#
+# Everything is drawn from a seeded random generator, so the same arguments always write the same fixtures.
+
+SYNTHETIC_FILE_COUNT = 6
+SYNTHETIC_SAMPLE_COUNT = 20000
+SYNTHETIC_LINE_COUNT = 4000
+
+# each observation covers SYNTHETIC_WAVENUMBER_WIDTH cm^-1, starting at one of a few overlapping ranges (so there's something to stack)
+SYNTHETIC_WAVENUMBER_STARTS = [1250.0, 1260.0, 1270.0]
+SYNTHETIC_WAVENUMBER_WIDTH = 12.0
+
+# the HITRAN lines cover a wider range than the observations, like a real HITRAN download does
+SYNTHETIC_LINE_WAVENUMBER_RANGE = [500.0, 2000.0]
+
+# how many isotopologues (local iso ids 1, 2, ...) of each molecule get lines
+SYNTHETIC_ISOTOPOLOGUES_PER_MOLECULE = 3
+
+# how many telluric lines are in each observation's atran, and the flux noise (the continuum is SYNTHETIC_CONTINUUM_FLUX)
+SYNTHETIC_TELLURIC_LINE_COUNT = 20
+SYNTHETIC_CONTINUUM_FLUX = 5.0
+SYNTHETIC_FLUX_NOISE = 0.05
+
+SYNTHETIC_OBJECTS = ["AFGL 2136", "Orion", "W3"]
+
+MODEL_ATMOSPHERE_TABLE = "Model Atmosphere Table.xls"
+
+# function writes one HAPI table (".data" and ".header" files) of random lines for a molecule
+def write_synthetic_hitran_table(hitran_dir, table_name, molecule_number, isotopologue_count, line_count, rng):
+
+    line_wavenumbers = np.sort(rng.uniform(*SYNTHETIC_LINE_WAVENUMBER_RANGE, line_count))
+    line_isotopologues = rng.integers(1, isotopologue_count + 1, line_count)
+    line_strengths = 10 ** rng.uniform(-26, -19, line_count)
+    line_elowers = rng.uniform(0, 2000, line_count)
+
+    record_order = HITRAN_DEFAULT_HEADER["order"]
+    record_format = HITRAN_DEFAULT_HEADER["format"]
+
+    records = []
+
+    for wavenumber, isotopologue, strength, elower in zip(line_wavenumbers, line_isotopologues, line_strengths, line_elowers):
+
+        line = {
+            "molec_id": molecule_number, "local_iso_id": int(isotopologue), "nu": wavenumber, "sw": strength, "a": 1.0,
+            "gamma_air": 0.07, "gamma_self": 0.3, "elower": elower, "n_air": 0.75, "delta_air": 0.0,
+            "global_upper_quanta": "", "global_lower_quanta": "", "local_upper_quanta": "", "local_lower_quanta": "",
+            "ierr": "", "iref": "", "line_mixing_flag": "", "gp": 1.0, "gpp": 1.0,
+        }
+
+        # "gamma_air" is a 5 character field, but its default format writes 6 characters
+        records.append("".join((record_format[key] % line[key])[-5:] if key == "gamma_air" else record_format[key] % line[key] for key in record_order))
+
+    with open(os.path.join(hitran_dir, table_name + ".data"), "w") as data_file:
+        data_file.write("\n".join(records) + "\n")
+
+    header = dict(HITRAN_DEFAULT_HEADER, table_name = table_name, number_of_rows = line_count)
+
+    with open(os.path.join(hitran_dir, table_name + ".header"), "w") as header_file:
+        header_file.write(json.dumps(header, indent = 2))
+
+# function writes one EXES-like FITS file
+def write_synthetic_exes_file(path, index, sample_count, rng):
+
+    wavenumber_start = SYNTHETIC_WAVENUMBER_STARTS[index % len(SYNTHETIC_WAVENUMBER_STARTS)]
+    wavenumber = np.linspace(wavenumber_start, wavenumber_start + SYNTHETIC_WAVENUMBER_WIDTH, sample_count)
+
+    telluric_centers = rng.uniform(wavenumber_start, wavenumber_start + SYNTHETIC_WAVENUMBER_WIDTH, SYNTHETIC_TELLURIC_LINE_COUNT)
+    atran = 1 - 0.5 * np.clip(np.exp(-(wavenumber[:, np.newaxis] - telluric_centers) ** 2 / 0.0004).sum(axis = 1), 0, 1)
+
+    flux = SYNTHETIC_CONTINUUM_FLUX * atran * (1 + 0.02 * np.sin(wavenumber)) + rng.normal(0, SYNTHETIC_FLUX_NOISE, sample_count)
+    uncertainty = np.full(sample_count, SYNTHETIC_FLUX_NOISE)
+
+    header = fits.Header()
+    header["OBJECT"] = SYNTHETIC_OBJECTS[index % len(SYNTHETIC_OBJECTS)]
+    header["TELEL"] = 40.0 + index
+    header["ZA_START"] = 90.0 - header["TELEL"] + 2.0
+    header["ZA_END"] = 90.0 - header["TELEL"] - 2.0
+    header["LAT_STA"] = 30.0 + index
+    header["LON_STA"] = -120.0 + index
+    header["ALTI_STA"] = 38000.0 + 100 * index
+    header["ALTI_END"] = 41000.0
+    header["TEMP_OUT"] = -40.0 - index
+    header["DATE-OBS"] = "2019-%02d-12T08:30:00" % (index % 12 + 1)
+
+    fits.PrimaryHDU(data = np.vstack([wavenumber, flux, uncertainty, atran]).astype(">f8"), header = header).writeto(path, overwrite = True)
+
+# function writes the whole fixture directory, returns the path of its EXES_Files directory
+def write_synthetic_fixtures(directory, file_count = SYNTHETIC_FILE_COUNT, sample_count = SYNTHETIC_SAMPLE_COUNT, line_count = SYNTHETIC_LINE_COUNT, seed = 0):
+
+    rng = np.random.default_rng(seed)
+
+    exes_dir = os.path.join(directory, "EXES_Files")
+    hitran_dir = os.path.join(directory, "HITRAN_Data")
+    os.makedirs(exes_dir, exist_ok = True)
+    os.makedirs(hitran_dir, exist_ok = True)
+
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), MODEL_ATMOSPHERE_TABLE), os.path.join(directory, MODEL_ATMOSPHERE_TABLE))
+
+    for molecule in CONF:
+        isotopologue_count = min(SYNTHETIC_ISOTOPOLOGUES_PER_MOLECULE, len(molecule["hitran_isotope_list"]))
+        write_synthetic_hitran_table(hitran_dir, molecule["table_name"], molecule["hitran_molecule_number"], isotopologue_count, line_count, rng)
+
+    for i in range(file_count):
+        write_synthetic_exes_file(os.path.join(exes_dir, "obs_" + str(i) + ".fits"), i, sample_count, rng)
+
+    return exes_dir
+
+
+if __name__ == "__main__":
+    print(write_synthetic_fixtures("synthetic_fixtures"))
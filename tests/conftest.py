@@ -0,0 +1,37 @@
+import os
+import sys
+import pytest
+
+# READ ME:
+# The HITRAN tables and the model atmosphere table are read from the working directory when the modules are imported (see hitran_molecule_info.py),
+# so every test runs in a synthetic data directory (see synthetic_fixtures.py), and the modules are only imported inside the tests, once it's the working directory.
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_DIR)
+
+# the synthetic data directory is written once, and shared by every test
+@pytest.fixture(scope = "session")
+def fixture_dir(tmp_path_factory):
+
+    from synthetic_fixtures import write_synthetic_fixtures
+
+    directory = tmp_path_factory.mktemp("synthetic_fixtures")
+    exes_dir = write_synthetic_fixtures(str(directory))
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+
+        monkeypatch.chdir(directory)
+        monkeypatch.setenv("EXES_DIRECTORY", exes_dir)
+        monkeypatch.setenv("EXES_ARCHIVE_DIRECTORY", str(directory / "EXES_Archive"))
+
+        yield directory
+
+# the dashboard module (its layout and callbacks), imported once in the synthetic data directory
+@pytest.fixture(scope = "session")
+def dashboard(fixture_dir):
+
+    import dashboard_spectra_and_hitran as dashboard
+
+    yield dashboard
+
+    dashboard.PREFETCH_SCHEDULER.shutdown()
@@ -0,0 +1,63 @@
+import numpy as np
+
+SCALE_FACTORS = [0.5, 2.0, 0.0]
+
+# function returns a wavenumber grid and a (molecules x wavenumbers) basis of optical depth spectra, each molecule with its own few lines
+def get_synthetic_basis_spectra():
+
+    wavenumber = np.linspace(1250.0, 1262.0, 4000)
+    line_centers = [[1251.3, 1255.2, 1260.1], [1252.7, 1257.9], [1253.4, 1258.8, 1261.2]]
+
+    basis_spectra = np.array([sum(0.3 * np.exp(-0.5 * ((wavenumber - center) / 0.01) ** 2) for center in centers) for centers in line_centers])
+
+    return wavenumber, basis_spectra
+
+def test_scale_factors_are_recovered_from_a_noise_free_spectrum(fixture_dir):
+
+    from column_density_retrieval import solve_column_density_scale_factors
+
+    wavenumber, basis_spectra = get_synthetic_basis_spectra()
+
+    # -log(continuum) has an offset and a slope, which are solved for alongside the scale factors
+    continuum = np.exp(0.1 - 0.01 * (wavenumber - wavenumber.mean()))
+    norm_flux = continuum * np.exp(-np.asarray(SCALE_FACTORS) @ basis_spectra)
+
+    solution = solve_column_density_scale_factors(wavenumber, norm_flux, np.full(len(wavenumber), 0.01), basis_spectra)
+
+    np.testing.assert_allclose(solution["scale_factors"], SCALE_FACTORS, atol = 1e-8)
+    assert solution["point_count"] == len(wavenumber)
+
+def test_scale_factors_are_recovered_from_a_noisy_spectrum(fixture_dir):
+
+    from column_density_retrieval import solve_column_density_scale_factors
+
+    wavenumber, basis_spectra = get_synthetic_basis_spectra()
+
+    norm_flux = np.exp(-np.asarray(SCALE_FACTORS) @ basis_spectra) + np.random.default_rng(0).normal(0, 0.002, len(wavenumber))
+
+    # unusable points (non-positive or NaN flux, or a zero uncertainty) are left out of the fit
+    norm_flux[:10] = -1.0
+    norm_flux[10:20] = np.nan
+    norm_uncertainty = np.full(len(wavenumber), 0.002)
+    norm_uncertainty[20:30] = 0.0
+
+    solution = solve_column_density_scale_factors(wavenumber, norm_flux, norm_uncertainty, basis_spectra)
+
+    np.testing.assert_allclose(solution["scale_factors"], SCALE_FACTORS, atol = 0.02)
+    assert solution["point_count"] == len(wavenumber) - 30
+
+def test_line_spectra_keep_each_lines_strength_in_its_own_group(fixture_dir):
+
+    from column_density_retrieval import get_uniform_wavenumber_grid, get_uniform_line_spectra
+
+    uniform_grid = get_uniform_wavenumber_grid(np.linspace(1250.0, 1262.0, 6001))
+    line_wavenumbers = np.array([1251.2345, 1255.0, 1258.777, 1300.0])
+    line_strengths = np.array([1.0, 2.0, 3.0, 4.0])
+    line_groups = np.array([0, 1, 0, 1])
+
+    line_spectra = get_uniform_line_spectra(uniform_grid, line_wavenumbers, line_strengths, line_groups, 2)
+
+    # the line profile is normalized (up to its truncation at GAUSSIAN_KERNEL_HALF_WIDTH), so each group integrates to the strength of its lines on the grid (the line at 1300 is off the grid)
+    spacing = uniform_grid[1] - uniform_grid[0]
+    np.testing.assert_allclose(line_spectra.sum(axis = 1) * spacing, [4.0, 2.0], rtol = 1e-4)
+    assert uniform_grid[np.argmax(line_spectra[1])] == uniform_grid[np.argmin(np.abs(uniform_grid - 1255.0))]
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+# function returns a spectrum with a sloped, rippled continuum, a few deep telluric lines (in its atran) and narrow absorption lines that the atran doesn't show
+def get_synthetic_spectrum(sample_count = 20000, seed = 0):
+
+    rng = np.random.default_rng(seed)
+    wavenumber = np.linspace(1250.0, 1262.0, sample_count)
+
+    continuum = 5.0 * (1 + 0.05 * np.sin(0.5 * wavenumber)) + 0.02 * (wavenumber - 1250.0)
+
+    atran = 1 - 0.8 * np.exp(-0.5 * ((wavenumber[:, np.newaxis] - [1252.5, 1256.1, 1259.4]) / 0.02) ** 2).sum(axis = 1)
+    absorption = np.exp(-0.3 * np.exp(-0.5 * ((wavenumber[:, np.newaxis] - rng.uniform(1250.0, 1262.0, 15)) / 0.005) ** 2).sum(axis = 1))
+
+    flux = continuum * atran * absorption * (1 + rng.normal(0, 0.002, sample_count))
+
+    return wavenumber, flux, atran, continuum
+
+@pytest.mark.parametrize("method", ["rolling_quantile", "clipped_spline"])
+def test_continuum_is_recovered_through_telluric_and_absorption_lines(fixture_dir, method):
+
+    from continuum_estimation import estimate_continuum
+
+    wavenumber, flux, atran, continuum = get_synthetic_spectrum()
+
+    # away from the edges (where the rolling window is one sided)
+    inner_samples = (wavenumber > 1250.5) & (wavenumber < 1261.5)
+
+    np.testing.assert_allclose(estimate_continuum(wavenumber, flux, atran, method)[inner_samples], continuum[inner_samples], rtol = 0.01)
+
+@pytest.mark.parametrize("method", ["rolling_quantile", "clipped_spline"])
+def test_continuum_does_not_depend_on_the_sample_order(fixture_dir, method):
+
+    from continuum_estimation import estimate_continuum
+
+    wavenumber, flux, atran, continuum = get_synthetic_spectrum()
+    order = np.random.default_rng(1).permutation(len(wavenumber))
+
+    np.testing.assert_allclose(estimate_continuum(wavenumber[order], flux[order], atran[order], method), estimate_continuum(wavenumber, flux, atran, method)[order])
+
+def test_batched_continua_match_single_spectrum_continua(fixture_dir):
+
+    from continuum_estimation import estimate_continuum, estimate_continua
+
+    # spectra of different lengths (with the same sample spacing, so they get the same window size) are padded into one rolling call
+    spectra = [get_synthetic_spectrum(seed = seed) for seed in range(3)]
+    spectra[1] = tuple(values[:12000] for values in spectra[1])
+
+    continua = estimate_continua(*[[spectrum[i] for spectrum in spectra] for i in range(3)])
+
+    for (wavenumber, flux, atran, continuum), batched_continuum in zip(spectra, continua):
+        np.testing.assert_allclose(batched_continuum, estimate_continuum(wavenumber, flux, atran))
+
+def test_telluric_lines_are_masked(fixture_dir):
+
+    from continuum_estimation import get_continuum_mask
+
+    wavenumber, flux, atran, continuum = get_synthetic_spectrum()
+    flux[5] = np.nan
+
+    mask = get_continuum_mask(wavenumber, flux, atran)
+
+    assert not mask[5]
+    assert not np.any(mask[np.abs(wavenumber - 1256.1) < 0.005])
+    assert np.all(mask[(np.abs(wavenumber - 1254.0) < 0.5)])
+
+def test_unknown_continuum_method_raises(fixture_dir):
+
+    from continuum_estimation import estimate_continuum
+
+    with pytest.raises(ValueError):
+        estimate_continuum(*get_synthetic_spectrum()[:3], method = "polynomial")
@@ -0,0 +1,26 @@
+import json
+import types
+from plotly.io.json import to_json_plotly
+
+# function returns the "loaded_spectrum" store of obs_0.fits drawn with the given cutoff (the way it comes back from the browser)
+def get_loaded_spectrum(dashboard, monkeypatch, cutoff):
+
+    monkeypatch.setattr(dashboard, "ctx", types.SimpleNamespace(triggered_id = "hitran_cutoff_parameter"))
+    spectra_figure, loaded_spectrum = dashboard.update_graph({"points": [{"hovertext": "obs_0.fits"}]}, 9, cutoff, None, None, None, "isotopologue", None)
+
+    return json.loads(to_json_plotly(loaded_spectrum))
+
+def test_cutoff_status_is_empty_when_the_cutoff_is_drawn_as_entered(dashboard, monkeypatch):
+
+    loaded_spectrum = get_loaded_spectrum(dashboard, monkeypatch, 1e-4)
+
+    assert loaded_spectrum["overlay_parameters"]["display_cutoff"] == 1e-4
+    assert dashboard.update_overlay_cutoff_status(loaded_spectrum) == ""
+
+def test_cutoff_status_shows_the_raised_cutoff(dashboard):
+
+    # e.g. more than OVERLAY_LINE_LIMIT lines passed 1e-4, so the full spectrum was drawn with the strength of the last one that fit
+    loaded_spectrum = {"file_name": "obs_0.fits", "overlay_parameters": {"cutoff": 1e-4, "display_cutoff": 0.0032}}
+
+    assert "cutoff is 0.0032" in dashboard.update_overlay_cutoff_status(loaded_spectrum)
+    assert dashboard.update_overlay_cutoff_status(None) == ""
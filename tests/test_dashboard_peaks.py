@@ -0,0 +1,87 @@
+import json
+import numpy as np
+import types
+import pytest
+from dash import Patch
+from plotly.io.json import to_json_plotly
+
+# a box selection of obs_0.fits, and the peak parameters that find a few dozen peaks in it
+SELECTION = {"range": {"x": [1254, 1256], "y": [0, 2]}}
+HEIGHT = 1.0
+PROMINENCE = 0.01
+BASELINE = 0.9
+
+# function sends a callback's return value through JSON, like it would be on its way to the browser and back
+def round_trip(value):
+    return json.loads(to_json_plotly(value))
+
+# function calls a callback the way dash would when "triggered_id" changed
+def call_callback(dashboard, monkeypatch, triggered_id, callback, *args):
+
+    monkeypatch.setattr(dashboard, "ctx", types.SimpleNamespace(triggered_id = triggered_id))
+
+    return callback(*args)
+
+@pytest.fixture
+def loaded_spectrum(dashboard, monkeypatch):
+
+    spectra_figure, loaded_spectrum = round_trip(call_callback(dashboard, monkeypatch, "exps_map", dashboard.update_graph, {"points": [{"hovertext": "obs_0.fits"}]}, 9, 1e-4, None, None, None, "isotopologue", None))
+
+    return loaded_spectrum
+
+# function calls "update_spectra_peaks()" for the selection with the given height, prominence and baseline, and the client's current peaks figure key
+def update_peaks(dashboard, monkeypatch, triggered_id, loaded_spectrum, height, prominence, peaks_figure_key, baseline = BASELINE):
+
+    return call_callback(dashboard, monkeypatch, triggered_id, dashboard.update_spectra_peaks, None, SELECTION, height, prominence, None, baseline, loaded_spectrum, peaks_figure_key)
+
+def test_peak_parameter_change_patches_the_identified_peaks(dashboard, monkeypatch, loaded_spectrum):
+
+    peaks_figure, peaks_figure_key = round_trip(update_peaks(dashboard, monkeypatch, "exp_spectra", loaded_spectrum, HEIGHT, None, None))
+
+    assert peaks_figure["data"][-1]["name"] == "Identified Peaks"
+    assert peaks_figure_key is not None
+
+    patched_figure, patched_figure_key = update_peaks(dashboard, monkeypatch, "prominence_parameter", loaded_spectrum, HEIGHT, PROMINENCE, peaks_figure_key)
+
+    assert isinstance(patched_figure, Patch)
+    assert patched_figure_key is dashboard.no_update
+
+def test_clearing_the_height_resets_the_key_and_the_next_height_rebuilds_the_figure(dashboard, monkeypatch, loaded_spectrum):
+
+    peaks_figure, peaks_figure_key = round_trip(update_peaks(dashboard, monkeypatch, "exp_spectra", loaded_spectrum, HEIGHT, PROMINENCE, None))
+
+    empty_figure, cleared_figure_key = round_trip(update_peaks(dashboard, monkeypatch, "height_parameter", loaded_spectrum, None, PROMINENCE, peaks_figure_key))
+
+    assert cleared_figure_key is None
+    assert empty_figure["data"][-1]["name"] != "Identified Peaks"
+
+    # the figure in the browser is now the empty one, so the peaks can't be patched into it
+    rebuilt_figure, rebuilt_figure_key = update_peaks(dashboard, monkeypatch, "height_parameter", loaded_spectrum, HEIGHT, PROMINENCE, cleared_figure_key)
+
+    assert not isinstance(rebuilt_figure, Patch)
+    assert round_trip(rebuilt_figure)["data"][-1]["name"] == "Identified Peaks"
+    assert round_trip(rebuilt_figure_key) == peaks_figure_key
+
+def test_peak_parameter_change_after_a_baseline_change_rebuilds_the_figure(dashboard, monkeypatch, loaded_spectrum):
+
+    peaks_figure, peaks_figure_key = round_trip(update_peaks(dashboard, monkeypatch, "exp_spectra", loaded_spectrum, HEIGHT, PROMINENCE, None))
+
+    # e.g. the baseline changed while the rebuilt figure (and its key) was still on its way to the browser
+    rebuilt_figure, rebuilt_figure_key = update_peaks(dashboard, monkeypatch, "prominence_parameter", loaded_spectrum, HEIGHT, PROMINENCE, peaks_figure_key, baseline = 0.8)
+
+    assert not isinstance(rebuilt_figure, Patch)
+    assert round_trip(rebuilt_figure)["data"][-1]["name"] == "Identified Peaks"
+    assert round_trip(rebuilt_figure_key) != peaks_figure_key
+
+def test_server_side_selection_matches_the_loaded_spectrum_figure(dashboard, monkeypatch):
+
+    spectra_figure, loaded_spectrum = round_trip(call_callback(dashboard, monkeypatch, "exps_map", dashboard.update_graph, {"points": [{"hovertext": "obs_0.fits"}]}, 9, 1e-4, None, None, None, "isotopologue", None))
+    peaks_figure, peaks_figure_key = round_trip(update_peaks(dashboard, monkeypatch, "exp_spectra", loaded_spectrum, HEIGHT, PROMINENCE, None))
+
+    # without the clientside filtered data, the selection is filtered out of the spectrum rebuilt from the "loaded_spectrum" store
+    selected_traces = dashboard.update_plot_axes_ranges(spectra_figure["data"][:2], SELECTION)
+
+    for selected_trace, peaks_trace in zip(selected_traces, peaks_figure["data"][:2]):
+        assert peaks_trace["name"] == selected_trace["name"]
+        np.testing.assert_array_equal(dashboard.decode_typed_array(peaks_trace["x"]), selected_trace["x"])
+        np.testing.assert_array_equal(dashboard.decode_typed_array(peaks_trace["y"]), selected_trace["y"])
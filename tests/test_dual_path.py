@@ -0,0 +1,41 @@
+import pytest
+
+@pytest.fixture
+def dual_path():
+
+    import dual_path
+
+    dual_path.DUAL_PATH_RECORDS.clear()
+    dual_path.set_dual_path_stages(["transition_strengths", "tile_strengths"])
+
+    yield dual_path
+
+    dual_path.set_dual_path_stages([])
+    dual_path.DUAL_PATH_RECORDS.clear()
+
+def test_decorated_functions_called_within_a_run_are_not_checked_again(dual_path):
+
+    inner_reference_calls = []
+
+    inner = dual_path.dual_path("transition_strengths", lambda x: inner_reference_calls.append(x) or 2 * x)(lambda x: 2 * x)
+    outer = dual_path.dual_path("tile_strengths", lambda x: inner(x) + 1)(lambda x: inner(x) + 1)
+
+    assert outer(3) == 7
+
+    # only the outer stage is recorded, and the inner stage's reference didn't run inside the outer stage's accelerated call
+    assert [record["stage"] for record in dual_path.DUAL_PATH_RECORDS] == ["tile_strengths"]
+    assert inner_reference_calls == []
+
+    assert inner(3) == 6
+    assert [record["stage"] for record in dual_path.DUAL_PATH_RECORDS] == ["tile_strengths", "transition_strengths"]
+
+def test_mismatches_are_recorded_with_the_accelerated_result(dual_path):
+
+    accelerated = dual_path.dual_path("transition_strengths", lambda x: [x, x])(lambda x: [x, x * (1 + 1e-6)])
+
+    assert accelerated(1.0) == [1.0, 1.0 + 1e-6]
+
+    record = dual_path.DUAL_PATH_RECORDS[-1]
+
+    assert not record["matched"]
+    assert record["differences"][0]["mismatch_count"] == 1
@@ -0,0 +1,85 @@
+import numpy as np
+
+FWHM = 0.02
+STANDARD_DEVIATION = FWHM / (2 * np.sqrt(2 * np.log(2)))
+UNCERTAINTY = 0.01
+
+# function returns a normalized spectrum with a gaussian absorption line of the given equivalent width (in cm^-1) at each of the centers
+def get_synthetic_spectrum(centers, equivalent_widths):
+
+    wavenumber = np.linspace(1250.0, 1262.0, 24001)
+    norm_flux = np.ones_like(wavenumber)
+
+    for center, equivalent_width in zip(centers, equivalent_widths):
+        norm_flux -= equivalent_width * np.exp(-0.5 * ((wavenumber - center) / STANDARD_DEVIATION) ** 2) / (np.sqrt(2 * np.pi) * STANDARD_DEVIATION)
+
+    return wavenumber, norm_flux, np.full(len(wavenumber), UNCERTAINTY)
+
+# function returns the synthetic HITRAN overlay of the spectrum's range, its line strengths, and the position of its strongest line
+def get_overlay(wavenumber):
+
+    from hitran_overlay import HitranOverlay
+
+    overlay = HitranOverlay([wavenumber[0], wavenumber[-1]])
+    line_strengths = overlay.evaluate(-40.0, 12.0, 30.0)
+
+    return overlay, line_strengths, int(np.nanargmax(line_strengths))
+
+def test_equivalent_width_of_a_gaussian_line_is_its_area(fixture_dir):
+
+    from equivalent_width import measure_equivalent_widths
+
+    wavenumber, norm_flux, norm_uncertainty = get_synthetic_spectrum([1255.0], [0.004])
+    overlay, line_strengths, strongest_line = get_overlay(wavenumber)
+
+    equivalent_width_df = measure_equivalent_widths(wavenumber, norm_flux, norm_uncertainty, [1255.0], [FWHM], overlay, line_strengths)
+
+    # +/- 1.5 FWHMs holds all but ~0.05% of a gaussian's area
+    # (the window is 0.06 cm^-1 wide, 121 samples spaced 0.0005 cm^-1 apart)
+    assert equivalent_width_df["sample_count"][0] == 121
+    np.testing.assert_allclose(equivalent_width_df["equivalent_width"][0], 0.004, rtol = 1e-3)
+    np.testing.assert_allclose(equivalent_width_df["equivalent_width_uncertainty"][0], np.sqrt(121) * UNCERTAINTY * 0.0005)
+
+def test_equivalent_widths_are_compared_to_the_assigned_line(fixture_dir):
+
+    from equivalent_width import measure_equivalent_widths
+
+    # a peak right on the strongest HITRAN line in range, which it's then assigned to
+    wavenumber = np.linspace(1250.0, 1262.0, 24001)
+    overlay, line_strengths, strongest_line = get_overlay(wavenumber)
+    center = overlay.wavenumber[strongest_line]
+
+    wavenumber, norm_flux, norm_uncertainty = get_synthetic_spectrum([center], [0.004])
+    equivalent_width_df = measure_equivalent_widths(wavenumber, norm_flux, norm_uncertainty, [center], [FWHM], overlay, line_strengths)
+
+    assert equivalent_width_df["line_wavenumber"][0] == center
+    assert equivalent_width_df["col_den_trans"][0] == line_strengths[strongest_line]
+    assert equivalent_width_df["window_col_den_trans"][0] >= line_strengths[strongest_line]
+    np.testing.assert_allclose(equivalent_width_df["strength_ratio"][0], equivalent_width_df["equivalent_width"][0] / line_strengths[strongest_line])
+
+def test_blended_peaks_split_their_windows_halfway_and_match_a_loop_over_the_peaks(fixture_dir):
+
+    from equivalent_width import measure_equivalent_widths, get_sample_widths
+
+    # the peaks are passed out of order, and the last two are closer than their windows, so they're cut off halfway between them
+    centers = [1258.0, 1253.0, 1253.04]
+    wavenumber, norm_flux, norm_uncertainty = get_synthetic_spectrum(centers, [0.002, 0.003, 0.001])
+    overlay, line_strengths, strongest_line = get_overlay(wavenumber)
+
+    # a few samples without a flux in the first window are left out of the sums
+    norm_flux[np.abs(wavenumber - 1253.0) < 0.002] = np.nan
+
+    equivalent_width_df = measure_equivalent_widths(wavenumber, norm_flux, norm_uncertainty, centers, [FWHM, FWHM, FWHM], overlay, line_strengths)
+
+    assert list(equivalent_width_df["center"]) == sorted(centers)
+    np.testing.assert_allclose(equivalent_width_df["window_lower"], [1252.97, 1253.02, 1257.97])
+    np.testing.assert_allclose(equivalent_width_df["window_upper"], [1253.02, 1253.07, 1258.03])
+    assert list(equivalent_width_df["masked_sample_count"]) == [np.sum(np.isnan(norm_flux)), 0, 0]
+
+    sample_widths = get_sample_widths(wavenumber)
+
+    for _, peak in equivalent_width_df.iterrows():
+
+        in_window = (wavenumber >= peak["window_lower"]) & (wavenumber <= peak["window_upper"]) & np.isfinite(norm_flux)
+
+        np.testing.assert_allclose(peak["equivalent_width"], np.sum((1 - norm_flux[in_window]) * sample_widths[in_window]), rtol = 1e-9)
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+import pytest
+
+SAMPLE_COUNT = 401
+
+# function writes an EXES file (with the synthetic header of file "index", see synthetic_fixtures.py) with the given rows
+def write_exes_file(exes_dir, file_name, index, wavenumber, flux, uncertainty, atran):
+
+    from synthetic_fixtures import write_synthetic_exes_file
+    from astropy.io import fits
+
+    os.makedirs(exes_dir, exist_ok = True)
+    path = os.path.join(exes_dir, file_name)
+
+    write_synthetic_exes_file(path, index, len(wavenumber), np.random.default_rng(index))
+
+    with fits.open(path, mode = "update") as hdulist:
+        hdulist[0].data = np.vstack([wavenumber, flux, uncertainty, atran]).astype(">f8")
+
+# function writes two observations of the same wavenumbers: a flat continuum (at different flux levels), with different absorption depths in the first quarter
+# (outside of the middle half that the flux normalization uses), where the normalized fluxes are 0.8 and 0.5 with normalized uncertainties 0.2 and 0.1
+def write_stackable_files(exes_dir):
+
+    wavenumber = np.linspace(1250.0, 1262.0, SAMPLE_COUNT)
+    absorbed = wavenumber < 1252.0
+    atran = np.ones(SAMPLE_COUNT)
+
+    write_exes_file(exes_dir, "a.fits", 0, wavenumber, np.where(absorbed, 1.6, 2.0), np.full(SAMPLE_COUNT, 0.4), atran)
+    write_exes_file(exes_dir, "b.fits", 1, wavenumber, np.where(absorbed, 1.5, 3.0), np.full(SAMPLE_COUNT, 0.3), atran)
+
+    return wavenumber
+
+def test_common_grid_covers_the_shared_range_at_the_coarsest_spacing(fixture_dir, tmp_path):
+
+    from exes_stacking import get_common_wavenumber_grid
+
+    exes_dir = str(tmp_path)
+    coarse_wavenumber = np.linspace(1250.0, 1262.0, 201)
+    fine_wavenumber = np.linspace(1255.0, 1265.0, 1001)
+
+    write_exes_file(exes_dir, "coarse.fits", 0, coarse_wavenumber, np.ones(201), np.ones(201), np.ones(201))
+    write_exes_file(exes_dir, "fine.fits", 1, fine_wavenumber, np.ones(1001), np.ones(1001), np.ones(1001))
+
+    grid = get_common_wavenumber_grid(["coarse.fits", "fine.fits"], exes_dir)
+
+    assert grid[0] == 1255.0
+    assert grid[-1] <= 1262.0
+    assert 1262.0 - grid[-1] < 0.06
+    np.testing.assert_allclose(np.diff(grid), 0.06)
+
+def test_files_without_shared_wavenumbers_can_not_be_stacked(fixture_dir, tmp_path):
+
+    from exes_stacking import get_common_wavenumber_grid, NoWavenumberOverlap
+
+    exes_dir = str(tmp_path)
+
+    write_exes_file(exes_dir, "low.fits", 0, np.linspace(1250.0, 1255.0, 101), np.ones(101), np.ones(101), np.ones(101))
+    write_exes_file(exes_dir, "high.fits", 1, np.linspace(1256.0, 1260.0, 101), np.ones(101), np.ones(101), np.ones(101))
+
+    with pytest.raises(NoWavenumberOverlap):
+        get_common_wavenumber_grid(["low.fits", "high.fits"], exes_dir)
+
+@pytest.mark.parametrize("chunk_size", [7, 65536])
+def test_stack_is_the_inverse_variance_weighted_mean(fixture_dir, tmp_path, chunk_size):
+
+    from exes_stacking import stack_exes_observations
+
+    exes_dir = str(tmp_path)
+    write_stackable_files(exes_dir)
+
+    stacked_data = stack_exes_observations(["a.fits", "b.fits"], exes_dir, chunk_size = chunk_size)
+
+    # weights 1 / 0.2^2 = 25 and 1 / 0.1^2 = 100
+    absorbed = stacked_data["wavenumber"] < 1251.9
+    continuum = stacked_data["wavenumber"] > 1252.1
+
+    np.testing.assert_allclose(stacked_data["flux"][absorbed], (25 * 0.8 + 100 * 0.5) / 125)
+    np.testing.assert_allclose(stacked_data["flux"][continuum], 1.0)
+    np.testing.assert_allclose(stacked_data["uncertainty"], 1 / np.sqrt(125))
+
+    assert stacked_data["stacked_file_names"] == ["a.fits", "b.fits"]
+    assert stacked_data["temperature"] == np.mean([-40.0, -41.0])
@@ -0,0 +1,101 @@
+import os
+import threading
+
+# function writes (or rewrites) a file in the watched directory, with a modification time that is distinct from its previous one
+def write_file(directory, file_name, content = b"fits", mtime_ns = 10 ** 18):
+
+    path = os.path.join(directory, file_name)
+
+    with open(path, "wb") as file:
+        file.write(content)
+
+    os.utime(path, ns = (mtime_ns, mtime_ns))
+
+# function returns a watcher of the directory that records every "on_change()" call, and retries the file names in "retry" (until it's emptied)
+def get_recording_watcher(directory, retry):
+
+    from fits_watcher import FitsDirectoryWatcher
+
+    calls = []
+
+    def on_change(added, changed, removed):
+        calls.append((added, changed, removed))
+        return list(retry)
+
+    return FitsDirectoryWatcher(str(directory), on_change, poll_interval = 0.05), calls
+
+def test_changes_are_reported_once(tmp_path):
+
+    write_file(tmp_path, "a.fits")
+    write_file(tmp_path, "notes.txt")
+    watcher, calls = get_recording_watcher(tmp_path, [])
+
+    # the files that were already there are in the initial snapshot
+    assert watcher.scan() == ([], [], [])
+
+    write_file(tmp_path, "b.fits")
+    write_file(tmp_path, "a.fits", mtime_ns = 2 * 10 ** 18)
+
+    assert watcher.scan() == (["b.fits"], ["a.fits"], [])
+    assert watcher.scan() == ([], [], [])
+
+    os.remove(tmp_path / "b.fits")
+
+    assert watcher.scan() == ([], [], ["b.fits"])
+    assert calls == [(["b.fits"], ["a.fits"], []), ([], [], ["b.fits"])]
+
+def test_files_that_failed_to_ingest_are_reported_again(tmp_path):
+
+    write_file(tmp_path, "a.fits")
+    retry = ["b.fits", "a.fits"]
+    watcher, calls = get_recording_watcher(tmp_path, retry)
+
+    write_file(tmp_path, "b.fits")
+    write_file(tmp_path, "a.fits", mtime_ns = 2 * 10 ** 18)
+
+    assert watcher.scan() == (["b.fits"], ["a.fits"], [])
+
+    # an added file is reported as added again, and a changed file as changed again, until they're ingested
+    assert watcher.scan() == (["b.fits"], ["a.fits"], [])
+
+    retry.clear()
+
+    assert watcher.scan() == (["b.fits"], ["a.fits"], [])
+    assert watcher.scan() == ([], [], [])
+    assert len(calls) == 3
+
+def test_initial_snapshot_reports_the_files_the_caller_does_not_know_about(tmp_path):
+
+    from fits_watcher import FitsDirectoryWatcher, get_directory_snapshot
+
+    write_file(tmp_path, "a.fits")
+    known_snapshot = get_directory_snapshot(str(tmp_path))
+    write_file(tmp_path, "b.fits")
+
+    watcher = FitsDirectoryWatcher(str(tmp_path), lambda added, changed, removed: None, initial_snapshot = known_snapshot)
+
+    assert watcher.scan() == (["b.fits"], [], [])
+
+def test_running_watcher_reports_a_new_file(tmp_path):
+
+    from fits_watcher import FitsDirectoryWatcher
+
+    reported = threading.Event()
+    calls = []
+
+    def on_change(added, changed, removed):
+        calls.append((added, changed, removed))
+        reported.set()
+
+    watcher = FitsDirectoryWatcher(str(tmp_path), on_change, poll_interval = 0.05)
+    watcher.start()
+
+    try:
+        write_file(tmp_path, "a.fits")
+        assert reported.wait(10)
+    finally:
+        watcher.stop()
+
+    # (a poll can land between the file's write and its new modification time, which reports it as changed afterwards)
+    assert calls[0] == (["a.fits"], [], [])
+    assert not watcher.is_alive()
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+# function returns random lines for a few isotopologues (in wavenumber order, with a few lines without a strength), in the format the index is built from
+def get_random_isotopologue_lines(seed = 0):
+
+    rng = np.random.default_rng(seed)
+    isotopologue_lines = {}
+
+    for i, isotopologue in enumerate(["H2O", "HDO", "CO2"]):
+
+        wavenumber = np.sort(rng.uniform(1250.0, 1262.0, 300))
+        strength = 10 ** rng.uniform(-8, -2, 300)
+        strength[rng.integers(0, 300, 5)] = np.nan
+
+        isotopologue_lines[isotopologue] = {"molecule": "CO2" if isotopologue == "CO2" else "H2O", "wavenumber": wavenumber, "col_den_trans": strength}
+
+    return isotopologue_lines
+
+@pytest.mark.parametrize("cutoff", [None, 1e-7, 1e-5, 3.3e-4, 1.0])
+def test_lines_above_cutoff_match_a_mask(fixture_dir, cutoff):
+
+    from hitran_cutoff_index import HitranCutoffIndex
+
+    isotopologue_lines = get_random_isotopologue_lines()
+    all_lines = HitranCutoffIndex(isotopologue_lines).get_all_lines_above_cutoff(cutoff)
+
+    for isotopologue, lines in isotopologue_lines.items():
+
+        above_cutoff = np.isfinite(lines["col_den_trans"]) & (lines["col_den_trans"] >= (cutoff or 0))
+
+        np.testing.assert_array_equal(all_lines[isotopologue]["wavenumber"], lines["wavenumber"][above_cutoff])
+        np.testing.assert_array_equal(all_lines[isotopologue]["col_den_trans"], lines["col_den_trans"][above_cutoff])
+
+def test_lines_in_range_match_a_mask(fixture_dir):
+
+    from hitran_cutoff_index import HitranCutoffIndex
+
+    isotopologue_lines = get_random_isotopologue_lines()
+    window_lines = HitranCutoffIndex(isotopologue_lines).get_all_lines_in_range(1254.2, 1255.9, 1e-5)
+
+    for isotopologue, lines in isotopologue_lines.items():
+
+        in_window = (1254.2 <= lines["wavenumber"]) & (lines["wavenumber"] <= 1255.9) & (lines["col_den_trans"] >= 1e-5)
+
+        np.testing.assert_array_equal(window_lines[isotopologue]["wavenumber"], lines["wavenumber"][in_window])
+
+def test_line_limits_keep_only_the_strongest_lines(fixture_dir):
+
+    from hitran_cutoff_index import HitranCutoffIndex
+
+    isotopologue_lines = get_random_isotopologue_lines()
+    index = HitranCutoffIndex(isotopologue_lines)
+
+    strengths = np.concatenate([lines["col_den_trans"] for lines in isotopologue_lines.values()])
+    strengths = np.sort(strengths[np.isfinite(strengths)])[::-1]
+
+    # the display cutoff is only raised when more lines than the limit would pass the cutoff
+    assert index.get_display_cutoff(1e-5, line_limit = 10000) == 1e-5
+    assert index.get_display_cutoff(1e-5, line_limit = 50) == strengths[49]
+    assert index.get_display_cutoff(None, line_limit = 50) == strengths[49]
+    assert index.get_display_cutoff(1.0, line_limit = 50) == 1.0
+
+    displayed_lines = index.get_all_lines_above_cutoff(index.get_display_cutoff(1e-5, line_limit = 50))
+    assert sum(len(lines["wavenumber"]) for lines in displayed_lines.values()) == 50
+
+    window_lines = index.get_all_lines_in_range(1250.0, 1262.0, None, line_limit = 20)
+    window_strengths = np.concatenate([lines["col_den_trans"] for lines in window_lines.values()])
+
+    np.testing.assert_array_equal(np.sort(window_strengths)[::-1], strengths[:20])
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+# temperatures (celsius) on the steps of the dashboard's temperature slider, and in between them (up to half a temperature bin from a bin's center)
+SLIDER_TEMPERATURES = [-80.0, -40.0, -37.5, 12.0]
+BINNED_TEMPERATURES = [-79.975, -37.3, -37.26, -37.225, 12.2]
+
+@pytest.mark.parametrize("temperature", SLIDER_TEMPERATURES)
+def test_tiled_strengths_match_direct_evaluation_on_slider_steps(fixture_dir, temperature):
+
+    from hitran_tile_cache import HitranTileCache
+
+    tile_cache = HitranTileCache([1240.0, 1290.0])
+
+    for wavenumber_range in [[1250.3, 1261.7], [1251.0, 1255.2], [1240.5, 1289.9]]:
+
+        overlay = tile_cache.get_overlay(wavenumber_range)
+
+        np.testing.assert_array_equal(tile_cache.get_strengths(overlay, temperature, 12.0, 30.0), overlay.evaluate(temperature, 12.0, 30.0))
+
+@pytest.mark.parametrize("temperature", BINNED_TEMPERATURES)
+def test_tiled_strengths_are_within_the_documented_tolerance(fixture_dir, temperature):
+
+    from hitran_tile_cache import HitranTileCache, TILE_STRENGTH_RTOL
+
+    tile_cache = HitranTileCache([1240.0, 1290.0])
+    overlay = tile_cache.get_overlay([1240.5, 1289.9])
+
+    np.testing.assert_allclose(tile_cache.get_strengths(overlay, temperature, 12.0, 30.0), overlay.evaluate(temperature, 12.0, 30.0), rtol = TILE_STRENGTH_RTOL, atol = 0.0)
+
+def test_tiles_are_shared_within_a_temperature_bin(fixture_dir):
+
+    from hitran_tile_cache import HitranTileCache
+
+    tile_cache = HitranTileCache([1250.0, 1262.0])
+    overlay = tile_cache.get_overlay([1250.0, 1262.0])
+
+    strengths = tile_cache.get_strengths(overlay, -37.3, 12.0, 30.0)
+    miss_count = tile_cache.get_stats()["misses"]
+
+    # -37.29 is in -37.3's bin (-37.325 to -37.275), so its strengths are served from the same tiles
+    np.testing.assert_array_equal(tile_cache.get_strengths(overlay, -37.29, 12.0, 30.0), strengths)
+    assert tile_cache.get_stats()["misses"] == miss_count
+
+    # -37.26 is in the next bin, which gets evaluated once, and is then shared with the rest of that bin
+    np.testing.assert_array_equal(tile_cache.get_strengths(overlay, -37.26, 12.0, 30.0), tile_cache.get_strengths(overlay, -37.25, 12.0, 30.0))
+    assert tile_cache.get_stats()["misses"] == 2 * miss_count
+
+# without tiles the pipeline scales "evaluate_temperature_strengths()" by the column densities, instead of folding them into the log space evaluation,
+# so the two only agree to rounding (-37.3 is the center of its temperature bin)
+def test_pipeline_strengths_match_with_and_without_tiles(fixture_dir):
+
+    from hitran_tile_cache import HitranTileCache
+    from spectrum_pipeline import SpectrumPipeline
+
+    tiled_pipeline = SpectrumPipeline(tile_cache = HitranTileCache())
+    direct_pipeline = SpectrumPipeline()
+
+    parameters = {"file_name": "obs_0.fits", "temperature": -37.3, "altitude_km": 12.3, "latitude": 30.0}
+
+    np.testing.assert_allclose(
+        tiled_pipeline.compute(["column_density_strengths"], **parameters)["column_density_strengths"],
+        direct_pipeline.compute(["column_density_strengths"], **parameters)["column_density_strengths"],
+        rtol = 1e-12,
+    )
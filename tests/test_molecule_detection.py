@@ -0,0 +1,71 @@
+import numpy as np
+
+WAVENUMBER_SHIFT = 0.03
+
+# function returns random line lists for two molecules (with one isotopologue each), and an observation that only has the first molecule's lines, offset by WAVENUMBER_SHIFT
+def get_synthetic_observation():
+
+    rng = np.random.default_rng(0)
+
+    isotopologue_lines = {
+        molecule + " (1)": {"molecule": molecule, "wavenumber": np.sort(rng.uniform(1250.0, 1262.0, 40)), "col_den_trans": rng.uniform(0.5, 1.0, 40)}
+        for molecule in ["H2O", "CH4"]
+    }
+
+    wavenumber = np.linspace(1250.0, 1262.0, 20000)
+    optical_depth = np.zeros_like(wavenumber)
+
+    for line_wavenumber, strength in zip(isotopologue_lines["H2O (1)"]["wavenumber"], isotopologue_lines["H2O (1)"]["col_den_trans"]):
+        optical_depth += 0.3 * strength * np.exp(-0.5 * ((wavenumber - line_wavenumber - WAVENUMBER_SHIFT) / 0.007) ** 2)
+
+    norm_flux = np.exp(-optical_depth) + rng.normal(0, 0.01, len(wavenumber))
+
+    return wavenumber, norm_flux, isotopologue_lines
+
+def test_injected_molecule_is_detected_at_its_shift(fixture_dir):
+
+    from molecule_detection import detect_molecules
+
+    wavenumber, norm_flux, isotopologue_lines = get_synthetic_observation()
+
+    detection_df = detect_molecules(wavenumber, norm_flux, isotopologue_lines).set_index("name")
+
+    assert list(detection_df["level"]) == ["molecule", "molecule", "isotopologue", "isotopologue"]
+    assert list(detection_df["line_count"]) == [40, 40, 40, 40]
+
+    # the molecule and its only isotopologue have the same template
+    for name in ["H2O", "H2O (1)"]:
+        assert detection_df.loc[name, "significance"] > 10
+        assert abs(detection_df.loc[name, "wavenumber_shift"] - WAVENUMBER_SHIFT) < wavenumber[1] - wavenumber[0]
+
+    for name in ["CH4", "CH4 (1)"]:
+        assert detection_df.loc[name, "significance"] < 5
+
+def test_templates_without_lines_in_range_are_not_detected(fixture_dir):
+
+    from molecule_detection import detect_molecules
+
+    wavenumber, norm_flux, isotopologue_lines = get_synthetic_observation()
+    isotopologue_lines["CO (1)"] = {"molecule": "CO", "wavenumber": np.array([2100.0]), "col_den_trans": np.array([1.0])}
+
+    detection_df = detect_molecules(wavenumber, norm_flux, isotopologue_lines).set_index("name")
+
+    assert detection_df.loc["CO", "line_count"] == 0
+    assert np.isnan(detection_df.loc["CO", "significance"])
+    assert np.isnan(detection_df.loc["CO (1)", "wavenumber_shift"])
+
+def test_batched_cross_correlation_matches_each_templates_correlation(fixture_dir):
+
+    from molecule_detection import get_batched_cross_correlation
+
+    rng = np.random.default_rng(1)
+    absorption_depth = rng.normal(size = 300)
+    templates = rng.normal(size = (3, 300))
+    max_lag = 25
+
+    correlation = get_batched_cross_correlation(absorption_depth, templates, max_lag)
+
+    # np.correlate's "full" output has the zero shift at index len - 1, and a positive shift correlates the spectrum against the template moved up
+    for template, template_correlation in zip(templates, correlation):
+        full_correlation = np.correlate(absorption_depth, template, mode = "full")
+        np.testing.assert_allclose(template_correlation, full_correlation[len(template) - 1 - max_lag:len(template) + max_lag], atol = 1e-9)
@@ -0,0 +1,51 @@
+import json
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+def test_typed_arrays_round_trip_exactly():
+
+    from plotly_transport import encode_typed_array, decode_typed_array
+
+    values = np.array([1302.4567891234567, -0.0, np.nan, np.inf, 1e-300, 5.0])
+
+    np.testing.assert_array_equal(decode_typed_array(encode_typed_array(values)), values)
+
+    # big endian arrays (as they come out of the FITS files) are written little endian
+    np.testing.assert_array_equal(decode_typed_array(encode_typed_array(values.astype(">f8"))), values)
+
+def test_downcast_typed_arrays_round_trip_to_float32():
+
+    from plotly_transport import encode_typed_array, decode_typed_array
+
+    values = np.linspace(1250.0, 1262.0, 1001)
+    encoded = encode_typed_array(values, downcast = True)
+
+    assert encoded["dtype"] == "f4"
+    np.testing.assert_array_equal(decode_typed_array(encoded), values.astype(np.float32))
+
+def test_lists_decode_with_nulls_as_nan():
+
+    from plotly_transport import decode_typed_array
+
+    # a trace that was never encoded comes back from the browser as a JSON list, with NaN as null
+    np.testing.assert_array_equal(decode_typed_array(json.loads(to_json_plotly([1.0, np.nan, 3.0]))), [1.0, np.nan, 3.0])
+
+def test_trace_list_only_downcasts_the_display_only_traces():
+
+    from plotly_transport import encode_trace_list, decode_typed_array
+
+    x = np.linspace(1250.0, 1262.0, 101)
+    trace_list = [
+        {"name": "experimental data", "x": x, "y": np.sin(x)},
+        {"name": "atran data", "x": x, "y": np.cos(x)},
+        {"name": "empty", "x": [], "y": []},
+    ]
+
+    encoded_trace_list = json.loads(to_json_plotly(encode_trace_list(trace_list, ["atran data"])))
+
+    assert encoded_trace_list[0]["y"]["dtype"] == "f8"
+    assert encoded_trace_list[1]["y"]["dtype"] == "f4"
+    assert encoded_trace_list[2]["x"] == []
+
+    np.testing.assert_array_equal(decode_typed_array(encoded_trace_list[0]["y"]), np.sin(x))
+    np.testing.assert_array_equal(decode_typed_array(encoded_trace_list[1]["x"]), x.astype(np.float32))
@@ -0,0 +1,118 @@
+import threading
+import pytest
+
+# a prefetch function that records the files it was called for, and blocks until it's released (or cancelled)
+class BlockingPrefetch:
+
+    def __init__(self):
+
+        self.release = threading.Event()
+        self.started = {}
+        self.cancelled_files = []
+        self.lock = threading.Lock()
+
+    def __call__(self, file_name, cancelled, **parameters):
+
+        with self.lock:
+            self.started.setdefault(file_name, threading.Event()).set()
+
+        while not (cancelled.is_set() or self.release.wait(0.01)):
+            pass
+
+        if cancelled.is_set():
+            self.cancelled_files.append(file_name)
+
+    def wait_until_started(self, file_name):
+
+        with self.lock:
+            started = self.started.setdefault(file_name, threading.Event())
+
+        assert started.wait(10)
+
+    def get_started_files(self):
+
+        with self.lock:
+            return sorted(file_name for file_name, started in self.started.items() if started.is_set())
+
+@pytest.fixture
+def prefetch():
+
+    prefetch = BlockingPrefetch()
+
+    yield prefetch
+
+    prefetch.release.set()
+
+def test_only_the_most_likely_files_are_scheduled_once(prefetch):
+
+    from prefetch_scheduler import PrefetchScheduler
+
+    scheduler = PrefetchScheduler(prefetch, worker_count = 1, file_limit = 2)
+
+    assert scheduler.schedule(["a", "a", "b", "c"], smooth_width = 9) == ["a", "b"]
+    assert scheduler.schedule(["a", "b"], smooth_width = 9) == ["a", "b"]
+    assert scheduler.stats["scheduled"] == 2
+
+    # the same file with other parameters is another prefetch
+    scheduler.schedule(["a"], smooth_width = 11)
+    assert scheduler.stats["scheduled"] == 3
+
+    prefetch.release.set()
+    scheduler.shutdown()
+
+def test_rescheduling_cancels_the_prefetches_that_are_not_wanted_anymore(prefetch):
+
+    from prefetch_scheduler import PrefetchScheduler
+
+    scheduler = PrefetchScheduler(prefetch, worker_count = 1)
+
+    scheduler.schedule(["a", "b", "c"])
+    prefetch.wait_until_started("a")
+
+    # "a" is running, so it's asked to stop, "b" is queued, so it never starts, and "c" is still wanted, so it isn't scheduled again
+    scheduler.schedule(["c", "d"])
+    prefetch.release.set()
+
+    # (without cancelling "d" first, like "shutdown()" would)
+    scheduler.executor.shutdown(wait = True)
+
+    assert prefetch.cancelled_files == ["a"]
+    assert prefetch.get_started_files() == ["a", "c", "d"]
+    assert scheduler.stats == {"scheduled": 4, "completed": 2, "cancelled": 2, "failed": 0}
+    assert scheduler.tasks == {}
+
+def test_wait_for_waits_for_a_running_prefetch_and_cancels_a_queued_one(prefetch):
+
+    from prefetch_scheduler import PrefetchScheduler
+
+    scheduler = PrefetchScheduler(prefetch, worker_count = 1)
+
+    scheduler.schedule(["a", "b"])
+    prefetch.wait_until_started("a")
+
+    scheduler.wait_for("b")
+    assert scheduler.stats["cancelled"] == 1
+
+    # "a" can only finish once it's released, so the wait returns once the prefetch is done
+    threading.Timer(0.1, prefetch.release.set).start()
+    scheduler.wait_for("a")
+
+    assert prefetch.release.is_set()
+    assert prefetch.get_started_files() == ["a"]
+
+    scheduler.shutdown()
+
+def test_failed_prefetches_are_counted_and_forgotten():
+
+    from prefetch_scheduler import PrefetchScheduler
+
+    def failing_prefetch(file_name, cancelled):
+        raise ValueError(file_name + " can't be stacked")
+
+    scheduler = PrefetchScheduler(failing_prefetch)
+
+    scheduler.schedule(["a"])
+    scheduler.executor.shutdown(wait = True)
+
+    assert scheduler.stats["failed"] == 1
+    assert scheduler.tasks == {}
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+OBSERVATION_INFO = {"object": "Orion", "latitude": 31.0, "longitude": -119.0, "avg_altitude": 39000.0, "avg_altitude_km": 11.9, "temperature": -41.0, "date": "2019-02-12"}
+SELECTION = {"range": {"x": [1254, 1256], "y": [0, 2]}}
+
+# function returns the fit info, peaks, fitted parameters and assignments of a fit with a peak at each of the given centers (the last peak isn't assigned)
+def get_fit_results(centers, molecule = "CH4"):
+
+    fit_info = {"fit_key": "obs_1.fits", "smooth_width": 9, "continuum_method": None, "selection": SELECTION, "baseline": 0.9, "weighted": True,
+                "overlay_temperature": -40.0, "overlay_altitude_km": 12.0, "overlay_latitude": 30.0}
+
+    peaks_df = pd.DataFrame({
+        "peak_number": np.arange(1, len(centers) + 1),
+        "wavenumber": centers,
+        "flux": 0.8,
+        "peak_model": "gaussian",
+        "center": centers,
+        "fwhm": 0.02,
+        "amplitude": -0.2,
+    })
+
+    fit_parameters_df = pd.DataFrame({"parameter": ["amplitude_0"] + ["mean_" + str(i + 1) for i in range(len(centers))], "value": [0.9] + list(centers), "standard_error": 0.001})
+
+    assignments_df = pd.DataFrame({
+        "molecule": [molecule] * (len(centers) - 1) + [None],
+        "isotopologue": ["(12C)H4"] * (len(centers) - 1) + [None],
+        "line_wavenumber": list(np.asarray(centers[:-1]) + 0.001) + [np.nan],
+        "col_den_trans": [1e-3] * (len(centers) - 1) + [np.nan],
+    })
+
+    return fit_info, peaks_df, fit_parameters_df, assignments_df
+
+def test_saved_fit_is_loaded_back(tmp_path):
+
+    from results_store import ResultsStore
+
+    results_store = ResultsStore(str(tmp_path / "results.sqlite"))
+    fit_info, peaks_df, fit_parameters_df, assignments_df = get_fit_results([1254.5, 1255.1, 1255.7])
+
+    fit_id = results_store.save_fit("obs_1.fits", OBSERVATION_INFO, fit_info, peaks_df, fit_parameters_df, assignments_df)
+    saved_fit = results_store.load_fit(fit_id)
+
+    assert saved_fit["fit"]["selection"] == SELECTION
+    assert saved_fit["fit"]["weighted"] == 1
+    assert saved_fit["fit"]["baseline"] == 0.9
+
+    pd.testing.assert_frame_equal(saved_fit["peaks"].drop(columns = ["fit_id", "file_name"]), peaks_df, check_dtype = False)
+    pd.testing.assert_frame_equal(saved_fit["fit_parameters"][["parameter", "value", "standard_error"]], fit_parameters_df, check_dtype = False)
+    assert saved_fit["fit_parameters"]["ci_lower"].isna().all()
+
+    # the unassigned peak has no assignment row
+    assert list(saved_fit["assignments"]["peak_number"]) == [1, 2]
+
+    assert results_store.load_fit(fit_id + 1) is None
+
+def test_fits_are_listed_newest_first_and_stacks_are_stored_under_their_sorted_file_names(tmp_path):
+
+    from results_store import ResultsStore
+
+    results_store = ResultsStore(str(tmp_path / "results.sqlite"))
+
+    first_fit_id = results_store.save_fit("obs_1.fits", OBSERVATION_INFO, *get_fit_results([1254.5, 1255.1]))
+    second_fit_id = results_store.save_fit("obs_1.fits", OBSERVATION_INFO, *get_fit_results([1254.6, 1255.2]))
+    stack_fit_id = results_store.save_fit(["obs_4.fits", "obs_1.fits"], OBSERVATION_INFO, *get_fit_results([1254.7, 1255.3]))
+
+    assert list(results_store.get_fits("obs_1.fits")["fit_id"]) == [second_fit_id, first_fit_id]
+    assert list(results_store.get_fits(("obs_1.fits", "obs_4.fits"))["fit_id"]) == [stack_fit_id]
+
+    # a store over the same database sees the same fits
+    assert list(ResultsStore(str(tmp_path / "results.sqlite")).get_fits("obs_1.fits")["fit_id"]) == [second_fit_id, first_fit_id]
+
+def test_peak_queries_filter_on_center_molecule_and_file(tmp_path):
+
+    from results_store import ResultsStore
+
+    results_store = ResultsStore(str(tmp_path / "results.sqlite"))
+
+    results_store.save_fit("obs_1.fits", OBSERVATION_INFO, *get_fit_results([1254.5, 1255.1, 1255.7]))
+    results_store.save_fit("obs_2.fits", dict(OBSERVATION_INFO, object = "W3"), *get_fit_results([1255.0, 1256.0], molecule = "H2O"))
+
+    peaks_df = results_store.query_peaks(wavenumber_min = 1255.0, wavenumber_max = 1256.0)
+
+    assert list(peaks_df["center"]) == [1255.0, 1255.1, 1255.7, 1256.0]
+    assert list(peaks_df["object"]) == ["W3", "Orion", "Orion", "W3"]
+
+    assert list(results_store.query_peaks(molecule = "CH4")["center"]) == [1254.5, 1255.1]
+    assert list(results_store.query_peaks(molecule = "H2O", file_name = "obs_2.fits")["center"]) == [1255.0]
+    assert results_store.query_peaks(molecule = "H2O", file_name = "obs_1.fits").empty
@@ -0,0 +1,112 @@
+import os
+import numpy as np
+
+SAMPLE_COUNT = 500
+
+# function writes synthetic EXES files (see synthetic_fixtures.py) into a directory, returns {file name: (wavenumber, flux, uncertainty, atran) rows}
+def write_exes_files(exes_dir, file_indices, seed = 0):
+
+    from synthetic_fixtures import write_synthetic_exes_file
+    from astropy.io import fits
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(exes_dir, exist_ok = True)
+
+    spectra = {}
+
+    for i in file_indices:
+        path = os.path.join(exes_dir, "file_" + str(i) + ".fits")
+        write_synthetic_exes_file(path, i, SAMPLE_COUNT, rng)
+        spectra[os.path.basename(path)] = fits.getdata(path).astype(float)
+
+    return spectra
+
+def test_sync_stores_every_file_and_then_nothing_changes(fixture_dir, tmp_path):
+
+    from spectra_archive import SpectraArchive
+
+    spectra = write_exes_files(str(tmp_path / "EXES_Files"), range(3))
+    archive = SpectraArchive(str(tmp_path / "archive"))
+
+    added, changed, removed = archive.sync(str(tmp_path / "EXES_Files"))
+
+    assert sorted(added) == sorted(spectra)
+    assert archive.get_file_names() == sorted(spectra)
+
+    for file_name, data in spectra.items():
+        np.testing.assert_array_equal(archive.get_spectrum(file_name), data)
+        np.testing.assert_array_equal(archive.get_raw_data(file_name)["flux"], data[1])
+
+    assert archive.sync(str(tmp_path / "EXES_Files")) == ([], [], [])
+
+    # the index is read back by a new archive over the same directory
+    np.testing.assert_array_equal(SpectraArchive(str(tmp_path / "archive")).get_spectrum("file_1.fits"), spectra["file_1.fits"])
+
+def test_changed_and_removed_files_are_dropped_and_compacted(fixture_dir, tmp_path):
+
+    from spectra_archive import SpectraArchive, ARCHIVE_ROW_COUNT
+
+    exes_dir = str(tmp_path / "EXES_Files")
+    spectra = write_exes_files(exes_dir, range(3))
+    archive = SpectraArchive(str(tmp_path / "archive"))
+    archive.sync(exes_dir)
+
+    # rewriting a file gives it a new block, and leaves its old one behind
+    spectra.update(write_exes_files(exes_dir, [1], seed = 1))
+    os.utime(os.path.join(exes_dir, "file_1.fits"), ns = (0, 1))
+
+    assert archive.sync(exes_dir) == ([], ["file_1.fits"], [])
+    assert archive.index["generation"] == 0
+    assert archive.index["value_count"] == 4 * ARCHIVE_ROW_COUNT * SAMPLE_COUNT
+
+    # once more than half of the flat file is dropped blocks, it's rewritten without them as the next generation
+    for file_name in ["file_0.fits", "file_2.fits"]:
+        os.remove(os.path.join(exes_dir, file_name))
+        spectra.pop(file_name)
+
+    assert archive.sync(exes_dir) == ([], [], ["file_0.fits", "file_2.fits"])
+    assert archive.index["generation"] == 1
+    assert archive.index["value_count"] == ARCHIVE_ROW_COUNT * SAMPLE_COUNT
+    assert not os.path.exists(archive.get_spectra_path(0))
+
+    for file_name, data in spectra.items():
+        np.testing.assert_array_equal(archive.get_spectrum(file_name), data)
+
+def test_values_left_by_an_interrupted_sync_are_cut_off(fixture_dir, tmp_path):
+
+    from spectra_archive import SpectraArchive, ARCHIVE_DTYPE
+
+    exes_dir = str(tmp_path / "EXES_Files")
+    spectra = write_exes_files(exes_dir, [0])
+    archive = SpectraArchive(str(tmp_path / "archive"))
+    archive.sync(exes_dir)
+
+    # e.g. the sync was killed after appending part of a block, before the index was written
+    with open(archive.get_spectra_path(archive.index["generation"]), "ab") as spectra_file:
+        spectra_file.write(np.zeros(123, dtype = ARCHIVE_DTYPE).tobytes())
+
+    spectra.update(write_exes_files(exes_dir, [1]))
+    archive.sync(exes_dir)
+
+    assert os.path.getsize(archive.get_spectra_path(archive.index["generation"])) == archive.index["value_count"] * ARCHIVE_DTYPE.itemsize
+
+    for file_name, data in spectra.items():
+        np.testing.assert_array_equal(archive.get_raw_data(file_name)["flux"], data[1])
+
+def test_stack_from_the_archive_matches_the_fits_files(fixture_dir, tmp_path):
+
+    from exes_stacking import stack_exes_observations
+    from spectra_archive import SpectraArchive
+
+    # files 0 and 3 start at the same wavenumber (see SYNTHETIC_WAVENUMBER_STARTS)
+    exes_dir = str(tmp_path / "EXES_Files")
+    write_exes_files(exes_dir, [0, 3])
+
+    archive = SpectraArchive(str(tmp_path / "archive"))
+    archive.sync(exes_dir)
+
+    archived_data = stack_exes_observations(["file_0.fits", "file_3.fits"], exes_dir, archive = archive)
+    stacked_data = stack_exes_observations(["file_0.fits", "file_3.fits"], exes_dir)
+
+    for key in ["wavenumber", "flux", "uncertainty", "atran"]:
+        np.testing.assert_array_equal(archived_data[key], stacked_data[key])
@@ -0,0 +1,104 @@
+import numpy as np
+
+PEAK_CENTERS = np.linspace(1255.05, 1255.95, 12)
+PEAK_STDDEV = 0.012
+
+# function returns a spectrum of well separated gaussian absorption peaks on a flat continuum, and the peak table the dashboard would send for it
+def get_synthetic_spectrum():
+
+    x = np.linspace(1255.0, 1256.0, 3000)
+    y = np.ones_like(x)
+
+    for center in PEAK_CENTERS:
+        y -= 0.2 * np.exp(-0.5 * ((x - center) / PEAK_STDDEV) ** 2)
+
+    y += np.random.default_rng(0).normal(0, 0.005, len(x))
+
+    table_data = [{"wavenumber": center, "flux": 0.8, "peak_model": "gaussian"} for center in PEAK_CENTERS]
+
+    return x, y, table_data
+
+# function returns a copy of the peak table with one peak switched to a lorentzian
+def switch_peak_model(table_data, i):
+
+    table_data = [dict(peak_data) for peak_data in table_data]
+    table_data[i]["peak_model"] = "lorentzian"
+
+    return table_data
+
+def test_cold_fit_optimizes_every_peak():
+
+    from spectra_fitting import SpectraFitCache
+
+    x, y, table_data = get_synthetic_spectrum()
+    fitted_model, report = SpectraFitCache().fit("selection", x, y, table_data, 1.0)
+
+    assert report["refit_peaks"] == len(table_data)
+    assert report["frozen_peaks"] == 0
+    assert not report["warm_start"]
+
+def test_unchanged_table_reuses_the_last_fit():
+
+    from spectra_fitting import SpectraFitCache
+
+    x, y, table_data = get_synthetic_spectrum()
+    fit_cache = SpectraFitCache()
+
+    fitted_model, report = fit_cache.fit("selection", x, y, table_data, 1.0)
+    reused_model, report = fit_cache.fit("selection", x, y, table_data, 1.0)
+
+    assert reused_model is fitted_model
+    assert report["iterations"] == 0
+    assert report["refit_peaks"] == 0
+
+def test_refit_only_optimizes_the_changed_peak_and_its_neighbours():
+
+    from spectra_fitting import SpectraFitCache, PEAK_MODEL_PARAMETERS
+
+    x, y, table_data = get_synthetic_spectrum()
+    fit_cache = SpectraFitCache()
+
+    fitted_model, report = fit_cache.fit("selection", x, y, table_data, 1.0)
+    refitted_model, report = fit_cache.fit("selection", x, y, switch_peak_model(table_data, 5), 1.0)
+
+    # the peaks are ~2.9 FWHMs apart, so only the two peaks next to the switched one are within NEIGHBOR_WIDTH_MULTIPLE of it
+    refit_peaks = [4, 5, 6]
+
+    assert report["refit_peaks"] == len(refit_peaks)
+    assert report["frozen_peaks"] == len(table_data) - len(refit_peaks)
+
+    # the frozen peaks (and the baseline) keep exactly the parameters they converged to
+    assert refitted_model.amplitude_0.value == fitted_model.amplitude_0.value
+
+    for i in range(len(table_data)):
+        if i not in refit_peaks:
+            for name in PEAK_MODEL_PARAMETERS["gaussian"]:
+                parameter_name = name + "_" + str(i + 1)
+                assert getattr(refitted_model, parameter_name).value == getattr(fitted_model, parameter_name).value
+
+def test_refit_without_freezing_optimizes_every_peak():
+
+    from spectra_fitting import SpectraFitCache
+
+    x, y, table_data = get_synthetic_spectrum()
+    fit_cache = SpectraFitCache()
+
+    fit_cache.fit("selection", x, y, table_data, 1.0)
+    refitted_model, report = fit_cache.fit("selection", x, y, switch_peak_model(table_data, 5), 1.0, freeze_unchanged = False)
+
+    assert report["refit_peaks"] == len(table_data)
+    assert report["frozen_peaks"] == 0
+    assert report["warm_start"]
+
+def test_forget_drops_only_the_matching_fits():
+
+    from spectra_fitting import SpectraFitCache
+
+    x, y, table_data = get_synthetic_spectrum()
+    fit_cache = SpectraFitCache()
+
+    fit_cache.fit("obs_0.fits", x, y, table_data, 1.0)
+    fit_cache.fit("obs_1.fits", x, y, table_data, 1.0)
+
+    assert fit_cache.forget(lambda fit_key: fit_key == "obs_0.fits") == 1
+    assert list(fit_cache.fits) == ["obs_1.fits"]